@@ -0,0 +1,218 @@
+'''
+Throughput and latency of the endpoints of the RESTful API, measured through
+the Flask test client (the whole WSGI stack, without a network). Run it from
+the main folder with:
+
+    python -m benchmarks.api_benchmark [--songs N] [--reuse] [--rounds R]
+                                       [--concurrency C] [--only TEXT]
+                                       [--output PATH] [--accept-encoding ENC]
+
+The catalogue is generated with benchmarks.datagen, as for
+benchmarks.db_benchmark. Every endpoint is requested R times, each time with
+another of the keys sampled by the generator, by C threads at once (1 by
+default), each thread with its own test client. The latency statistics are
+those of the single requests and the throughput (ops) is requests per
+second of wall time, so with C > 1 it shows how the server scales. The
+"304" benchmarks repeat the request with the ETag of the first response.
+The write benchmarks create and then delete what they create, so each
+round is two requests. With --accept-encoding every request sends that
+Accept-Encoding header, e.g. gzip to measure the compressed responses (see
+content_encoding).
+
+Responses with another status than the expected one are counted in the
+"errors" of the benchmark. The results are saved as JSON, by default in
+benchmarks/results/api-<commit>.json, to be compared with
+benchmarks.compare.
+'''
+import argparse, shutil, sys, tempfile, threading, time
+from urllib.parse import quote
+
+import cooccurrence
+import resources
+from benchmarks import datagen, db_benchmark, results
+
+DEFAULT_ROUNDS = 200
+API = '/musicfinder/api'
+
+def _cycle(values):
+    return lambda i: values[i % len(values)]
+
+def _template(**data):
+    return {'template': {'data': [{'name': name, 'value': value} for name, value in data.items()]}}
+
+def get_endpoints(db, keys, related=True):
+    '''
+    Return a list of (name, request(client, i)) where request makes the
+    requests of round i with client and returns the list of (response,
+    expected status).
+    '''
+    artist = _cycle([quote(a) for a in keys['artists']])
+    user = _cycle([quote(u) for u in keys['users']])
+    playlist = _cycle([(quote(name), quote(u)) for name, u in keys['playlists']])
+    song = _cycle([(quote(s['byArtist']), quote(s['name']))
+                   for s in db.get_songs_by_id(keys['songs']).values()])
+
+    def get(url, status=200):
+        return lambda client, i: [(client.get(url(i)), status)]
+
+    def not_modified(url):
+        etags = {}
+
+        def request(client, i):
+            path = url(i)
+            if path not in etags:
+                etags[path] = client.get(path).headers.get('ETag')
+            return [(client.get(path, headers={'If-None-Match': etags[path]}), 304)]
+        return request
+
+    def post_user(client, i):
+        nickname = 'bench user %d-%d' % (threading.get_ident(), i)
+        return [(client.post(API + '/users/', json=_template(nickname=nickname, password='password',
+                                                              age=30, nationality='Finland')), 201),
+                (client.delete(API + '/users/%s/' % quote(nickname)), 204)]
+
+    def post_song(client, i):
+        title = 'Bench Song %d-%d' % (threading.get_ident(), i)
+        return [(client.post(API + '/artists/%s/songs/' % artist(i),
+                             json=_template(name=title, datePublished=2000, duration='3:00')), 201),
+                (client.delete(API + '/artists/%s/songs/%s' % (artist(i), quote(title))), 204)]
+
+    def post_playlist(client, i):
+        name = 'Bench Playlist %d-%d' % (threading.get_ident(), i)
+        return [(client.post(API + '/users/%s/playlists/' % user(i), json=_template(name=name)), 201),
+                (client.delete(API + '/users/%s/playlists/%s/' % (user(i), quote(name))), 204)]
+
+    artist_url = lambda i: API + '/artists/%s/' % artist(i)
+    song_url = lambda i: API + '/artists/%s/songs/%s' % song(i)
+    user_url = lambda i: API + '/users/%s/' % user(i)
+    playlist_url = lambda i: API + '/users/%s/playlists/%s/' % (playlist(i)[1], playlist(i)[0])
+    endpoints = [
+        ('GET artists', get(lambda i: API + '/artists/')),
+        ('GET artists 304', not_modified(lambda i: API + '/artists/')),
+        ('GET artists?genre', get(lambda i: API + '/artists/?genre=Rock')),
+        ('GET artist', get(artist_url)),
+        ('GET artist 304', not_modified(artist_url)),
+        ('GET songs', get(lambda i: API + '/artists/%s/songs/' % artist(i))),
+        ('GET song', get(song_url)),
+        ('GET song 304', not_modified(song_url)),
+        ('GET search', get(lambda i: API + '/search/?q=%s' % song(i)[1].split('%20')[-1])),
+        ('GET users', get(lambda i: API + '/users/')),
+        ('GET user', get(user_url)),
+        ('GET user 304', not_modified(user_url)),
+        ('GET user playlists', get(lambda i: API + '/users/%s/playlists/' % user(i))),
+        ('GET playlist', get(playlist_url)),
+        ('GET playlist songs', get(lambda i: playlist_url(i) + 'songs/')),
+        ('GET recommendations', get(lambda i: user_url(i) + 'recommendations/')),
+        ('GET statistics songs', get(lambda i: API + '/statistics/songs/')),
+        ('GET statistics genres', get(lambda i: API + '/statistics/genres/?by=age')),
+        ('GET statistics additions', get(lambda i: API + '/statistics/additions/')),
+        ('POST+DELETE user', post_user),
+        ('POST+DELETE song', post_song),
+        ('POST+DELETE playlist', post_playlist),
+    ]
+    if related:
+        endpoints.insert(8, ('GET song related', get(lambda i: song_url(i) + '/related/')))
+    return endpoints
+
+def measure(app, request, rounds, concurrency=1, warmup=1, accept_encoding=None):
+    '''
+    Make rounds rounds of request, split among concurrency threads, and
+    return their statistics (see results.summarize) with the number of
+    responses with an unexpected status in 'errors'. accept_encoding is the
+    Accept-Encoding header of the requests, if any.
+    '''
+    def create_client():
+        client = app.test_client()
+        if accept_encoding:
+            client.environ_base['HTTP_ACCEPT_ENCODING'] = accept_encoding
+        return client
+
+    client = create_client()
+    for i in range(warmup):
+        request(client, i)
+    timings = []
+    errors = []
+    clock = time.perf_counter
+
+    def worker(first):
+        client = create_client()
+        own, failed = [], 0
+        for i in range(first, warmup + rounds, concurrency):
+            start = clock()
+            responses = request(client, i)
+            own.append(clock() - start)
+            failed += sum(1 for response, status in responses if response.status_code != status)
+        timings.extend(own)
+        errors.append(failed)
+
+    threads = [threading.Thread(target=worker, args=(warmup + n,)) for n in range(concurrency)]
+    start = clock()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = results.summarize(timings, len(timings), clock() - start)
+    stats['errors'] = sum(errors)
+    return stats
+
+def run(db, keys, rounds, concurrency=1, only=None, progress=None, accept_encoding=None):
+    '''
+    Serve db with the resources application and measure every endpoint
+    whose name contains only. The song co-occurrence index is built in a
+    scratch folder if numpy is available. Return {name: statistics}.
+    '''
+    app = resources.app
+    saved = app.config['DATABASE'], app.config['COOCCURRENCE_PATH'], app.debug
+    folder = tempfile.mkdtemp()
+    related = cooccurrence.numpy is not None
+    if related:
+        cooccurrence.build(db, folder)
+    app.config['DATABASE'], app.config['COOCCURRENCE_PATH'], app.debug = db, folder, False
+    measured = {}
+    try:
+        for name, request in get_endpoints(db, keys, related):
+            if only and only not in name:
+                continue
+            measured[name] = measure(app, request, rounds, concurrency,
+                                     accept_encoding=accept_encoding)
+            if progress is not None:
+                progress(name, measured[name])
+    finally:
+        app.config['DATABASE'], app.config['COOCCURRENCE_PATH'], app.debug = saved
+        shutil.rmtree(folder, ignore_errors=True)
+    return measured
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Throughput and latency of the API endpoints.')
+    parser.add_argument('--songs', type=int, default=db_benchmark.DEFAULT_SONGS,
+                        help='songs of the generated catalogue (default: %(default)s)')
+    parser.add_argument('--db', default=datagen.BENCH_DB_PATH,
+                        help='database file (default: %(default)s)')
+    parser.add_argument('--reuse', action='store_true',
+                        help='reuse the database if it was generated before')
+    parser.add_argument('--rounds', type=int, default=DEFAULT_ROUNDS,
+                        help='requests to every endpoint (default: %(default)s)')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='threads making requests at once (default: %(default)s)')
+    parser.add_argument('--only', help='run only the benchmarks whose name contains this text')
+    parser.add_argument('--output', help='JSON file of the results (default: benchmarks/results/api-<commit>.json)')
+    parser.add_argument('--accept-encoding', help='Accept-Encoding header of the requests, e.g. gzip')
+    args = parser.parse_args(argv)
+
+    db, keys = db_benchmark.open_database(args.db, args.songs, args.reuse)
+    try:
+        measured = run(db, keys, args.rounds, args.concurrency, args.only,
+                       lambda name, stats: sys.stderr.write('%s: %.1f us, %d errors\n'
+                                                            % (name, stats['median'] * 1e6, stats['errors'])),
+                       args.accept_encoding)
+    finally:
+        db.close()
+    results.print_results(measured)
+    document = results.create_document('api', measured,
+                                       {'songs': keys['sizes']['songs'], 'sizes': keys['sizes'],
+                                        'rounds': args.rounds, 'concurrency': args.concurrency,
+                                        'accept_encoding': args.accept_encoding})
+    print('Results saved in %s' % results.save(document, args.output))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+'''
+Compare two saved benchmark results. Run it from the main folder with:
+
+    python -m benchmarks.compare OLD.json NEW.json [--threshold T] [--stat S]
+
+For every benchmark of both files it prints the statistic S (median by
+default) of each run and the relative change. A benchmark is a regression
+when it got slower by more than T (0.1, i.e. 10%, by default) and an
+improvement when it got faster by more than T. The command exits with
+status 1 if there is any regression, so it can gate a commit.
+'''
+import argparse, sys
+
+from benchmarks import results
+
+DEFAULT_THRESHOLD = 0.1
+STATISTICS = ('min', 'mean', 'median', 'p95', 'p99')
+
+def compare(old, new, threshold=DEFAULT_THRESHOLD, statistic='median'):
+    '''
+    Compare the results of the documents old and new (see
+    results.create_document). Return a list of (benchmark, old value, new
+    value, relative change, verdict) sorted by benchmark, where verdict is
+    'regression', 'improvement' or '' and a benchmark missing in one of the
+    documents has None as value, change and verdict.
+    '''
+    rows = []
+    old_results, new_results = old['results'], new['results']
+    for name in sorted(set(old_results) | set(new_results)):
+        before = old_results.get(name, {}).get(statistic)
+        after = new_results.get(name, {}).get(statistic)
+        if before is None or after is None:
+            rows.append((name, before, after, None, None))
+            continue
+        change = (after - before) / before if before else 0.0
+        if change > threshold:
+            verdict = 'regression'
+        elif change < -threshold:
+            verdict = 'improvement'
+        else:
+            verdict = ''
+        rows.append((name, before, after, change, verdict))
+    return rows
+
+def main(argv=None, out=sys.stdout):
+    parser = argparse.ArgumentParser(description='Compare two saved benchmark results.')
+    parser.add_argument('old', help='results of the baseline')
+    parser.add_argument('new', help='results to compare with the baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='relative change counted as a regression (default: %(default)s)')
+    parser.add_argument('--stat', choices=STATISTICS, default='median',
+                        help='statistic compared (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    old, new = results.load(args.old), results.load(args.new)
+    out.write('%s (%s) -> %s (%s), %s in us\n' % (old.get('commit'), old.get('suite'),
+                                                  new.get('commit'), new.get('suite'), args.stat))
+    rows = compare(old, new, args.threshold, args.stat)
+    for name, before, after, change, verdict in rows:
+        if change is None:
+            out.write('%-64s %s\n' % (name, 'only in the old results' if after is None
+                                      else 'only in the new results'))
+        else:
+            out.write('%-64s %12.1f %12.1f %+8.1f%% %s\n' % (name, before * 1e6, after * 1e6,
+                                                           change * 100, verdict))
+    regressions = sum(1 for row in rows if row[4] == 'regression')
+    out.write('%d regressions\n' % regressions)
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,223 @@
+'''
+Synthetic catalogue generator for the benchmarks. Run it from the main folder
+with:
+
+    python -m benchmarks.datagen --songs N [--db PATH] [--seed S]
+
+It creates the database (schema, the initial data and the migrations) and
+adds N songs and, in proportion, artists, users, playlists and playlist
+entries, so the same command with N from 10^4 to 10^7 scales every table:
+
+    artists          N / 10
+    songs            N
+    users            N / 100
+    playlists        3 per user
+    playlist entries 20 per playlist
+
+The data is drawn from a random generator seeded with S, so a given N and S
+always produce the same database. Genres, languages and countries follow a
+skewed distribution, like a real catalogue. Rows are inserted in large
+batches with MusicDatabase.bulk_load. The sizes and the sampled keys of the
+generated rows are saved in PATH.json, so the benchmarks can reuse the
+database (see load_keys).
+'''
+import argparse, json, os, random, sys, time
+
+import database
+
+DEFAULT_SEED = 1
+BENCH_DB_PATH = os.path.join('db', 'db_bench.db')
+
+#Rows per executemany.
+BATCH_SIZE = 20000
+
+PLAYLISTS_PER_USER = 3
+SONGS_PER_PLAYLIST = 20
+
+GENRES = ('Rock', 'Pop', 'Indie Rock', 'Alternative Rock', 'Electronic', 'Hip Hop',
+          'Jazz', 'Classical', 'Metal', 'Folk', 'Soul', 'Blues', 'Punk', 'Reggae',
+          'Techno', 'House', 'Country', 'Latin', 'Grunge', 'Ambient')
+LANGUAGES = ('English', 'Spanish', 'German', 'French', 'Italian', 'Portuguese',
+             'Finnish', 'Japanese')
+COUNTRIES = ('USA', 'England', 'Germany', 'France', 'Italy', 'Spain', 'Mexico',
+             'Brazil', 'Finland', 'Japan', 'Australia', 'Canada', 'Sweden',
+             'Ireland', 'Scotland', 'Iceland', 'Norway', 'Argentina', 'Chile',
+             'Netherlands')
+
+def get_sizes(songs):
+    '''
+    Return the number of rows generated for every table for songs songs.
+    '''
+    users = max(songs // 100, 1)
+    playlists = users * PLAYLISTS_PER_USER
+    return {'artists': max(songs // 10, 1), 'songs': songs, 'users': users,
+            'playlists': playlists,
+            'song_in_playlist': playlists * min(SONGS_PER_PLAYLIST, songs)}
+
+def _skewed(rng, values):
+    #Roughly Zipf: the first values are picked much more often.
+    return values[min(int(rng.paretovariate(1.2)) - 1, len(values) - 1)]
+
+def artist_name(i):
+    return 'Artist %07d' % i
+
+def user_name(i):
+    return 'user%07d' % i
+
+def playlist_name(i):
+    return 'Playlist %d' % i
+
+def _batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _insert(db, table, statement, rows, progress):
+    '''
+    Insert rows into table with the indexes and triggers of table dropped.
+    '''
+    count = 0
+    with db.bulk_load(table) as con:
+        for batch in _batches(rows):
+            con.executemany(statement, batch)
+            con.commit()
+            count += len(batch)
+            if progress is not None:
+                progress(table, count)
+    return count
+
+def generate(db, songs, seed=DEFAULT_SEED, progress=None, similarity=True):
+    '''
+    Add songs generated songs, and the rest of the rows of get_sizes, to the
+    MusicDatabase db. progress, if given, is called with the table and the
+    rows inserted so far after every batch. With similarity the artist
+    similarity index is rebuilt at the end. Return the sizes of get_sizes
+    and the sid range and samples of the generated rows, which the
+    benchmarks use as keys: {'sizes', 'first_sid', 'last_sid', 'artists',
+    'songs', 'users', 'playlists'}.
+    '''
+    if songs < 1:
+        raise ValueError("Generate at least one song")
+    rng = random.Random(seed)
+    sizes = get_sizes(songs)
+    now = int(time.time())
+
+    artists = ((artist_name(i), _skewed(rng, GENRES), _skewed(rng, COUNTRIES),
+                _skewed(rng, LANGUAGES), rng.randint(1950, 2020))
+               for i in range(sizes['artists']))
+    _insert(db, 'artists', 'INSERT INTO artists (legalName, genre, foundingLocation, language, foundingDate) VALUES (?,?,?,?,?)',
+            artists, progress)
+
+    with db._pool.connection() as con:
+        first_sid = (con.execute('SELECT MAX(sid) FROM songs').fetchone()[0] or 0) + 1
+    last_sid = first_sid + songs - 1
+    #Artists get a skewed number of songs: a few have many of them.
+    song_rows = ((first_sid + i, 'Song %d' % i,
+                  artist_name(min(int(rng.paretovariate(1.1)) - 1, sizes['artists'] - 1)
+                              if rng.random() < 0.2 else rng.randrange(sizes['artists'])),
+                  rng.randint(1950, 2020), '%d:%02d' % (rng.randint(1, 9), rng.randrange(60)))
+                 for i in range(songs))
+    _insert(db, 'songs', 'INSERT INTO songs (sid, name, byArtist, datePublished, duration) VALUES (?,?,?,?,?)',
+            song_rows, progress)
+
+    users = ((user_name(i), 'password', rng.randint(14, 80), _skewed(rng, COUNTRIES),
+              rng.choice(('Male', 'Female')))
+             for i in range(sizes['users']))
+    _insert(db, 'users', 'INSERT INTO users (nickname, password, age, nationality, gender) VALUES (?,?,?,?,?)',
+            users, progress)
+
+    playlists = ((playlist_name(i % PLAYLISTS_PER_USER), user_name(i // PLAYLISTS_PER_USER),
+                  now - rng.randrange(10 ** 8))
+                 for i in range(sizes['playlists']))
+    _insert(db, 'playlists', 'INSERT INTO playlists (name, author, created_on) VALUES (?,?,?)',
+            playlists, progress)
+
+    def entries():
+        #Half of the songs of a playlist are popular ones (the first sids),
+        #so songs co-occur like in real playlists.
+        per_playlist = sizes['song_in_playlist'] // sizes['playlists']
+        popular = max(songs // 100, per_playlist)
+        for i in range(sizes['playlists']):
+            name, user = playlist_name(i % PLAYLISTS_PER_USER), user_name(i // PLAYLISTS_PER_USER)
+            chosen = set()
+            while len(chosen) < per_playlist:
+                if rng.random() < 0.5:
+                    chosen.add(first_sid + rng.randrange(min(popular, songs)))
+                else:
+                    chosen.add(first_sid + rng.randrange(songs))
+            added_on = now - rng.randrange(10 ** 7)
+            for sid in sorted(chosen):
+                yield (sid, name, user, added_on)
+    _insert(db, 'song_in_playlist', 'INSERT OR IGNORE INTO song_in_playlist (song, pl_name, pl_user, added_on) VALUES (?,?,?,?)',
+            entries(), progress)
+
+    if similarity:
+        db.rebuild_similarity_index()
+
+    sample = random.Random(seed + 1)
+    return {'sizes': sizes, 'first_sid': first_sid, 'last_sid': last_sid,
+            'artists': [artist_name(sample.randrange(sizes['artists'])) for _ in range(100)],
+            'songs': [first_sid + sample.randrange(songs) for _ in range(100)],
+            'users': [user_name(sample.randrange(sizes['users'])) for _ in range(100)],
+            'playlists': [(playlist_name(sample.randrange(PLAYLISTS_PER_USER)),
+                           user_name(sample.randrange(sizes['users']))) for _ in range(100)]}
+
+def create_database(path, songs, seed=DEFAULT_SEED, progress=None, similarity=True):
+    '''
+    Create a new database in path (an existing one is replaced) with the
+    initial data and songs generated songs. Return the MusicDatabase and
+    the result of generate.
+    '''
+    for suffix in ('', '-wal', '-shm', '.json'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    db = database.MusicDatabase(path)
+    db.load_init_values()
+    generated = generate(db, songs, seed, progress, similarity)
+    with open(path + '.json', 'w') as f:
+        json.dump(generated, f)
+    return db, generated
+
+def load_keys(path):
+    '''
+    Return the result of generate saved by create_database for the database
+    in path, or None if there is none.
+    '''
+    if not os.path.exists(path + '.json'):
+        return None
+    with open(path + '.json') as f:
+        generated = json.load(f)
+    generated['playlists'] = [tuple(playlist) for playlist in generated['playlists']]
+    return generated
+
+def print_progress(table, count):
+    sys.stderr.write('%s: %d rows\n' % (table, count))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a synthetic catalogue for the benchmarks.')
+    parser.add_argument('--songs', type=int, default=100000,
+                        help='songs to generate; the other tables scale with it (default: %(default)s)')
+    parser.add_argument('--db', default=BENCH_DB_PATH,
+                        help='database file, replaced if it exists (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED,
+                        help='seed of the random generator (default: %(default)s)')
+    parser.add_argument('--no-similarity', action='store_true',
+                        help='do not rebuild the artist similarity index')
+    parser.add_argument('--quiet', action='store_true', help='do not report progress')
+    args = parser.parse_args(argv)
+
+    start = time.time()
+    db, generated = create_database(args.db, args.songs, args.seed,
+                                    None if args.quiet else print_progress,
+                                    not args.no_similarity)
+    db.close()
+    print(', '.join('%d %s' % (count, table) for table, count in generated['sizes'].items())
+          + ' in %.1f s' % (time.time() - start))
+
+if __name__ == '__main__':
+    main()
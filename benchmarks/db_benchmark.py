@@ -0,0 +1,214 @@
+'''
+Micro-benchmarks of the public methods of MusicDatabase. Run them from the
+main folder with:
+
+    python -m benchmarks.db_benchmark [--songs N] [--reuse] [--rounds R]
+                                      [--only TEXT] [--output PATH] [--replica]
+
+The catalogue is generated with benchmarks.datagen in db/db_bench.db (N
+songs, and the rest in proportion), or reused with --reuse if it was
+generated before. Every method is called R times, each round with another
+key of those sampled by the generator, after a warm-up round. The entity
+getters (get_artist, get_song, get_user, get_playlist) are measured with
+the caches warm ("cached") and disabled ("uncached"). The writes run last,
+each benchmark undoing its own changes. With --replica the artists and
+songs are read from the in-memory catalogue replica (see
+database.CatalogueReplica), so the writes to them include a new copy.
+
+The statistics of every benchmark (see benchmarks.results) are printed and
+saved as JSON, by default in benchmarks/results/db-<commit>.json, to be
+compared with benchmarks.compare.
+'''
+import argparse, sys
+
+import database
+from benchmarks import datagen, results
+
+DEFAULT_SONGS = 10000
+DEFAULT_ROUNDS = 200
+PAGE = 100
+
+def _cycle(values):
+    return lambda i: values[i % len(values)]
+
+def get_read_benchmarks(db, uncached, keys):
+    '''
+    Return a list of (name, function(i)) with the read benchmarks. db is a
+    MusicDatabase with caches and uncached one without them, both on the
+    database described by keys (see datagen.generate).
+    '''
+    artist = _cycle(keys['artists'])
+    user = _cycle(keys['users'])
+    playlist = _cycle(keys['playlists'])
+    sids = keys['songs']
+    songs = list(db.get_songs_by_id(sids).values())
+    song = _cycle([(s['byArtist'], s['name']) for s in songs])
+    words = _cycle([s['name'].split()[-1] for s in songs])
+    #Keyset pagination cursors spread over the tables.
+    cursor = database.encode_cursor
+    artist_cursor = _cycle([cursor([a]) for a in keys['artists']])
+    song_cursor = _cycle([cursor([sid]) for sid in sids])
+    user_cursor = _cycle([cursor([u]) for u in keys['users']])
+    benchmarks = []
+    for suffix, instance in (('cached', db), ('uncached', uncached)):
+        benchmarks += [
+            ('get_artist[%s]' % suffix, lambda i, d=instance: d.get_artist(artist(i))),
+            ('get_song[%s]' % suffix, lambda i, d=instance: d.get_song(*song(i))),
+            ('get_user[%s]' % suffix, lambda i, d=instance: d.get_user(user(i))),
+            ('get_playlist[%s]' % suffix, lambda i, d=instance: d.get_playlist(*playlist(i))),
+        ]
+    benchmarks += [
+        ('contains_song', lambda i: uncached.contains_song(*song(i))),
+        ('contains_playlist', lambda i: uncached.contains_playlist(playlist(i)[1], playlist(i)[0])),
+        ('get_artists[page]', lambda i: db.get_artists(limit=PAGE)),
+        ('get_artists[after]', lambda i: db.get_artists(limit=PAGE, after=artist_cursor(i))),
+        ('get_artists[genre]', lambda i: db.get_artists(genre='Rock', limit=PAGE)),
+        ('iter_artists[page]', lambda i: list(db.iter_artists(limit=PAGE))),
+        ('get_songs[artist]', lambda i: db.get_songs(artist(i))),
+        ('get_songs[page]', lambda i: db.get_songs(limit=PAGE, after=song_cursor(i))),
+        ('iter_songs[page]', lambda i: list(db.iter_songs(limit=PAGE))),
+        ('get_users[page]', lambda i: db.get_users(limit=PAGE, after=user_cursor(i))),
+        ('get_playlists', lambda i: db.get_playlists(user(i))),
+        ('get_songs_in_playlist', lambda i: db.get_songs_in_playlist(*playlist(i))),
+        ('get_songs_by_id[100]', lambda i: db.get_songs_by_id(sids)),
+        ('search_artists', lambda i: db.search_artists(artist(i).split()[-1])),
+        ('search_songs', lambda i: db.search_songs(words(i))),
+        ('get_table_versions', lambda i: db.get_table_versions(('artists', 'songs', 'users'))),
+        ('get_playlist_last_modified', lambda i: db.get_playlist_last_modified(*playlist(i))),
+        ('get_similar_artists', lambda i: db.get_similar_artists(artist(i), 20)),
+        ('get_recommendations', lambda i: db.get_recommendations(user(i))),
+        ('get_top_songs', lambda i: db.get_top_songs()),
+        ('get_top_artists', lambda i: db.get_top_artists()),
+        ('get_genre_popularity', lambda i: db.get_genre_popularity('nationality')),
+        ('get_daily_additions', lambda i: db.get_daily_additions()),
+        ('get_pool_stats', lambda i: db.get_pool_stats()),
+    ]
+    return benchmarks
+
+def get_write_benchmarks(db, keys):
+    '''
+    Return a list of (name, function(i)) with the write benchmarks. Each one
+    writes and then removes its own rows, so the database ends as it was
+    (but for the ids).
+    '''
+    artist = _cycle(keys['artists'])
+    sids = _cycle(keys['songs'])
+
+    def user_cycle(i):
+        nickname = 'bench user %d' % i
+        db.create_user(nickname, 'password', 30, 'Finland', 'Female')
+        db.modify_user(nickname, 31, 'Spain', 'Male')
+        db.delete_user(nickname)
+
+    def append_user(i):
+        db.append_user('bench user %d' % i, 'password')
+        db.delete_user('bench user %d' % i)
+
+    def song_cycle(i):
+        db.create_song('Bench Song %d' % i, 2000, '3:00', artist(i))
+        db.delete_song(artist(i), 'Bench Song %d' % i)
+
+    def songs_batch(i):
+        songs = [('Bench Song %d-%d' % (i, n), 2000, '3:00') for n in range(10)]
+        db.create_songs(artist(i), songs)
+        for title, year, length in songs:
+            db.delete_song(artist(i), title)
+
+    def remove_playlist(user, name):
+        #Deleting a playlist leaves its entries in song_in_playlist.
+        db.delete_playlist(user, name)
+        with db._pool.connection() as con:
+            con.execute('DELETE FROM song_in_playlist WHERE pl_user = ? AND pl_name = ?', (user, name))
+
+    def playlist_cycle(i):
+        user = keys['users'][i % len(keys['users'])]
+        db.create_playlist('Bench Playlist %d' % i, user)
+        db.append_song_to_playlist(sids(i), 'Bench Playlist %d' % i, user)
+        remove_playlist(user, 'Bench Playlist %d' % i)
+
+    def playlist_batch(i):
+        user = keys['users'][i % len(keys['users'])]
+        songs = [(s['byArtist'], s['name']) for s in
+                 db.get_songs_by_id([sids(i + n) for n in range(10)]).values()]
+        db.create_playlist('Bench Playlist %d' % i, user)
+        db.append_songs_to_playlist('Bench Playlist %d' % i, user, songs)
+        remove_playlist(user, 'Bench Playlist %d' % i)
+
+    def artist_cycle(i):
+        db.create_artist('Bench Artist %d' % i, 'Rock', 'Finland', 'Finnish', 2000)
+        with db._pool.connection() as con:
+            con.execute('DELETE FROM artists WHERE legalName = ?', ('Bench Artist %d' % i,))
+
+    return [
+        ('create_artist', artist_cycle),
+        ('create_song+delete_song', song_cycle),
+        ('create_songs[10]+delete_song', songs_batch),
+        ('create_user+modify_user+delete_user', user_cycle),
+        ('append_user+delete_user', append_user),
+        ('create_playlist+append_song_to_playlist+delete_playlist', playlist_cycle),
+        ('create_playlist+append_songs_to_playlist[10]+delete_playlist', playlist_batch),
+        ('refresh_similarity_index', lambda i: db.refresh_similarity_index()),
+    ]
+
+def run(db, uncached, keys, rounds, only=None, progress=None):
+    '''
+    Run the read and then the write benchmarks whose name contains only.
+    Return a dictionary {name: statistics}.
+    '''
+    measured = {}
+    benchmarks = get_read_benchmarks(db, uncached, keys) + get_write_benchmarks(db, keys)
+    for name, function in benchmarks:
+        if only and only not in name:
+            continue
+        measured[name] = results.measure(function, rounds)
+        if progress is not None:
+            progress(name, measured[name])
+    return measured
+
+def open_database(path, songs, reuse, seed=datagen.DEFAULT_SEED):
+    '''
+    Return the MusicDatabase on path and the keys of the generated data,
+    generating it unless reuse is True and it was generated before.
+    '''
+    keys = datagen.load_keys(path) if reuse else None
+    if keys is None:
+        db, keys = datagen.create_database(path, songs, seed, datagen.print_progress)
+    else:
+        db = database.MusicDatabase(path)
+    return db, keys
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Micro-benchmarks of the MusicDatabase methods.')
+    parser.add_argument('--songs', type=int, default=DEFAULT_SONGS,
+                        help='songs of the generated catalogue (default: %(default)s)')
+    parser.add_argument('--db', default=datagen.BENCH_DB_PATH,
+                        help='database file (default: %(default)s)')
+    parser.add_argument('--reuse', action='store_true',
+                        help='reuse the database if it was generated before')
+    parser.add_argument('--rounds', type=int, default=DEFAULT_ROUNDS,
+                        help='timed calls of every method (default: %(default)s)')
+    parser.add_argument('--only', help='run only the benchmarks whose name contains this text')
+    parser.add_argument('--output', help='JSON file of the results (default: benchmarks/results/db-<commit>.json)')
+    parser.add_argument('--replica', action='store_true',
+                        help='read the artists and songs from the in-memory replica')
+    args = parser.parse_args(argv)
+
+    db, keys = open_database(args.db, args.songs, args.reuse)
+    if args.replica:
+        db.close()
+        db = database.MusicDatabase(args.db, replica=True)
+    uncached = database.MusicDatabase(args.db, cache_size=0, replica=args.replica)
+    try:
+        measured = run(db, uncached, keys, args.rounds, args.only,
+                       lambda name, stats: sys.stderr.write('%s: %.1f us\n' % (name, stats['median'] * 1e6)))
+    finally:
+        uncached.close()
+        db.close()
+    results.print_results(measured)
+    document = results.create_document('db', measured,
+                                       {'songs': keys['sizes']['songs'], 'sizes': keys['sizes'],
+                                        'rounds': args.rounds, 'replica': args.replica})
+    print('Results saved in %s' % results.save(document, args.output))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+'''
+Micro-benchmark of the rendering of the Collection+JSON and HAL envelopes of
+resources.py. Run it from the main folder with:
+
+    python -m benchmarks.envelope_benchmark [--artists N] [--repeat R]
+
+It loads N generated artists (each with one song) in a scratch database and
+reports how many items per second create_artist_item builds, and how many
+requests per second the Artists (one page of 1000 items), Artist and Users
+resources render.
+'''
+import argparse, os, timeit
+
+from flask import g
+
+import database
+import resources
+
+DEFAULT_ARTISTS = 10000
+DEFAULT_REPEAT = 5
+PAGE = 1000
+BENCH_DB_PATH = os.path.join('db', 'db_bench.db')
+
+def load_artists(db, count):
+    '''
+    Load count generated artists, each with one song, in db.
+    '''
+    artists = [('Artist %05d' % i, 'Genre %d' % (i % 17), 'Country %d' % (i % 31),
+                'Language %d' % (i % 7), 1950 + i % 70) for i in range(count)]
+    songs = [('Song %05d' % i, 1950 + i % 70, '3:%02d' % (i % 60), 'Artist %05d' % i)
+             for i in range(count)]
+    with db._pool.connection() as con:
+        con.executemany('INSERT INTO artists (legalName, genre, foundingLocation, language, foundingDate) VALUES (?,?,?,?,?)', artists)
+        con.executemany('INSERT INTO songs (name, datePublished, duration, byArtist) VALUES (?,?,?,?)', songs)
+
+def best_rate(function, operations, repeat):
+    '''
+    Return the best rate (operations per second) of repeat runs of function.
+    '''
+    best = min(timeit.repeat(function, number=1, repeat=repeat))
+    return operations / best
+
+def render(resource, *args):
+    '''
+    Call the undecorated get method of resource, so the measure does not
+    include the conditional request checks.
+    '''
+    get = resource.get
+    return getattr(get, '__wrapped__', get)(resource, *args)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--artists', type=int, default=DEFAULT_ARTISTS)
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    args = parser.parse_args()
+
+    if os.path.exists(BENCH_DB_PATH):
+        os.remove(BENCH_DB_PATH)
+    db = database.MusicDatabase(BENCH_DB_PATH)
+    db.load_init_values()
+    load_artists(db, args.artists)
+    resources.app.config['DATABASE'] = db
+    try:
+        rows = db.get_artists(limit=PAGE)
+        results = []
+        with resources.app.test_request_context('/musicfinder/api/artists/?limit=%d' % PAGE):
+            g.db = db
+            results.append(('create_artist_item (items/s)',
+                            best_rate(lambda: [resources.create_artist_item(a) for a in rows],
+                                      len(rows), args.repeat)))
+            artists = resources.Artists()
+            results.append(('Artists.get, %d items (req/s)' % PAGE,
+                            best_rate(lambda: render(artists), 1, args.repeat)))
+        with resources.app.test_request_context('/musicfinder/api/artists/Placebo/'):
+            g.db = db
+            artist = resources.Artist()
+            results.append(('Artist.get x1000 (req/s)',
+                            best_rate(lambda: [render(artist, 'Placebo') for _ in range(1000)],
+                                      1000, args.repeat)))
+        with resources.app.test_request_context('/musicfinder/api/users/'):
+            g.db = db
+            users = resources.Users()
+            results.append(('Users.get x1000 (req/s)',
+                            best_rate(lambda: [render(users) for _ in range(1000)],
+                                      1000, args.repeat)))
+    finally:
+        db.clean()
+    for name, rate in results:
+        print('%-34s %12.0f' % (name, rate))
+
+if __name__ == '__main__':
+    main()
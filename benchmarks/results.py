@@ -0,0 +1,102 @@
+'''
+Measurement and storage of the benchmark results.
+
+Every benchmark is summarized with the same statistics (seconds per
+operation: min, max, mean, stddev, median, p95 and p99, plus operations per
+second), and a suite is saved as one JSON document together with the
+commit, the versions of Python and SQLite and the parameters of the run,
+so two runs can be compared with benchmarks.compare.
+'''
+import json, math, os, platform, sqlite3, subprocess, sys, time
+
+#Folder where the suites save their results by default.
+RESULTS_FOLDER = os.path.join('benchmarks', 'results')
+
+def summarize(timings, operations=None, seconds=None):
+    '''
+    Return the statistics of timings, the seconds of every operation.
+    operations and seconds give the throughput when the operations did not
+    run one after the other (concurrent requests); by default it is the
+    inverse of the mean.
+    '''
+    timings = sorted(timings)
+    count = len(timings)
+    if not count:
+        raise ValueError("There are no timings to summarize")
+    mean = sum(timings) / count
+    variance = sum((t - mean) ** 2 for t in timings) / (count - 1) if count > 1 else 0.0
+
+    def percentile(p):
+        return timings[min(count - 1, int(math.ceil(p * count)) - 1)]
+
+    if operations is None:
+        operations, seconds = count, sum(timings)
+    return {'rounds': count, 'min': timings[0], 'max': timings[-1], 'mean': mean,
+            'stddev': math.sqrt(variance), 'median': percentile(0.5),
+            'p95': percentile(0.95), 'p99': percentile(0.99),
+            'ops': operations / seconds if seconds else None}
+
+def measure(function, rounds, warmup=1):
+    '''
+    Call function(i) warmup times and then rounds times, timing every call.
+    Return the statistics of the timed calls (see summarize).
+    '''
+    for i in range(warmup):
+        function(i)
+    timings = []
+    clock = time.perf_counter
+    for i in range(warmup, warmup + rounds):
+        start = clock()
+        function(i)
+        timings.append(clock() - start)
+    return summarize(timings)
+
+def get_commit():
+    '''
+    Return the current git commit, or None outside a git checkout.
+    '''
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                         stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode('ascii').strip()
+
+def create_document(suite, results, parameters):
+    '''
+    Return the JSON document of a run of suite: results is a dictionary
+    {benchmark name: statistics} and parameters the options of the run.
+    '''
+    return {'suite': suite, 'created_on': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': get_commit(), 'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version, 'platform': platform.platform(),
+            'parameters': parameters, 'results': results}
+
+def save(document, path=None):
+    '''
+    Write document to path, by default RESULTS_FOLDER/<suite>-<commit>.json.
+    Return the path.
+    '''
+    if path is None:
+        path = os.path.join(RESULTS_FOLDER, '%s-%s.json' % (document['suite'],
+                                                            document['commit'] or 'local'))
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+    return path
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+def print_results(results, out=sys.stdout):
+    '''
+    Print a table with the median, p95 and throughput of every benchmark.
+    '''
+    out.write('%-64s %12s %12s %12s\n' % ('benchmark', 'median (us)', 'p95 (us)', 'ops/s'))
+    for name in sorted(results):
+        stats = results[name]
+        out.write('%-64s %12.1f %12.1f %12.0f\n' % (name, stats['median'] * 1e6,
+                                                   stats['p95'] * 1e6, stats['ops'] or 0))
@@ -0,0 +1,133 @@
+'''
+Memory and time of a long listing: the rows of the songs table read into
+records (records.Song, built by the cursor) and rendered as Collection+JSON
+items, against the same rows read into dictionaries. Run it from the main
+folder with:
+
+    python -m benchmarks.rows_benchmark [--rows N] [--repeat R] [--mode MODE]
+
+It loads N generated songs (100000 by default) in db/db_rows_bench.db with
+MusicDatabase.bulk_load and runs every mode in its own process, so the peak
+RSS of one does not hide the other. For each mode it reports the best time
+of R listings, the memory allocated at the peak of a listing and the memory
+still held by the listed rows (both traced with tracemalloc), and the peak
+RSS of the process. The modes are:
+
+    records  MusicDatabase.get_songs(), the records built by the cursor
+    render   get_songs() and create_song_item on every record
+    dicts    the rows read as sqlite3.Row objects and copied to dictionaries,
+             as the database did before the records
+'''
+import argparse, os, subprocess, sys, timeit, tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from flask import g
+
+import database
+import resources
+
+DEFAULT_ROWS = 100000
+DEFAULT_REPEAT = 3
+ARTISTS = 1000
+MODES = ('records', 'render', 'dicts')
+BENCH_DB_PATH = os.path.join('db', 'db_rows_bench.db')
+
+def load_songs(db, count):
+    '''
+    Load ARTISTS artists and count songs spread over them in db.
+    '''
+    artists = [('Artist %04d' % i, 'Genre %d' % (i % 17), 'Country %d' % (i % 31),
+                'Language %d' % (i % 7), 1950 + i % 70) for i in range(ARTISTS)]
+    songs = [('Song %06d' % i, 1950 + i % 70, '3:%02d' % (i % 60), 'Artist %04d' % (i % ARTISTS))
+             for i in range(count)]
+    with db.bulk_load('artists', 'songs') as con:
+        con.executemany('INSERT INTO artists (legalName, genre, foundingLocation, language, foundingDate) VALUES (?,?,?,?,?)', artists)
+        con.executemany('INSERT INTO songs (name, datePublished, duration, byArtist) VALUES (?,?,?,?)', songs)
+        con.commit()
+
+def as_dict(row):
+    return {'sid': row['sid'], 'name': row['name'], 'byArtist': row['byArtist'],
+            'datePublished': row['datePublished'], 'duration': row['duration']}
+
+def get_listing(db, mode):
+    '''
+    Return a function that lists every song of db as mode does.
+    '''
+    if mode == 'dicts':
+        return lambda: db._execute('SELECT * FROM songs ORDER BY sid', (), 'all', as_dict)
+    if mode == 'render':
+        return lambda: [resources.create_song_item(s) for s in db.get_songs()]
+    return db.get_songs
+
+def measure(db, mode, repeat):
+    '''
+    Return (best seconds, peak traced bytes, retained traced bytes, peak
+    RSS in bytes or None) of the listings of mode.
+    '''
+    listing = get_listing(db, mode)
+    seconds = min(timeit.repeat(listing, number=1, repeat=repeat))
+    tracemalloc.start()
+    try:
+        rows = listing()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del rows
+    rss = None
+    if resource is not None:
+        #Kilobytes on Linux, bytes on macOS.
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        rss *= 1 if sys.platform == 'darwin' else 1024
+    return seconds, peak, retained, rss
+
+def run_mode(path, mode, rows, repeat):
+    '''
+    Measure mode on the database at path and print its line.
+    '''
+    db = database.MusicDatabase(path)
+    try:
+        with resources.app.test_request_context('/musicfinder/api/songs/'):
+            g.db = db
+            seconds, peak, retained, rss = measure(db, mode, repeat)
+    finally:
+        db.close()
+    print('%-8s %10.3f %14.1f %14.1f %12s' % (mode, seconds, peak / 2.0 ** 20, retained / 2.0 ** 20,
+                                              '-' if rss is None else '%.1f' % (rss / 2.0 ** 20)))
+    print('%-8s %10.2f %14.1f %14.1f' % ('per row', seconds / rows * 1e6, peak / float(rows),
+                                         retained / float(rows)))
+    sys.stdout.flush()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS)
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--mode', choices=MODES,
+                        help='measure only this mode, in this process, on the loaded database')
+    args = parser.parse_args(argv)
+
+    if args.mode is not None:
+        run_mode(BENCH_DB_PATH, args.mode, args.rows, args.repeat)
+        return
+
+    if os.path.exists(BENCH_DB_PATH):
+        os.remove(BENCH_DB_PATH)
+    db = database.MusicDatabase(BENCH_DB_PATH)
+    db.load_init_values()
+    load_songs(db, args.rows)
+    rows = db._execute('SELECT COUNT(*) FROM songs', (), 'one')[0]
+    db.close()
+    print('%d rows; seconds, MiB (us and bytes per row)' % rows)
+    print('%-8s %10s %14s %14s %12s' % ('mode', 'time', 'traced peak', 'retained', 'peak RSS'))
+    try:
+        for mode in MODES:
+            subprocess.check_call([sys.executable, '-m', 'benchmarks.rows_benchmark', '--mode', mode,
+                                   '--rows', str(rows), '--repeat', str(args.repeat)])
+    finally:
+        os.remove(BENCH_DB_PATH)
+
+if __name__ == '__main__':
+    main()
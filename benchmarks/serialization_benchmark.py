@@ -0,0 +1,62 @@
+'''
+Benchmark of the JSON backends of serialization. Run it from the main folder
+with:
+
+    python -m benchmarks.serialization_benchmark [--artists N] [--repeat R]
+
+It builds the Collection+JSON envelope of N generated artists (no database is
+needed) and reports, for every available backend, how long serializing it
+takes and the size of the output.
+'''
+import argparse, json, timeit
+
+import records
+import resources
+import serialization
+
+DEFAULT_ARTISTS = 10000
+DEFAULT_REPEAT = 5
+
+def create_envelope(count):
+    '''
+    Return the Collection+JSON envelope of count generated artists, as
+    Artists.get builds it.
+    '''
+    artists = [records.Artist('Artist %05d' % i, 'Genre %d' % (i % 17), 'Country %d' % (i % 31),
+                              'Language %d' % (i % 7), 1950 + i % 70)
+               for i in range(count)]
+    href = resources.api.url_for(resources.Artists)
+    return {'collection': {'version': '1.0', 'href': href, 'links': [],
+                           'queries': [{'href': href, 'rel': 'search',
+                                        'prompt': 'Search artists',
+                                        'data': resources.ARTISTS_QUERY_DATA}],
+                           'template': resources.ARTISTS_TEMPLATE,
+                           'items': [resources.create_artist_item(a) for a in artists]}}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--artists', type=int, default=DEFAULT_ARTISTS)
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    args = parser.parse_args()
+
+    with resources.app.test_request_context('/musicfinder/api/artists/'):
+        envelope = create_envelope(args.artists)
+    results = []
+    try:
+        for name in sorted(serialization.BACKENDS):
+            serialization.set_backend(name)
+            data = serialization.dumps(envelope)
+            assert json.loads(data) == envelope
+            best = min(timeit.repeat(lambda: serialization.dumps(envelope),
+                                     number=1, repeat=args.repeat))
+            results.append((name, best, len(data)))
+    finally:
+        serialization.set_backend()
+    baseline = dict((name, best) for name, best, size in results).get('json')
+    print('%d artists' % args.artists)
+    for name, best, size in results:
+        speedup = ' (x%.1f)' % (baseline / best) if baseline else ''
+        print('%-8s %8.2f ms %10d bytes%s' % (name, best * 1000, size, speedup))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+'''
+Import time and cold start of the server, every round in a new Python
+process started from a scratch folder (the paths of the server must not
+depend on the working directory). Run it from the main folder with:
+
+    python -m benchmarks.startup_benchmark [--rounds R] [--top N] [--output PATH]
+
+The benchmarks are:
+
+    interpreter     python -c pass: the floor of the others
+    import          import musicfinder, the module gunicorn loads
+    first response  import musicfinder, create the application and answer a
+                    GET of the artists, with the database opened by that
+                    request (a copy of the test data, see
+                    MusicDatabase.load_init_values)
+    cold start      the whole process of the first response, interpreter
+                    included
+
+import and first response are timed inside the process, so they leave out
+the interpreter. They must stay below IMPORT_BUDGET and
+FIRST_RESPONSE_BUDGET, which test.musicfinder_startup_tests checks. The N
+modules with the longest own import time, from python -X importtime, are
+printed and saved with the results, by default in
+benchmarks/results/startup-<commit>.json.
+'''
+import argparse, os, shutil, subprocess, sys, tempfile, time
+
+import database
+from benchmarks import results
+
+DEFAULT_ROUNDS = 5
+DEFAULT_TOP = 15
+
+#Seconds, measured inside the process. The import took 0.25 s and the first
+#response 0.35 s on the development machine; before the application was
+#created lazily, importing it opened the database and loaded NumPy and SciPy.
+IMPORT_BUDGET = 0.6
+FIRST_RESPONSE_BUDGET = 1.0
+
+IMPORT_SCRIPT = '''
+import time
+start = time.perf_counter()
+import musicfinder
+print(time.perf_counter() - start)
+'''
+
+FIRST_RESPONSE_SCRIPT = '''
+import sys, time
+start = time.perf_counter()
+import musicfinder, resources
+from werkzeug.test import Client
+resources.app.config['DATABASE_PATH'] = sys.argv[1]
+response = Client(musicfinder.application).get('/musicfinder/api/artists/')
+if response.status_code != 200:
+    raise SystemExit('GET artists answered %s' % response.status)
+print(time.perf_counter() - start)
+'''
+
+def run_python(args, folder):
+    '''
+    Run the Python interpreter with args in folder, with the main folder in
+    its path. Return (seconds of the whole process, stdout, stderr).
+    '''
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [database.BASE_DIR, env.get('PYTHONPATH')]))
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable] + args, cwd=folder, env=env,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             universal_newlines=True)
+    seconds = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError('python %s failed:\n%s' % (' '.join(args), process.stderr))
+    return seconds, process.stdout, process.stderr
+
+def measure_import(folder):
+    '''
+    Return the seconds taken by import musicfinder in a new process.
+    '''
+    return float(run_python(['-c', IMPORT_SCRIPT], folder)[1].split()[-1])
+
+def measure_first_response(folder, db_path):
+    '''
+    Return (seconds from the first import to the first response, inside
+    the process; seconds of the whole process) with the database db_path.
+    '''
+    seconds, output, _errors = run_python(['-c', FIRST_RESPONSE_SCRIPT, db_path], folder)
+    return float(output.split()[-1]), seconds
+
+def get_import_times(folder, module='musicfinder'):
+    '''
+    Return the list of (module, own seconds, cumulative seconds) of the
+    modules loaded by import module in a new process, from the longest own
+    time, as reported by python -X importtime.
+    '''
+    errors = run_python(['-X', 'importtime', '-c', 'import %s' % module], folder)[2]
+    times = []
+    for line in errors.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        times.append((name.strip(), int(own) / 1e6, int(cumulative) / 1e6))
+    times.sort(key=lambda entry: entry[1], reverse=True)
+    return times
+
+def create_database(folder):
+    '''
+    Create the database of the first responses in folder. Return its path.
+    '''
+    db_path = os.path.join(folder, 'startup.db')
+    db = database.MusicDatabase(db_path)
+    try:
+        db.load_init_values()
+    finally:
+        db.close()
+    return db_path
+
+def run(rounds, progress=None):
+    '''
+    Measure every benchmark rounds times. Return {name: statistics}.
+    '''
+    folder = tempfile.mkdtemp()
+    try:
+        db_path = create_database(folder)
+        timings = {'interpreter': [], 'import': [], 'first response': [], 'cold start': []}
+        for i in range(rounds):
+            timings['interpreter'].append(run_python(['-c', 'pass'], folder)[0])
+            timings['import'].append(measure_import(folder))
+            first_response, cold_start = measure_first_response(folder, db_path)
+            timings['first response'].append(first_response)
+            timings['cold start'].append(cold_start)
+        measured = {}
+        for name, values in timings.items():
+            measured[name] = results.summarize(values)
+            if progress is not None:
+                progress(name, measured[name])
+        return measured
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import time and cold start of the server.')
+    parser.add_argument('--rounds', type=int, default=DEFAULT_ROUNDS,
+                        help='processes started for every benchmark (default: %(default)s)')
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP,
+                        help='slowest imports printed (default: %(default)s)')
+    parser.add_argument('--output', help='JSON file of the results (default: benchmarks/results/startup-<commit>.json)')
+    args = parser.parse_args(argv)
+
+    measured = run(args.rounds, lambda name, stats: sys.stderr.write('%s: %.1f ms\n'
+                                                                     % (name, stats['median'] * 1e3)))
+    results.print_results(measured)
+    folder = tempfile.mkdtemp()
+    try:
+        imports = get_import_times(folder)[:args.top]
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    print('\nSlowest imports (own ms, cumulative ms):')
+    for name, own, cumulative in imports:
+        print('  %-40s %8.1f %8.1f' % (name, own * 1e3, cumulative * 1e3))
+    for name, budget in (('import', IMPORT_BUDGET), ('first response', FIRST_RESPONSE_BUDGET)):
+        if measured[name]['median'] > budget:
+            print('%s takes %.0f ms, over its budget of %.0f ms' % (name, measured[name]['median'] * 1e3, budget * 1e3))
+    document = results.create_document('startup', measured,
+                                       {'rounds': args.rounds,
+                                        'budgets': {'import': IMPORT_BUDGET,
+                                                    'first response': FIRST_RESPONSE_BUDGET}})
+    document['imports'] = [{'module': name, 'own': own, 'cumulative': cumulative}
+                           for name, own, cumulative in imports]
+    print('Results saved in %s' % results.save(document, args.output))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+'''
+Bulk import of catalogue data from CSV or JSONL files.
+
+Use it from the main folder with:
+
+    python -m bulk_import --artists artists.csv --songs songs.jsonl [--db PATH]
+
+The kinds of records are imported in the order artists, songs, playlists,
+playlist_songs, so every record can refer to the ones imported before it.
+The columns (CSV header) or keys (JSONL objects) of each kind are:
+
+    artists         legalName, genre, foundingLocation, language, foundingDate
+    songs           name, byArtist, datePublished, duration
+    playlists       name, author, created_on
+    playlist_songs  playlist, user, artist, title, added_on
+
+Records are read as a stream and inserted with executemany, one transaction
+per batch, while the indexes and triggers of the target table are dropped
+(see MusicDatabase.bulk_load). References (byArtist, author, and the
+playlists and songs of playlist_songs) are resolved for a whole batch at a
+time; records with unknown references or missing required fields are
+rejected and counted.
+Artists and playlists that already exist are skipped.
+
+The triggers that keep the artist similarity index up to date are dropped
+during the load too, so once the files are imported the index is rebuilt
+(see MusicDatabase.rebuild_similarity_index).
+'''
+import argparse, csv, json, os, sys, time
+
+import database
+
+#Records inserted per executemany and transaction.
+DEFAULT_BATCH_SIZE = 20000
+
+#Keys resolved per lookup query.
+LOOKUP_CHUNK = 500
+
+#Kind -> (table, fields as (name, required, integer)).
+KINDS = {
+    'artists': ('artists', (('legalName', True, False), ('genre', False, False),
+                            ('foundingLocation', False, False),
+                            ('language', False, False),
+                            ('foundingDate', False, True))),
+    'songs': ('songs', (('name', True, False), ('byArtist', True, False),
+                        ('datePublished', False, True), ('duration', True, False))),
+    'playlists': ('playlists', (('name', True, False), ('author', True, False),
+                                ('created_on', False, True))),
+    'playlist_songs': ('song_in_playlist', (('playlist', True, False),
+                                            ('user', True, False),
+                                            ('artist', True, False),
+                                            ('title', True, False),
+                                            ('added_on', False, True))),
+}
+IMPORT_ORDER = ('artists', 'songs', 'playlists', 'playlist_songs')
+
+STATEMENTS = {
+    'artists': 'INSERT OR IGNORE INTO artists (legalName, genre, foundingLocation, language, foundingDate) VALUES (?,?,?,?,?)',
+    'songs': 'INSERT INTO songs (name, byArtist, datePublished, duration) VALUES (?,?,?,?)',
+    'playlists': 'INSERT OR IGNORE INTO playlists (name, author, created_on) VALUES (?,?,?)',
+    'playlist_songs': 'INSERT OR IGNORE INTO song_in_playlist (song, pl_name, pl_user, added_on) VALUES (?,?,?,?)',
+}
+
+def read_records(path, format=None):
+    '''
+    Yield the records of a CSV or JSONL file as dictionaries. format is
+    'csv' or 'jsonl'; None guesses it from the extension of path.
+    '''
+    if format is None:
+        extension = os.path.splitext(path)[1].lower()
+        format = 'csv' if extension == '.csv' else 'jsonl'
+    if format not in ('csv', 'jsonl'):
+        raise ValueError("Unknown format %s" % format)
+    with open(path, newline='', encoding='utf-8') as f:
+        if format == 'csv':
+            for record in csv.DictReader(f):
+                yield record
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def _convert(record, fields):
+    '''
+    Return the values of fields in record as a tuple, or None if a required
+    field is missing or an integer field is not a number. Empty strings are
+    NULL.
+    '''
+    values = []
+    for name, required, integer in fields:
+        value = record.get(name)
+        if value == '':
+            value = None
+        if value is None:
+            if required:
+                return None
+        elif integer:
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                return None
+        values.append(value)
+    return tuple(values)
+
+def _lookup(cur, query, keys):
+    '''
+    Run query (whose IN list is written as %s) for keys, LOOKUP_CHUNK keys
+    at a time, and return the rows found. Keys are tuples of one or more
+    values.
+    '''
+    rows = []
+    keys = list(keys)
+    for start in range(0, len(keys), LOOKUP_CHUNK):
+        chunk = keys[start:start + LOOKUP_CHUNK]
+        size = len(chunk[0])
+        placeholders = ', '.join(['(%s)' % ', '.join('?' * size)] * len(chunk))
+        cur.execute(query % placeholders, [value for key in chunk for value in key])
+        rows.extend(cur.fetchall())
+    return rows
+
+class BulkImporter(object):
+    '''
+    Imports streams of records into a MusicDatabase, batch_size records per
+    transaction. progress, if given, is called after every batch with the
+    kind of the records and the counters of the import so far.
+
+    The references already resolved are remembered for the life of the
+    importer, so a batch only looks up the values it has not seen before.
+    '''
+
+    def __init__(self, db, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+        super(BulkImporter, self).__init__()
+        if batch_size < 1:
+            raise ValueError("The batch size must be at least 1")
+        self.db = db
+        self.batch_size = batch_size
+        self.progress = progress
+        self._artists = set()
+        self._users = set()
+        self._playlists = set()
+        self._songs = {}
+
+    def import_records(self, kind, records):
+        '''
+        Import the records (dictionaries) of kind. Return the counters of the
+        import: records read, imported, skipped (already existing) and
+        rejected, and the seconds it took.
+        '''
+        if kind not in KINDS:
+            raise ValueError("Unknown kind of records %s" % kind)
+        table, fields = KINDS[kind]
+        counters = {'read': 0, 'imported': 0, 'skipped': 0, 'rejected': 0,
+                    'seconds': 0.0}
+        start = time.time()
+        with self.db.bulk_load(table) as con:
+            cur = con.cursor()
+            batch = []
+            for record in records:
+                counters['read'] += 1
+                values = _convert(record, fields)
+                if values is None:
+                    counters['rejected'] += 1
+                    continue
+                batch.append(values)
+                if len(batch) == self.batch_size:
+                    self._insert(cur, kind, batch, counters)
+                    con.commit()
+                    self._report(kind, counters, start)
+                    batch = []
+            if batch:
+                self._insert(cur, kind, batch, counters)
+                con.commit()
+                self._report(kind, counters, start)
+        counters['seconds'] = time.time() - start
+        return counters
+
+    def import_file(self, kind, path, format=None):
+        '''
+        Import the records of kind stored in a CSV or JSONL file.
+        '''
+        return self.import_records(kind, read_records(path, format))
+
+    def _report(self, kind, counters, start):
+        counters['seconds'] = time.time() - start
+        if self.progress is not None:
+            self.progress(kind, counters)
+
+    def _insert(self, cur, kind, batch, counters):
+        '''
+        Resolve the references of batch, insert the rows that can be
+        inserted and update counters.
+        '''
+        if kind == 'songs':
+            self._resolve_artists(cur, set(row[1] for row in batch))
+            rows = [row for row in batch if row[1] in self._artists]
+        elif kind == 'playlists':
+            self._resolve_users(cur, set(row[1] for row in batch))
+            rows = [row for row in batch if row[1] in self._users]
+        elif kind == 'playlist_songs':
+            self._resolve_playlists(cur, set((row[0], row[1]) for row in batch))
+            self._resolve_songs(cur, set((row[2], row[3]) for row in batch))
+            rows = [(self._songs[(artist, title)], playlist, user, added_on)
+                    for playlist, user, artist, title, added_on in batch
+                    if (playlist, user) in self._playlists and (artist, title) in self._songs]
+        else:
+            rows = batch
+        counters['rejected'] += len(batch) - len(rows)
+        if not rows:
+            return
+        cur.executemany(STATEMENTS[kind], rows)
+        counters['imported'] += cur.rowcount
+        counters['skipped'] += len(rows) - cur.rowcount
+        if kind == 'artists':
+            self._artists.update(row[0] for row in rows)
+        elif kind == 'playlists':
+            self._playlists.update((row[0], row[1]) for row in rows)
+
+    def _resolve_artists(self, cur, names):
+        missing = [(name,) for name in names if name not in self._artists]
+        if missing:
+            rows = _lookup(cur, 'SELECT legalName FROM artists WHERE legalName IN (VALUES %s)', missing)
+            self._artists.update(row[0] for row in rows)
+
+    def _resolve_users(self, cur, nicknames):
+        missing = [(nickname,) for nickname in nicknames if nickname not in self._users]
+        if missing:
+            rows = _lookup(cur, 'SELECT nickname FROM users WHERE nickname IN (VALUES %s)', missing)
+            self._users.update(row[0] for row in rows)
+
+    def _resolve_playlists(self, cur, keys):
+        missing = [key for key in keys if key not in self._playlists]
+        if missing:
+            rows = _lookup(cur, 'SELECT name, author FROM playlists\
+                                 WHERE (name, author) IN (VALUES %s)', missing)
+            self._playlists.update((row[0], row[1]) for row in rows)
+
+    def _resolve_songs(self, cur, keys):
+        #A title may appear more than once for an artist: the first song wins.
+        missing = [key for key in keys if key not in self._songs]
+        if missing:
+            rows = _lookup(cur, 'SELECT byArtist, name, MIN(sid) FROM songs\
+                                 WHERE (byArtist, name) IN (VALUES %s) GROUP BY byArtist, name', missing)
+            self._songs.update(((row[0], row[1]), row[2]) for row in rows)
+
+def print_progress(kind, counters):
+    '''
+    Progress callback that writes one line per batch to stderr.
+    '''
+    seconds = max(counters['seconds'], 1e-6)
+    sys.stderr.write('%s: %d read, %d imported, %d skipped, %d rejected (%.0f records/s)\n'
+                     % (kind, counters['read'], counters['imported'], counters['skipped'],
+                        counters['rejected'], counters['read'] / seconds))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk import of catalogue data from CSV or JSONL files.')
+    for kind in IMPORT_ORDER:
+        parser.add_argument('--' + kind.replace('_', '-'), dest=kind, metavar='PATH',
+                            help='file with the %s to import' % kind.replace('_', ' '))
+    parser.add_argument('--db', default=database.DEFAULT_DB_PATH,
+                        help='database file (default: %(default)s)')
+    parser.add_argument('--format', choices=('csv', 'jsonl'),
+                        help='format of the files (default: from the extension)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='records per transaction (default: %(default)s)')
+    parser.add_argument('--quiet', action='store_true', help='do not report progress')
+    args = parser.parse_args(argv)
+    paths = [(kind, getattr(args, kind)) for kind in IMPORT_ORDER if getattr(args, kind)]
+    if not paths:
+        parser.error('give at least one file to import')
+
+    if not os.path.exists(args.db):
+        parser.error('the database %s does not exist' % args.db)
+
+    db = database.MusicDatabase(args.db)
+    db.apply_migrations()
+    importer = BulkImporter(db, args.batch_size, None if args.quiet else print_progress)
+    try:
+        for kind, path in paths:
+            counters = importer.import_file(kind, path, args.format)
+            print('%s: %d imported, %d skipped, %d rejected in %.1f s'
+                  % (kind, counters['imported'], counters['skipped'],
+                     counters['rejected'], counters['seconds']))
+        start = time.time()
+        artists = db.rebuild_similarity_index()
+        print('similarity index: %d artists in %.1f s' % (artists, time.time() - start))
+    finally:
+        db.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+from collections import OrderedDict
+import threading, time
+
+#Default bounds of the entity caches of MusicDatabase.
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_CACHE_TTL = 30.0
+
+#Returned by LRUCache.get when the key is not cached.
+MISSING = object()
+
+class LRUCache(object):
+    '''
+    Thread-safe in-process cache with a least-recently-used eviction policy.
+
+    At most max_size entries are kept and every entry expires ttl seconds
+    after it was stored (None means no expiration). The cache counts hits,
+    misses, evictions (entries dropped to make room), expirations and
+    invalidations.
+
+    Every invalidation bumps a generation counter. A reader takes the
+    generation before reading the database and passes it to set(); if the
+    entry was invalidated in between, the value read may be stale and is not
+    stored.
+    '''
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL,
+                 clock=time.monotonic):
+        super(LRUCache, self).__init__()
+        if max_size < 1:
+            raise ValueError("The cache size must be at least 1")
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0,
+                          'expirations': 0, 'invalidations': 0}
+
+    def get(self, key):
+        '''
+        Return the value cached for key or MISSING.
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > self._clock():
+                    self._entries.move_to_end(key)
+                    self._counters['hits'] += 1
+                    return value
+                del self._entries[key]
+                self._counters['expirations'] += 1
+            self._counters['misses'] += 1
+            return MISSING
+
+    def set(self, key, value, generation=None):
+        '''
+        Store value for key, evicting the least recently used entry if the
+        cache is full. If generation is given and an invalidation happened
+        since it was read, nothing is stored.
+        '''
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            expires = None if self.ttl is None else self._clock() + self.ttl
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def invalidate(self, *keys):
+        '''
+        Drop the entries of keys.
+        '''
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self._counters['invalidations'] += 1
+
+    def invalidate_if(self, predicate):
+        '''
+        Drop every entry whose key satisfies predicate.
+        '''
+        with self._lock:
+            self.generation += 1
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+                self._counters['invalidations'] += 1
+
+    def clear(self):
+        '''
+        Drop every entry. The counters are kept.
+        '''
+        with self._lock:
+            self.generation += 1
+            self._counters['invalidations'] += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        '''
+        Return a dictionary with the size and the counters of the cache.
+        '''
+        with self._lock:
+            stats = dict(self._counters)
+            stats['size'] = len(self._entries)
+        stats['max_size'] = self.max_size
+        stats['ttl'] = self.ttl
+        return stats
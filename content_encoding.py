@@ -0,0 +1,164 @@
+'''
+Compression of the responses of a Flask application, negotiated with the
+Accept-Encoding header of the request.
+
+init_app adds to an application a hook that compresses its textual
+responses (JSON, Collection+JSON, HAL, text) with the first encoding of
+ENCODINGS that is installed and accepted by the client: zstd (zstandard
+package), br (brotli package) or gzip. The application config sets:
+
+    COMPRESS_MIN_SIZE   smallest body compressed, in bytes (DEFAULT_MIN_SIZE);
+                        smaller bodies are sent as they are
+    COMPRESS_LEVELS     {encoding: level} (DEFAULT_LEVELS)
+    COMPRESS_MIMETYPES  media types compressed (DEFAULT_MIMETYPES)
+
+Streamed responses (see resources.stream_collection) are compressed chunk
+by chunk: every chunk is flushed, so the client still gets the items as
+they are read. Their size is not known in advance, so they are compressed
+whatever it is. Responses that already have a Content-Encoding, file
+responses and responses without body (HEAD, 204, 304) are left alone.
+'''
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+#Encodings by preference, when the client accepts several.
+ENCODINGS = [encoding for encoding, module in (('zstd', zstandard), ('br', brotli), ('gzip', zlib))
+             if module is not None]
+
+#Below about 1 KB the bytes saved do not pay for the work of compressing.
+DEFAULT_MIN_SIZE = 1024
+#Fast levels: the bodies are compressed for every request. On a page of
+#1000 artists (270 KB) gzip 3 takes 1 ms for 15.6 KB, gzip 6 2.4 ms for
+#12.9 KB.
+DEFAULT_LEVELS = {'gzip': 3, 'br': 4, 'zstd': 3}
+DEFAULT_MIMETYPES = ('application/json', 'application/vnd.collection+json',
+                     'application/hal+json', 'text/plain', 'text/html')
+
+class StreamCompressor(object):
+    '''
+    Incremental compressor of one response with encoding at level.
+    compress() returns the compressed bytes of a chunk, with flush flushed
+    so the client can decompress everything sent so far; finish() returns
+    the end of the stream.
+    '''
+
+    def __init__(self, encoding, level):
+        super(StreamCompressor, self).__init__()
+        if encoding not in ENCODINGS:
+            raise ValueError("Unknown or not installed encoding %s" % encoding)
+        self.encoding = encoding
+        if encoding == 'gzip':
+            #wbits 31: a gzip header and trailer around the deflate stream.
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        elif encoding == 'br':
+            self._compressor = brotli.Compressor(quality=level)
+        else:
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data, flush=True):
+        if self.encoding == 'br':
+            compressed = self._compressor.process(data)
+            return compressed + self._compressor.flush() if flush else compressed
+        compressed = self._compressor.compress(data)
+        if not flush:
+            return compressed
+        if self.encoding == 'gzip':
+            return compressed + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        return compressed + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+def compress(data, encoding, level):
+    '''
+    Return data compressed with encoding at level, in one piece.
+    '''
+    compressor = StreamCompressor(encoding, level)
+    return compressor.compress(data, flush=False) + compressor.finish()
+
+def compress_stream(chunks, encoding, level):
+    '''
+    Generator of the compressed chunks of the iterable chunks. The iterable
+    is closed when the generator is.
+    '''
+    compressor = StreamCompressor(encoding, level)
+    try:
+        for chunk in chunks:
+            if chunk:
+                yield compressor.compress(chunk)
+        yield compressor.finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+def choose_encoding(accept_encodings):
+    '''
+    Return the first encoding of ENCODINGS accepted (quality above zero) in
+    accept_encodings, a werkzeug Accept object, or None.
+    '''
+    for encoding in ENCODINGS:
+        if accept_encodings.quality(encoding) > 0:
+            return encoding
+    return None
+
+def compress_response(response, accept_encodings, config):
+    '''
+    Compress the body of response, if it should be (see the module), with
+    the encoding negotiated from accept_encodings. config holds the
+    settings. Return response.
+    '''
+    if response.status_code < 200 or response.status_code in (204, 304) or \
+       response.direct_passthrough or 'Content-Encoding' in response.headers or \
+       response.mimetype not in config.get('COMPRESS_MIMETYPES', DEFAULT_MIMETYPES):
+        return response
+    min_size = config.get('COMPRESS_MIN_SIZE', DEFAULT_MIN_SIZE)
+    streamed = response.is_streamed
+    if not streamed and (response.calculate_content_length() or 0) < min_size:
+        return response
+    #From here the body depends on Accept-Encoding.
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(accept_encodings)
+    if encoding is None:
+        return response
+    level = config.get('COMPRESS_LEVELS', DEFAULT_LEVELS).get(encoding, DEFAULT_LEVELS[encoding])
+    if streamed:
+        response.response = compress_stream(response.response, encoding, level)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        compressed = compress(data, encoding, level)
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    #A strong ETag names one sequence of bytes, which now depends on the
+    #encoding.
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag('%s-%s' % (etag, encoding))
+    return response
+
+def init_app(app):
+    '''
+    Add to the Flask application app the hook that compresses its
+    responses. Hooks added after this one see the uncompressed body.
+    '''
+    from flask import request
+
+    @app.after_request
+    def compress_body(response):
+        if request.method == 'HEAD':
+            return response
+        return compress_response(response, request.accept_encodings, app.config)
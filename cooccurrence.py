@@ -0,0 +1,382 @@
+'''
+Song to song co-occurrence ("listeners also added") computed from the songs
+of the playlists.
+
+The playlists form a sparse incidence matrix A with one row per sid and one
+column per playlist. The co-occurrence of two songs, the number of playlists
+that contain both, is the entry of A A^T. Only the top_k songs that co-occur
+the most with every song are kept, as compressed rows: the sorted sids of
+the songs that have a row, the offsets of the rows and the flat arrays of
+the related sids and their counts, so the size of the index follows the
+songs in playlists and not the largest sid. They are saved as .npy files and
+opened as memory maps, so a lookup is a binary search and a slice.
+
+A full build writes one layer with every song. An update writes a layer
+with only the songs whose co-occurrences changed, on top of the previous
+ones (the newest layer that has a song holds its row), so its output does
+not grow with the catalogue. When there are more than MAX_LAYERS layers the
+update merges them into one.
+
+Build or update the index from the main folder with:
+
+    python -m cooccurrence [--full] [--db PATH] [--path FOLDER] [--top-k K]
+
+A full build reads every row of song_in_playlist. An update reads the songs
+added to or removed from playlists since the last run, logged by triggers
+in playlist_changes, and recomputes the songs of the changed playlists from
+the playlists that contain them. It runs a full build instead if the log
+asks for it (see MusicDatabase.bulk_load). Each run removes the changes it
+has read, so a database has one index.
+
+NumPy and SciPy are optional: they are only needed to build and read the
+index (pip install numpy scipy).
+'''
+import argparse, json, os, re, time
+from array import array
+
+import database
+
+try:
+    import numpy
+    from scipy import sparse
+except ImportError:
+    numpy = sparse = None
+
+#Folder of the index files, next to the database.
+DEFAULT_PATH = os.path.join(database.BASE_DIR, 'db', 'cooccurrence')
+
+#Related songs kept per song.
+DEFAULT_TOP_K = 20
+
+#Rows of A A^T computed at a time, which bounds the memory of a build.
+ROWS_PER_CHUNK = 10000
+
+#Layers stacked by the updates before they are merged into one.
+MAX_LAYERS = 8
+
+#Files of a layer: sids of its rows, offsets of the rows, related sids and
+#their counts.
+LAYER_FILES = ('rows', 'offsets', 'related', 'counts')
+
+#Every build writes a new generation of the files and then replaces
+#meta.json, so readers never see a partially written index.
+META_FILE = 'meta.json'
+GENERATION_FILE = re.compile(r'^(\w+)-(\d+)\.(npy|json)$')
+
+def _require():
+    if numpy is None:
+        raise ImportError("numpy and scipy are needed by the co-occurrence index")
+
+def _file(path, name, generation, extension='npy'):
+    return os.path.join(path, '%s-%d.%s' % (name, generation, extension))
+
+def read_meta(path=DEFAULT_PATH):
+    '''
+    Return the description of the last build stored in path (generation,
+    layers, top_k, last_change and built_on), or None if the index has not
+    been built, or was built in a format of older versions.
+    '''
+    try:
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    return meta if 'last_change' in meta else None
+
+def _load_layer(path, generation, mmap_mode='r'):
+    return tuple(numpy.load(_file(path, name, generation), mmap_mode=mmap_mode)
+                 for name in LAYER_FILES)
+
+class CooccurrenceIndex(object):
+    '''
+    Read-only view of the last build of the index stored in path. The arrays
+    are memory-mapped: opening the index is cheap and the pages are shared
+    by every process that reads it.
+    '''
+
+    def __init__(self, path=DEFAULT_PATH):
+        super(CooccurrenceIndex, self).__init__()
+        _require()
+        self.path = path
+        self.meta = read_meta(path)
+        if self.meta is None:
+            raise FileNotFoundError("There is no co-occurrence index in %s" % path)
+        self.top_k = self.meta['top_k']
+        #Newest first.
+        self.layers = [_load_layer(path, generation) for generation in reversed(self.meta['layers'])]
+
+    def related(self, sid, limit=None):
+        '''
+        Return at most limit (by default top_k) songs added to the playlists
+        that contain the song sid, as (sid, count) pairs, where count is the
+        number of playlists with both songs. The largest counts come first.
+        '''
+        limit = self.top_k if limit is None else min(limit, self.top_k)
+        for rows, offsets, related, counts in self.layers:
+            i = int(numpy.searchsorted(rows, sid))
+            if i < len(rows) and rows[i] == sid:
+                start = int(offsets[i])
+                end = min(int(offsets[i + 1]), start + limit)
+                return list(zip(related[start:end].tolist(), counts[start:end].tolist()))
+        return []
+
+#Path -> (modification time of meta.json, CooccurrenceIndex)
+_opened = {}
+
+def get_index(path=DEFAULT_PATH):
+    '''
+    Return the CooccurrenceIndex stored in path, or None if it has not been
+    built or numpy is not installed. The index is opened once per process
+    and opened again when a newer build replaces it.
+    '''
+    if numpy is None:
+        return None
+    try:
+        mtime = os.stat(os.path.join(path, META_FILE)).st_mtime_ns
+    except OSError:
+        return None
+    opened = _opened.get(path)
+    if opened is None or opened[0] != mtime:
+        try:
+            opened = (mtime, CooccurrenceIndex(path))
+        except OSError:
+            #A build replaced the files while they were opened; the next
+            #call opens the new ones.
+            return opened[1] if opened is not None else None
+        _opened[path] = opened
+    return opened[1]
+
+def _read_entries(entries):
+    '''
+    Read the playlist entries, (sid, pl_user, pl_name) tuples. Return the
+    array of their sids, the array of their playlist columns (every
+    playlist is given the next free column) and the number of playlists.
+    '''
+    sids = array('q')
+    columns = array('q')
+    playlists = {}
+    for sid, user, name in entries:
+        if sid is None:
+            continue
+        column = playlists.get((user, name))
+        if column is None:
+            column = playlists[(user, name)] = len(playlists)
+        sids.append(sid)
+        columns.append(column)
+    return (numpy.array(sids, dtype=numpy.int64),
+            numpy.array(columns, dtype=numpy.int64), len(playlists))
+
+def _incidence(sids, columns, shape):
+    '''
+    Return the incidence matrix (CSR) with a 1 in every (sid, column).
+    '''
+    data = numpy.ones(len(sids), dtype=numpy.int32)
+    matrix = sparse.csr_matrix((data, (sids, columns)), shape=shape)
+    matrix.data[:] = 1
+    return matrix
+
+def _top_related(matrix, rows, top_k):
+    '''
+    Return the layer (rows, offsets, related sids, counts) with the top_k
+    largest entries of the rows of matrix A A^T; rows must be sorted. Songs
+    are not related to themselves; ties are broken by the smallest sid.
+    '''
+    lengths = numpy.zeros(len(rows), dtype=numpy.int64)
+    related = []
+    counts = []
+    transposed = matrix.T.tocsr()
+    for start in range(0, len(rows), ROWS_PER_CHUNK):
+        chunk = rows[start:start + ROWS_PER_CHUNK]
+        product = (matrix[chunk] @ transposed).tocsr()
+        #Flatten the product to (position in chunk, sid, count) triples,
+        #sort them by position and count and keep the first top_k of each
+        #position.
+        position = numpy.repeat(numpy.arange(len(chunk)), numpy.diff(product.indptr))
+        sids = product.indices.astype(numpy.int64)
+        values = product.data
+        keep = sids != chunk[position]
+        position, sids, values = position[keep], sids[keep], values[keep]
+        order = numpy.lexsort((sids, -values, position))
+        position, sids, values = position[order], sids[order], values[order]
+        first = numpy.searchsorted(position, numpy.arange(len(chunk)))
+        rank = numpy.arange(len(position)) - first[position]
+        top = rank < top_k
+        lengths[start:start + len(chunk)] = numpy.bincount(position[top], minlength=len(chunk))
+        related.append(sids[top])
+        counts.append(values[top].astype(numpy.int32))
+    offsets = numpy.zeros(len(rows) + 1, dtype=numpy.int64)
+    numpy.cumsum(lengths, out=offsets[1:])
+    return (numpy.asarray(rows, dtype=numpy.int64), offsets,
+            numpy.concatenate(related) if related else numpy.zeros(0, dtype=numpy.int64),
+            numpy.concatenate(counts) if counts else numpy.zeros(0, dtype=numpy.int32))
+
+def _compute_layer(sids, columns, playlists, rows, top_k):
+    '''
+    Return the layer of the songs rows (sorted sids) computed from the
+    playlist entries (sids, columns). The songs are numbered again in the
+    matrix, so its size follows the entries and not the largest sid.
+    '''
+    universe = numpy.union1d(sids, rows)
+    matrix = _incidence(numpy.searchsorted(universe, sids), columns, (len(universe), playlists))
+    _rows, offsets, related, counts = _top_related(matrix, numpy.searchsorted(universe, rows), top_k)
+    return rows, offsets, universe[related], counts
+
+def _merge(layers):
+    '''
+    Merge layers, oldest first, into one: every song keeps the row of the
+    newest layer that has it, and empty rows are dropped.
+    '''
+    sids = numpy.concatenate([layer[0] for layer in layers])
+    priority = numpy.concatenate([numpy.full(len(layer[0]), -i, dtype=numpy.int64)
+                                  for i, layer in enumerate(layers)])
+    position = numpy.concatenate([numpy.arange(len(layer[0]), dtype=numpy.int64)
+                                  for layer in layers])
+    #Start of every row in the concatenation of the flat arrays.
+    base = numpy.cumsum([0] + [len(layer[2]) for layer in layers])
+    starts = numpy.concatenate([numpy.asarray(layer[1][:-1]) + base[i]
+                                for i, layer in enumerate(layers)])
+    lengths = numpy.concatenate([numpy.diff(layer[1]) for layer in layers])
+    order = numpy.lexsort((priority, sids))
+    newest = numpy.ones(len(order), dtype=bool)
+    newest[1:] = sids[order][1:] != sids[order][:-1]
+    chosen = order[newest]
+    chosen = chosen[lengths[chosen] > 0]
+    offsets = numpy.zeros(len(chosen) + 1, dtype=numpy.int64)
+    numpy.cumsum(lengths[chosen], out=offsets[1:])
+    flat = numpy.repeat(starts[chosen] - offsets[:-1], lengths[chosen]) + numpy.arange(offsets[-1])
+    related = numpy.concatenate([layer[2] for layer in layers])[flat]
+    counts = numpy.concatenate([layer[3] for layer in layers])[flat]
+    return sids[chosen], offsets, related, counts
+
+def _save(path, generation, layer, layers, meta):
+    '''
+    Write layer as generation of the index to path, make the stack layers
+    (generations, oldest first) the current index and remove the files of
+    the generations that neither the current nor the previous index use.
+    '''
+    os.makedirs(path, exist_ok=True)
+    previous = read_meta(path)
+    for name, values in zip(LAYER_FILES, layer):
+        numpy.save(_file(path, name, generation), values)
+    meta = dict(meta, generation=generation, layers=layers, built_on=time.time())
+    temporary = os.path.join(path, META_FILE + '.tmp')
+    with open(temporary, 'w') as f:
+        json.dump(meta, f)
+    os.replace(temporary, os.path.join(path, META_FILE))
+    #Readers may still have the files of the previous index mapped, and
+    #Windows does not remove a mapped file: they are kept until the next
+    #build. Files of older ones that are still open there (PermissionError)
+    #are left for a later build too.
+    used = set(layers) | set([generation])
+    if previous is not None:
+        used |= set(previous['layers']) | set([previous['generation']])
+    for filename in os.listdir(path):
+        match = GENERATION_FILE.match(filename)
+        if match and int(match.group(2)) not in used:
+            try:
+                os.remove(os.path.join(path, filename))
+            except OSError:
+                pass
+
+def _next_generation(path):
+    '''
+    Return the generation of the next build in path: one more than the
+    last one, even if it was written in an older format.
+    '''
+    try:
+        with open(os.path.join(path, META_FILE)) as f:
+            return json.load(f)['generation'] + 1
+    except FileNotFoundError:
+        return 1
+
+def build(db, path=DEFAULT_PATH, top_k=DEFAULT_TOP_K):
+    '''
+    Build the whole index from the playlists of the MusicDatabase db. Return
+    the counters of the build: playlist entries read, songs whose related
+    songs were computed, playlists, and the seconds it took.
+    '''
+    _require()
+    if top_k < 1:
+        raise ValueError("top_k must be a positive integer")
+    start = time.time()
+    #Changes logged while the entries are read are read again by the next
+    #update, which computes their songs again.
+    last_change = db.get_last_playlist_change()
+    sids, columns, playlists = _read_entries(entry[:3] for entry in db.iter_playlist_entries())
+    rows = numpy.unique(sids)
+    generation = _next_generation(path)
+    _save(path, generation, _compute_layer(sids, columns, playlists, rows, top_k), [generation],
+          {'top_k': top_k, 'last_change': last_change})
+    db.delete_playlist_changes(last_change)
+    return {'entries': len(sids), 'songs': len(rows), 'playlists': playlists,
+            'seconds': time.time() - start}
+
+def update(db, path=DEFAULT_PATH):
+    '''
+    Recompute, in a new layer, the related songs of the songs added to or
+    removed from playlists since the last build or update and of the other
+    songs of those playlists. Build the whole index if it has not been
+    built or if the change log asks for it. Return the counters of the
+    update, as build, with the changes read as entries.
+    '''
+    _require()
+    meta = read_meta(path)
+    if meta is None:
+        return build(db, path)
+    start = time.time()
+    changes = db.get_playlist_changes(meta['last_change'])
+    if any(user is None for _id, _song, user, _name in changes):
+        return build(db, path, meta['top_k'])
+    counters = {'entries': len(changes), 'songs': 0, 'playlists': 0}
+    if changes:
+        generation = meta['generation']
+        #Every song of a changed playlist has new co-occurrences, and so
+        #has a song removed from it.
+        changed = set((user, name) for _id, _song, user, name in changes)
+        rows = set(song for _id, song, _user, _name in changes if song is not None)
+        rows.update(db.iter_playlist_songs(changed))
+        rows = numpy.array(sorted(rows), dtype=numpy.int64)
+        sids, columns, playlists = _read_entries(db.iter_cooccurring_entries(rows.tolist()))
+        layer = _compute_layer(sids, columns, playlists, rows, meta['top_k'])
+        layers = meta['layers'] + [generation + 1]
+        if len(layers) > MAX_LAYERS:
+            layer = _merge([_load_layer(path, g) for g in meta['layers']] + [layer])
+            layers = [generation + 1]
+        _save(path, generation + 1, layer, layers,
+              {'top_k': meta['top_k'], 'last_change': changes[-1][0]})
+        db.delete_playlist_changes(changes[-1][0])
+        counters['songs'] = len(rows)
+        counters['playlists'] = playlists
+    counters['seconds'] = time.time() - start
+    return counters
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the song co-occurrence index of the playlists.')
+    parser.add_argument('--full', action='store_true',
+                        help='rebuild the whole index instead of applying the logged playlist changes')
+    parser.add_argument('--db', default=database.DEFAULT_DB_PATH,
+                        help='database file (default: %(default)s)')
+    parser.add_argument('--path', default=DEFAULT_PATH,
+                        help='folder of the index (default: %(default)s)')
+    parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K,
+                        help='related songs kept per song on a full build (default: %(default)s)')
+    args = parser.parse_args(argv)
+    if numpy is None:
+        parser.error('numpy and scipy are needed to build the index')
+    if not os.path.exists(args.db):
+        parser.error('the database %s does not exist' % args.db)
+
+    db = database.MusicDatabase(args.db)
+    db.apply_migrations()
+    try:
+        if args.full:
+            counters = build(db, args.path, args.top_k)
+        else:
+            counters = update(db, args.path)
+    finally:
+        db.close()
+    print('%d entries read, %d songs updated, %d playlists in %.1f s'
+          % (counters['entries'], counters['songs'], counters['playlists'], counters['seconds']))
+
+if __name__ == '__main__':
+    main()
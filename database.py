@@ -1,27 +1,763 @@
+from contextlib import contextmanager
 from datetime import datetime
-import time, sqlite3, sys, re, os
+import time, sqlite3, sys, re, os, queue, threading, json, base64, inspect, itertools
 
-# Get the current working directory
-cwd = os.getcwd()
+from cache import LRUCache, MISSING, DEFAULT_CACHE_SIZE, DEFAULT_CACHE_TTL
+from records import Record, Artist, Song, User, Playlist
+import instrumentation
+
+#Folder of this module: the default paths do not depend on the directory the
+#server or the tests are started from.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 #Default paths for .db and .sql files to create and populate the database.
-DEFAULT_DB_PATH = os.path.join(cwd, 'db', 'musicdb.db')
-DEFAULT_SCHEMA = os.path.join(cwd, 'db', 'schema_dump.sql')
-DEFAULT_DATA_DUMP = os.path.join(cwd, 'db', 'musicfinder_data_dump.sql')
+DEFAULT_DB_PATH = os.path.join(BASE_DIR, 'db', 'musicdb.db')
+DEFAULT_SCHEMA = os.path.join(BASE_DIR, 'db', 'schema_dump.sql')
+DEFAULT_DATA_DUMP = os.path.join(BASE_DIR, 'db', 'musicfinder_data_dump.sql')
+#Folder with the versioned schema migrations (NNNN_description.sql). The
+#version of the database is kept in PRAGMA user_version.
+DEFAULT_MIGRATIONS = os.path.join(BASE_DIR, 'db', 'migrations')
+MIGRATION_FILE = re.compile(r'^(\d+)_[\w-]+\.sql$')
+
+#Number of results returned by the full-text searches if no limit is given.
+DEFAULT_SEARCH_LIMIT = 20
+
+#Weights of the artist similarity: same genre, same language, same country
+#and share of the playlists of an artist that also contain the other one.
+SIMILARITY_WEIGHTS = {'genre': 1.0, 'language': 0.3, 'foundingLocation': 0.2,
+                      'playlists': 2.0}
+#Neighbours kept per artist in artist_similarity.
+SIMILAR_ARTISTS = 50
+#Most recent playlists of an artist used to count its co-occurrences.
+SIMILARITY_PLAYLISTS = 1000
+#Queued artists recomputed per transaction by the similarity refresh (see
+#the similarity module), so a burst of playlist changes does not hold the
+#write lock for long.
+SIMILARITY_REFRESH_BATCH = 100
+#Number of recommended songs if no limit is given, and songs taken from
+#each recommended artist.
+DEFAULT_RECOMMENDATIONS_LIMIT = 20
+RECOMMENDED_SONGS_PER_ARTIST = 3
+
+#Number of songs or artists returned by the statistics if no limit is given.
+DEFAULT_STATISTICS_LIMIT = 20
+#Attributes of the users by which the genre statistics are grouped.
+STATISTICS_DIMENSIONS = ('nationality', 'gender', 'age')
+#Tables whose rows the statistics summaries are computed from, and the
+#statements that compute the summaries again from them (see
+#db/migrations/0007_playlist_statistics.sql).
+STATISTICS_SOURCES = ('song_in_playlist', 'songs', 'artists', 'users')
+STATISTICS_REBUILD = [
+    'DELETE FROM song_stats',
+    'DELETE FROM artist_stats',
+    'DELETE FROM genre_stats',
+    'DELETE FROM daily_stats',
+    'INSERT INTO song_stats (song, plays)\
+     SELECT song, COUNT(*) FROM song_in_playlist GROUP BY song',
+    'INSERT INTO artist_stats (artist, plays)\
+     SELECT s.byArtist, COUNT(*) FROM song_in_playlist e JOIN songs s ON s.sid = e.song\
+     WHERE s.byArtist IS NOT NULL GROUP BY s.byArtist',
+    'INSERT INTO genre_stats (dimension, value, genre, plays)\
+     SELECT dimension, value, genre, COUNT(*) FROM playlist_genre_facts\
+     GROUP BY dimension, value, genre',
+    'INSERT INTO daily_stats (day, additions)\
+     SELECT CAST(added_on AS INTEGER) / 86400, COUNT(*) FROM song_in_playlist\
+     WHERE added_on IS NOT NULL GROUP BY CAST(added_on AS INTEGER) / 86400',
+]
+
+#Rows read per fetchmany call by the generators that stream collections.
+DEFAULT_FETCH_SIZE = 500
+
+#Compiled statements kept by every connection. The keyset queries built from
+#the filters of the collections have many variants, so the default of
+#sqlite3 (128) would keep evicting them.
+DEFAULT_CACHED_STATEMENTS = 512
+
+#Modes of MusicDatabase._execute.
+QUERY_MODES = ('one', 'all', 'iter', 'execute', 'many')
+#Largest list of values bound in one IN (...) clause.
+MAX_BOUND_LIST = 512
+
+#Default settings of the connection pool.
+DEFAULT_POOL_SIZE = 5
+DEFAULT_CHECKOUT_TIMEOUT = 5.0
+DEFAULT_BUSY_TIMEOUT = 5000
+
+#Pragma profiles applied to every new connection, in order. The "wal" profile
+#lets many readers run alongside one writer: readers see the last committed
+#snapshot while the writer appends to the write-ahead log. The "rollback"
+#profile keeps sqlite's defaults.
+PRAGMA_PROFILES = {
+    'wal': [
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'NORMAL'),
+        ('cache_size', -16000),
+        ('mmap_size', 134217728),
+        ('temp_store', 'MEMORY'),
+        ('busy_timeout', DEFAULT_BUSY_TIMEOUT),
+        ('wal_autocheckpoint', 1000),
+    ],
+    'rollback': [
+        ('journal_mode', 'DELETE'),
+        ('synchronous', 'FULL'),
+        ('busy_timeout', DEFAULT_BUSY_TIMEOUT),
+    ],
+    #Readers of the in-memory copies of a CatalogueReplica.
+    'memory': [
+        ('query_only', 'ON'),
+        ('temp_store', 'MEMORY'),
+    ],
+}
+DEFAULT_PRAGMA_PROFILE = 'wal'
+
+#Number of write transactions between two passive WAL checkpoints run by the
+#pool. None disables them and leaves only wal_autocheckpoint.
+DEFAULT_CHECKPOINT_INTERVAL = 500
+DEFAULT_CHECKPOINT_MODE = 'PASSIVE'
+CHECKPOINT_MODES = ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE')
+
+#Tables read from the catalogue replica, and the seconds between two checks
+#of the database file for changes made by other connections.
+REPLICA_TABLES = ('artists', 'songs')
+DEFAULT_REPLICA_CHECK_INTERVAL = 1.0
+#Name of each in-memory copy: the replica and the copy numbers keep the
+#copies of one process apart.
+REPLICA_URI = 'file:musicfinder-replica-%d-%d?mode=memory&cache=shared'
+_replica_ids = itertools.count(1)
+
+def resolve_pragmas(pragmas=None, busy_timeout=None):
+    '''
+    Return the pragma profile as a list of (name, value) pairs. pragmas is
+    either the name of a profile in PRAGMA_PROFILES, a dictionary or a list of
+    pairs; None selects DEFAULT_PRAGMA_PROFILE. A busy_timeout that is not
+    None replaces the one of the profile.
+    '''
+    if pragmas is None:
+        pragmas = DEFAULT_PRAGMA_PROFILE
+    if isinstance(pragmas, str):
+        try:
+            pragmas = PRAGMA_PROFILES[pragmas]
+        except KeyError:
+            raise ValueError("Unknown pragma profile %s" % pragmas)
+    elif isinstance(pragmas, dict):
+        pragmas = pragmas.items()
+    resolved = [(name, value) for name, value in pragmas if name != 'busy_timeout' or busy_timeout is None]
+    if busy_timeout is not None:
+        resolved.append(('busy_timeout', busy_timeout))
+    for name, value in resolved:
+        if not re.match(r'^[a-z_]+$', name) or not re.match(r'^-?[A-Za-z0-9_]+$', str(value)):
+            raise ValueError("Invalid pragma %s = %s" % (name, value))
+    return resolved
+
+def bind_list(values):
+    '''
+    Return the placeholders and the parameters that bind the list values in
+    an IN (...) clause. The parameters are padded with NULLs, which match
+    nothing, up to a power of two, so a handful of statements serve every
+    length and stay compiled in the statement cache.
+    '''
+    values = list(values)
+    size = 1
+    while size < len(values):
+        size *= 2
+    return ', '.join('?' * size), values + [None] * (size - len(values))
+
+def build_search_expression(text):
+    '''
+    Translate free text into an FTS5 query where every word is matched as a
+    prefix, e.g. 'indie ro' becomes '"indie"* "ro"*'. Words are quoted so
+    user input can never use the FTS5 query syntax. Return None if text has
+    no words.
+    '''
+    words = re.findall(r'\w+', text or '')
+    if not words:
+        return None
+    return ' '.join('"%s"*' % word for word in words)
+
+def encode_cursor(values):
+    '''
+    Encode the key values of a row as an opaque, url-safe pagination cursor.
+    '''
+    data = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, size):
+    '''
+    Decode a cursor created by encode_cursor that holds size key values.
+    Raise ValueError if the cursor is malformed.
+    '''
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(data.decode('utf-8'))
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError("Malformed cursor %s" % cursor)
+    if not isinstance(values, list) or len(values) != size or \
+       not all(isinstance(v, (str, int, float)) or v is None for v in values):
+        raise ValueError("Malformed cursor %s" % cursor)
+    return values
+
+class Page(list):
+    '''
+    List of objects returned by a paginated getter. next_cursor and
+    prev_cursor are the cursors of the following and previous pages, or None
+    if there is no such page.
+    '''
+
+    def __init__(self, objects=(), next_cursor=None, prev_cursor=None):
+        super(Page, self).__init__(objects)
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+class PoolTimeout(sqlite3.OperationalError):
+    '''
+    Raised when no pooled connection becomes free before the checkout timeout
+    expires.
+    '''
+
+class ConnectionPool(object):
+    '''
+    Bounded pool of long-lived sqlite3 connections to one database file.
+
+    Connections are opened lazily, up to size of them, and are configured
+    only once when they are created (foreign keys, row_factory and the
+    pragma profile, see resolve_pragmas). Each connection keeps up to
+    cached_statements compiled statements. A caller that finds every
+    connection checked out waits at most timeout seconds before PoolTimeout
+    is raised. Every checkpoint_interval write transactions the pool runs a
+    WAL checkpoint in checkpoint_mode on the connection that committed, and
+    on_write, if given, is called after each of them. With uri db_path is
+    an sqlite URI filename (e.g. an in-memory database).
+    '''
+
+    def __init__(self, db_path, size=DEFAULT_POOL_SIZE,
+                 timeout=DEFAULT_CHECKOUT_TIMEOUT,
+                 busy_timeout=None, pragmas=None,
+                 checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL,
+                 checkpoint_mode=DEFAULT_CHECKPOINT_MODE,
+                 cached_statements=DEFAULT_CACHED_STATEMENTS,
+                 on_write=None, uri=False):
+        super(ConnectionPool, self).__init__()
+        if size < 1:
+            raise ValueError("The pool size must be at least 1")
+        if checkpoint_mode not in CHECKPOINT_MODES:
+            raise ValueError("Unknown checkpoint mode %s" % checkpoint_mode)
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = resolve_pragmas(pragmas, busy_timeout)
+        self.busy_timeout = dict(self.pragmas).get('busy_timeout', DEFAULT_BUSY_TIMEOUT)
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_mode = checkpoint_mode
+        self.cached_statements = cached_statements
+        self.on_write = on_write
+        self.uri = uri
+        self._writes_since_checkpoint = 0
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        #Connection -> generation in which it was opened. close() bumps the
+        #generation so connections checked out at that time are discarded
+        #when they come back.
+        self._generation = 0
+        self._owners = {}
+        self._counters = {'created': 0, 'closed': 0, 'checkouts': 0,
+                          'waits': 0, 'timeouts': 0, 'writes': 0,
+                          'checkpoints': 0}
+
+    def _connect(self):
+        '''
+        Open a new connection and apply the per-connection configuration.
+        '''
+        con = sqlite3.connect(self.db_path, timeout=self.busy_timeout / 1000.0,
+                              check_same_thread=False,
+                              cached_statements=self.cached_statements,
+                              uri=self.uri)
+        con.row_factory = sqlite3.Row
+        with instrumentation.timer('pragmas', 'ConnectionPool.pragmas'):
+            con.execute('PRAGMA foreign_keys = ON')
+            for name, value in self.pragmas:
+                con.execute('PRAGMA %s = %s' % (name, value))
+        return con
+
+    def acquire(self):
+        '''
+        Check out a connection. The caller must give it back with release().
+        '''
+        try:
+            con = self._idle.get_nowait()
+        except queue.Empty:
+            con = None
+        if con is None:
+            with self._lock:
+                can_open = len(self._owners) < self.size
+                if can_open:
+                    #Reserve the slot before connecting outside the lock.
+                    placeholder = object()
+                    self._owners[placeholder] = self._generation
+            if can_open:
+                try:
+                    con = self._connect()
+                finally:
+                    with self._lock:
+                        generation = self._owners.pop(placeholder)
+                        if con is not None:
+                            self._owners[con] = generation
+                            self._counters['created'] += 1
+            else:
+                with self._lock:
+                    self._counters['waits'] += 1
+                try:
+                    con = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._counters['timeouts'] += 1
+                    raise PoolTimeout("No database connection available after %.1f seconds" % self.timeout)
+        with self._lock:
+            self._counters['checkouts'] += 1
+        return con
+
+    def release(self, con):
+        '''
+        Give back a connection obtained with acquire().
+        '''
+        if con.in_transaction:
+            con.rollback()
+        with self._lock:
+            stale = self._owners.get(con) != self._generation
+            if stale:
+                self._owners.pop(con, None)
+                self._counters['closed'] += 1
+        if stale:
+            con.close()
+        else:
+            self._idle.put(con)
+
+    @contextmanager
+    def connection(self):
+        '''
+        Context manager that checks out a connection and runs the block as
+        one transaction: it is committed on success and rolled back if an
+        exception is raised.
+        '''
+        con = self.acquire()
+        try:
+            changes = con.total_changes
+            with con:
+                yield con
+            if con.total_changes != changes:
+                self._after_write(con)
+        finally:
+            self.release(con)
+
+    def _after_write(self, con):
+        '''
+        Count a committed write transaction, run a checkpoint when the
+        checkpoint interval is reached and call on_write.
+        '''
+        with self._lock:
+            self._counters['writes'] += 1
+            self._writes_since_checkpoint += 1
+            due = (self.checkpoint_interval is not None and
+                   self._writes_since_checkpoint >= self.checkpoint_interval)
+            if due:
+                self._writes_since_checkpoint = 0
+        if due:
+            self.checkpoint(con)
+        if self.on_write is not None:
+            self.on_write()
+
+    def checkpoint(self, con=None, mode=None):
+        '''
+        Run a WAL checkpoint and return the (busy, log, checkpointed) row
+        reported by sqlite. A PASSIVE checkpoint never blocks readers or
+        writers; it copies as many frames as it can back to the database.
+        '''
+        mode = mode or self.checkpoint_mode
+        if mode not in CHECKPOINT_MODES:
+            raise ValueError("Unknown checkpoint mode %s" % mode)
+        if con is None:
+            with self.connection() as con:
+                return self.checkpoint(con, mode)
+        result = tuple(con.execute('PRAGMA wal_checkpoint(%s)' % mode).fetchone())
+        with self._lock:
+            self._counters['checkpoints'] += 1
+        return result
+
+    def close(self):
+        '''
+        Close every idle connection. Connections that are checked out are
+        closed as soon as they are released.
+        '''
+        with self._lock:
+            self._generation += 1
+        while True:
+            try:
+                con = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._owners.pop(con, None)
+                self._counters['closed'] += 1
+            con.close()
+
+    def stats(self):
+        '''
+        Return a dictionary with the current state and the counters of the
+        pool.
+        '''
+        with self._lock:
+            stats = dict(self._counters)
+            stats['size'] = self.size
+            stats['open'] = len(self._owners)
+        stats['idle'] = self._idle.qsize()
+        stats['in_use'] = stats['open'] - stats['idle']
+        return stats
+
+class _ReplicaCopy(object):
+    '''
+    One in-memory copy of a CatalogueReplica: the connection that keeps the
+    shared-cache database alive, the pool of its readers and the number of
+    reads running on it.
+    '''
+
+    def __init__(self, uri, size, cached_statements):
+        super(_ReplicaCopy, self).__init__()
+        self.anchor = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self.pool = ConnectionPool(uri, size, pragmas='memory', checkpoint_interval=None,
+                                   cached_statements=cached_statements, uri=True)
+        #Last write reported to the replica before the copy was checked.
+        self.checked = 0
+        self.readers = 0
+        self.retired = False
+
+    def close(self):
+        self.pool.close()
+        self.anchor.close()
+
+class CatalogueReplica(object):
+    '''
+    Read-only copy in memory of a database file, made with the sqlite backup
+    API, that serves the catalogue reads of MusicDatabase (see its replica
+    argument).
+
+    Every copy is a shared-cache in-memory database read through its own
+    ConnectionPool of size connections. refresh() copies the file into a new
+    database and swaps it in atomically: the reads already running finish on
+    the previous copy, which is freed when the last of them ends. Before a
+    read the replica checks whether the file changed, at most every
+    check_interval seconds, and right away after a write reported with
+    changed(), which the read then waits for. PRAGMA data_version tells
+    whether another connection committed and the change counters of tables
+    (see table_versions) whether the commit touched them; only then is the
+    file copied again. Without the counters every commit does.
+    '''
+
+    def __init__(self, db_path, size=DEFAULT_POOL_SIZE,
+                 check_interval=DEFAULT_REPLICA_CHECK_INTERVAL,
+                 tables=REPLICA_TABLES, busy_timeout=DEFAULT_BUSY_TIMEOUT,
+                 cached_statements=DEFAULT_CACHED_STATEMENTS):
+        super(CatalogueReplica, self).__init__()
+        self.db_path = db_path
+        self.size = size
+        self.check_interval = check_interval
+        self.tables = tuple(tables)
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self._id = next(_replica_ids)
+        #_refresh_lock serializes the checks and the copies, _lock guards
+        #the current copy, its readers and the reported writes.
+        self._refresh_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._source = None
+        self._current = None
+        self._copies = 0
+        self._writes = 0
+        self._data_version = None
+        self._versions = None
+        self._next_check = 0.0
+        self._counters = {'refreshes': 0, 'checks': 0, 'reads': 0}
+
+    def changed(self):
+        '''
+        Report a write committed to the database file. The next read checks
+        the file before it is served.
+        '''
+        with self._lock:
+            self._writes += 1
+
+    @contextmanager
+    def connection(self):
+        '''
+        Context manager that checks out a connection to the current copy,
+        once it is up to date (see the class).
+        '''
+        while True:
+            self._check()
+            with self._lock:
+                copy = self._current
+                if copy is not None:
+                    copy.readers += 1
+                    self._counters['reads'] += 1
+                    break
+        try:
+            with copy.pool.connection() as con:
+                yield con
+        finally:
+            with self._lock:
+                copy.readers -= 1
+                free = copy.retired and copy.readers == 0
+            if free:
+                copy.close()
+
+    def _check(self):
+        '''
+        Copy the file again if it has changes the current copy lacks. A read
+        waits for the first copy and for the check of the writes reported
+        before it; otherwise it goes on with the current copy while another
+        thread checks.
+        '''
+        with self._lock:
+            copy = self._current
+            writes = self._writes
+            wait = copy is None or copy.checked < writes
+        if not wait and time.monotonic() < self._next_check:
+            return
+        if not self._refresh_lock.acquire(wait):
+            return
+        try:
+            with self._lock:
+                copy = self._current
+                writes = self._writes
+            if copy is None or (copy.checked < writes or time.monotonic() >= self._next_check) \
+               and self._is_outdated():
+                self._refresh(writes)
+            else:
+                copy.checked = writes
+                self._next_check = time.monotonic() + self.check_interval
+        finally:
+            self._refresh_lock.release()
+
+    def _open_source(self):
+        if self._source is None:
+            self._source = sqlite3.connect(self.db_path, timeout=self.busy_timeout / 1000.0,
+                                           check_same_thread=False)
+        return self._source
+
+    def _read_versions(self, source):
+        '''
+        Return the change counters of the tables, or None if the database
+        has none.
+        '''
+        placeholders, pvalue = bind_list(self.tables)
+        try:
+            return source.execute('SELECT name, version FROM table_versions WHERE name IN (%s)\
+                                   ORDER BY name' % placeholders, pvalue).fetchall()
+        except sqlite3.OperationalError:
+            return None
+
+    def _is_outdated(self):
+        '''
+        Tell whether the tables changed since the current copy was made.
+        '''
+        source = self._open_source()
+        self._counters['checks'] += 1
+        data_version = source.execute('PRAGMA data_version').fetchone()[0]
+        if data_version == self._data_version:
+            return False
+        self._data_version = data_version
+        versions = self._read_versions(source)
+        return versions is None or versions != self._versions
+
+    def refresh(self):
+        '''
+        Copy the database file into a new in-memory database and serve the
+        reads from it.
+        '''
+        with self._refresh_lock:
+            with self._lock:
+                writes = self._writes
+            self._refresh(writes)
+
+    def _refresh(self, writes):
+        source = self._open_source()
+        #Read before the copy: a commit in between only costs another copy.
+        self._data_version = source.execute('PRAGMA data_version').fetchone()[0]
+        self._versions = self._read_versions(source)
+        self._copies += 1
+        copy = _ReplicaCopy(REPLICA_URI % (self._id, self._copies), self.size,
+                            self.cached_statements)
+        try:
+            source.backup(copy.anchor)
+        except BaseException:
+            copy.close()
+            raise
+        copy.checked = writes
+        self._swap(copy)
+        self._counters['refreshes'] += 1
+        self._next_check = time.monotonic() + self.check_interval
+
+    def _swap(self, copy):
+        '''
+        Make copy the current one and free the previous copy once no read
+        uses it.
+        '''
+        with self._lock:
+            previous, self._current = self._current, copy
+            free = previous is not None and previous.readers == 0
+            if previous is not None:
+                previous.retired = True
+        if free:
+            previous.close()
+
+    def close(self):
+        '''
+        Drop the current copy and close the connection to the file. The next
+        read makes a new copy.
+        '''
+        with self._refresh_lock:
+            self._swap(None)
+            if self._source is not None:
+                self._source.close()
+                self._source = None
+            self._data_version = self._versions = None
+
+    def stats(self):
+        '''
+        Return a dictionary with the counters of the replica: the copies
+        made, the checks of the file and the reads served, and the
+        generation of the current copy.
+        '''
+        with self._lock:
+            stats = dict(self._counters)
+            stats['generation'] = self._copies if self._current is not None else None
+        return stats
 
 class MusicDatabase(object):
 
-    def __init__(self, db_path=None):
+    def __init__(self, db_path=None, pool_size=DEFAULT_POOL_SIZE,
+                 checkout_timeout=DEFAULT_CHECKOUT_TIMEOUT,
+                 busy_timeout=None, pragmas=None,
+                 checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL,
+                 checkpoint_mode=DEFAULT_CHECKPOINT_MODE,
+                 cache_size=DEFAULT_CACHE_SIZE, cache_ttl=DEFAULT_CACHE_TTL,
+                 cached_statements=DEFAULT_CACHED_STATEMENTS, replica=False,
+                 replica_check_interval=DEFAULT_REPLICA_CHECK_INTERVAL):
         '''
         db_path is the address of the path with respect to the calling script.
         If db_path is None, DEFAULT_DB_PATH is used instead.
+        pool_size is the maximum number of connections kept open,
+        checkout_timeout the number of seconds a method waits for a free
+        connection and busy_timeout the milliseconds sqlite waits on a
+        locked database (by default the one of the pragma profile).
+        pragmas is the pragma profile applied to each connection (see
+        resolve_pragmas) and checkpoint_interval/checkpoint_mode define how
+        often and how the WAL is checkpointed.
+        cache_size and cache_ttl bound each of the artist, song, user and
+        playlist caches that serve get_artist, get_song, get_user and
+        get_playlist (see cache.LRUCache). A cache_size of 0 disables them.
+        The caches are invalidated by the writes done through this object;
+        cache_ttl bounds how long writes done by other processes may go
+        unnoticed.
+        cached_statements is the number of compiled statements kept by each
+        pooled connection.
+        With replica the artists and songs are read from an in-memory copy
+        of the database (see CatalogueReplica), made again after the writes
+        done through this object and, checked every replica_check_interval
+        seconds, after the writes of other connections to those tables.
         '''
         super(MusicDatabase, self).__init__()
         if db_path is not None:
             self.db_path = db_path
         else:
             self.db_path = DEFAULT_DB_PATH
-            
+        self._replica = None
+        if replica:
+            self._replica = CatalogueReplica(self.db_path, pool_size, replica_check_interval,
+                                             cached_statements=cached_statements)
+        self._pool = ConnectionPool(self.db_path, pool_size, checkout_timeout,
+                                    busy_timeout, pragmas,
+                                    checkpoint_interval, checkpoint_mode,
+                                    cached_statements,
+                                    self._replica and self._replica.changed)
+        self._caches = {}
+        if cache_size:
+            for kind in ('artist', 'song', 'user', 'playlist'):
+                self._caches[kind] = LRUCache(cache_size, cache_ttl)
+
+    def get_pool_stats(self):
+        '''
+        Return the statistics of the connection pool (see
+        ConnectionPool.stats).
+        '''
+        return self._pool.stats()
+
+    def get_replica_stats(self):
+        '''
+        Return the statistics of the catalogue replica (see
+        CatalogueReplica.stats), or None without replica.
+        '''
+        return self._replica.stats() if self._replica is not None else None
+
+    def get_cache_stats(self):
+        '''
+        Return the statistics of each entity cache (see LRUCache.stats).
+        '''
+        return dict((kind, cache.stats()) for kind, cache in self._caches.items())
+
+    def clear_caches(self):
+        '''
+        Drop every cached entity.
+        '''
+        for cache in self._caches.values():
+            cache.clear()
+
+    def _cached(self, kind, key, load):
+        '''
+        Read-through lookup in the cache of kind: return a copy of the object
+        cached for key, or call load() to read it from the database and cache
+        it. Objects that do not exist (None) are not cached.
+        '''
+        cache = self._caches.get(kind)
+        if cache is None:
+            return load()
+        value = cache.get(key)
+        if value is MISSING:
+            generation = cache.generation
+            value = load()
+            if value is None:
+                return None
+            cache.set(key, value, generation)
+        #Callers may modify the object they get
+        return value.copy()
+
+    def _invalidate(self, kind, *keys):
+        '''
+        Drop keys from the cache of kind. Called once the write is committed.
+        '''
+        cache = self._caches.get(kind)
+        if cache is not None:
+            cache.invalidate(*keys)
+
+    def _invalidate_playlists_of(self, user):
+        cache = self._caches.get('playlist')
+        if cache is not None:
+            cache.invalidate_if(lambda key: key[0] == user)
+
+    def close(self):
+        '''
+        Close the pooled connections and drop the catalogue replica. Both
+        are opened again on demand.
+        '''
+        self._pool.close()
+        if self._replica is not None:
+            self._replica.close()
+
+    def checkpoint(self, mode=None):
+        '''
+        Checkpoint the write-ahead log. mode is one of CHECKPOINT_MODES; by
+        default the checkpoint mode of the pool is used.
+        '''
+        return self._pool.checkpoint(mode=mode)
+
     def create_connection(db_path):
         conn = None
         try:
@@ -51,7 +787,13 @@ class MusicDatabase(object):
         '''
         Purge the database removing old values.
         '''
+        #Pooled connections would keep the removed file alive.
+        self.close()
+        self.clear_caches()
         os.remove(self.db_path)
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.remove(self.db_path + suffix)
 
     def load_init_values(self, schema=None, dump=None):
         '''
@@ -63,6 +805,28 @@ class MusicDatabase(object):
         '''
         self.create_tables_from_schema(schema)
         self.load_table_values_from_dump(dump)
+        self.apply_migrations()
+
+    def restore(self, source):
+        '''
+        Replace the content of the database with that of the database file
+        source, copied page by page with the sqlite backup API. Copying a
+        database populated once (see load_init_values) is several times
+        faster than running the scripts again; the tests copy one before
+        every test.
+        '''
+        #Pooled connections and cached entities belong to the old content.
+        self.close()
+        self.clear_caches()
+        con = sqlite3.connect(source)
+        try:
+            target = sqlite3.connect(self.db_path)
+            try:
+                con.backup(target)
+            finally:
+                target.close()
+        finally:
+            con.close()
 
     def create_tables_from_schema(self, schema=None):
         '''
@@ -70,13 +834,27 @@ class MusicDatabase(object):
         schema contains the path to the .sql schema file. If it is None,
         DEFAULT_SCHEMA is used instead.
         '''
-        con = sqlite3.connect(self.db_path)
         if schema is None:
             schema = DEFAULT_SCHEMA
         with open (schema) as f:
             sql = f.read()
-            cur = con.cursor()
-            cur.executescript(sql)
+        self._run_script(sql)
+
+    def _run_script(self, sql):
+        '''
+        Run an sql script on a pooled connection. The dump files drop and
+        recreate referenced tables, so foreign keys are disabled while the
+        script runs.
+        '''
+        try:
+            with self._transaction() as cur:
+                cur.execute('PRAGMA foreign_keys = OFF')
+                try:
+                    cur.executescript(sql)
+                finally:
+                    cur.execute('PRAGMA foreign_keys = ON')
+        finally:
+            self.clear_caches()
 
     def load_table_values_from_dump(self, dump=None):
         '''
@@ -84,40 +862,124 @@ class MusicDatabase(object):
         dump is the  path to the .sql dump file. If it is None,
         DEFAULT_DATA_DUMP is used instead.
         '''
-        con = sqlite3.connect(self.db_path)
         if dump is None:
             dump = DEFAULT_DATA_DUMP
         with open (dump) as f:
             sql = f.read()
+        self._run_script(sql)
+
+    def get_schema_version(self):
+        '''
+        Return the version of the last migration applied to the database.
+        '''
+        return self._execute('PRAGMA user_version', mode='one')[0]
+
+    def get_migrations(self, migrations=None):
+        '''
+        Return the sorted list of (version, path) of the migration files
+        found in the migrations folder (DEFAULT_MIGRATIONS if None).
+        '''
+        if migrations is None:
+            migrations = DEFAULT_MIGRATIONS
+        found = []
+        for filename in os.listdir(migrations):
+            match = MIGRATION_FILE.match(filename)
+            if match:
+                found.append((int(match.group(1)), os.path.join(migrations, filename)))
+        found.sort()
+        return found
+
+    def apply_migrations(self, migrations=None):
+        '''
+        Apply, in order, every migration newer than the schema version of the
+        database. Each migration runs in its own transaction together with the
+        update of the schema version, so a failing migration leaves the
+        database at the previous version. Return the list of applied versions.
+        '''
+        applied = []
+        current = self.get_schema_version()
+        for version, path in self.get_migrations(migrations):
+            if version <= current:
+                continue
+            with open(path) as f:
+                sql = f.read()
+            with self._transaction() as cur:
+                cur.executescript('BEGIN;\n%s\nPRAGMA user_version = %d;\nCOMMIT;' % (sql, version))
+            applied.append(version)
+            current = version
+        return applied
+
+    @contextmanager
+    def bulk_load(self, *tables):
+        '''
+        Context manager for loading many rows into tables. It yields a pooled
+        connection on which the indexes and triggers of tables (the search
+        index and change counter triggers included) are dropped, so the rows
+        are inserted without index maintenance. The caller commits as often
+        as it wants. On exit the uncommitted rows are rolled back, the indexes
+        and triggers are created again, the search indexes and the statistics
+        summaries are rebuilt, the change counters of tables are bumped and
+        the caches are cleared.
+
+        Writes made by other connections during the load bypass the dropped
+        triggers, so this is meant for maintenance windows.
+        '''
+        for table in tables:
+            if not re.match(r'^\w+$', table):
+                raise ValueError("Invalid table name %s" % table)
+        placeholders = ', '.join('?' * len(tables))
+        with self._pool.connection() as con:
             cur = con.cursor()
-            cur.executescript(sql)
+            cur.execute("SELECT type, name, sql FROM sqlite_master\
+                         WHERE type IN ('index', 'trigger') AND sql IS NOT NULL\
+                         AND tbl_name IN (%s) ORDER BY type, name" % placeholders, tables)
+            deferred = cur.fetchall()
+            for row in deferred:
+                cur.execute('DROP %s IF EXISTS "%s"' % (row['type'].upper(), row['name']))
+            con.commit()
+            try:
+                yield con
+            finally:
+                con.rollback()
+                for row in deferred:
+                    cur.execute(row['sql'])
+                for table in tables:
+                    cur.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                (table + '_fts',))
+                    if cur.fetchone() is not None:
+                        cur.execute("INSERT INTO %s_fts(%s_fts) VALUES ('rebuild')" % (table, table))
+                    cur.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'table_versions'")
+                    if cur.fetchone() is not None:
+                        cur.execute("UPDATE table_versions SET version = version + 1,\
+                                     modified_on = CAST(strftime('%s', 'now') AS INTEGER)\
+                                     WHERE name = ?", (table,))
+                #The entries loaded without triggers are not in the change
+                #log of the co-occurrence index: ask for a full build.
+                cur.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'playlist_changes'")
+                if cur.fetchone() is not None and 'song_in_playlist' in tables:
+                    cur.execute('INSERT INTO playlist_changes (song, pl_user, pl_name) VALUES (NULL, NULL, NULL)')
+                cur.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'song_stats'")
+                if cur.fetchone() is not None and set(tables) & set(STATISTICS_SOURCES):
+                    for statement in STATISTICS_REBUILD:
+                        cur.execute(statement)
+                con.commit()
+                cur.execute('PRAGMA optimize')
+                self.clear_caches()
 
     def check_foreign_keys_status(self):
         '''
-        Check if the foreign keys has been activated. Return and print in the
-        screen if foreign keys are activated.
+        Check if the foreign keys has been activated on the pooled
+        connections. Return and print in the screen if foreign keys are
+        activated.
         '''
-        con = None
         try:
-            #Connects to the database.
-            con = sqlite3.connect(self.db_path)
-            #Get the cursor object.
-            #It allows to execute SQL code and traverse the result set
-            cur = con.cursor()
-            #Execute the pragma command
-            cur.execute('PRAGMA foreign_keys')
-            #We know we retrieve just one record: use fetchone()
-            data = cur.fetchone()
-            data_text = 'ON' if data == (1,) else 'OFF'
-            print(f"Foreign Keys status: {data_text}")
-
+            #We know we retrieve just one record
+            data = self._execute('PRAGMA foreign_keys', mode='one', create=tuple)
         except sqlite3.Error as excp:
             print(f"Error {excp.args}")
             sys.exit(1)
-
-        finally:
-            if con:
-                con.close()
+        data_text = 'ON' if data == (1,) else 'OFF'
+        print(f"Foreign Keys status: {data_text}")
         return data
 
     def set_and_check_foreign_keys_status(self):
@@ -126,478 +988,912 @@ class MusicDatabase(object):
         exists. Print the results of this test.
         '''
         keys_on = 'PRAGMA foreign_keys = ON'
-        con = None
         try:
-            #Connects to the database.
-            con = sqlite3.connect(self.db_path)
-            #Get the cursor object.
-            #It allows to execute SQL code and traverse the result set
-            cur = con.cursor()
-            #Execute the pragma command, ON
-            cur.execute(keys_on)
-            #Commit the changes
-            con.commit()
-            #Execute the pragma check command
-            cur.execute('PRAGMA foreign_keys')
-            #We know we retrieve just one record: use fetchone()
-            data = cur.fetchone()
-            data_text = 'ON' if data == (1,) else 'OFF'
-            print(f"Foreign Keys status: {data_text}")
-
+            with self._transaction() as cur:
+                #Execute the pragma command, ON
+                cur.execute(keys_on)
+                #Execute the pragma check command
+                data = tuple(cur.execute('PRAGMA foreign_keys').fetchone())
         except sqlite3.Error as excp:
             print(f"Error {excp.args}")
             sys.exit(1)
-
-        finally:
-            if con:
-                con.close()
+        data_text = 'ON' if data == (1,) else 'OFF'
+        print(f"Foreign Keys status: {data_text}")
         return data
 
+    #Here the query layer: every statement runs through _execute or
+    #_transaction.
+    def _execute(self, query, pvalue=(), mode='all', create=None,
+                 batch_size=DEFAULT_FETCH_SIZE, replica=False):
+        '''
+        Run the statement query bound to pvalue on a pooled connection, as
+        one transaction. The connections keep their statements compiled and
+        look them up by their text, so values are always bound as ?
+        parameters, never written into the statement. mode is one of
+        QUERY_MODES:
+
+            one      return create(row) of the first row, or None
+            all      return the list of create(row) of every row
+            iter     return a generator of create(row) that fetches the rows
+                     in batches of batch_size (see _iter_rows)
+            execute  run a write and return its cursor (lastrowid, rowcount)
+            many     run the statement with every sequence of parameters of
+                     pvalue and return the number of changed rows
+
+        create may be a Record class: the cursor then builds the records
+        itself from the row tuples (see Record.row_factory). Without create
+        the rows are returned as sqlite3.Row objects. With replica a read of
+        the artists or songs runs on the catalogue replica, if there is one.
+        '''
+        if mode not in QUERY_MODES:
+            raise ValueError("Unknown query mode %s" % mode)
+        pool = self._replica if replica and self._replica is not None else self._pool
+        if mode == 'iter':
+            return self._iter_rows(query, pvalue, create, batch_size, pool)
+        with pool.connection() as con:
+            if mode == 'many':
+                return con.executemany(query, pvalue).rowcount
+            cur = con.execute(query, pvalue)
+            if mode == 'execute':
+                return cur
+            create = self._use_row_factory(cur, create)
+            if mode == 'one':
+                rows = self._fetch_rows(cur, create, 1)
+                return rows[0] if rows else None
+            return self._fetch_rows(cur, create)
+
+    def _fetch_rows(self, cur, create, size=None):
+        '''
+        Fetch every row of cur, or the next size rows, and return the list
+        of their records: built by the cursor itself (see _use_row_factory)
+        or by create, if it is not None.
+        '''
+        rows = cur.fetchall() if size is None else cur.fetchmany(size)
+        return rows if create is None else [create(row) for row in rows]
 
-    #Here the helpers that transform database rows into dictionary.
-    def _create_song_object(self, row):
+    def _use_row_factory(self, cur, create):
+        '''
+        If create is a Record class, make cur build the records of its rows
+        and return None; otherwise return create.
+        '''
+        if isinstance(create, type) and issubclass(create, Record):
+            cur.row_factory = create.row_factory(cur.description)
+            return None
+        return create
 
-        song_artist = row['byArtist']
-        song_title = row['name']
-        song_year = row['datePublished']
-        song_length = row['duration']
-        song_id = row['sid']
-        song = {'sid':song_id, 'name': song_title,
-                   'byArtist':song_artist, 'datePublished':song_year,
-                   'duration':song_length}
-        return song
+    @contextmanager
+    def _transaction(self, immediate=False):
+        '''
+        Context manager that yields a cursor of a pooled connection, for the
+        methods that run several statements in one transaction. It is
+        committed when the block ends and rolled back if it raises. With
+        immediate the write lock is taken before the first statement.
+        '''
+        with self._pool.connection() as con:
+            cur = con.cursor()
+            if immediate:
+                cur.execute('BEGIN IMMEDIATE')
+            yield cur
 
-    def _create_artist_object(self, row):
+    def _build_keyset_query(self, query, where, pvalue, keys, limit=None,
+                            after=None, before=None):
+        '''
+        Complete the SELECT statement query with the where conditions, the
+        keyset condition of the after/before cursor, the ORDER BY keys clause
+        and, if limit is given, a LIMIT clause. Return the statement and its
+        parameters.
+        '''
+        where = list(where)
+        pvalue = list(pvalue)
+        order = ', '.join(keys)
+        cursor = after if after is not None else before
+        if cursor is not None:
+            operator = '>' if after is not None else '<'
+            where.append('(%s) %s (%s)' % (order, operator, ', '.join('?' * len(keys))))
+            pvalue.extend(decode_cursor(cursor, len(keys)))
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        #Pages before a cursor are read backwards and reversed afterwards.
+        direction = 'DESC' if before is not None else 'ASC'
+        query += ' ORDER BY ' + ', '.join('%s %s' % (key, direction) for key in keys)
+        if limit is not None:
+            query += ' LIMIT ?'
+            pvalue.append(limit)
+        return query, pvalue
+
+    def _get_page(self, query, where, pvalue, keys, create, limit=None,
+                  after=None, before=None, cursor_fields=None, replica=False):
+        '''
+        Run the SELECT statement query restricted by the where conditions
+        (bound to pvalue) and ordered by the unique key columns keys, and
+        convert each row with create (a function of the row or a Record
+        class, see _execute).
+
+        Without limit the list of all the objects is returned. Otherwise a
+        Page with at most limit objects is returned, using keyset pagination:
+        after (or before) is a cursor of a previous Page and the statement
+        asks for the rows whose key is greater (or smaller) than it. With an
+        index on the keys the cost of a page does not depend on how deep it
+        is. The cursors hold the values of the keys read from the created
+        objects, under the names cursor_fields (by default keys). replica
+        is given to _execute.
+        '''
+        if limit is not None and limit < 1:
+            raise ValueError("The limit must be a positive integer")
+        #One extra row tells whether there is another page.
+        query, pvalue = self._build_keyset_query(query, where, pvalue, keys,
+                                                 limit and limit + 1, after, before)
+        objects = self._execute(query, pvalue, 'all', create, replica=replica)
+        if limit is None:
+            return objects
+
+        more = len(objects) > limit
+        page = Page(objects[:limit])
+        if before is not None:
+            page.reverse()
+        if page:
+            fields = cursor_fields or keys
+            first = encode_cursor([page[0][field] for field in fields])
+            last = encode_cursor([page[-1][field] for field in fields])
+            if before is not None:
+                page.prev_cursor = first if more else None
+                page.next_cursor = last
+            else:
+                page.prev_cursor = first if after is not None else None
+                page.next_cursor = last if more else None
+        return page
 
-        artist_name = row['legalName']
-        artist_genre = row['genre']
-        artist_country= row['foundingLocation']
-        artist_language= row['language']
-        artist_formed_in = row['foundingDate']
-        artist = {'legalName':artist_name, 'genre': artist_genre,
-                   'foundingLocation': artist_country, 'language': artist_language,
-                   'foundingDate': artist_formed_in}
-        return artist
+    def _iter_query(self, query, where, pvalue, keys, create, limit=None,
+                    after=None, batch_size=DEFAULT_FETCH_SIZE, replica=False,
+                    cursor_fields=None):
+        '''
+        Generator version of _get_page: return a generator that yields the
+        converted rows one by one. They are read as pages of batch_size
+        rows, each with its own pooled connection, which goes back to the
+        pool before the rows are yielded: a slow consumer (e.g. a client
+        reading a streamed response) never holds a connection, and only the
+        current batch is ever in memory. Every page starts after the last
+        row of the previous one, so rows are neither repeated nor skipped
+        by writes between the batches. The arguments are checked here,
+        before the generator starts.
+        '''
+        if limit is not None and limit < 1:
+            raise ValueError("The limit must be a positive integer")
+        if batch_size < 1:
+            raise ValueError("The batch size must be a positive integer")
+        #Raises ValueError for a wrong cursor.
+        self._build_keyset_query(query, where, pvalue, keys, limit, after)
+
+        def generate(after, limit):
+            while limit is None or limit > 0:
+                size = batch_size if limit is None else min(batch_size, limit)
+                page = self._get_page(query, where, pvalue, keys, create, size, after,
+                                      cursor_fields=cursor_fields, replica=replica)
+                yield from page
+                if page.next_cursor is None:
+                    return
+                after = page.next_cursor
+                if limit is not None:
+                    limit -= len(page)
+        return generate(after, limit)
+
+    def _iter_rows(self, query, pvalue, create, batch_size, pool):
+        with pool.connection() as con:
+            cur = con.execute(query, pvalue)
+            create = self._use_row_factory(cur, create)
+            while True:
+                rows = self._fetch_rows(cur, create, batch_size)
+                if not rows:
+                    break
+                yield from rows
+
+    #Here the helpers that transform database rows into records (see records).
+    def _create_song_object(self, row):
+        return Song.from_row(row)
 
-    def _create_playlist_object(self, row):
+    def _create_artist_object(self, row):
+        return Artist.from_row(row)
 
-        pl_name = row['name']
-        pl_user = row['author']
-        pl_created = row['created_on']
+    def _create_playlist_object(self, row):
+        return Playlist.from_row(row)
 
-        pl = {'name':pl_name, 'author': pl_user,
-                   'created_on': pl_created}
-        return pl
     def _create_user_object(self, row):
-
-        name = row['nickname']
-        gender = row['gender']
-        age = row['age']
-        country = row['nationality']
-        password = row['password']
-        user = {'nickname':name, 'password':password, 'gender': gender,
-                   'age': age, 'nationality':country}
-        return user
+        return User.from_row(row)
 
     def get_song(self, artist, title):
+        '''
+        Return the song title of artist, or None. Songs are served from the
+        song cache when possible.
+        '''
+        return self._cached('song', (artist, title),
+                            lambda: self._select_song(artist, title))
 
-        #Create the SQL Query
-        keys_on = 'PRAGMA foreign_keys = ON'
+    def _select_song(self, artist, title):
         query = 'SELECT * FROM songs WHERE byArtist = ? and name = ?'
-        con = sqlite3.connect(self.db_path)
-        with con:
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            cur.execute(keys_on)
-            pvalue = (artist, title,)
-            cur.execute(query, pvalue)
-
-            row = cur.fetchone()
-            if row is None:
-                return None
-
-            return self._create_song_object(row)
+        return self._execute(query, (artist, title), 'one', Song, replica=True)
 
     def get_user(self, nickname, password=None):
+        '''
+        Return the user nickname, or None. If password is given the user is
+        only returned when the password matches. Users are served from the
+        user cache when possible.
+        '''
+        user = self._cached('user', nickname,
+                            lambda: self._select_user(nickname))
+        if user is None or (password is not None and user['password'] != password):
+            return None
+        return user
 
-        #Create the SQL Query
-        keys_on = 'PRAGMA foreign_keys = ON'
+    def _select_user(self, nickname):
         query = 'SELECT * FROM users WHERE nickname = ?'
-        if password is not None:
-            query += " AND password = '" + password + "'";
+        return self._execute(query, (nickname,), 'one', User)
 
-        con = sqlite3.connect(self.db_path)
-        with con:
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            cur.execute(keys_on)
-            pvalue = (nickname,)
-            cur.execute(query, pvalue)
-            row = cur.fetchone()
-            if row is None:
-                return None
-            return self._create_user_object(row)
-
-
-    def get_songs(self, artist=None):
 
+    def get_songs(self, artist=None, limit=None, after=None, before=None):
+        '''
+        Return the songs of artist (all songs if None) ordered by title, or by
+        sid if artist is None. With limit a Page is returned (see _get_page).
+        '''
         #Create the SQL Statement
-        keys_on = 'PRAGMA foreign_keys = ON'
-        query = 'SELECT * FROM songs'
-        if artist is  not None:
-            query += ' where byArtist = ?'
-        con = sqlite3.connect(self.db_path)
-        with con:
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            cur.execute(keys_on)
-            if artist is not None:
-                pvalue = (artist,)
-                cur.execute(query, pvalue)
-            else:
-                cur.execute(query)
+        where, pvalue, keys = self._songs_filters(artist)
+        return self._get_page('SELECT * FROM songs', where, pvalue, keys,
+                              Song, limit, after, before, replica=True)
 
-            rows = cur.fetchall()
-            if rows is None:
-                return None
+    def iter_songs(self, artist=None, limit=None, after=None,
+                   batch_size=DEFAULT_FETCH_SIZE):
+        '''
+        Generator version of get_songs (see _iter_query).
+        '''
+        where, pvalue, keys = self._songs_filters(artist)
+        return self._iter_query('SELECT * FROM songs', where, pvalue, keys,
+                                Song, limit, after,
+                                batch_size, replica=True)
 
-            songs = []
-            for row in rows:
-                song = self._create_song_object(row)
-                songs.append(song)
-            return songs
+    def _songs_filters(self, artist):
+        '''
+        Return the where conditions, parameters and sort keys of get_songs.
+        '''
+        if artist is not None:
+            return ['byArtist = ?'], [artist], ('name', 'sid')
+        return [], [], ('sid',)
 
     def get_playlist(self, name, user):
-        keys_on = 'PRAGMA foreign_keys = ON'
-        query = 'SELECT * FROM playlists where author = ? and name = ?'
-        con = sqlite3.connect(self.db_path)
-        with con:
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            cur.execute(keys_on)
-            pvalue = (user, name)
-            cur.execute(query, pvalue)
-            row = cur.fetchone()
-            if row is None:
-                return None
+        '''
+        Return the playlist name of user, or None. Playlists are served from
+        the playlist cache when possible.
+        '''
+        return self._cached('playlist', (user, name),
+                            lambda: self._select_playlist(name, user))
 
-            return self._create_playlist_object(row)
+    def _select_playlist(self, name, user):
+        query = 'SELECT * FROM playlists where author = ? and name = ?'
+        return self._execute(query, (user, name), 'one', Playlist)
 
-    def get_playlists(self, user):
+    def get_playlists(self, user, limit=None, after=None, before=None):
+        '''
+        Return the playlists of user ordered by name. With limit a Page is
+        returned (see _get_page).
+        '''
         #Create the SQL Query
-        keys_on = 'PRAGMA foreign_keys = ON'
-        query = 'SELECT name, author, created_on FROM playlists where author = ?'
-        #Connects to the database. Gets a connection object
-        con = sqlite3.connect(self.db_path)
-        with con:
-            #Cursor and row initialization
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            #Provide support for foreign keys
-            cur.execute(keys_on)
-            #Execute main SQL Statement
-            pvalue = (user,)
-            cur.execute(query, pvalue)
-            #Process the response.
-            #Just one row is expected
-            rows = cur.fetchall()
-            if rows is None:
-                return None
-            #Build the return object
-            pls = []
-            for row in rows:
-                pl = self._create_playlist_object(row)
-                pls.append(pl)
-            return pls
-
-    def get_songs_in_playlist(self, pl_name, pl_user):
+        query = 'SELECT name, author, created_on FROM playlists'
+        return self._get_page(query, ['author = ?'], [user], ('name',),
+                              Playlist, limit, after, before)
+
+    def get_songs_in_playlist(self, pl_name, pl_user, limit=None, after=None, before=None):
+        '''
+        Return the songs of a playlist ordered by sid. With limit a Page is
+        returned (see _get_page).
+        '''
         #Create the SQL Statement
-        keys_on = 'PRAGMA foreign_keys = ON'
-        query = 'SELECT sid, name, datePublished, duration, byArtist FROM song_in_playlist, songs where pl_name = ? and pl_user = ? and song = sid'
-        #Connects to the database.
-        con = sqlite3.connect(self.db_path)
-        with con:
-            #Cursor and row initialization
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            #Provide support for foreign keys
-            cur.execute(keys_on)
-            #Execute main SQL Statement
-            pvalue = (pl_name, pl_user,)
-            cur.execute(query, pvalue)
-            #Get results
-            rows = cur.fetchall()
-            if rows is None:
-                return None
-            #Build the return object
-            songs = []
-            for row in rows:
-                song = self._create_song_object(row)
-                songs.append(song)
-            return songs
+        query = 'SELECT song, sid, name, datePublished, duration, byArtist FROM song_in_playlist, songs'
+        return self._get_page(query, ['pl_name = ?', 'pl_user = ?', 'song = sid'],
+                              [pl_name, pl_user], ('song',),
+                              Song, limit, after, before, ('sid',))
 
+    def iter_playlist_entries(self, since=None, batch_size=DEFAULT_FETCH_SIZE):
+        '''
+        Generator over every song of every playlist, as (sid, pl_user,
+        pl_name, added_on) tuples. With since only the entries added on or
+        after that time are read.
+        '''
+        query = 'SELECT song, pl_user, pl_name, added_on FROM song_in_playlist'
+        pvalue = []
+        if since is not None:
+            query += ' WHERE added_on >= ?'
+            pvalue.append(since)
+        return self._execute(query, pvalue, 'iter', tuple, batch_size)
+
+    def iter_playlist_songs(self, playlists, batch_size=DEFAULT_FETCH_SIZE):
+        '''
+        Generator over the sids of the songs of playlists, a list of
+        (pl_user, pl_name) pairs.
+        '''
+        playlists = list(playlists)
+        step = MAX_BOUND_LIST // 2
+        for start in range(0, len(playlists), step):
+            chunk = playlists[start:start + step]
+            query = 'SELECT song FROM song_in_playlist WHERE (pl_user, pl_name) IN (VALUES %s)' \
+                    % ', '.join(['(?, ?)'] * len(chunk))
+            for row in self._execute(query, [value for pair in chunk for value in pair],
+                                     'iter', tuple, batch_size):
+                yield row[0]
+
+    def iter_cooccurring_entries(self, sids, batch_size=DEFAULT_FETCH_SIZE):
+        '''
+        Generator over the songs of every playlist that contains one of the
+        songs sids, as (sid, pl_user, pl_name) tuples. A playlist with
+        several of the songs may be read more than once.
+        '''
+        sids = list(sids)
+        for start in range(0, len(sids), MAX_BOUND_LIST):
+            placeholders, pvalue = bind_list(sids[start:start + MAX_BOUND_LIST])
+            query = 'SELECT song, pl_user, pl_name FROM song_in_playlist\
+                     WHERE (pl_user, pl_name) IN (SELECT pl_user, pl_name FROM song_in_playlist\
+                                                  WHERE song IN (%s))' % placeholders
+            yield from self._execute(query, pvalue, 'iter', tuple, batch_size)
+
+    def get_playlist_changes(self, after=0):
+        '''
+        Return the songs added to or removed from playlists logged in
+        playlist_changes after the change after, as a list of (id, song,
+        pl_user, pl_name) tuples ordered by id. A row with a NULL playlist
+        asks for a full build of the co-occurrence index.
+        '''
+        query = 'SELECT id, song, pl_user, pl_name FROM playlist_changes WHERE id > ? ORDER BY id'
+        return self._execute(query, (after,), 'all', tuple)
 
-    def create_artist(self, name, genre, country, language, formed_in):
-        keys_on = 'PRAGMA foreign_keys = ON'
-        stmnt = 'INSERT INTO artists (legalName,genre,foundingLocation,language,foundingDate) VALUES(?,?,?,?,?)'
-        con = sqlite3.connect(self.db_path)
-        with con:
-            #Cursor and row initialization
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            #Provide support for foreign keys
-            cur.execute(keys_on)
+    def get_last_playlist_change(self):
+        '''
+        Return the id of the last change logged in playlist_changes, 0 if
+        there is none.
+        '''
+        return self._execute('SELECT IFNULL(MAX(id), 0) FROM playlist_changes', mode='one',
+                             create=tuple)[0]
 
+    def delete_playlist_changes(self, last):
+        '''
+        Remove the changes of playlist_changes up to the change last, once
+        they are in the co-occurrence index.
+        '''
+        self._execute('DELETE FROM playlist_changes WHERE id <= ?', (last,), 'execute')
 
-            #Execute SQL Statement to get userid given nickname
+    def get_songs_by_id(self, sids):
+        '''
+        Return a dictionary {sid: song} with the songs of sids that exist.
+        '''
+        sids = list(sids)
+        songs = {}
+        for start in range(0, len(sids), MAX_BOUND_LIST):
+            placeholders, pvalue = bind_list(sids[start:start + MAX_BOUND_LIST])
+            query = 'SELECT * FROM songs WHERE sid IN (%s)' % placeholders
+            for song in self._execute(query, pvalue, 'all', Song, replica=True):
+                songs[song['sid']] = song
+        return songs
+
+    def create_artist(self, name, genre, country, language, formed_in):
+        stmnt = 'INSERT INTO artists (legalName,genre,foundingLocation,language,foundingDate) VALUES(?,?,?,?,?)'
+        try:
             pvalue = (name,genre,country,language,formed_in,)
-            cur.execute(stmnt, pvalue)
-            #Extract user id
-            #Return the id in
-            return cur.lastrowid
+            return self._execute(stmnt, pvalue, 'execute').lastrowid
+        finally:
+            self._invalidate('artist', name)
 
     def create_song(self, title, year, length, artist):
-        keys_on = 'PRAGMA foreign_keys = ON'
         stmnt = 'INSERT INTO songs (name,datePublished,duration,byArtist) VALUES(?,?,?,?)'
-        con = sqlite3.connect(self.db_path)
-        with con:
-            #Cursor and row initialization
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            #Provide support for foreign keys
-            cur.execute(keys_on)
-
-
-            #Execute SQL Statement to get userid given nickname
+        try:
             pvalue = (title,year,length,artist,)
-            cur.execute(stmnt, pvalue)
-            #Extract user id
-            #Return the id in
-            return cur.lastrowid
+            return self._execute(stmnt, pvalue, 'execute').lastrowid
+        finally:
+            self._invalidate('song', (artist, title))
 
     def create_user(self, nickname, password, age, country, gender):
-        keys_on = 'PRAGMA foreign_keys = ON'
         stmnt = 'INSERT INTO users (nickname,password,age,nationality,gender) VALUES(?,?,?,?,?)'
-        con = sqlite3.connect(self.db_path)
-        with con:
-            #Cursor and row initialization
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            #Provide support for foreign keys
-            cur.execute(keys_on)
-
-            #Execute SQL Statement to get userid given nickname
+        try:
             pvalue = (nickname,password,age,country,gender,)
-            cur.execute(stmnt, pvalue)
-            #Extract user id
-            #Return the id in
-            return cur.lastrowid
+            return self._execute(stmnt, pvalue, 'execute').lastrowid
+        finally:
+            self._invalidate('user', nickname)
 
     def append_user(self, nickname, password):
         '''Same as create_user but it returns the nickname instead of the user id (basically for testing) '''
 
-        keys_on = 'PRAGMA foreign_keys = ON'
         #SQL Statement for extracting the userid given a nickname
         query1 = 'SELECT nickname from users WHERE nickname = ?'
         stmnt = 'INSERT INTO users (nickname,password) VALUES(?,?)'
-        con = sqlite3.connect(self.db_path)
-
-        with con:
-            #Cursor and row initialization
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            #Provide support for foreign keys
-            cur.execute(keys_on)
-            pvalue = (nickname,)
-            cur.execute(query1, pvalue)
-            #No value expected (no other user with that nickname expected)
-            row = cur.fetchone()
-            if row is None:
-                #Execute SQL Statement to get userid given nickname
-                pvalue = (nickname,password,)
-                cur.execute(stmnt, pvalue)
-                #Extract user id
-                #Return the id in
-                return nickname
-            else:
-                return None
+        try:
+            with self._transaction() as cur:
+                pvalue = (nickname,)
+                cur.execute(query1, pvalue)
+                #No value expected (no other user with that nickname expected)
+                row = cur.fetchone()
+                if row is None:
+                    #Execute SQL Statement to get userid given nickname
+                    pvalue = (nickname,password,)
+                    cur.execute(stmnt, pvalue)
+                    #Extract user id
+                    #Return the id in
+                    return nickname
+                else:
+                    return None
+        finally:
+            self._invalidate('user', nickname)
 
 
 
     def create_playlist(self, name, user):
-        keys_on = 'PRAGMA foreign_keys = ON'
         stmnt = 'INSERT INTO playlists (name, author, created_on) VALUES(?,?,?)'
-        con = sqlite3.connect(self.db_path)
-        with con:
-            #Cursor and row initialization
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            #Provide support for foreign keys
-            cur.execute(keys_on)
-
+        try:
             timestamp = time.mktime(datetime.now().timetuple())
-
-            #Execute SQL Statement to get userid given nickname
             pvalue = (name, user, timestamp,)
-            cur.execute(stmnt, pvalue)
-            #Extract user id
-            #Return the id in
-            return cur.lastrowid
+            return self._execute(stmnt, pvalue, 'execute').lastrowid
+        finally:
+            self._invalidate('playlist', (user, name))
 
     def append_song_to_playlist(self, song, plname, pluser):
-        keys_on = 'PRAGMA foreign_keys = ON'
         stmnt = 'INSERT INTO song_in_playlist (song, pl_name, pl_user, added_on) VALUES(?,?,?,?)'
-        con = sqlite3.connect(self.db_path)
-        with con:
-            #Cursor and row initialization
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            #Provide support for foreign keys
-            cur.execute(keys_on)
+        timestamp = time.mktime(datetime.now().timetuple())
+        pvalue = (song, plname, pluser, timestamp,)
+        return self._execute(stmnt, pvalue, 'execute').lastrowid
 
-            timestamp = time.mktime(datetime.now().timetuple())
+    def create_songs(self, artist, songs):
+        '''
+        Create the songs of artist in a single transaction. songs is a list
+        of (title, year, length). Return a list with, for every song, a pair
+        (sid, None) if it was created or (None, error message) if it was not.
+        '''
+        stmnt = 'INSERT INTO songs (name,datePublished,duration,byArtist) VALUES(?,?,?,?)'
+        results = []
+        try:
+            with self._transaction() as cur:
+                for title, year, length in songs:
+                    try:
+                        cur.execute(stmnt, (title, year, length, artist))
+                    except sqlite3.IntegrityError as error:
+                        #Only the failed statement is undone, the
+                        #transaction goes on with the next song.
+                        results.append((None, str(error)))
+                    else:
+                        results.append((cur.lastrowid, None))
+                return results
+        finally:
+            self._invalidate('song', *[(artist, title) for title, year, length in songs])
 
-            #Execute SQL Statement to get userid given nickname
-            pvalue = (song, plname, pluser, timestamp,)
-            cur.execute(stmnt, pvalue)
-            #Extract user id
-            #Return the id in
-            return cur.lastrowid
+    def append_songs_to_playlist(self, plname, pluser, songs):
+        '''
+        Append songs to the playlist plname of pluser in a single
+        transaction. songs is a list of (artist, title). Return a list with,
+        for every song, a pair (sid, None) if it was appended or (sid or
+        None, error message) if the song does not exist or is already in the
+        playlist.
+        '''
+        query = 'SELECT MIN(sid) FROM songs WHERE byArtist = ? and name = ?'
+        stmnt = 'INSERT INTO song_in_playlist (song, pl_name, pl_user, added_on) VALUES(?,?,?,?)'
+        results = []
+        with self._transaction() as cur:
+            timestamp = time.mktime(datetime.now().timetuple())
+            for artist, title in songs:
+                cur.execute(query, (artist, title))
+                sid = cur.fetchone()[0]
+                if sid is None:
+                    results.append((None, "There is no song named %s of the artist %s" % (title, artist)))
+                    continue
+                try:
+                    cur.execute(stmnt, (sid, plname, pluser, timestamp))
+                except sqlite3.IntegrityError:
+                    results.append((sid, "The song %s of the artist %s is already in the playlist" % (title, artist)))
+                else:
+                    results.append((sid, None))
+            return results
 
 
     def get_artist(self, name):
-        #Create the SQL Query
-        keys_on = 'PRAGMA foreign_keys = ON'
+        '''
+        Return the artist name, or None. Artists are served from the artist
+        cache when possible.
+        '''
+        return self._cached('artist', name, lambda: self._select_artist(name))
+
+    def _select_artist(self, name):
         query = 'SELECT * FROM artists WHERE legalName = ?'
-        #Connects to the database. Gets a connection object
-        con = sqlite3.connect(self.db_path)
-        with con:
-            #Cursor and row initialization
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            #Provide support for foreign keys
-            cur.execute(keys_on)
-            #Execute main SQL Statement
-            pvalue = (name,)
-            cur.execute(query, pvalue)
-            #Process the response.
-            #Just one row is expected
-            row = cur.fetchone()
-            if row is None:
-                return None
-            #Build the return object
-            return self._create_artist_object(row)
+        return self._execute(query, (name,), 'one', Artist, replica=True)
 
-    def get_users(self):
+    def get_users(self, limit=None, after=None, before=None):
+        '''
+        Return the users ordered by nickname. With limit a Page is returned
+        (see _get_page).
+        '''
         #Create the SQL Statement
-        keys_on = 'PRAGMA foreign_keys = ON'
         query = 'SELECT * FROM users'
-          #Nickname restriction
+        return self._get_page(query, [], [], ('nickname',),
+                              User, limit, after, before)
 
-        con = sqlite3.connect(self.db_path)
-        with con:
-            #Cursor and row initialization
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            #Provide support for foreign keys
-            cur.execute(keys_on)
-            #Execute main SQL Statement
-            cur.execute(query)
-            #Get results
-            rows = cur.fetchall()
-            if rows is None:
-                return None
-            #Build the return object
-            users = []
-            for row in rows:
-                u = self._create_user_object(row)
-                users.append(u)
-            return users
-
-    def get_artists(self, name = None, genre = None, country = None, language = None):
+    def get_artists(self, name = None, genre = None, country = None, language = None,
+                    limit=None, after=None, before=None):
+        '''
+        Return the artists ordered by name, filtered by substrings of their
+        name, genre, country and language. With limit a Page is returned (see
+        _get_page).
+        '''
         #Create the SQL Statement
-        keys_on = 'PRAGMA foreign_keys = ON'
         query = 'SELECT * FROM artists'
-          #Nickname restriction
-        if genre is not None or country is not None or language is not None or name is not None:
-            query += " where "
-            add = 0
+        where, pvalue = self._artists_filters(name, genre, country, language)
+        return self._get_page(query, where, pvalue, ('legalName',),
+                              Artist, limit, after, before, replica=True)
+
+    def iter_artists(self, name = None, genre = None, country = None, language = None,
+                     limit=None, after=None, batch_size=DEFAULT_FETCH_SIZE):
+        '''
+        Generator version of get_artists (see _iter_query).
+        '''
+        query = 'SELECT * FROM artists'
+        where, pvalue = self._artists_filters(name, genre, country, language)
+        return self._iter_query(query, where, pvalue, ('legalName',),
+                                Artist, limit, after,
+                                batch_size, replica=True)
+
+    def _artists_filters(self, name, genre, country, language):
+        '''
+        Return the where conditions and parameters of get_artists.
+        '''
+        #Substring restrictions. Values are bound as parameters, never
+        #interpolated in the statement. Use search_artists for ranked, indexed
+        #word searches.
+        filters = [('genre', genre), ('foundingLocation', country),
+                   ('language', language), ('legalName', name)]
+        where = []
+        pvalue = []
+        for column, value in filters:
+            if value is not None:
+                where.append("%s like ?" % column)
+                pvalue.append('%' + value + '%')
+        return where, pvalue
+
+    def search_artists(self, text, limit=DEFAULT_SEARCH_LIMIT):
+        '''
+        Full-text search of the artists by name, genre, country and language.
+        Every word of text must match the beginning of a word of the artist.
+        Return at most limit artists, best match first; each artist has an
+        extra 'rank' key (bm25 score, lower is better).
+        '''
+        expression = build_search_expression(text)
+        if expression is None:
+            return []
+        query = 'SELECT artists.*, artists_fts.rank AS rank FROM artists_fts \
+                 JOIN artists ON artists.rowid = artists_fts.rowid \
+                 WHERE artists_fts MATCH ? ORDER BY artists_fts.rank LIMIT ?'
+        return self._execute(query, (expression, limit), 'all', Artist)
+
+    def search_songs(self, text, limit=DEFAULT_SEARCH_LIMIT):
+        '''
+        Full-text search of the songs by title and artist. Same matching
+        rules and return format as search_artists.
+        '''
+        expression = build_search_expression(text)
+        if expression is None:
+            return []
+        query = 'SELECT songs.*, songs_fts.rank AS rank FROM songs_fts \
+                 JOIN songs ON songs.sid = songs_fts.rowid \
+                 WHERE songs_fts MATCH ? ORDER BY songs_fts.rank LIMIT ?'
+        return self._execute(query, (expression, limit), 'all', Song)
+
+    def rebuild_search_index(self):
+        '''
+        Rebuild the full-text indexes from the artists and songs tables. The
+        triggers keep them in sync; a rebuild is only needed after the rowids
+        of artists change (e.g. VACUUM) or after loading data with the
+        triggers disabled.
+        '''
+        with self._transaction() as cur:
+            cur.execute("INSERT INTO artists_fts(artists_fts) VALUES ('rebuild')")
+            cur.execute("INSERT INTO songs_fts(songs_fts) VALUES ('rebuild')")
+
+    def rebuild_statistics(self):
+        '''
+        Compute the statistics summaries (song_stats, artist_stats,
+        genre_stats and daily_stats) again from the playlist entries. The
+        triggers keep them up to date; a rebuild is only needed after writing
+        STATISTICS_SOURCES with the triggers disabled. It also drops the
+        counts that reached zero.
+        '''
+        with self._transaction() as cur:
+            for statement in STATISTICS_REBUILD:
+                cur.execute(statement)
+
+    def get_top_songs(self, limit=DEFAULT_STATISTICS_LIMIT):
+        '''
+        Return at most limit songs, the ones in most playlists first. Each
+        song has an extra 'plays' key: the number of playlists that contain
+        it.
+        '''
+        if limit < 1:
+            raise ValueError("The limit must be a positive integer")
+        #CROSS JOIN keeps song_stats as the outer loop, read in the order of
+        #its plays index, so only limit songs are looked up.
+        query = 'SELECT songs.*, song_stats.plays AS plays FROM song_stats\
+                 CROSS JOIN songs ON songs.sid = song_stats.song WHERE song_stats.plays > 0\
+                 ORDER BY song_stats.plays DESC, song_stats.song LIMIT ?'
+        return self._execute(query, (limit,), 'all', Song)
+
+    def get_top_artists(self, limit=DEFAULT_STATISTICS_LIMIT):
+        '''
+        Return at most limit artists, the ones whose songs were added most
+        often to playlists first. Each artist has an extra 'plays' key: the
+        number of playlist entries of its songs.
+        '''
+        if limit < 1:
+            raise ValueError("The limit must be a positive integer")
+        query = 'SELECT artists.*, artist_stats.plays AS plays FROM artist_stats\
+                 CROSS JOIN artists ON artists.legalName = artist_stats.artist\
+                 WHERE artist_stats.plays > 0\
+                 ORDER BY artist_stats.plays DESC, artist_stats.artist LIMIT ?'
+        return self._execute(query, (limit,), 'all', Artist)
+
+    def get_genre_popularity(self, dimension, value=None, limit=None):
+        '''
+        Return the playlist entries of each genre grouped by dimension, an
+        attribute of the owners of the playlists (one of
+        STATISTICS_DIMENSIONS; ages are grouped by decade, e.g. '20-29'), as a
+        list of (value, genre, plays) ordered by value and then by plays, most
+        first. With value only that group is returned, and with limit at most
+        limit genres of each group. Raise ValueError for an unknown
+        dimension.
+        '''
+        if dimension not in STATISTICS_DIMENSIONS:
+            raise ValueError("Unknown dimension %s" % dimension)
+        if limit is not None and limit < 1:
+            raise ValueError("The limit must be a positive integer")
+        query = 'SELECT value, genre, plays FROM genre_stats WHERE dimension = ?'
+        pvalue = [dimension]
+        if value is not None:
+            query += ' AND value = ?'
+            pvalue.append(value)
+        query += ' AND plays > 0 ORDER BY value, plays DESC, genre'
+        rows = self._execute(query, pvalue, 'all', tuple)
+        if limit is None:
+            return rows
+        genres = []
+        count = 0
+        for i, row in enumerate(rows):
+            count = count + 1 if i and row[0] == rows[i - 1][0] else 1
+            if count <= limit:
+                genres.append(row)
+        return genres
+
+    def get_daily_additions(self, since=None, until=None):
+        '''
+        Return the number of songs added to playlists on each day (UTC), of
+        the entries still in the playlists, as a list of ('YYYY-MM-DD',
+        additions) oldest first. since and until (seconds since the epoch)
+        limit it to the days from the one of since to the one of until.
+        '''
+        query = "SELECT date(day * 86400, 'unixepoch'), additions FROM daily_stats\
+                 WHERE additions > 0"
+        pvalue = []
+        if since is not None:
+            query += ' AND day >= ?'
+            pvalue.append(int(since) // 86400)
+        if until is not None:
+            query += ' AND day <= ?'
+            pvalue.append(int(until) // 86400)
+        return self._execute(query + ' ORDER BY day', pvalue, 'all', tuple)
+
+    def get_table_versions(self, tables):
+        '''
+        Return a dictionary {table: (version, modified_on)} with the change
+        counters of tables kept by the triggers of table_versions. Tables
+        without a counter (e.g. before the migrations are applied) are not
+        in the dictionary.
+        '''
+        placeholders, pvalue = bind_list(tables)
+        query = 'SELECT name, version, modified_on FROM table_versions WHERE name IN (%s)' \
+                % placeholders
+        try:
+            rows = self._execute(query, pvalue)
+        except sqlite3.OperationalError:
+            return {}
+        return {row['name']: (row['version'], row['modified_on']) for row in rows}
+
+    def get_playlist_last_modified(self, name, user):
+        '''
+        Return the time of the last change of the playlist name of user: the
+        latest of its created_on and of the added_on of its songs. None if
+        the playlist does not exist.
+        '''
+        query = 'SELECT MAX(IFNULL(created_on, 0), IFNULL((SELECT MAX(added_on) FROM song_in_playlist\
+                 WHERE pl_user = ? AND pl_name = ?), 0)) FROM playlists\
+                 WHERE author = ? AND name = ?'
+        row = self._execute(query, (user, name, user, name), 'one')
+        return None if row is None else row[0]
+
+    def refresh_similarity_index(self, limit=None):
+        '''
+        Recompute the neighbours of the artists queued in similarity_queue
+        by the triggers on artists and song_in_playlist, at most limit of
+        them (all if limit is None). The artists of the playlists marked in
+        similarity_playlists are queued first, once per playlist. Return the
+        number of artists recomputed; 0 if the similarity tables do not
+        exist.
+        '''
+        try:
+            if self._execute('SELECT 1 FROM similarity_queue UNION ALL\
+                              SELECT 1 FROM similarity_playlists LIMIT 1', mode='one') is None:
+                return 0
+        except sqlite3.OperationalError:
+            return 0
+        #Take the write lock before reading the queue, so no trigger queues
+        #an artist between reading and emptying it.
+        with self._transaction(immediate=True) as cur:
+            cur.execute('INSERT OR IGNORE INTO similarity_queue (artist)\
+                         SELECT DISTINCT songs.byArtist FROM similarity_playlists\
+                         JOIN song_in_playlist ON song_in_playlist.pl_user = similarity_playlists.pl_user\
+                         AND song_in_playlist.pl_name = similarity_playlists.pl_name\
+                         JOIN songs ON songs.sid = song_in_playlist.song\
+                         WHERE songs.byArtist IS NOT NULL')
+            cur.execute('DELETE FROM similarity_playlists')
+            cur.execute('SELECT artist FROM similarity_queue LIMIT ?',
+                        (-1 if limit is None else limit,))
+            artists = [row[0] for row in cur.fetchall()]
+            for artist in artists:
+                self._update_similar_artists(cur, artist)
+            cur.executemany('DELETE FROM similarity_queue WHERE artist = ?',
+                            [(artist,) for artist in artists])
+            #One change of the counter per refresh instead of a trigger on
+            #every row; the artist triggers that also write the index bump
+            #the counter of artists.
+            if artists:
+                cur.execute("UPDATE table_versions SET version = version + 1,\
+                             modified_on = CAST(strftime('%s', 'now') AS INTEGER)\
+                             WHERE name = 'artist_similarity'")
+            return len(artists)
+
+    def rebuild_similarity_index(self):
+        '''
+        Queue every artist and recompute the whole similarity index. Needed
+        after loading data with the triggers disabled (see bulk_load).
+        Return the number of artists recomputed.
+        '''
+        self._execute('INSERT OR IGNORE INTO similarity_queue (artist)\
+                       SELECT legalName FROM artists WHERE legalName IS NOT NULL', mode='execute')
+        return self.refresh_similarity_index()
+
+    def _update_similar_artists(self, cur, artist):
+        '''
+        Replace the rows of artist in artist_similarity with its
+        SIMILAR_ARTISTS best neighbours. Every query is bounded by the index
+        it reads, so the cost does not grow with the size of the catalogue.
+        '''
+        cur.execute('DELETE FROM artist_similarity WHERE artist = ?', (artist,))
+        cur.execute('SELECT genre, language, foundingLocation FROM artists WHERE legalName = ?',
+                    (artist,))
+        row = cur.fetchone()
+        if row is None:
+            return
+        genre, language, country = row
+        scores = {}
+        #Artists of the same genre: those that also share language and
+        #country first, so a large genre is never read whole.
         if genre is not None:
-            query += "genre like '%%%s%%'" % genre
-            add = 1
-        if country is not None:
-            if add:
-                query += " and "
-            query += "foundingLocation like '%%%s%%'" % country
-            add = 1
-        if language is not None:
-            if add:
-                query += " and "
-            query += "language like '%%%s%%'" % language
-            add = 1
-        if name is not None:
-            if add:
-                query += " and "
-            query += "legalName like '%%%s%%'" % name
-
-        con = sqlite3.connect(self.db_path)
-        with con:
-            #Cursor and row initialization
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            #Provide support for foreign keys
-            cur.execute(keys_on)
-            #Execute main SQL Statement
-            cur.execute(query)
-            #Get results
-            rows = cur.fetchall()
-            if rows is None:
-                return None
-            #Build the return object
-            artists = []
-            for row in rows:
-                artist = self._create_artist_object(row)
-                artists.append(artist)
-            return artists
+            tiers = (('genre = ? AND language = ? AND foundingLocation = ?',
+                      (genre, language, country)),
+                     ('genre = ? AND language = ?', (genre, language)),
+                     ('genre = ?', (genre,)))
+            for where, pvalue in tiers:
+                if None in pvalue:
+                    continue
+                cur.execute('SELECT legalName, language, foundingLocation FROM artists\
+                             WHERE %s AND legalName <> ? LIMIT ?' % where,
+                            pvalue + (artist, SIMILAR_ARTISTS))
+                for name, other_language, other_country in cur.fetchall():
+                    score = SIMILARITY_WEIGHTS['genre']
+                    if language is not None and other_language == language:
+                        score += SIMILARITY_WEIGHTS['language']
+                    if country is not None and other_country == country:
+                        score += SIMILARITY_WEIGHTS['foundingLocation']
+                    scores[name] = score
+                if len(scores) >= SIMILAR_ARTISTS:
+                    break
+        #Artists in the same playlists, as the share of the (most recent)
+        #playlists of artist that contain them.
+        cur.execute('WITH lists AS (SELECT pl_user, pl_name FROM songs\
+                                    JOIN song_in_playlist ON song_in_playlist.song = songs.sid\
+                                    WHERE songs.byArtist = ? GROUP BY pl_user, pl_name\
+                                    ORDER BY MAX(added_on) DESC LIMIT ?),\
+                          entries AS (SELECT DISTINCT lists.pl_user, lists.pl_name, songs.byArtist\
+                                      FROM lists JOIN song_in_playlist\
+                                      ON song_in_playlist.pl_user = lists.pl_user\
+                                      AND song_in_playlist.pl_name = lists.pl_name\
+                                      JOIN songs ON songs.sid = song_in_playlist.song)\
+                     SELECT byArtist, COUNT(*) FROM entries GROUP BY byArtist',
+                    (artist, SIMILARITY_PLAYLISTS))
+        counts = dict(cur.fetchall())
+        total = counts.pop(artist, 0)
+        for name, count in counts.items():
+            if name is not None and total:
+                scores[name] = scores.get(name, 0.0) + SIMILARITY_WEIGHTS['playlists'] * count / total
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:SIMILAR_ARTISTS]
+        cur.executemany('INSERT INTO artist_similarity (artist, similar, score) VALUES (?,?,?)',
+                        [(artist, name, score) for name, score in best])
+
+    def get_similar_artists(self, artist, limit=SIMILAR_ARTISTS):
+        '''
+        Return at most limit artists similar to artist, most similar first,
+        as stored in the similarity index. Each artist has an extra 'score'
+        key.
+        '''
+        query = 'SELECT artists.*, artist_similarity.score AS score FROM artist_similarity\
+                 JOIN artists ON artists.legalName = artist_similarity.similar\
+                 WHERE artist_similarity.artist = ?\
+                 ORDER BY artist_similarity.score DESC, artists.legalName LIMIT ?'
+        return self._execute(query, (artist, limit), 'all', Artist)
+
+    def get_recommendations(self, nickname, limit=DEFAULT_RECOMMENDATIONS_LIMIT):
+        '''
+        Return at most limit songs recommended to the user nickname, best
+        first. Each song has an extra 'score' key.
+
+        The artists of the songs in the playlists of the user are the seeds.
+        Their neighbours in the similarity index are scored by the average
+        similarity to the seeds, weighted by the songs of each seed, and the
+        most played songs of the best artists that are not yet in the
+        playlists of the user are recommended (at most
+        RECOMMENDED_SONGS_PER_ARTIST per artist). The index is only read:
+        the queued artists are recomputed by refresh_similarity_index (see
+        the similarity module). A user without songs in playlists gets no
+        recommendations.
+        '''
+        if limit < 1:
+            raise ValueError("The limit must be a positive integer")
+        seeds_query = 'SELECT songs.byArtist, COUNT(*) FROM song_in_playlist\
+                       JOIN songs ON songs.sid = song_in_playlist.song\
+                       WHERE song_in_playlist.pl_user = ? GROUP BY songs.byArtist'
+        similar_query = 'SELECT artist, similar, score FROM artist_similarity WHERE artist IN (%s)'
+        songs_query = 'SELECT songs.*, COALESCE((SELECT plays FROM song_stats\
+                                                 WHERE song_stats.song = songs.sid), 0) AS plays\
+                       FROM songs WHERE byArtist = ? AND sid NOT IN\
+                       (SELECT song FROM song_in_playlist WHERE pl_user = ?)\
+                       ORDER BY plays DESC, name LIMIT ?'
+        with self._transaction() as cur:
+            cur.execute(seeds_query, (nickname,))
+            seeds = dict((artist, count) for artist, count in cur.fetchall()
+                         if artist is not None)
+            if not seeds:
+                return []
+            total = float(sum(seeds.values()))
+            scores = {}
+            names = list(seeds)
+            for start in range(0, len(names), MAX_BOUND_LIST):
+                placeholders, pvalue = bind_list(names[start:start + MAX_BOUND_LIST])
+                cur.execute(similar_query % placeholders, pvalue)
+                for artist, similar, score in cur.fetchall():
+                    scores[similar] = scores.get(similar, 0.0) + score * seeds[artist] / total
+            songs = []
+            for artist, score in sorted(scores.items(), key=lambda item: (-item[1], item[0])):
+                if len(songs) >= limit:
+                    break
+                cur.execute(songs_query, (artist, nickname,
+                                          min(RECOMMENDED_SONGS_PER_ARTIST, limit - len(songs))))
+                for row in cur.fetchall():
+                    song = self._create_song_object(row)
+                    song['score'] = round(score, 4)
+                    songs.append(song)
+            return songs
 
     def delete_playlist(self, user, title):
-        keys_on = 'PRAGMA foreign_keys = ON'
         stmnt = 'DELETE FROM playlists WHERE author = ? and name = ?'
-        #connects  to the database.
-        con = sqlite3.connect(self.db_path)
-        with con:
-            #Cursor and row initialization
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            #Provide support for foreign keys
-            cur.execute(keys_on)
-            #Execute main SQL Statement
+        try:
             pvalue = (user,title,)
-            cur.execute(stmnt, pvalue)
-
-            if cur.rowcount < 1:
-                return False
-
-            return True
+            return self._execute(stmnt, pvalue, 'execute').rowcount > 0
+        finally:
+            self._invalidate('playlist', (user, title))
 
     def delete_user(self, nickname):
-        keys_on = 'PRAGMA foreign_keys = ON'
         stmnt = 'DELETE FROM users WHERE nickname = ?'
-        #connects  to the database.
-        con = sqlite3.connect(self.db_path)
-        with con:
-            #Cursor and row initialization
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            #Provide support for foreign keys
-            cur.execute(keys_on)
-            #Execute main SQL Statement
+        try:
             pvalue = (nickname,)
-            cur.execute(stmnt, pvalue)
-            if cur.rowcount < 1:
-                return False
-
-            return True
+            return self._execute(stmnt, pvalue, 'execute').rowcount > 0
+        finally:
+            self._invalidate('user', nickname)
+            self._invalidate_playlists_of(nickname)
 
 
 
@@ -605,66 +1901,44 @@ class MusicDatabase(object):
         return self.get_playlist(title, user) is not None
 
     def modify_playlist(self, user, title, new_user, new_title, created_on):
-        keys_on = 'PRAGMA foreign_keys = ON'
         stmnt = 'UPDATE playlists SET name = ? , author = ?, created_on = ?\
                  WHERE user = ? and author = ?'
-        #Connects  to the database.
-        con = sqlite3.connect(self.db_path)
-        with con:
-            #Cursor and row initialization
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            #Provide support for foreign keys
-            cur.execute(keys_on)
-            #Execute main SQL Statement
+        try:
             pvalue = (new_title, new_user, created_on, user, title,)
-            cur.execute(stmnt, pvalue)
-            if cur.rowcount < 1:
+            if self._execute(stmnt, pvalue, 'execute').rowcount < 1:
                 return None
             return new_title
+        finally:
+            self._invalidate('playlist', (user, title), (new_user, new_title))
 
     def modify_user(self, old_nickname, age, country, gender):
-        keys_on = 'PRAGMA foreign_keys = ON'
         stmnt = 'UPDATE users SET age = ?, nationality = ?, gender = ? \
                  WHERE nickname = ?'
-        #Connects  to the database.
-        con = sqlite3.connect(self.db_path)
-        with con:
-            #Cursor and row initialization
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            #Provide support for foreign keys
-            cur.execute(keys_on)
-            #Execute main SQL Statement
+        try:
             pvalue = (age, country, gender, old_nickname,)
-            cur.execute(stmnt, pvalue)
-            if cur.rowcount < 1:
+            if self._execute(stmnt, pvalue, 'execute').rowcount < 1:
                 return None
             return old_nickname
+        finally:
+            self._invalidate('user', old_nickname)
 
     def delete_song(self, artist, title):
 
-        keys_on = 'PRAGMA foreign_keys = ON'
-
         query = 'DELETE FROM songs WHERE byArtist = ? and name = ?'
-
-        con = sqlite3.connect(self.db_path)
-        with con:
-
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-
-            cur.execute(keys_on)
-
+        try:
             pvalue = (artist,title)
-            cur.execute(query, pvalue)
-
-            if cur.rowcount < 1:
-                return False
-            return True
+            return self._execute(query, pvalue, 'execute').rowcount > 0
+        finally:
+            self._invalidate('song', (artist, title))
 
     def contains_song(self, artist, title):
         return self.get_song(artist, title) is not None
 
-
-MusicDatabase.create_connection(DEFAULT_DB_PATH)
\ No newline at end of file
+#Phases timed when the instrumentation is enabled (see instrumentation).
+instrumentation.register(ConnectionPool, 'checkout', ('acquire',))
+instrumentation.register(ConnectionPool, 'connect', ('_connect',))
+instrumentation.register(CatalogueReplica, 'replica', ('_refresh',))
+instrumentation.register(MusicDatabase, 'query',
+                         [name for name, value in vars(MusicDatabase).items()
+                          if not name.startswith('_') and inspect.isfunction(value) and name != 'bulk_load'])
+instrumentation.register(MusicDatabase, 'rows', ('_fetch_rows',))
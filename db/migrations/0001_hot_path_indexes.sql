@@ -0,0 +1,7 @@
+-- Secondary indexes for the lookups done on every request.
+-- get_song / get_songs(artist): WHERE byArtist = ? [and name = ?]
+CREATE INDEX IF NOT EXISTS songs_by_artist_name ON songs (byArtist, name);
+-- get_playlists(user): WHERE author = ?
+CREATE INDEX IF NOT EXISTS playlists_by_author ON playlists (author);
+-- get_songs_in_playlist: WHERE pl_name = ? and pl_user = ?
+CREATE INDEX IF NOT EXISTS song_in_playlist_by_playlist ON song_in_playlist (pl_user, pl_name);
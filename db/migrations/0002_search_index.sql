@@ -0,0 +1,48 @@
+-- Full-text search over the catalogue. Both indexes are external content
+-- tables: they only store the index, the text is read from artists/songs.
+-- The prefix option keeps 2 and 3 character prefix queries (e.g. "col*")
+-- as cheap as whole-token lookups.
+CREATE VIRTUAL TABLE IF NOT EXISTS artists_fts USING fts5(
+	legalName, genre, foundingLocation, language,
+	content='artists', content_rowid='rowid',
+	tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS songs_fts USING fts5(
+	name, byArtist,
+	content='songs', content_rowid='sid',
+	tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+
+-- Matches on the name weigh more than matches on the other columns.
+INSERT INTO artists_fts(artists_fts, rank) VALUES('rank', 'bm25(10.0, 2.0, 1.0, 1.0)');
+INSERT INTO songs_fts(songs_fts, rank) VALUES('rank', 'bm25(10.0, 3.0)');
+
+-- Keep the indexes in sync with the catalogue.
+CREATE TRIGGER IF NOT EXISTS artists_fts_insert AFTER INSERT ON artists BEGIN
+	INSERT INTO artists_fts(rowid, legalName, genre, foundingLocation, language)
+	VALUES (new.rowid, new.legalName, new.genre, new.foundingLocation, new.language);
+END;
+CREATE TRIGGER IF NOT EXISTS artists_fts_delete AFTER DELETE ON artists BEGIN
+	INSERT INTO artists_fts(artists_fts, rowid, legalName, genre, foundingLocation, language)
+	VALUES ('delete', old.rowid, old.legalName, old.genre, old.foundingLocation, old.language);
+END;
+CREATE TRIGGER IF NOT EXISTS artists_fts_update AFTER UPDATE ON artists BEGIN
+	INSERT INTO artists_fts(artists_fts, rowid, legalName, genre, foundingLocation, language)
+	VALUES ('delete', old.rowid, old.legalName, old.genre, old.foundingLocation, old.language);
+	INSERT INTO artists_fts(rowid, legalName, genre, foundingLocation, language)
+	VALUES (new.rowid, new.legalName, new.genre, new.foundingLocation, new.language);
+END;
+CREATE TRIGGER IF NOT EXISTS songs_fts_insert AFTER INSERT ON songs BEGIN
+	INSERT INTO songs_fts(rowid, name, byArtist) VALUES (new.sid, new.name, new.byArtist);
+END;
+CREATE TRIGGER IF NOT EXISTS songs_fts_delete AFTER DELETE ON songs BEGIN
+	INSERT INTO songs_fts(songs_fts, rowid, name, byArtist) VALUES ('delete', old.sid, old.name, old.byArtist);
+END;
+CREATE TRIGGER IF NOT EXISTS songs_fts_update AFTER UPDATE ON songs BEGIN
+	INSERT INTO songs_fts(songs_fts, rowid, name, byArtist) VALUES ('delete', old.sid, old.name, old.byArtist);
+	INSERT INTO songs_fts(rowid, name, byArtist) VALUES (new.sid, new.name, new.byArtist);
+END;
+
+-- Index the rows that already exist.
+INSERT INTO artists_fts(artists_fts) VALUES ('rebuild');
+INSERT INTO songs_fts(songs_fts) VALUES ('rebuild');
@@ -0,0 +1,8 @@
+-- Keyset pagination walks playlists by (author, name) and the songs of a
+-- playlist by (pl_user, pl_name, song). Extending the indexes of 0001 with
+-- the sort key lets every page be read straight from the index, without a
+-- temporary b-tree over all the rows of the user or playlist.
+DROP INDEX IF EXISTS playlists_by_author;
+CREATE INDEX IF NOT EXISTS playlists_by_author_name ON playlists (author, name);
+DROP INDEX IF EXISTS song_in_playlist_by_playlist;
+CREATE INDEX IF NOT EXISTS song_in_playlist_by_playlist_song ON song_in_playlist (pl_user, pl_name, song);
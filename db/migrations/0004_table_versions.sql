@@ -0,0 +1,106 @@
+-- Per-table change counters used as cheap HTTP validators (ETag and
+-- Last-Modified). Every insert, update or delete bumps the version of its
+-- table and stores the time of the change, so a client polling a resource
+-- can be answered by reading this table only.
+CREATE TABLE IF NOT EXISTS table_versions (
+	`name`	TEXT,
+	`version`	INTEGER NOT NULL DEFAULT 0,
+	`modified_on`	INTEGER NOT NULL,
+	PRIMARY KEY(name)
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO table_versions (name, version, modified_on) VALUES
+	('artists', 0, CAST(strftime('%s', 'now') AS INTEGER)),
+	('songs', 0, CAST(strftime('%s', 'now') AS INTEGER)),
+	('users', 0, CAST(strftime('%s', 'now') AS INTEGER)),
+	('playlists', 0, CAST(strftime('%s', 'now') AS INTEGER)),
+	('song_in_playlist', 0, CAST(strftime('%s', 'now') AS INTEGER));
+
+CREATE TRIGGER IF NOT EXISTS artists_version_insert AFTER INSERT ON artists BEGIN
+	UPDATE table_versions SET version = version + 1,
+		modified_on = CAST(strftime('%s', 'now') AS INTEGER)
+	WHERE name = 'artists';
+END;
+
+CREATE TRIGGER IF NOT EXISTS artists_version_update AFTER UPDATE ON artists BEGIN
+	UPDATE table_versions SET version = version + 1,
+		modified_on = CAST(strftime('%s', 'now') AS INTEGER)
+	WHERE name = 'artists';
+END;
+
+CREATE TRIGGER IF NOT EXISTS artists_version_delete AFTER DELETE ON artists BEGIN
+	UPDATE table_versions SET version = version + 1,
+		modified_on = CAST(strftime('%s', 'now') AS INTEGER)
+	WHERE name = 'artists';
+END;
+
+CREATE TRIGGER IF NOT EXISTS songs_version_insert AFTER INSERT ON songs BEGIN
+	UPDATE table_versions SET version = version + 1,
+		modified_on = CAST(strftime('%s', 'now') AS INTEGER)
+	WHERE name = 'songs';
+END;
+
+CREATE TRIGGER IF NOT EXISTS songs_version_update AFTER UPDATE ON songs BEGIN
+	UPDATE table_versions SET version = version + 1,
+		modified_on = CAST(strftime('%s', 'now') AS INTEGER)
+	WHERE name = 'songs';
+END;
+
+CREATE TRIGGER IF NOT EXISTS songs_version_delete AFTER DELETE ON songs BEGIN
+	UPDATE table_versions SET version = version + 1,
+		modified_on = CAST(strftime('%s', 'now') AS INTEGER)
+	WHERE name = 'songs';
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_version_insert AFTER INSERT ON users BEGIN
+	UPDATE table_versions SET version = version + 1,
+		modified_on = CAST(strftime('%s', 'now') AS INTEGER)
+	WHERE name = 'users';
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_version_update AFTER UPDATE ON users BEGIN
+	UPDATE table_versions SET version = version + 1,
+		modified_on = CAST(strftime('%s', 'now') AS INTEGER)
+	WHERE name = 'users';
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_version_delete AFTER DELETE ON users BEGIN
+	UPDATE table_versions SET version = version + 1,
+		modified_on = CAST(strftime('%s', 'now') AS INTEGER)
+	WHERE name = 'users';
+END;
+
+CREATE TRIGGER IF NOT EXISTS playlists_version_insert AFTER INSERT ON playlists BEGIN
+	UPDATE table_versions SET version = version + 1,
+		modified_on = CAST(strftime('%s', 'now') AS INTEGER)
+	WHERE name = 'playlists';
+END;
+
+CREATE TRIGGER IF NOT EXISTS playlists_version_update AFTER UPDATE ON playlists BEGIN
+	UPDATE table_versions SET version = version + 1,
+		modified_on = CAST(strftime('%s', 'now') AS INTEGER)
+	WHERE name = 'playlists';
+END;
+
+CREATE TRIGGER IF NOT EXISTS playlists_version_delete AFTER DELETE ON playlists BEGIN
+	UPDATE table_versions SET version = version + 1,
+		modified_on = CAST(strftime('%s', 'now') AS INTEGER)
+	WHERE name = 'playlists';
+END;
+
+CREATE TRIGGER IF NOT EXISTS song_in_playlist_version_insert AFTER INSERT ON song_in_playlist BEGIN
+	UPDATE table_versions SET version = version + 1,
+		modified_on = CAST(strftime('%s', 'now') AS INTEGER)
+	WHERE name = 'song_in_playlist';
+END;
+
+CREATE TRIGGER IF NOT EXISTS song_in_playlist_version_update AFTER UPDATE ON song_in_playlist BEGIN
+	UPDATE table_versions SET version = version + 1,
+		modified_on = CAST(strftime('%s', 'now') AS INTEGER)
+	WHERE name = 'song_in_playlist';
+END;
+
+CREATE TRIGGER IF NOT EXISTS song_in_playlist_version_delete AFTER DELETE ON song_in_playlist BEGIN
+	UPDATE table_versions SET version = version + 1,
+		modified_on = CAST(strftime('%s', 'now') AS INTEGER)
+	WHERE name = 'song_in_playlist';
+END;
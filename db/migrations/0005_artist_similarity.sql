@@ -0,0 +1,55 @@
+-- Precomputed artist similarity used by the recommendations. Every artist
+-- keeps its best neighbours, scored from genre, language and country and
+-- from how often both artists appear in the same playlists.
+CREATE TABLE IF NOT EXISTS artist_similarity (
+	`artist`	TEXT,
+	`similar`	TEXT,
+	`score`	REAL NOT NULL,
+	PRIMARY KEY(artist, similar)
+) WITHOUT ROWID;
+
+-- Candidate neighbours by content are looked up by genre, then language
+-- and country, without scanning the whole genre.
+CREATE INDEX IF NOT EXISTS artists_by_genre ON artists (genre, language, foundingLocation);
+
+-- Artists whose neighbours are out of date. The triggers below add them and
+-- MusicDatabase.refresh_similarity_index recomputes and removes them.
+CREATE TABLE IF NOT EXISTS similarity_queue (
+	`artist`	TEXT,
+	PRIMARY KEY(artist)
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO similarity_queue (artist)
+	SELECT legalName FROM artists WHERE legalName IS NOT NULL;
+
+-- A playlist change alters the co-occurrences of the artist of the song
+-- with every artist of the playlist, in both directions.
+CREATE TRIGGER IF NOT EXISTS song_in_playlist_similarity_insert AFTER INSERT ON song_in_playlist BEGIN
+	INSERT OR IGNORE INTO similarity_queue (artist)
+		SELECT songs.byArtist FROM song_in_playlist
+		JOIN songs ON songs.sid = song_in_playlist.song
+		WHERE song_in_playlist.pl_user = new.pl_user AND song_in_playlist.pl_name = new.pl_name
+		AND songs.byArtist IS NOT NULL;
+END;
+
+CREATE TRIGGER IF NOT EXISTS song_in_playlist_similarity_delete AFTER DELETE ON song_in_playlist BEGIN
+	INSERT OR IGNORE INTO similarity_queue (artist)
+		SELECT byArtist FROM songs WHERE sid = old.song AND byArtist IS NOT NULL;
+	INSERT OR IGNORE INTO similarity_queue (artist)
+		SELECT songs.byArtist FROM song_in_playlist
+		JOIN songs ON songs.sid = song_in_playlist.song
+		WHERE song_in_playlist.pl_user = old.pl_user AND song_in_playlist.pl_name = old.pl_name
+		AND songs.byArtist IS NOT NULL;
+END;
+
+CREATE TRIGGER IF NOT EXISTS artists_similarity_insert AFTER INSERT ON artists BEGIN
+	INSERT OR IGNORE INTO similarity_queue (artist) VALUES (new.legalName);
+END;
+
+CREATE TRIGGER IF NOT EXISTS artists_similarity_update AFTER UPDATE OF legalName, genre, language, foundingLocation ON artists BEGIN
+	INSERT OR IGNORE INTO similarity_queue (artist) VALUES (new.legalName);
+	DELETE FROM artist_similarity WHERE artist = old.legalName AND old.legalName IS NOT new.legalName;
+END;
+
+CREATE TRIGGER IF NOT EXISTS artists_similarity_delete AFTER DELETE ON artists BEGIN
+	DELETE FROM artist_similarity WHERE artist = old.legalName OR similar = old.legalName;
+END;
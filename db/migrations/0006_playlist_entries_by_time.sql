@@ -0,0 +1,3 @@
+-- The co-occurrence index is updated from the playlist entries added since
+-- its last build; this index lets the update read only those rows.
+CREATE INDEX IF NOT EXISTS song_in_playlist_by_added_on ON song_in_playlist (added_on);
@@ -0,0 +1,227 @@
+-- Summaries of the playlist entries served by the statistics resources. The
+-- triggers below keep them up to date on every write, so reading them is an
+-- indexed lookup instead of an aggregate over song_in_playlist. Counts that
+-- drop to zero keep their row; the readers skip them.
+
+-- Playlists that contain each song.
+CREATE TABLE IF NOT EXISTS song_stats (
+	`song`	INTEGER,
+	`plays`	INTEGER NOT NULL,
+	PRIMARY KEY(song)
+);
+CREATE INDEX IF NOT EXISTS song_stats_by_plays ON song_stats (plays DESC, song);
+
+-- Playlist entries of the songs of each artist.
+CREATE TABLE IF NOT EXISTS artist_stats (
+	`artist`	TEXT,
+	`plays`	INTEGER NOT NULL,
+	PRIMARY KEY(artist)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS artist_stats_by_plays ON artist_stats (plays DESC, artist);
+
+-- Playlist entries of each genre by an attribute (dimension) of the owner of
+-- the playlist: nationality, gender or age (by decade, e.g. '20-29').
+CREATE TABLE IF NOT EXISTS genre_stats (
+	`dimension`	TEXT,
+	`value`	TEXT,
+	`genre`	TEXT,
+	`plays`	INTEGER NOT NULL,
+	PRIMARY KEY(dimension, value, genre)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS genre_stats_by_plays ON genre_stats (dimension, value, plays DESC, genre);
+
+-- Playlist entries by the day (UTC, days since the epoch) they were added.
+CREATE TABLE IF NOT EXISTS daily_stats (
+	`day`	INTEGER,
+	`additions`	INTEGER NOT NULL,
+	PRIMARY KEY(day)
+);
+
+-- The rows counted by genre_stats: every playlist entry once per known
+-- attribute of its owner, with the genre of the artist of its song. The
+-- triggers filter it by entry, user, artist or song; the filters are pushed
+-- into each branch, which then reads a handful of rows by primary key.
+CREATE VIEW IF NOT EXISTS playlist_genre_facts AS
+	SELECT e.song, e.pl_name, e.pl_user, s.byArtist AS artist, a.genre,
+		'nationality' AS dimension, u.nationality AS value
+	FROM song_in_playlist e JOIN songs s ON s.sid = e.song
+	JOIN artists a ON a.legalName = s.byArtist JOIN users u ON u.nickname = e.pl_user
+	WHERE a.genre IS NOT NULL AND u.nationality IS NOT NULL
+	UNION ALL
+	SELECT e.song, e.pl_name, e.pl_user, s.byArtist, a.genre, 'gender', u.gender
+	FROM song_in_playlist e JOIN songs s ON s.sid = e.song
+	JOIN artists a ON a.legalName = s.byArtist JOIN users u ON u.nickname = e.pl_user
+	WHERE a.genre IS NOT NULL AND u.gender IS NOT NULL
+	UNION ALL
+	SELECT e.song, e.pl_name, e.pl_user, s.byArtist, a.genre, 'age',
+		(CAST(u.age AS INTEGER) / 10 * 10) || '-' || (CAST(u.age AS INTEGER) / 10 * 10 + 9)
+	FROM song_in_playlist e JOIN songs s ON s.sid = e.song
+	JOIN artists a ON a.legalName = s.byArtist JOIN users u ON u.nickname = e.pl_user
+	WHERE a.genre IS NOT NULL AND u.age IS NOT NULL;
+
+INSERT INTO song_stats (song, plays)
+	SELECT song, COUNT(*) FROM song_in_playlist GROUP BY song;
+INSERT INTO artist_stats (artist, plays)
+	SELECT s.byArtist, COUNT(*) FROM song_in_playlist e JOIN songs s ON s.sid = e.song
+	WHERE s.byArtist IS NOT NULL GROUP BY s.byArtist;
+INSERT INTO genre_stats (dimension, value, genre, plays)
+	SELECT dimension, value, genre, COUNT(*) FROM playlist_genre_facts
+	GROUP BY dimension, value, genre;
+INSERT INTO daily_stats (day, additions)
+	SELECT CAST(added_on AS INTEGER) / 86400, COUNT(*) FROM song_in_playlist
+	WHERE added_on IS NOT NULL GROUP BY CAST(added_on AS INTEGER) / 86400;
+
+-- Playlist entries. The rows removed are subtracted before the delete, while
+-- playlist_genre_facts still has them.
+CREATE TRIGGER IF NOT EXISTS song_in_playlist_stats_insert AFTER INSERT ON song_in_playlist BEGIN
+	INSERT INTO song_stats (song, plays) VALUES (new.song, 1)
+		ON CONFLICT (song) DO UPDATE SET plays = plays + 1;
+	INSERT INTO artist_stats (artist, plays)
+		SELECT byArtist, 1 FROM songs WHERE sid = new.song AND byArtist IS NOT NULL
+		ON CONFLICT (artist) DO UPDATE SET plays = plays + 1;
+	INSERT INTO genre_stats (dimension, value, genre, plays)
+		SELECT dimension, value, genre, 1 FROM playlist_genre_facts
+		WHERE song = new.song AND pl_name = new.pl_name AND pl_user = new.pl_user
+		ON CONFLICT (dimension, value, genre) DO UPDATE SET plays = plays + 1;
+	INSERT INTO daily_stats (day, additions)
+		SELECT CAST(new.added_on AS INTEGER) / 86400, 1 WHERE new.added_on IS NOT NULL
+		ON CONFLICT (day) DO UPDATE SET additions = additions + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS song_in_playlist_stats_delete BEFORE DELETE ON song_in_playlist BEGIN
+	UPDATE song_stats SET plays = plays - 1 WHERE song = old.song;
+	UPDATE artist_stats SET plays = plays - 1
+		WHERE artist = (SELECT byArtist FROM songs WHERE sid = old.song);
+	UPDATE genre_stats SET plays = plays - 1
+		WHERE (dimension, value, genre) IN
+		(SELECT dimension, value, genre FROM playlist_genre_facts
+		 WHERE song = old.song AND pl_name = old.pl_name AND pl_user = old.pl_user);
+	UPDATE daily_stats SET additions = additions - 1
+		WHERE day = CAST(old.added_on AS INTEGER) / 86400;
+END;
+
+CREATE TRIGGER IF NOT EXISTS song_in_playlist_stats_update_old BEFORE UPDATE OF song, pl_user, added_on ON song_in_playlist BEGIN
+	UPDATE song_stats SET plays = plays - 1 WHERE song = old.song;
+	UPDATE artist_stats SET plays = plays - 1
+		WHERE artist = (SELECT byArtist FROM songs WHERE sid = old.song);
+	UPDATE genre_stats SET plays = plays - 1
+		WHERE (dimension, value, genre) IN
+		(SELECT dimension, value, genre FROM playlist_genre_facts
+		 WHERE song = old.song AND pl_name = old.pl_name AND pl_user = old.pl_user);
+	UPDATE daily_stats SET additions = additions - 1
+		WHERE day = CAST(old.added_on AS INTEGER) / 86400;
+END;
+
+CREATE TRIGGER IF NOT EXISTS song_in_playlist_stats_update_new AFTER UPDATE OF song, pl_user, added_on ON song_in_playlist BEGIN
+	INSERT INTO song_stats (song, plays) VALUES (new.song, 1)
+		ON CONFLICT (song) DO UPDATE SET plays = plays + 1;
+	INSERT INTO artist_stats (artist, plays)
+		SELECT byArtist, 1 FROM songs WHERE sid = new.song AND byArtist IS NOT NULL
+		ON CONFLICT (artist) DO UPDATE SET plays = plays + 1;
+	INSERT INTO genre_stats (dimension, value, genre, plays)
+		SELECT dimension, value, genre, 1 FROM playlist_genre_facts
+		WHERE song = new.song AND pl_name = new.pl_name AND pl_user = new.pl_user
+		ON CONFLICT (dimension, value, genre) DO UPDATE SET plays = plays + 1;
+	INSERT INTO daily_stats (day, additions)
+		SELECT CAST(new.added_on AS INTEGER) / 86400, 1 WHERE new.added_on IS NOT NULL
+		ON CONFLICT (day) DO UPDATE SET additions = additions + 1;
+END;
+
+-- The attributes of users, the genres of artists and the artists of songs
+-- decide where the entries are counted: a change moves the entries it
+-- affects from the old counts to the new ones.
+CREATE TRIGGER IF NOT EXISTS users_stats_insert AFTER INSERT ON users BEGIN
+	INSERT INTO genre_stats (dimension, value, genre, plays)
+		SELECT dimension, value, genre, COUNT(*) FROM playlist_genre_facts
+		WHERE pl_user = new.nickname GROUP BY dimension, value, genre
+		ON CONFLICT (dimension, value, genre) DO UPDATE SET plays = plays + excluded.plays;
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_stats_delete BEFORE DELETE ON users BEGIN
+	INSERT INTO genre_stats (dimension, value, genre, plays)
+		SELECT dimension, value, genre, -COUNT(*) FROM playlist_genre_facts
+		WHERE pl_user = old.nickname GROUP BY dimension, value, genre
+		ON CONFLICT (dimension, value, genre) DO UPDATE SET plays = plays + excluded.plays;
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_stats_update_old BEFORE UPDATE OF nickname, nationality, gender, age ON users BEGIN
+	INSERT INTO genre_stats (dimension, value, genre, plays)
+		SELECT dimension, value, genre, -COUNT(*) FROM playlist_genre_facts
+		WHERE pl_user = old.nickname GROUP BY dimension, value, genre
+		ON CONFLICT (dimension, value, genre) DO UPDATE SET plays = plays + excluded.plays;
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_stats_update_new AFTER UPDATE OF nickname, nationality, gender, age ON users BEGIN
+	INSERT INTO genre_stats (dimension, value, genre, plays)
+		SELECT dimension, value, genre, COUNT(*) FROM playlist_genre_facts
+		WHERE pl_user = new.nickname GROUP BY dimension, value, genre
+		ON CONFLICT (dimension, value, genre) DO UPDATE SET plays = plays + excluded.plays;
+END;
+
+CREATE TRIGGER IF NOT EXISTS artists_stats_insert AFTER INSERT ON artists BEGIN
+	INSERT INTO genre_stats (dimension, value, genre, plays)
+		SELECT dimension, value, genre, COUNT(*) FROM playlist_genre_facts
+		WHERE artist = new.legalName GROUP BY dimension, value, genre
+		ON CONFLICT (dimension, value, genre) DO UPDATE SET plays = plays + excluded.plays;
+END;
+
+CREATE TRIGGER IF NOT EXISTS artists_stats_delete BEFORE DELETE ON artists BEGIN
+	INSERT INTO genre_stats (dimension, value, genre, plays)
+		SELECT dimension, value, genre, -COUNT(*) FROM playlist_genre_facts
+		WHERE artist = old.legalName GROUP BY dimension, value, genre
+		ON CONFLICT (dimension, value, genre) DO UPDATE SET plays = plays + excluded.plays;
+END;
+
+CREATE TRIGGER IF NOT EXISTS artists_stats_update_old BEFORE UPDATE OF legalName, genre ON artists BEGIN
+	INSERT INTO genre_stats (dimension, value, genre, plays)
+		SELECT dimension, value, genre, -COUNT(*) FROM playlist_genre_facts
+		WHERE artist = old.legalName GROUP BY dimension, value, genre
+		ON CONFLICT (dimension, value, genre) DO UPDATE SET plays = plays + excluded.plays;
+END;
+
+CREATE TRIGGER IF NOT EXISTS artists_stats_update_new AFTER UPDATE OF legalName, genre ON artists BEGIN
+	INSERT INTO genre_stats (dimension, value, genre, plays)
+		SELECT dimension, value, genre, COUNT(*) FROM playlist_genre_facts
+		WHERE artist = new.legalName GROUP BY dimension, value, genre
+		ON CONFLICT (dimension, value, genre) DO UPDATE SET plays = plays + excluded.plays;
+END;
+
+CREATE TRIGGER IF NOT EXISTS songs_stats_insert AFTER INSERT ON songs BEGIN
+	INSERT INTO artist_stats (artist, plays)
+		SELECT new.byArtist, COUNT(*) FROM song_in_playlist
+		WHERE song = new.sid AND new.byArtist IS NOT NULL HAVING COUNT(*) > 0
+		ON CONFLICT (artist) DO UPDATE SET plays = plays + excluded.plays;
+	INSERT INTO genre_stats (dimension, value, genre, plays)
+		SELECT dimension, value, genre, COUNT(*) FROM playlist_genre_facts
+		WHERE song = new.sid GROUP BY dimension, value, genre
+		ON CONFLICT (dimension, value, genre) DO UPDATE SET plays = plays + excluded.plays;
+END;
+
+CREATE TRIGGER IF NOT EXISTS songs_stats_delete BEFORE DELETE ON songs BEGIN
+	UPDATE artist_stats SET plays = plays - (SELECT COUNT(*) FROM song_in_playlist WHERE song = old.sid)
+		WHERE artist = old.byArtist;
+	INSERT INTO genre_stats (dimension, value, genre, plays)
+		SELECT dimension, value, genre, -COUNT(*) FROM playlist_genre_facts
+		WHERE song = old.sid GROUP BY dimension, value, genre
+		ON CONFLICT (dimension, value, genre) DO UPDATE SET plays = plays + excluded.plays;
+END;
+
+CREATE TRIGGER IF NOT EXISTS songs_stats_update_old BEFORE UPDATE OF sid, byArtist ON songs BEGIN
+	UPDATE artist_stats SET plays = plays - (SELECT COUNT(*) FROM song_in_playlist WHERE song = old.sid)
+		WHERE artist = old.byArtist;
+	INSERT INTO genre_stats (dimension, value, genre, plays)
+		SELECT dimension, value, genre, -COUNT(*) FROM playlist_genre_facts
+		WHERE song = old.sid GROUP BY dimension, value, genre
+		ON CONFLICT (dimension, value, genre) DO UPDATE SET plays = plays + excluded.plays;
+END;
+
+CREATE TRIGGER IF NOT EXISTS songs_stats_update_new AFTER UPDATE OF sid, byArtist ON songs BEGIN
+	INSERT INTO artist_stats (artist, plays)
+		SELECT new.byArtist, COUNT(*) FROM song_in_playlist
+		WHERE song = new.sid AND new.byArtist IS NOT NULL HAVING COUNT(*) > 0
+		ON CONFLICT (artist) DO UPDATE SET plays = plays + excluded.plays;
+	INSERT INTO genre_stats (dimension, value, genre, plays)
+		SELECT dimension, value, genre, COUNT(*) FROM playlist_genre_facts
+		WHERE song = new.sid GROUP BY dimension, value, genre
+		ON CONFLICT (dimension, value, genre) DO UPDATE SET plays = plays + excluded.plays;
+END;
@@ -0,0 +1,23 @@
+-- The playlist triggers of 0005 queued every artist of the playlist on
+-- each entry, so appending n songs re-read the playlist n times. An entry
+-- now queues the artist of its own song and marks its playlist, whose
+-- other artists are queued once by MusicDatabase.refresh_similarity_index.
+CREATE TABLE IF NOT EXISTS similarity_playlists (
+	`pl_user`	TEXT,
+	`pl_name`	TEXT,
+	PRIMARY KEY(pl_user, pl_name)
+) WITHOUT ROWID;
+
+DROP TRIGGER IF EXISTS song_in_playlist_similarity_insert;
+CREATE TRIGGER IF NOT EXISTS song_in_playlist_similarity_insert AFTER INSERT ON song_in_playlist BEGIN
+	INSERT OR IGNORE INTO similarity_queue (artist)
+		SELECT byArtist FROM songs WHERE sid = new.song AND byArtist IS NOT NULL;
+	INSERT OR IGNORE INTO similarity_playlists (pl_user, pl_name) VALUES (new.pl_user, new.pl_name);
+END;
+
+DROP TRIGGER IF EXISTS song_in_playlist_similarity_delete;
+CREATE TRIGGER IF NOT EXISTS song_in_playlist_similarity_delete AFTER DELETE ON song_in_playlist BEGIN
+	INSERT OR IGNORE INTO similarity_queue (artist)
+		SELECT byArtist FROM songs WHERE sid = old.song AND byArtist IS NOT NULL;
+	INSERT OR IGNORE INTO similarity_playlists (pl_user, pl_name) VALUES (old.pl_user, old.pl_name);
+END;
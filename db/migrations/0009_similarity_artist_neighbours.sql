@@ -0,0 +1,30 @@
+-- The artist triggers of 0005 only queued the artist that changed, so the
+-- artists that had it as a neighbour kept their old scores, and the
+-- artists of its new genre never took it in. They are queued too now:
+-- the artists that list it in artist_similarity, looked up by the index
+-- below, and the artists of its genre.
+CREATE INDEX IF NOT EXISTS artist_similarity_by_similar ON artist_similarity (similar);
+
+DROP TRIGGER IF EXISTS artists_similarity_insert;
+CREATE TRIGGER IF NOT EXISTS artists_similarity_insert AFTER INSERT ON artists BEGIN
+	INSERT OR IGNORE INTO similarity_queue (artist) VALUES (new.legalName);
+	INSERT OR IGNORE INTO similarity_queue (artist)
+		SELECT legalName FROM artists WHERE genre = new.genre AND legalName IS NOT NULL;
+END;
+
+DROP TRIGGER IF EXISTS artists_similarity_update;
+CREATE TRIGGER IF NOT EXISTS artists_similarity_update AFTER UPDATE OF legalName, genre, language, foundingLocation ON artists BEGIN
+	INSERT OR IGNORE INTO similarity_queue (artist) VALUES (new.legalName);
+	INSERT OR IGNORE INTO similarity_queue (artist)
+		SELECT artist FROM artist_similarity WHERE similar = old.legalName AND artist IS NOT old.legalName;
+	INSERT OR IGNORE INTO similarity_queue (artist)
+		SELECT legalName FROM artists WHERE genre = new.genre AND legalName IS NOT NULL;
+	DELETE FROM artist_similarity WHERE artist = old.legalName AND old.legalName IS NOT new.legalName;
+END;
+
+DROP TRIGGER IF EXISTS artists_similarity_delete;
+CREATE TRIGGER IF NOT EXISTS artists_similarity_delete AFTER DELETE ON artists BEGIN
+	INSERT OR IGNORE INTO similarity_queue (artist)
+		SELECT artist FROM artist_similarity WHERE similar = old.legalName AND artist IS NOT old.legalName;
+	DELETE FROM artist_similarity WHERE artist = old.legalName OR similar = old.legalName;
+END;
@@ -0,0 +1,6 @@
+-- The similarity index is refreshed outside the requests (see the
+-- similarity module), so the recommendations need a change counter of
+-- their own to validate against. MusicDatabase.refresh_similarity_index
+-- bumps it once per refresh.
+INSERT OR IGNORE INTO table_versions (name, version, modified_on) VALUES
+	('artist_similarity', 0, CAST(strftime('%s', 'now') AS INTEGER));
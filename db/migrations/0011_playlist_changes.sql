@@ -0,0 +1,26 @@
+-- Log of the songs added to and removed from the playlists, read by the
+-- updates of the co-occurrence index (see cooccurrence.update), which
+-- remove the rows they have read. Unlike added_on it also records the
+-- removals, and the entries whose added_on is missing or in the past.
+-- A row whose playlist is NULL asks for a full build: bulk_load adds one
+-- after loading entries with the triggers dropped. AUTOINCREMENT keeps the
+-- ids growing once the log has been emptied.
+CREATE TABLE IF NOT EXISTS playlist_changes (
+	`id`	INTEGER PRIMARY KEY AUTOINCREMENT,
+	`song`	INTEGER,
+	`pl_user`	TEXT,
+	`pl_name`	TEXT
+);
+
+CREATE TRIGGER IF NOT EXISTS song_in_playlist_changes_insert AFTER INSERT ON song_in_playlist BEGIN
+	INSERT INTO playlist_changes (song, pl_user, pl_name) VALUES (new.song, new.pl_user, new.pl_name);
+END;
+
+CREATE TRIGGER IF NOT EXISTS song_in_playlist_changes_update AFTER UPDATE ON song_in_playlist BEGIN
+	INSERT INTO playlist_changes (song, pl_user, pl_name) VALUES (old.song, old.pl_user, old.pl_name);
+	INSERT INTO playlist_changes (song, pl_user, pl_name) VALUES (new.song, new.pl_user, new.pl_name);
+END;
+
+CREATE TRIGGER IF NOT EXISTS song_in_playlist_changes_delete AFTER DELETE ON song_in_playlist BEGIN
+	INSERT INTO playlist_changes (song, pl_user, pl_name) VALUES (old.song, old.pl_user, old.pl_name);
+END;
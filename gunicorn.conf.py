@@ -0,0 +1,78 @@
+'''
+Gunicorn settings of the production server. Use it from the main folder with:
+
+    gunicorn -c gunicorn.conf.py musicfinder:application
+
+or through python musicfinder.py --production, which reads this file too.
+Every setting can be changed with an environment variable:
+
+    MUSICFINDER_BIND        address to listen on (default 0.0.0.0:5000)
+    MUSICFINDER_WORKERS     worker processes (default 2 * CPUs + 1)
+    MUSICFINDER_THREADS     request threads per worker (default 8)
+    MUSICFINDER_BACKLOG     pending connections queued by the kernel (default 2048)
+    MUSICFINDER_CONNECTIONS open connections per worker (default 1000)
+    MUSICFINDER_TIMEOUT     seconds a worker may stay silent before it is restarted (default 30)
+    MUSICFINDER_GRACEFUL_TIMEOUT
+                            seconds given to the running requests on shutdown (default 30)
+    MUSICFINDER_REPLICA     1 to serve the artists and songs of each worker from its own
+                            in-memory copy of the database (default 0)
+    MUSICFINDER_DATABASE    database file (default db/musicdb.db)
+
+The workers are threaded (gthread): idle keep-alive connections wait in a
+selector instead of holding a thread, so workers * connections clients can
+stay connected while workers * threads requests run at once. On SIGTERM or
+SIGINT the workers stop accepting connections, finish the requests in
+progress (up to the graceful timeout) and close their database connections.
+'''
+import multiprocessing, os, sys
+
+def _setting(name, default):
+    return int(os.environ.get('MUSICFINDER_' + name, default))
+
+bind = os.environ.get('MUSICFINDER_BIND', '0.0.0.0:5000')
+workers = _setting('WORKERS', 2 * multiprocessing.cpu_count() + 1)
+worker_class = 'gthread'
+threads = _setting('THREADS', 8)
+worker_connections = _setting('CONNECTIONS', 1000)
+backlog = _setting('BACKLOG', 2048)
+keepalive = 5
+timeout = _setting('TIMEOUT', 30)
+graceful_timeout = _setting('GRACEFUL_TIMEOUT', 30)
+#Every worker imports the application itself, so no sqlite connection is
+#opened before the fork and shared between processes.
+preload_app = False
+accesslog = '-'
+
+def on_starting(server):
+    '''
+    Bring the schema up to date once, before the workers start.
+    '''
+    import database
+    db = database.MusicDatabase(os.environ.get('MUSICFINDER_DATABASE') or None)
+    try:
+        db.apply_migrations()
+    finally:
+        db.close()
+
+def post_worker_init(worker):
+    '''
+    Size the connection pool of the worker to its number of threads, so no
+    request waits for a free connection. With MUSICFINDER_REPLICA the worker
+    reads the catalogue from its own replica (see database.CatalogueReplica).
+    '''
+    import resources
+    if os.environ.get('MUSICFINDER_DATABASE'):
+        resources.app.config['DATABASE_PATH'] = os.environ['MUSICFINDER_DATABASE']
+    #The database is opened by the first request of the worker.
+    resources.app.config['DATABASE_OPTIONS'] = {'pool_size': max(worker.cfg.threads, 1),
+                                                'replica': bool(_setting('REPLICA', 0))}
+
+def worker_exit(server, worker):
+    '''
+    Close the database connections of a worker that stops.
+    '''
+    resources = sys.modules.get('resources')
+    #Workers that served no request have no application or no database.
+    app = vars(resources).get('app') if resources is not None else None
+    if app is not None and app.config.get('DATABASE') is not None:
+        app.config['DATABASE'].close()
@@ -0,0 +1,377 @@
+'''
+Opt-in instrumentation of the server: per-phase timers, latency histograms in
+the Prometheus text format and request profiling.
+
+Classes and modules register the methods to time with register(). Nothing
+is wrapped until the instrumentation is enabled (enable(), or the
+environment variable MUSICFINDER_INSTRUMENTATION=1 at import time), so a
+server that does not use it pays nothing. Once enabled, every call of a
+registered method is observed in the histogram of its phase and name, and
+added to the phase totals of the current request. The phases are:
+
+    checkout   waiting for a pooled connection (ConnectionPool.acquire)
+    connect    opening a connection, pragmas included (ConnectionPool._connect)
+    pragmas    applying the pragma profile to a new connection
+    replica    copying the database into a new catalogue replica
+               (CatalogueReplica._refresh)
+    query      the public methods of MusicDatabase
+    rows       fetching the rows of a query and building their records
+               (MusicDatabase._fetch_rows)
+    resource   the get/post/put/delete methods of the resources
+    serialize  JSON encoding (serialization.dumps)
+
+Phases nest: a query includes its checkout and rows, and a resource the
+queries and the serialization it runs. Calls nested in the same phase are
+only added once to the request totals.
+
+init_app adds to a Flask application the hooks that time every request,
+report its phase totals in a Server-Timing header and, when the application
+config PROFILE_REQUESTS is true, profile the requests that carry an
+X-Profile header (cprofile, or pyinstrument if installed); their response
+is then the text report of the profiler.
+'''
+from contextlib import contextmanager
+import bisect, cProfile, functools, io, os, pstats, threading, time, types
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+#Upper bounds, in seconds, of the buckets of the latency histograms.
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+#Help text of the histograms, by metric name.
+METRICS = {
+    'musicfinder_request_seconds': 'Latency of the requests by endpoint, method and status',
+    'musicfinder_phase_seconds': 'Time spent in each phase of the requests by phase and name',
+}
+
+#Lines of the cProfile report.
+PROFILE_LINES = 40
+
+enabled = os.environ.get('MUSICFINDER_INSTRUMENTATION', '') not in ('', '0')
+
+class Histogram(object):
+    '''
+    Thread-safe histogram of observed values with fixed bucket bounds.
+    '''
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__()
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def snapshot(self):
+        '''
+        Return the cumulative count of every bucket (the last one is +Inf),
+        the sum and the count of the observed values.
+        '''
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = []
+        running = 0
+        for count in counts:
+            running += count
+            cumulative.append(running)
+        return cumulative, total, running
+
+#(metric, labels) -> Histogram, where labels is a tuple of (name, value).
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+#Methods given to register: (owner, phase, names, label prefix), and the
+#wrapped ones.
+_registered = []
+_wrapped = set()
+
+#Per-thread state of the current request: phase totals and the phases
+#being timed.
+_local = threading.local()
+
+def observe(metric, labels, value):
+    '''
+    Add value to the histogram of metric with labels (a tuple of (name,
+    value) pairs).
+    '''
+    key = (metric, labels)
+    histogram = _histograms.get(key)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(key, Histogram())
+    histogram.observe(value)
+
+def reset():
+    '''
+    Drop every observed value.
+    '''
+    with _histograms_lock:
+        _histograms.clear()
+
+def start_request():
+    '''
+    Start collecting the phase totals of the request run by this thread.
+    '''
+    _local.phases = {}
+
+def end_request():
+    '''
+    Stop collecting and return the phase totals {phase: seconds} of the
+    request run by this thread.
+    '''
+    phases = getattr(_local, 'phases', None)
+    _local.phases = None
+    return phases or {}
+
+def _record(phase, name, elapsed, outermost):
+    observe('musicfinder_phase_seconds', (('phase', phase), ('name', name)), elapsed)
+    phases = getattr(_local, 'phases', None)
+    if outermost and phases is not None:
+        phases[phase] = phases.get(phase, 0.0) + elapsed
+
+def _enter(phase):
+    '''
+    Mark phase as being timed by this thread and return True if it was not
+    already.
+    '''
+    active = getattr(_local, 'active', None)
+    if active is None:
+        active = _local.active = {}
+    depth = active.get(phase, 0)
+    active[phase] = depth + 1
+    return depth == 0
+
+def _leave(phase):
+    _local.active[phase] -= 1
+
+@contextmanager
+def timer(phase, name):
+    '''
+    Context manager that times its block as a call of name in phase. It does
+    nothing while the instrumentation is disabled.
+    '''
+    if not enabled:
+        yield
+        return
+    outermost = _enter(phase)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _leave(phase)
+        _record(phase, name, time.perf_counter() - start, outermost)
+
+def _timed_iteration(generator, phase, name, elapsed):
+    '''
+    Iterate over generator adding the time of every step to elapsed, and
+    record the total once it is exhausted or closed.
+    '''
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(generator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - start
+            yield item
+    finally:
+        generator.close()
+        _record(phase, name, elapsed, False)
+
+def timed(function, phase, name):
+    '''
+    Return a wrapper of function that times its calls as name in phase. The
+    time of a generator returned by function is recorded when it is
+    exhausted.
+    '''
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not enabled:
+            return function(*args, **kwargs)
+        outermost = _enter(phase)
+        start = time.perf_counter()
+        result = None
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            _leave(phase)
+            elapsed = time.perf_counter() - start
+            if not isinstance(result, types.GeneratorType):
+                _record(phase, name, elapsed, outermost)
+        if isinstance(result, types.GeneratorType):
+            return _timed_iteration(result, phase, name, elapsed)
+        return result
+    return wrapper
+
+def register(owner, phase, names, prefix=None):
+    '''
+    Time the functions names of owner (a class or a module) as phase. Their
+    calls are labelled prefix.name (by default the name of owner). The
+    functions are wrapped now if the instrumentation is enabled, and by
+    enable() otherwise.
+    '''
+    if prefix is None:
+        prefix = getattr(owner, '__name__', str(owner))
+    _registered.append((owner, phase, tuple(names), prefix))
+    if enabled:
+        _wrap(owner, phase, names, prefix)
+
+def _wrap(owner, phase, names, prefix):
+    for name in names:
+        if (owner, name) in _wrapped:
+            continue
+        function = vars(owner)[name]
+        setattr(owner, name, timed(function, phase, '%s.%s' % (prefix, name)))
+        _wrapped.add((owner, name))
+
+def enable():
+    '''
+    Turn the instrumentation on, wrapping the registered functions.
+    '''
+    global enabled
+    for owner, phase, names, prefix in _registered:
+        _wrap(owner, phase, names, prefix)
+    enabled = True
+
+def disable():
+    '''
+    Turn the instrumentation off. The wrappers stay but only check the flag.
+    '''
+    global enabled
+    enabled = False
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append('%s="%s"' % (name, value))
+    return '{%s}' % ','.join(escaped)
+
+def _format_number(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+def render_metrics(pool_stats=None, cache_stats=None):
+    '''
+    Return the histograms, and the statistics of a connection pool and of
+    entity caches if given, in the Prometheus text exposition format.
+    '''
+    lines = []
+    with _histograms_lock:
+        histograms = sorted(_histograms.items())
+    by_metric = {}
+    for (metric, labels), histogram in histograms:
+        by_metric.setdefault(metric, []).append((labels, histogram))
+    for metric in sorted(by_metric):
+        lines.append('# HELP %s %s' % (metric, METRICS.get(metric, metric)))
+        lines.append('# TYPE %s histogram' % metric)
+        for labels, histogram in by_metric[metric]:
+            cumulative, total, count = histogram.snapshot()
+            bounds = [repr(bound) for bound in histogram.buckets] + ['+Inf']
+            for bound, running in zip(bounds, cumulative):
+                lines.append('%s_bucket%s %d' % (metric, _format_labels(labels + (('le', bound),)), running))
+            lines.append('%s_sum%s %s' % (metric, _format_labels(labels), repr(total)))
+            lines.append('%s_count%s %d' % (metric, _format_labels(labels), count))
+    if pool_stats is not None:
+        lines.append('# HELP musicfinder_db_connections Connections of the database pool by state')
+        lines.append('# TYPE musicfinder_db_connections gauge')
+        for state in ('size', 'open', 'idle', 'in_use'):
+            lines.append('musicfinder_db_connections{state="%s"} %d' % (state, pool_stats[state]))
+        for counter in sorted(pool_stats):
+            if counter in ('size', 'open', 'idle', 'in_use'):
+                continue
+            lines.append('# TYPE musicfinder_db_pool_%s_total counter' % counter)
+            lines.append('musicfinder_db_pool_%s_total %s' % (counter, _format_number(pool_stats[counter])))
+    if cache_stats:
+        counters = sorted(set(name for stats in cache_stats.values() for name in stats))
+        for counter in counters:
+            lines.append('# TYPE musicfinder_cache_%s gauge' % counter)
+            for kind in sorted(cache_stats):
+                if counter in cache_stats[kind]:
+                    lines.append('musicfinder_cache_%s{cache="%s"} %s'
+                                 % (counter, kind, _format_number(cache_stats[kind][counter])))
+    return '\n'.join(lines) + '\n'
+
+def init_app(app):
+    '''
+    Add to the Flask application app the hooks that time its requests and
+    profile the ones that ask for it.
+    '''
+    from flask import g, request
+
+    @app.before_request
+    def start_instrumentation():
+        g.profiler = None
+        kind = request.headers.get('X-Profile')
+        if kind and app.config.get('PROFILE_REQUESTS'):
+            g.profiler = start_profiler(kind)
+        if enabled:
+            g.request_start = time.perf_counter()
+            start_request()
+
+    @app.after_request
+    def end_instrumentation(response):
+        profiler = g.pop('profiler', None)
+        start = g.pop('request_start', None)
+        if start is not None:
+            elapsed = time.perf_counter() - start
+            phases = end_request()
+            observe('musicfinder_request_seconds',
+                    (('endpoint', request.endpoint or 'none'), ('method', request.method),
+                     ('status', str(response.status_code))), elapsed)
+            timing = ['%s;dur=%.3f' % (phase, seconds * 1000)
+                      for phase, seconds in sorted(phases.items())]
+            timing.append('total;dur=%.3f' % (elapsed * 1000))
+            response.headers['Server-Timing'] = ', '.join(timing)
+        if profiler is not None:
+            report = stop_profiler(profiler)
+            response.set_data(report.encode('utf-8'))
+            response.mimetype = 'text/plain'
+            response.headers['X-Profile'] = profiler[0]
+        return response
+
+def start_profiler(kind):
+    '''
+    Start profiling the current thread with kind, "cprofile" or
+    "pyinstrument" (a sampling profiler, if installed). Return the profiler
+    to give to stop_profiler, or None if kind is not available.
+    '''
+    kind = kind.lower()
+    if kind == 'pyinstrument' and pyinstrument is not None:
+        profiler = pyinstrument.Profiler()
+        profiler.start()
+        return (kind, profiler)
+    if kind == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return (kind, profiler)
+    return None
+
+def stop_profiler(profiler):
+    '''
+    Stop profiler and return its report as text.
+    '''
+    kind, profiler = profiler
+    if kind == 'pyinstrument':
+        profiler.stop()
+        return profiler.output_text()
+    profiler.disable()
+    output = io.StringIO()
+    stats = pstats.Stats(profiler, stream=output)
+    stats.sort_stats('cumulative').print_stats(PROFILE_LINES)
+    return output.getvalue()
@@ -1,11 +1,120 @@
-from werkzeug.serving import run_simple
+'''
+The Music Finder server: the RESTful API (resources) and the admin UI
+(musicfinder_admin) served by one WSGI application.
+
+Development server, single process, with the reloader and the debugger:
+
+    python musicfinder.py [--host HOST] [--port PORT]
+
+Production server, gunicorn with several worker processes (see
+gunicorn.conf.py for the defaults and the environment variables):
+
+    python musicfinder.py --production [--bind HOST:PORT] [--workers N]
+                          [--threads T] [--backlog B] [--connections C]
+                          [--graceful-timeout S]
+
+which is the same as gunicorn -c gunicorn.conf.py musicfinder:application.
+
+Importing this module creates nothing: application is built by its first
+use (see create_application), and the database is opened by the first
+request (see resources.get_database).
+'''
+import argparse, os, runpy, threading
+
 from werkzeug.middleware.dispatcher import DispatcherMiddleware
-from resources import app as musicfinder
-from musicfinder_admin.application import app as musicfinder_admin
+import resources
+
+GUNICORN_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+
+_lock = threading.Lock()
+
+def create_application():
+    '''
+    Return the WSGI application of the server: the default API application
+    (resources.app) with the admin UI under /musicfinder_admin.
+    '''
+    from musicfinder_admin.application import app as musicfinder_admin
+    return DispatcherMiddleware(resources.app, {
+         '/musicfinder_admin': musicfinder_admin
+    })
+
+def __getattr__(name):
+    '''
+    The WSGI application of the server (application), created by its first
+    use.
+    '''
+    if name != 'application':
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    with _lock:
+        if 'application' not in globals():
+            globals()['application'] = create_application()
+    return globals()['application']
+
+def create_production_server(settings):
+    '''
+    Return the gunicorn application that serves application, configured
+    with the settings of GUNICORN_CONFIG replaced by those of settings that
+    are not None.
+    '''
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise SystemExit('The production server needs gunicorn (pip install gunicorn)')
+
+    class ProductionServer(BaseApplication):
+
+        def load_config(self):
+            config = runpy.run_path(GUNICORN_CONFIG)
+            config.update((key, value) for key, value in settings.items() if value is not None)
+            for key, value in config.items():
+                if key in self.cfg.settings:
+                    self.cfg.set(key, value)
+
+        def load(self):
+            return create_application()
+
+    return ProductionServer()
+
+def run_production(settings):
+    '''
+    Serve application with gunicorn (see create_production_server).
+    '''
+    create_production_server(settings).run()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the Music Finder server.')
+    parser.add_argument('--host', default='localhost',
+                        help='address of the development server (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=5000,
+                        help='port of the development server (default: %(default)s)')
+    parser.add_argument('--production', action='store_true',
+                        help='serve with gunicorn worker processes instead of the development server')
+    parser.add_argument('--bind', help='HOST:PORT of the production server')
+    parser.add_argument('--workers', type=int, help='worker processes')
+    parser.add_argument('--threads', type=int, help='request threads per worker')
+    parser.add_argument('--backlog', type=int, help='pending connections queued by the kernel')
+    parser.add_argument('--connections', type=int, dest='worker_connections',
+                        help='open connections per worker')
+    parser.add_argument('--graceful-timeout', type=int,
+                        help='seconds given to the running requests on shutdown')
+    args = parser.parse_args(argv)
+
+    if args.production:
+        run_production({'bind': args.bind, 'workers': args.workers,
+                        'threads': args.threads, 'backlog': args.backlog,
+                        'worker_connections': args.worker_connections,
+                        'graceful_timeout': args.graceful_timeout})
+    else:
+        from werkzeug.serving import run_simple
+        from musicfinder_admin.application import app as musicfinder_admin
+        #The debug mode is only turned on here: every other deployment of
+        #application runs without it.
+        resources.app.debug = True
+        musicfinder_admin.debug = True
+        #Bring the schema up to date before serving requests.
+        resources.get_database(resources.app).apply_migrations()
+        run_simple(args.host, args.port, create_application(),
+                   use_reloader=True, use_debugger=True, use_evalex=True)
 
-application = DispatcherMiddleware(musicfinder, {
-     '/musicfinder_admin': musicfinder_admin
-})
 if __name__ == '__main__':
-    run_simple('localhost', 5000, application,
-               use_reloader=True, use_debugger=True, use_evalex=True)
\ No newline at end of file
+    main()
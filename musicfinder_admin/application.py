@@ -1,4 +1,8 @@
 from flask import Flask
+
+from musicfinder_admin.assets import StaticAssets
 #Define the application and the api
 app = Flask(__name__, static_folder='static', static_url_path='')
-app.debug=True
\ No newline at end of file
+#The built assets (python -m musicfinder_admin.assets) are served compressed
+#and cached before the requests reach Flask.
+app.wsgi_app = StaticAssets(app.wsgi_app)
@@ -0,0 +1,244 @@
+'''
+Precompressed, fingerprinted static assets of the admin UI.
+
+The build step copies every file of the static folder into the build folder
+under a name that carries the hash of its content (bootstrap.min.css becomes
+bootstrap.min.<hash>.css), next to its gzip and, if the brotli module is
+installed, brotli variants (<name>.gz, <name>.br). The references of the
+stylesheets (url(...)) and of the pages (src and href) are rewritten to the
+fingerprinted names; the pages themselves keep their names, they are the
+URLs users open. Run it from the main folder, before starting the server,
+every time the static folder changes:
+
+    python -m musicfinder_admin.assets [--static DIR] [--output DIR]
+
+The build writes manifest.json, read by StaticAssets: a WSGI middleware that
+answers the GET and HEAD requests of the built assets before they reach the
+application. It picks the variant allowed by Accept-Encoding (brotli, then
+gzip, then none) and hands the open file to the server (wsgi.file_wrapper),
+so the process never reads nor compresses the bytes itself. Fingerprinted
+names never change content and are cached for a year (immutable); the
+other names are revalidated with their ETag on every use. Without a build
+the requests go on to the application, which serves the static folder as
+before.
+'''
+import argparse, gzip, hashlib, json, mimetypes, os, posixpath, re, shutil
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from werkzeug.http import parse_accept_header, quote_etag, unquote_etag
+from werkzeug.utils import get_content_type
+from werkzeug.wsgi import wrap_file
+
+DEFAULT_STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DEFAULT_BUILD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static_build')
+MANIFEST = 'manifest.json'
+
+#Characters of the content hash kept in the fingerprinted names.
+FINGERPRINT_LENGTH = 12
+#Files that keep their name: the pages are the entry points of the UI.
+PAGE_EXTENSIONS = ('.html',)
+STYLESHEET_EXTENSIONS = ('.css',)
+#Only text formats are compressed; woff and woff2 fonts already are.
+COMPRESSIBLE_EXTENSIONS = ('.html', '.css', '.js', '.map', '.json', '.svg', '.txt',
+                           '.eot', '.ttf')
+#Variants by preference, with the suffix of their file.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+CACHE_IMMUTABLE = 'public, max-age=31536000, immutable'
+CACHE_REVALIDATE = 'no-cache'
+
+STYLESHEET_REFERENCE = re.compile(r'''(url\(\s*['"]?|sourceMappingURL=)([^'")\s*?#]+)''')
+PAGE_REFERENCE = re.compile(r'''(\b(?:src|href)\s*=\s*["'])([^"'?#]+)''')
+
+def fingerprint(path, digest):
+    '''
+    Return path with the hash digest before its extension.
+    '''
+    root, extension = posixpath.splitext(path)
+    return '%s.%s%s' % (root, digest[:FINGERPRINT_LENGTH], extension)
+
+def compress(data, encoding):
+    '''
+    Return data compressed with encoding ('gzip' or 'br'), or None if the
+    encoding is not available.
+    '''
+    if encoding == 'gzip':
+        #No timestamp: the same content always gives the same file.
+        return gzip.compress(data, 9, mtime=0)
+    if encoding == 'br' and brotli is not None:
+        return brotli.compress(data, quality=11)
+    return None
+
+def rewrite_references(data, path, pattern, files):
+    '''
+    Replace in data (the content of path) the references matched by pattern
+    to the files already built by their fingerprinted names. files maps the
+    paths in the static folder to their built names. The pages were written
+    on Windows and some references differ from the files in case only
+    (Bootstrap/ for bootstrap/): those match too. References to other
+    sites, absolute paths and unknown files are left as they are.
+    '''
+    folder = posixpath.dirname(path)
+    folded = dict((key.lower(), key) for key in files)
+
+    def replace(match):
+        reference = match.group(2)
+        if ':' in reference or reference.startswith('/'):
+            return match.group(0)
+        target = posixpath.normpath(posixpath.join(folder, reference))
+        target = folded.get(target.lower(), target)
+        if target not in files:
+            return match.group(0)
+        return match.group(1) + posixpath.relpath(files[target], folder or '.')
+
+    text = data.decode('utf-8')
+    return pattern.sub(replace, text).encode('utf-8')
+
+def build(static=DEFAULT_STATIC_FOLDER, output=DEFAULT_BUILD_FOLDER):
+    '''
+    Build the assets of the static folder into output, which is emptied
+    first, and return the manifest: {path: {'file', 'hash', 'encodings'}}
+    with the built file of every path of the static folder, the hash of its
+    content and its compressed variants.
+    '''
+    paths = []
+    for folder, folders, filenames in os.walk(static):
+        folders.sort()
+        for filename in sorted(filenames):
+            path = os.path.relpath(os.path.join(folder, filename), static)
+            paths.append(path.replace(os.sep, '/'))
+    #The stylesheets point to fonts and images, the pages to everything: they
+    #are built once their references have a fingerprint.
+    def stage(path):
+        extension = posixpath.splitext(path)[1].lower()
+        return 2 if extension in PAGE_EXTENSIONS else 1 if extension in STYLESHEET_EXTENSIONS else 0
+    paths.sort(key=stage)
+
+    if os.path.isdir(output):
+        shutil.rmtree(output)
+    files = {}
+    manifest = {}
+    for path in paths:
+        with open(os.path.join(static, *path.split('/')), 'rb') as f:
+            data = f.read()
+        extension = posixpath.splitext(path)[1].lower()
+        if extension in PAGE_EXTENSIONS:
+            data = rewrite_references(data, path, PAGE_REFERENCE, files)
+        elif extension in STYLESHEET_EXTENSIONS:
+            data = rewrite_references(data, path, STYLESHEET_REFERENCE, files)
+        digest = hashlib.sha256(data).hexdigest()
+        built = path if extension in PAGE_EXTENSIONS else fingerprint(path, digest)
+        target = os.path.join(output, *built.split('/'))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.write(data)
+        encodings = []
+        if extension in COMPRESSIBLE_EXTENSIONS:
+            for encoding, suffix in ENCODINGS:
+                compressed = compress(data, encoding)
+                #Variants that do not save anything are not worth a file.
+                if compressed is not None and len(compressed) < len(data):
+                    with open(target + suffix, 'wb') as f:
+                        f.write(compressed)
+                    encodings.append(encoding)
+        files[path] = built
+        manifest[path] = {'file': built, 'hash': digest[:FINGERPRINT_LENGTH],
+                          'encodings': encodings}
+    with open(os.path.join(output, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return manifest
+
+class StaticAssets(object):
+    '''
+    WSGI middleware that serves the assets built in folder (see build) in
+    front of app: the fingerprinted names with CACHE_IMMUTABLE and the names
+    of the static folder with CACHE_REVALIDATE. Other requests, and every
+    request if folder has no manifest, go to app. The headers of every
+    variant are computed once, when the middleware is created.
+    '''
+
+    def __init__(self, app, folder=DEFAULT_BUILD_FOLDER):
+        super(StaticAssets, self).__init__()
+        self.app = app
+        self.folder = folder
+        self.routes = {}
+        try:
+            with open(os.path.join(folder, MANIFEST)) as f:
+                manifest = json.load(f)
+        except (IOError, ValueError):
+            manifest = {}
+        for path, asset in manifest.items():
+            variants = self._variants(asset)
+            self.routes['/' + path] = (variants, CACHE_REVALIDATE)
+            if asset['file'] != path:
+                self.routes['/' + asset['file']] = (variants, CACHE_IMMUTABLE)
+
+    def _variants(self, asset):
+        '''
+        Return the list of (encoding, file, etag, headers) of the variants of
+        asset, by preference, the uncompressed one (encoding None) last.
+        '''
+        filename = os.path.join(self.folder, *asset['file'].split('/'))
+        mimetype = mimetypes.guess_type(asset['file'])[0] or 'application/octet-stream'
+        content_type = get_content_type(mimetype, 'utf-8')
+        variants = []
+        for encoding, suffix in ENCODINGS + ((None, ''),):
+            if encoding is not None and encoding not in asset['encodings']:
+                continue
+            etag = asset['hash'] + ('-' + encoding if encoding else '')
+            headers = [('Content-Type', content_type),
+                       ('Content-Length', str(os.path.getsize(filename + suffix))),
+                       ('ETag', quote_etag(etag))]
+            if encoding is not None:
+                headers.append(('Content-Encoding', encoding))
+            if asset['encodings']:
+                headers.append(('Vary', 'Accept-Encoding'))
+            variants.append((encoding, filename + suffix, etag, headers))
+        return variants
+
+    def __call__(self, environ, start_response):
+        route = self.routes.get(environ.get('PATH_INFO', ''))
+        method = environ.get('REQUEST_METHOD', 'GET')
+        if route is None or method not in ('GET', 'HEAD'):
+            return self.app(environ, start_response)
+        variants, cache_control = route
+        accepted = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING'))
+        for encoding, filename, etag, headers in variants:
+            if encoding is None or accepted.quality(encoding) > 0:
+                break
+        headers = headers + [('Cache-Control', cache_control)]
+        if etag in [unquote_etag(tag.strip())[0]
+                    for tag in environ.get('HTTP_IF_NONE_MATCH', '').split(',') if tag.strip()]:
+            start_response('304 Not Modified', [header for header in headers
+                                                if header[0] in ('ETag', 'Vary', 'Cache-Control')])
+            return []
+        start_response('200 OK', headers)
+        if method == 'HEAD':
+            return []
+        return wrap_file(environ, open(filename, 'rb'))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the fingerprinted and compressed admin assets.')
+    parser.add_argument('--static', default=DEFAULT_STATIC_FOLDER,
+                        help='folder of the assets (default: %(default)s)')
+    parser.add_argument('--output', default=DEFAULT_BUILD_FOLDER,
+                        help='folder of the built assets (default: %(default)s)')
+    args = parser.parse_args(argv)
+    manifest = build(args.static, args.output)
+    size = compressed = 0
+    for path, asset in manifest.items():
+        built = os.path.join(args.output, *asset['file'].split('/'))
+        size += os.path.getsize(built)
+        #The smallest variant is the first one.
+        suffix = dict(ENCODINGS)[asset['encodings'][0]] if asset['encodings'] else ''
+        compressed += os.path.getsize(built + suffix)
+    print('%d assets, %.1f KiB, %.1f KiB compressed%s, in %s'
+          % (len(manifest), size / 1024.0, compressed / 1024.0,
+             '' if brotli is not None else ' (brotli is not installed)', args.output))
+
+if __name__ == '__main__':
+    main()
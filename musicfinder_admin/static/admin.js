@@ -30,23 +30,9 @@ function getUsers() {
 		if (DEBUG) {
 			console.log ("RECEIVED RESPONSE: data:",data,"; textStatus:",textStatus)
 		}
-		//Extract the users
-    	users = data.collection.items;
-		for (var i=0; i < users.length; i++){
-			var user = users[i];
-			//Extract the nickname by getting the data values. Once obtained
-			// the nickname use the method appendUserToList to show the user
-			// information in the UI.
-			//Data format example:
-			//  [ { "name" : "nickname", "value" : "Mystery" },
-			//    { "name" : "registrationdate", "value" : "2014-10-12" } ]
-			var user_data = user.data;
-			for (var j=0; j<user_data.length;j++){
-				if (user_data[j].name=="nickname"){
-					appendUserToList(user.href, user_data[j].value);
-				}			
-			} 
-		}
+		//Extract the users, of this page and of the next ones
+		appendUsers(data.collection.items);
+		getNextPages(data, appendUsers);
 		//Set the href of #addUser for creating a new user
 		setNewUserUrl(data.collection.href)
 	}).fail(function (jqXHR, textStatus, errorThrown){
@@ -84,6 +70,24 @@ function setNewUserUrl(url){
  TRIGGER: Submit button with value Create from form #create_user_form 
 **/
 
+function appendUsers(users) {
+	for (var i=0; i < users.length; i++){
+		var user = users[i];
+		//Extract the nickname by getting the data values. Once obtained
+		// the nickname use the method appendUserToList to show the user
+		// information in the UI.
+		//Data format example:
+		//  [ { "name" : "nickname", "value" : "Mystery" },
+		//    { "name" : "registrationdate", "value" : "2014-10-12" } ]
+		var user_data = user.data;
+		for (var j=0; j<user_data.length;j++){
+			if (user_data[j].name=="nickname"){
+				appendUserToList(user.href, user_data[j].value);
+			}
+		}
+	}
+}
+
 function appendUserToList(url, nickname) {
 	//var $user = $('<tr>').html('<a class= "user_link" href="'+url+'">'+nickname+'</a>');
 	var $user = $('<tr>').html('<a class= "user_link" href=playlists.html?'+nickname+'>'+nickname+'</a>');
@@ -32,19 +32,9 @@ function getArtists() {
 		if (DEBUG) {
 			console.log ("RECEIVED RESPONSE: data:",data,"; textStatus:",textStatus)
 		}
-		//Extract the users
-    	users = data.collection.items;
-		for (var i=0; i < users.length; i++){
-			var user = users[i];
-			//Extract the nickname by getting the data values. Once obtained
-			// the nickname use the method appendUserToList to show the user
-			// information in the UI.
-			//Data format example:
-			//  [ { "name" : "nickname", "value" : "Mystery" },
-			//    { "name" : "registrationdate", "value" : "2014-10-12" } ]
-			var user_data = user.data;
-			appendArtistToList(user.href, user_data);
-			}
+		//Extract the artists, of this page and of the next ones
+		appendArtists(data.collection.items);
+		getNextPages(data, appendArtists);
 	}).fail(function (jqXHR, textStatus, errorThrown){
 		if (DEBUG) {
 			console.log ("RECEIVED ERROR: textStatus:",textStatus, ";error:",errorThrown)
@@ -67,10 +57,8 @@ function getSongs(apiurl) {
 		var songs = data.collection.items;
 		if (songs.length == 0)
 		    alert("No songs by the selected artist");
-		for(i = 0; i<songs.length; i++){
-            var song = songs[i].data;
-			appendSong(song);
-        }
+		appendSongs(songs);
+		getNextPages(data, appendSongs);
 	}).fail(function (jqXHR, textStatus, errorThrown){
 		if (DEBUG) {
 			console.log ("RECEIVED ERROR: textStatus:",textStatus, ";error:",errorThrown)
@@ -143,18 +131,9 @@ function search() {
 		if (DEBUG) {
 			console.log ("RECEIVED RESPONSE: data:",data,"; textStatus:",textStatus)
 		}
-		//Extract the users
-    	artists = data.collection.items;
-
-		for (var i=0; i < artists.length; i++){
-			artist = artists[i];
-			artist_data = artist.data; 
-
-            appendArtistToList(artist.href, artist_data);
-
-
-
-		}
+		//Extract the artists, of this page and of the next ones
+		appendArtists(data.collection.items);
+		getNextPages(data, appendArtists);
 	}).fail(function (jqXHR, textStatus, errorThrown){
 		if (DEBUG) {
 			console.log ("RECEIVED ERROR: textStatus:",textStatus, ";error:",errorThrown)
@@ -164,6 +143,21 @@ function search() {
 	});
 }
 
+function appendArtists(artists) {
+	for (var i=0; i < artists.length; i++){
+		//Data format example:
+		//  [ { "name" : "legalName", "value" : "Muse" },
+		//    { "name" : "genre", "value" : "Alternative Rock" }, ... ]
+		appendArtistToList(artists[i].href, artists[i].data);
+	}
+}
+
+function appendSongs(songs) {
+	for (var i=0; i < songs.length; i++){
+		appendSong(songs[i].data);
+	}
+}
+
 function appendArtistToList(url, data) {
     var toappend = '<h4><a class= "artist_link" href="'+url+'">'+data[0].value+'</a></h4><div class="details hideDetails">';
     if(data[1].value != null)
@@ -0,0 +1,34 @@
+/**** START PAGINATION****/
+/*
+The collections are paginated (100 items by default). getNextPages requests
+the pages that follow the collection in data, one after the other through
+their "next" link, and calls handleItems with the items of each one.
+Returns the jqXHR of the next page, or nothing if data is the last page.
+
+Shared by the pages of the admin UI: DEBUG and DEFAULT_DATATYPE are the
+constants of the script of each page.
+*/
+function getNextPages(data, handleItems) {
+	var next = (data.collection.links || []).find(function (link){
+		return link.rel == "next";
+	});
+	if (!next) {
+		return;
+	}
+	return $.ajax({
+		url: next.href,
+		dataType:DEFAULT_DATATYPE
+	}).done(function (data, textStatus, jqXHR){
+		if (DEBUG) {
+			console.log ("RECEIVED RESPONSE: data:",data,"; textStatus:",textStatus)
+		}
+		handleItems(data.collection.items);
+		getNextPages(data, handleItems);
+	}).fail(function (jqXHR, textStatus, errorThrown){
+		if (DEBUG) {
+			console.log ("RECEIVED ERROR: textStatus:",textStatus, ";error:",errorThrown)
+		}
+		alert ("Could not fetch the whole list.  Please, try again");
+	});
+}
+/**** END PAGINATION****/
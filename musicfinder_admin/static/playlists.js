@@ -8,6 +8,34 @@ DEFAULT_DATATYPE = "json",
 ENTRYPOINT = "/musicfinder/api/" //Entry point is getUsers()
 
 
+/*
+The collections are paginated (100 items by default). getNextPages requests
+the pages that follow the collection in data, one after the other through
+their "next" link, and calls handleItems with the items of each one.
+*/
+function getNextPages(data, handleItems) {
+	var links = data.collection.links || [];
+	for (var i=0; i < links.length; i++){
+		if (links[i].rel == "next"){
+			return $.ajax({
+				url: links[i].href,
+				dataType:DEFAULT_DATATYPE
+			}).done(function (data, textStatus, jqXHR){
+				if (DEBUG) {
+					console.log ("RECEIVED RESPONSE: data:",data,"; textStatus:",textStatus)
+				}
+				handleItems(data.collection.items);
+				getNextPages(data, handleItems);
+			}).fail(function (jqXHR, textStatus, errorThrown){
+				if (DEBUG) {
+					console.log ("RECEIVED ERROR: textStatus:",textStatus, ";error:",errorThrown)
+				}
+				alert ("Could not fetch the whole list.  Please, try again");
+			});
+		}
+	}
+}
+
 function getPlaylists(nickname) {
 	var apiurl = ENTRYPOINT + "users/"+nickname+"/playlists/";
 
@@ -22,17 +50,9 @@ function getPlaylists(nickname) {
 		if (DEBUG) {
 			console.log ("RECEIVED RESPONSE: data:",data,"; textStatus:",textStatus)
 		}
-		//Extract the users
-    	users = data.collection.items;
-		for (var i=0; i < users.length; i++){
-			var user = users[i];
-			var user_data = user.data;
-			for (var j=0; j<user_data.length;j++){
-				if (user_data[j].name=="name"){
-					appendPlaylistToList(user.href, user_data[j].value);
-				}
-			}
-		}
+		//Extract the playlists, of this page and of the next ones
+		appendPlaylists(data.collection.items);
+		getNextPages(data, appendPlaylists);
 		//Set the href of #addUser for creating a new user
 		setNewUserUrl(data.collection.href)
 	}).fail(function (jqXHR, textStatus, errorThrown){
@@ -70,13 +90,15 @@ function search() {
 		if (DEBUG) {
 			console.log ("RECEIVED RESPONSE: data:",data,"; textStatus:",textStatus)
 		}
-		var playlists = data.collection.items;
-		for(var i =0; i<playlists.length; i++){
-		    var pl_data= playlists[i].data;
-		    if(pl_data[0].value.toLowerCase().indexOf(playlistInput.toLowerCase()) > -1)
-                    	appendPlaylistToList(playlists[i].href, pl_data[0].value);
-
-		}
+		var appendMatches = function (playlists){
+			for(var i =0; i<playlists.length; i++){
+			    var pl_data= playlists[i].data;
+			    if(pl_data[0].value.toLowerCase().indexOf(playlistInput.toLowerCase()) > -1)
+			        appendPlaylistToList(playlists[i].href, pl_data[0].value);
+			}
+		};
+		appendMatches(data.collection.items);
+		getNextPages(data, appendMatches);
 
 
 	}).fail(function (jqXHR, textStatus, errorThrown){
@@ -98,6 +120,23 @@ function handleGetsongs() {
 	return false;
 }
 
+function appendPlaylists(playlists) {
+	for (var i=0; i < playlists.length; i++){
+		var playlist_data = playlists[i].data;
+		for (var j=0; j<playlist_data.length;j++){
+			if (playlist_data[j].name=="name"){
+				appendPlaylistToList(playlists[i].href, playlist_data[j].value);
+			}
+		}
+	}
+}
+
+function appendSongs(songs) {
+	for (var i=0; i < songs.length; i++){
+		appendSong(songs[i].data);
+	}
+}
+
 function appendPlaylistToList(url, nickname) {
 	var $user = $('<tr>').html('<a class= "playlist_link" href="'+url+'">'+nickname+'</a>');
 	//Add to the user list
@@ -115,12 +154,8 @@ function getUser(apiurl) {
 			console.log ("RECEIVED RESPONSE: data:",data,"; textStatus:",textStatus)
 		}
         $("#songsinpl").empty();
-		var songs = data.collection.items;
-		for(i = 0; i<songs.length; i++){
-            var song = songs[i].data;
-			appendSong(song);
-
-        }
+		appendSongs(data.collection.items);
+		getNextPages(data, appendSongs);
 
 	}).fail(function (jqXHR, textStatus, errorThrown){
 		if (DEBUG) {
@@ -143,12 +178,8 @@ function getSongs() {
 			console.log ("RECEIVED RESPONSE: data:",data,"; textStatus:",textStatus)
 		}
         $("#songsinpl").empty();
-		var songs = data.collection.items;
-		for(i = 0; i<songs.length; i++){
-            var song = songs[i].data;
-			appendSong(song);
-
-        }
+		appendSongs(data.collection.items);
+		getNextPages(data, appendSongs);
 
 	}).fail(function (jqXHR, textStatus, errorThrown){
 		if (DEBUG) {
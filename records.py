@@ -0,0 +1,149 @@
+'''
+Compact records for the rows returned by MusicDatabase.
+
+Every record class keeps its fields in __slots__, so a record takes a
+fraction of the memory of the dictionary it replaces and is built without
+one. The records are also mutable mappings: record['name'], 'name' in
+record, record.get('name'), dict(record) and the comparison with a
+dictionary all work as they did with the dictionaries. Code that renders
+many records reads the attributes (record.name), which is the fastest
+access.
+
+The fields of a class are the columns it is built from; the other slots
+(e.g. 'rank', 'score' or 'plays') are optional and only exist in a record once they
+are set. row_factory returns a sqlite3 row factory that builds the records
+straight from the tuples of a cursor.
+'''
+from collections.abc import MutableMapping
+from operator import itemgetter
+
+class Record(MutableMapping):
+    '''
+    Base class of the records. Subclasses define __slots__, the fields
+    (the leading slots, given to __init__ in order) and __init__.
+    '''
+    __slots__ = ()
+    fields = ()
+
+    @classmethod
+    def from_row(cls, row):
+        '''
+        Return the record of row, a sqlite3.Row or a mapping with every
+        field.
+        '''
+        return cls(*[row[field] for field in cls.fields])
+
+    @classmethod
+    def row_factory(cls, description):
+        '''
+        Return a row factory (see sqlite3.Cursor.row_factory) that builds a
+        record from every row of a cursor with the columns of description.
+        Optional slots that are columns of description are set too. Raise
+        ValueError if a field is not a column.
+        '''
+        names = [column[0] for column in description]
+        try:
+            positions = [names.index(field) for field in cls.fields]
+        except ValueError:
+            raise ValueError("The columns %s do not include every field of %s"
+                             % (', '.join(names), cls.__name__))
+        extras = [(name, names.index(name)) for name in cls.__slots__
+                  if name not in cls.fields and name in names]
+        getter = itemgetter(*positions)
+        if not extras:
+            return lambda cursor, row: cls(*getter(row))
+
+        def factory(cursor, row):
+            record = cls(*getter(row))
+            for name, position in extras:
+                setattr(record, name, row[position])
+            return record
+        return factory
+
+    def __getitem__(self, key):
+        if key in self.__slots__:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        if key in self.__slots__:
+            try:
+                delattr(self, key)
+                return
+            except AttributeError:
+                pass
+        raise KeyError(key)
+
+    def __iter__(self):
+        for name in self.__slots__:
+            if hasattr(self, name):
+                yield name
+
+    def __len__(self):
+        return sum(1 for name in self)
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__,
+                           ', '.join('%s=%r' % item for item in self.items()))
+
+    def copy(self):
+        '''
+        Return a shallow copy of the record.
+        '''
+        record = self.__class__(*[getattr(self, field) for field in self.fields])
+        for name in self.__slots__[len(self.fields):]:
+            if hasattr(self, name):
+                setattr(record, name, getattr(self, name))
+        return record
+
+class Artist(Record):
+    __slots__ = ('legalName', 'genre', 'foundingLocation', 'language', 'foundingDate',
+                 'rank', 'score', 'plays')
+    fields = __slots__[:5]
+
+    def __init__(self, legalName, genre, foundingLocation, language, foundingDate):
+        self.legalName = legalName
+        self.genre = genre
+        self.foundingLocation = foundingLocation
+        self.language = language
+        self.foundingDate = foundingDate
+
+class Song(Record):
+    __slots__ = ('sid', 'name', 'byArtist', 'datePublished', 'duration',
+                 'rank', 'score', 'plays')
+    fields = __slots__[:5]
+
+    def __init__(self, sid, name, byArtist, datePublished, duration):
+        self.sid = sid
+        self.name = name
+        self.byArtist = byArtist
+        self.datePublished = datePublished
+        self.duration = duration
+
+class User(Record):
+    __slots__ = ('nickname', 'password', 'gender', 'age', 'nationality')
+    fields = __slots__
+
+    def __init__(self, nickname, password, gender, age, nationality):
+        self.nickname = nickname
+        self.password = password
+        self.gender = gender
+        self.age = age
+        self.nationality = nationality
+
+class Playlist(Record):
+    __slots__ = ('name', 'author', 'created_on')
+    fields = __slots__
+
+    def __init__(self, name, author, created_on):
+        self.name = name
+        self.author = author
+        self.created_on = created_on
@@ -1,15 +1,21 @@
-import json
-
-from flask import Flask, request, jsonify, g, Response
+import calendar
+import hashlib
+import time
+from functools import wraps
+from urllib.parse import urlencode, quote
+
+import flask
+from flask import Flask, current_app, request, jsonify, g, Response, stream_with_context
 from flask_restful import Api, Resource, abort
 from werkzeug.exceptions import NotFound, UnsupportedMediaType
+from werkzeug.http import http_date, parse_date, unquote_etag
+import content_encoding
 import database
-import os
-
-# Get the current working directory
-cwd = os.getcwd()
+import instrumentation
+import serialization
+import os, threading
 
-DEFAULT_DB_PATH = os.path.join(cwd, 'db', 'musicdb.db')
+DEFAULT_DB_PATH = database.DEFAULT_DB_PATH
 
 #Constants for hypermedia formats and profiles
 
@@ -20,17 +26,162 @@ PLAYLIST_PROFILE = "https://docs.google.com/document/d/1qSKj2f4MgQ1L1qx1qbanf76B
 
 ATOM_THREAD_PROFILE = "https://tools.ietf.org/html/rfc4685"
 
+#Upper bound of the limit parameter of the search resource
+MAX_SEARCH_LIMIT = 100
+
+#Upper bound of the limit parameter of the recommendations resource
+MAX_RECOMMENDATIONS_LIMIT = 100
+
+#Upper bound of the limit parameter of the statistics resources
+MAX_STATISTICS_LIMIT = 100
+
+#Number of related songs returned if the client sends no limit
+DEFAULT_RELATED_LIMIT = 10
+
+#Page size of the collections when the client sends no limit, and the
+#largest limit accepted
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+#Number of items written per chunk by the streamed collections
+STREAM_CHUNK_ITEMS = 100
+
+#Largest number of items accepted by the batch POST requests
+MAX_BATCH_SIZE = 1000
 
-app = Flask(__name__)
-app.debug = True
 
 # Constants for hypermedia formats and profiles
 COLLECTIONJSON = "application/vnd.collection+json"
 HAL = "application/hal+json"
 
-# Define the API and database
-api = Api(app)
-app.config["DATABASE"] = database.MusicDatabase(DEFAULT_DB_PATH)
+#Static fragments of the envelopes. They are built once at import time and
+#shared by every response (they are never modified), so a request only
+#builds the data of its rows.
+ARTISTS_QUERY_DATA = [
+    {"prompt" : "Search the artists by name", "name" : "name",
+     "value" : "", "required":False},
+    {"prompt" : "Search the artist by genre", "name" : "genre",
+     "value" : "", "required":False},
+    {"prompt" : "Search the artists by country", "name" : "country",
+     "value" : "", "required":False},
+    {"prompt" : "Search the artists by language", "name" : "language",
+     "value" : "", "required":False}
+]
+SEARCH_QUERY_DATA = [
+    {"prompt" : "Words to search (prefixes are matched)", "name" : "q",
+     "value" : "", "required":True},
+    {"prompt" : "Comma separated types: artists, songs", "name" : "type",
+     "value" : "", "required":False},
+    {"prompt" : "Maximum number of results", "name" : "limit",
+     "value" : "", "required":False}
+]
+RELATED_QUERY_DATA = [
+    {"prompt" : "Maximum number of songs", "name" : "limit",
+     "value" : "", "required":False}
+]
+RECOMMENDATIONS_QUERY_DATA = [
+    {"prompt" : "Maximum number of songs", "name" : "limit",
+     "value" : "", "required":False}
+]
+STATISTICS_QUERY_DATA = [
+    {"prompt" : "Maximum number of results", "name" : "limit",
+     "value" : "", "required":False}
+]
+GENRES_QUERY_DATA = [
+    {"prompt" : "Group by: nationality, gender or age", "name" : "by",
+     "value" : "", "required":True},
+    {"prompt" : "Only the group with this value", "name" : "value",
+     "value" : "", "required":False},
+    {"prompt" : "Maximum number of genres of each group", "name" : "limit",
+     "value" : "", "required":False}
+]
+ADDITIONS_QUERY_DATA = [
+    {"prompt" : "First day (YYYY-MM-DD)", "name" : "since",
+     "value" : "", "required":False},
+    {"prompt" : "Last day (YYYY-MM-DD)", "name" : "until",
+     "value" : "", "required":False}
+]
+
+ARTISTS_TEMPLATE = {
+    "data" : [
+        {"prompt" : "", "name" : "legalName", "value" : "", "required":True},
+        {"prompt" : "", "name" : "foundingLocation", "value" : "", "required":False},
+        {"prompt" : "", "name" : "genre", "value" : "", "required":False},
+        {"prompt" : "", "name" : "language", "value" : "", "required":False},
+        {"prompt" : "", "name" : "foundingDate", "value" : "", "required":False}
+    ]
+}
+ARTIST_TEMPLATE = {
+    "data" : [
+        {"prompt" : "", "name" : "legalName", "value" : "", "required":True},
+        {"prompt" : "", "name" : "genre", "value" : "", "required":False},
+        {"prompt" : "", "name" : "foundingLocation", "value" : "", "required":False},
+        {"prompt" : "", "name" : "language", "value" : "", "required":False},
+        {"prompt" : "", "name" : "foundingDate", "value" : "", "required":False}
+    ]
+}
+SONGS_TEMPLATE = {
+    "data" : [
+        {"prompt" : "", "name" : "name", "value" : "", "required":True},
+        {"prompt" : "", "name" : "byArtist", "value" : "", "required":True},
+        {"prompt" : "", "name" : "duration", "value" : "", "required":False},
+        {"prompt" : "", "name" : "datePublished", "value" : "", "required":False}
+    ]
+}
+SONG_TEMPLATE = {
+    "data" : [
+        {"prompt" : "", "name" : "name", "value" : "", "required":True},
+        {"prompt" : "", "name" : "byArtist", "value" : "", "required":False},
+        {"prompt" : "", "name" : "datePublished", "value" : "", "required":False},
+        {"prompt" : "", "name" : "duration", "value" : "", "required":False},
+        {"prompt" : "", "name" : "sid", "value" : "", "required":False}
+    ]
+}
+PLAYLIST_TEMPLATE = {
+    "data" : [
+        {"prompt" : "", "name" : "name", "value" : "", "required":True},
+        {"prompt" : "", "name" : "author", "value" : "", "required":True},
+        {"prompt" : "", "name" : "created_on", "value" : "", "required":False}
+    ]
+}
+USERS_TEMPLATE = {
+    "data" : [
+        {"prompt" : "Insert nickname", "name" : "nickname",
+         "value" : "", "required":True},
+        {"prompt" : "Insert password", "name" : "password",
+         "object" : {}, "required":False},
+        {"prompt" : "Insert user gender", "name" : "gender",
+         "value" : "", "required":False},
+        {"prompt" : "Insert user country", "name" : "nationality",
+         "value" : "", "required":False},
+        {"prompt" : "Insert user age", "name" : "age",
+         "value" : "", "required":False}
+    ]
+}
+USER_TEMPLATE = {
+    "data" : [
+        {"prompt" : "", "name" : "nickname", "value" : "", "required":True},
+        {"prompt" : "", "name" : "gender", "value" : "", "required":False},
+        {"prompt" : "", "name" : "nationality", "value" : "", "required":False},
+        {"prompt" : "", "name" : "age", "value" : "", "required":False}
+    ]
+}
+
+ARTIST_CURIES = [{"name": "artist", "href": ARTIST_PROFILE},
+                 {"name": "atom-thread", "href": ATOM_THREAD_PROFILE}]
+SONG_CURIES = [{"name": "song", "href": SONG_PROFILE},
+               {"name": "atom-thread", "href": ATOM_THREAD_PROFILE}]
+PLAYLIST_CURIES = [{"name": "playlist", "href": PLAYLIST_PROFILE},
+                   {"name": "atom-thread", "href": ATOM_THREAD_PROFILE}]
+USER_CURIES = [{"name": "user", "href": USER_PROFILE},
+               {"name": "atom-thread", "href": ATOM_THREAD_PROFILE}]
+
+#Characters left unquoted in the URL parameters, the same as werkzeug's
+#default converter.
+URL_SAFE = "!$&'()*+,/:;=@"
+
+#Guards the creation of the databases and of the default application.
+_lock = threading.Lock()
 
 # Error handling
 def create_error_response(status_code, title, message, resource_type=None):
@@ -38,21 +189,307 @@ def create_error_response(status_code, title, message, resource_type=None):
     response.status_code = status_code
     return response
 
-@app.errorhandler(404)
 def resource_not_found(error):
     return create_error_response(404, "Resource not found", "This resource URL does not exist")
 
-@app.errorhandler(500)
 def unknown_error(error):
     return create_error_response(500, "Error", "The system has failed. Please contact the administrator")
 
+def get_page_parameters(default_limit=DEFAULT_PAGE_SIZE):
+    '''
+    Read the limit, after and before pagination parameters of the request.
+    default_limit is used when the client sends no limit (None means no
+    limit). Raise ValueError if they are not valid.
+    '''
+    parameters = request.args
+    limit = parameters.get('limit', None)
+    if limit is None:
+        limit = default_limit
+    else:
+        limit = int(limit)
+        if not 0 < limit <= MAX_PAGE_SIZE:
+            raise ValueError("The limit must be between 1 and %d" % MAX_PAGE_SIZE)
+    after = parameters.get('after', None)
+    before = parameters.get('before', None)
+    if after is not None and before is not None:
+        raise ValueError("Use either after or before")
+    return limit, after, before
+
+def create_page_links(page, href):
+    '''
+    Return the Collection+JSON links to the next and previous pages of page.
+    The rest of the query parameters of the request (filters, limit) are
+    kept in the links.
+    '''
+    parameters = request.args.to_dict()
+    parameters.pop('after', None)
+    parameters.pop('before', None)
+    links = []
+    for rel, name, cursor, prompt in (('next', 'after', page.next_cursor, "Next page"),
+                                      ('prev', 'before', page.prev_cursor, "Previous page")):
+        if cursor is not None:
+            parameters[name] = cursor
+            links.append({'href': href + '?' + urlencode(parameters),
+                          'rel': rel, 'prompt': prompt})
+            del parameters[name]
+    return links
+
+def create_page_error_response(error, resource_type):
+    return create_error_response(400, "Wrong request format", str(error),
+                                 resource_type)
+
+def get_batch_items(input):
+    '''
+    Return the data of the items of a batch request, {"items": [{"data":
+    [{"name": ..., "value": ...}, ...]}, ...]}, as a list of dictionaries.
+    Raise ValueError if the batch is malformed, empty or has more than
+    MAX_BATCH_SIZE items.
+    '''
+    try:
+        items = [dict((d['name'], d['value']) for d in item['data'])
+                 for item in input['items']]
+    except (KeyError, TypeError):
+        raise ValueError("Send the items as {\"items\": [{\"data\": [...]}, ...]}")
+    if not 0 < len(items) <= MAX_BATCH_SIZE:
+        raise ValueError("A batch must have between 1 and %d items" % MAX_BATCH_SIZE)
+    return items
+
+def is_batch_request(input):
+    return isinstance(input, dict) and 'items' in input
+
+def create_validators(tables, last_modified=None):
+    '''
+    Return the ETag and Last-Modified headers of the representation of the
+    current request. The ETag is a hash of the request path and query with
+    the change counters of tables, so it changes whenever one of the tables
+    is written. last_modified (seconds since the epoch) defaults to the time
+    of the last change of tables. Return an empty dictionary if the database
+    has no counters for tables.
+    '''
+    versions = g.db.get_table_versions(tables)
+    if len(versions) < len(tables):
+        return {}
+    digest = hashlib.sha1(request.full_path.encode('utf-8'))
+    for table in tables:
+        digest.update(('|%s:%d:%d' % ((table,) + versions[table])).encode('utf-8'))
+    if last_modified is None:
+        last_modified = max(modified_on for _, modified_on in versions.values())
+    #Weak because the same data may be sent with different bytes (e.g.
+    #compressed); clients are told to revalidate on every use.
+    return {'ETag': 'W/"%s"' % digest.hexdigest()[:32],
+            'Last-Modified': http_date(int(last_modified)),
+            'Cache-Control': 'no-cache'}
+
+def is_not_modified(validators):
+    '''
+    Tell whether the client already has the representation described by
+    validators: If-None-Match contains its ETag or, if the client sent no
+    If-None-Match, If-Modified-Since is not older than its Last-Modified.
+    '''
+    if not validators:
+        return False
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(unquote_etag(validators['ETag'])[0])
+    since = request.if_modified_since
+    if since is not None:
+        return parse_date(validators['Last-Modified']) <= since
+    return False
+
+def conditional(*tables, last_modified=None):
+    '''
+    Decorator for the get method of a resource that reads tables. A request
+    whose validators match (see is_not_modified) is answered with 304 before
+    the resource is read or rendered; any other successful response gets
+    the ETag and Last-Modified headers. The keyword argument last_modified
+    is a function that takes the arguments of get and returns the
+    Last-Modified time of the resource, or None if it does not exist.
+    '''
+    def decorator(get):
+        @wraps(get)
+        def wrapper(self, *args, **kw):
+            modified_on = None
+            if last_modified is not None:
+                modified_on = last_modified(*args, **kw)
+                if modified_on is None:
+                    return get(self, *args, **kw)
+            validators = create_validators(tables, modified_on)
+            if is_not_modified(validators):
+                return Response(status=304, headers=validators)
+            result = get(self, *args, **kw)
+            if isinstance(result, Response):
+                if result.status_code == 200:
+                    result.headers.extend(validators)
+                return result
+            if isinstance(result, dict):
+                return result, 200, validators
+            return result
+        return wrapper
+    return decorator
+
+def get_playlist_last_modified(nickname, title):
+    '''
+    Return the Last-Modified time of the playlist title of nickname, or None
+    if it does not exist: the latest of its created_on, of the added_on of
+    its songs and of the last change of song_in_playlist, since a song
+    removed from the playlist leaves no time behind.
+    '''
+    modified_on = g.db.get_playlist_last_modified(title, nickname)
+    if modified_on is None:
+        return None
+    versions = g.db.get_table_versions(('song_in_playlist',))
+    if 'song_in_playlist' in versions:
+        modified_on = max(modified_on, versions['song_in_playlist'][1])
+    return modified_on
+
+def url_for(resource, **values):
+    '''
+    Return the URL of resource in the application of the request, like
+    Api.url_for.
+    '''
+    return flask.url_for(resource.endpoint, **values)
+
+def get_database(app=None):
+    '''
+    Return the MusicDatabase of app (the application of the request if
+    None). It is opened the first time it is needed, with the DATABASE_PATH
+    and DATABASE_OPTIONS of the configuration, unless DATABASE is set
+    already.
+    '''
+    config = (app or current_app).config
+    db = config.get("DATABASE")
+    if db is None:
+        with _lock:
+            db = config.get("DATABASE")
+            if db is None:
+                db = database.MusicDatabase(config["DATABASE_PATH"], **config["DATABASE_OPTIONS"])
+                config["DATABASE"] = db
+    return db
+
 # Set up the database before each request
-@app.before_request
 def set_database():
-    g.db = app.config["DATABASE"]
+    g.db = get_database()
+
+def get_href_builder(resource, *names):
+    '''
+    Return a function that takes the values of names and returns the URL of
+    resource, like url_for(resource, name=value, ...). The route is only
+    resolved the first time in each request (the URL prefix may change
+    between requests); after that a URL costs a format and a quote per
+    value.
+    '''
+    builders = g.setdefault('href_builders', {})
+    key = (resource, names)
+    builder = builders.get(key)
+    if builder is None:
+        url = url_for(resource, **{name: '__%s__' % name for name in names})
+        url = url.replace('{', '{{').replace('}', '}}')
+        for i, name in enumerate(names):
+            url = url.replace('__%s__' % name, '{%d}' % i)
+
+        def builder(*values):
+            return url.format(*[quote(str(value), safe=URL_SAFE) for value in values])
+        builders[key] = builder
+    return builder
+
+#The item builders read the attributes of the records of the database (see
+#records), which is faster than going through their mapping interface.
+def create_artist_item(a):
+    '''
+    Return the Collection+JSON item of the artist record a.
+    '''
+    _name = a.legalName
+    return {'href': get_href_builder(Artist, 'artist')(_name),
+            'data': [{'name': 'legalName', 'value': _name},
+                     {'name': 'genre', 'value': a.genre},
+                     {'name': 'foundingLocation', 'value': a.foundingLocation},
+                     {'name': 'language', 'value': a.language},
+                     {'name': 'foundingDate', 'value': a.foundingDate}],
+            'links': []}
+
+def create_song_item(a):
+    '''
+    Return the Collection+JSON item of the song record a.
+    '''
+    _title = a.name
+    _artist = a.byArtist
+    return {'href': get_href_builder(Song, 'artist', 'title')(_artist, _title),
+            'data': [{'name': 'name', 'value': _title},
+                     {'name': 'byArtist', 'value': _artist},
+                     {'name': 'duration', 'value': a.duration},
+                     {'name': 'datePublished', 'value': a.datePublished}],
+            'links': []}
+
+def create_playlist_item(a):
+    '''
+    Return the Collection+JSON item of the playlist record a.
+    '''
+    _title = a.name
+    _user = a.author
+    return {'href': get_href_builder(Playlist, 'nickname', 'title')(_user, _title),
+            'data': [{'name': 'name', 'value': _title},
+                     {'name': 'author', 'value': _user},
+                     {'name': 'created_on', 'value': a.created_on}],
+            'links': []}
+
+def create_user_item(a):
+    '''
+    Return the Collection+JSON item of the user record a.
+    '''
+    _nickname = a.nickname
+    return {'href': get_href_builder(User, 'nickname')(_nickname),
+            'read-only': True,
+            'data': [{'name': 'nickname', 'value': _nickname},
+                     {'name': 'gender', 'value': a.gender},
+                     {'name': 'nationality', 'value': a.nationality},
+                     {'name': 'age', 'value': a.age}],
+            'links': [{'href': get_href_builder(User_playlists, 'nickname')(_nickname),
+                       'rel': "playlists",
+                       'name': "playlists",
+                       'prompt': "Playlists of user"}]}
+
+def is_streaming_requested():
+    '''
+    Tell whether a collection must be streamed: the client sent stream=true,
+    or STREAM_COLLECTIONS is set in the configuration and the client did not
+    send stream=false.
+    '''
+    value = request.args.get('stream', None)
+    if value is not None:
+        return value.lower() in ('1', 'true', 'yes')
+    return current_app.config.get('STREAM_COLLECTIONS', False)
+
+def stream_collection(envelope, objects, create_item):
+    '''
+    Return a chunked Collection+JSON Response. envelope is the collection
+    without its items; objects is an iterator (a MusicDatabase generator)
+    whose objects are turned into items with create_item. The items are
+    written in groups of STREAM_CHUNK_ITEMS as they are read, so memory use
+    and time to first byte do not depend on the size of the collection.
+    '''
+    head = serialization.dumps(envelope)
+    #Reopen the collection object, which closes the envelope ("}}"), to
+    #append the items array.
+    head = head[:-2] + b',"items":['
+
+    def generate():
+        yield head
+        chunk = []
+        separator = b''
+        for obj in objects:
+            chunk.append(serialization.dumps(create_item(obj)))
+            if len(chunk) == STREAM_CHUNK_ITEMS:
+                yield separator + b','.join(chunk)
+                separator = b','
+                chunk = []
+        if chunk:
+            yield separator + b','.join(chunk)
+        yield b']}}'
+
+    return Response(stream_with_context(generate()), 200, mimetype=COLLECTIONJSON)
 
 class Artists(Resource):
 
+    @conditional('artists')
     def get(self):
 
         parameters = request.args
@@ -60,73 +497,41 @@ class Artists(Resource):
         language = parameters.get('language', None)
         name = parameters.get('name', None)
         genre = parameters.get('genre', None)
+        streaming = is_streaming_requested()
 
-        artist_db = g.db.get_artists(name, genre, country, language)
+        try:
+            if streaming:
+                limit, after, before = get_page_parameters(None)
+                if before is not None:
+                    raise ValueError("before is not supported when streaming")
+                artist_db = g.db.iter_artists(name, genre, country, language,
+                                              limit, after)
+            else:
+                limit, after, before = get_page_parameters()
+                artist_db = g.db.get_artists(name, genre, country, language,
+                                             limit, after, before)
+        except ValueError as error:
+            return create_page_error_response(error, "Artists")
 
         envelope = {}
         collection = {}
         envelope["collection"] = collection
         collection['version'] = "1.0"
-        collection['href'] = api.url_for(Artists)
+        collection['href'] = url_for(Artists)
+        if not streaming:
+            collection['links'] = create_page_links(artist_db, collection['href'])
 
         collection['queries'] = [
-            {'href':api.url_for(Artists),
+            {'href': collection['href'],
              'rel':'search',
              'prompt':"Search artists",
-             'data' : [
-                {"prompt" : "Search the artists by name",
-                 "name" : "name",
-                 "value" : "",
-                 "required":False},
-                {"prompt" : "Search the artist by genre",
-                 "name" : "genre",
-                 "value" : "",
-                 "required":False},
-                {"prompt" : "Search the artists by country",
-                 "name" : "country",
-                 "value" : "",
-                 "required":False},
-                {"prompt" : "Search the artists by language",
-                 "name" : "language",
-                 "value" : "",
-                 "required":False}
-
-                ]
-            }
+             'data': ARTISTS_QUERY_DATA}
         ]
-
-        collection['template'] = {
-        "data" : [
-            {"prompt" : "", "name" : "legalName", "value" : "", "required":True},
-            {"prompt" : "", "name" : "foundingLocation", "value" : "", "required":False},
-            {"prompt" : "", "name" : "genre", "value" : "", "required":False},
-            {"prompt" : "", "name" : "language", "value" : "", "required":False},
-            {"prompt" : "", "name" : "foundingDate", "value" : "", "required":False}
-
-        ]
-        }
+        collection['template'] = ARTISTS_TEMPLATE
+        if streaming:
+            return stream_collection(envelope, artist_db, create_artist_item)
         #Create the items
-        items = []
-        for a in artist_db:
-            _name = a['legalName']
-            _country = a['foundingLocation']
-            _genre = a['genre']
-            _language = a['language']
-            _formed_in = a['foundingDate']
-            _url = api.url_for(Artist, artist=_name)
-            artist = {}
-            artist['href'] = _url
-            artist['data'] = []
-
-            ss = [('legalName',_name), ('genre', _genre), ('foundingLocation',_country), ('language',_language),
-                ('foundingDate', _formed_in)]
-            for s in ss:
-                value = {'name': s[0], 'value': s[1]}
-                artist['data'].append(value)
-
-            artist['links'] = []
-            items.append(artist)
-        collection['items'] = items
+        collection['items'] = [create_artist_item(a) for a in artist_db]
         return envelope
 
     def post(self):
@@ -156,14 +561,79 @@ class Artists(Resource):
         aid = g.db.create_artist(dictionary['legalName'], dictionary['genre'], dictionary.get('foundingLocation', None), dictionary.get('language', None), dictionary.get('foundingDate', None))
         if not aid:
             abort(500)
-        url = api.url_for(Artist, artist=dictionary['legalName'])
+        url = url_for(Artist, artist=dictionary['legalName'])
 
         #RENDER
         #Return the response
         return Response(status=201, headers={'Location':url})
 
+class Search(Resource):
+
+    @conditional('artists', 'songs')
+    def get(self):
+
+        parameters = request.args
+        text = parameters.get('q', '')
+        types = parameters.get('type', 'artists,songs').split(',')
+        try:
+            limit = int(parameters.get('limit', database.DEFAULT_SEARCH_LIMIT))
+        except ValueError:
+            limit = 0
+        if not text.strip():
+            return create_error_response(400, "Wrong request format",
+                                         "Include the text to search in the q parameter",
+                                         "Search")
+        if not 0 < limit <= MAX_SEARCH_LIMIT:
+            return create_error_response(400, "Wrong request format",
+                                         "The limit must be between 1 and %d" % MAX_SEARCH_LIMIT,
+                                         "Search")
+
+        #The bm25 ranks of the artists and of the songs come from different
+        #indexes (weights, number and length of rows), so they cannot be
+        #compared: each type is a ranked list of its own, with its own limit.
+        results = []
+        if 'artists' in types:
+            artist_href = get_href_builder(Artist, 'artist')
+            for a in g.db.search_artists(text, limit):
+                _url = artist_href(a.legalName)
+                data = [('legalName', a.legalName), ('genre', a.genre),
+                        ('foundingLocation', a.foundingLocation),
+                        ('language', a.language),
+                        ('foundingDate', a.foundingDate)]
+                results.append((a.rank, _url, ARTIST_PROFILE, data))
+        if 'songs' in types:
+            song_href = get_href_builder(Song, 'artist', 'title')
+            for s in g.db.search_songs(text, limit):
+                _url = song_href(s.byArtist, s.name)
+                data = [('name', s.name), ('byArtist', s.byArtist),
+                        ('duration', s.duration),
+                        ('datePublished', s.datePublished)]
+                results.append((s.rank, _url, SONG_PROFILE, data))
+
+        envelope = {}
+        collection = {}
+        envelope["collection"] = collection
+        collection['version'] = "1.0"
+        collection['href'] = url_for(Search)
+        collection['queries'] = [
+            {'href': collection['href'],
+             'rel':'search',
+             'prompt':"Search artists and songs",
+             'data': SEARCH_QUERY_DATA}
+        ]
+        #Create the items
+        items = []
+        for _rank, _url, _profile, data in results:
+            item_data = [{'name': name, 'value': value} for name, value in data]
+            item_data.append({'name': 'rank', 'value': _rank})
+            items.append({'href': _url, 'data': item_data,
+                          'links': [{'href': _profile, 'rel': 'profile'}]})
+        collection['items'] = items
+        return envelope
+
 class Artist(Resource):
 
+    @conditional('artists')
     def get(self, artist):
         artist_db = g.db.get_artist(artist)
         if not artist_db:
@@ -178,40 +648,21 @@ class Artist(Resource):
         envelope["_links"] = links
 
         #Fill the links
-        _curies = [
-            {
-            "name": "artist",
-            "href": ARTIST_PROFILE,
-            },
-            {
-            "name": "atom-thread",
-            "href": ATOM_THREAD_PROFILE
-            }
-        ]
-        links['curies'] = _curies
-        links['self'] = {'href':api.url_for(Artist, artist=artist),
+        links['curies'] = ARTIST_CURIES
+        links['self'] = {'href':url_for(Artist, artist=artist),
                          'profile': ARTIST_PROFILE}
-        links['collection'] = [{'href': api.url_for(Artists),
+        links['collection'] = [{'href': url_for(Artists),
                                 'profile': ARTIST_PROFILE,
                                 'type': COLLECTIONJSON,
                                 'rel': "artists-all"},
-                               {'href': api.url_for(Songs, artist=artist),
+                               {'href': url_for(Songs, artist=artist),
                                 'profile': SONG_PROFILE,
                                 'type': COLLECTIONJSON,
                                 'rel': "songs-all"}
                                ]
 
         #Fill the template
-        envelope['template'] = {
-        "data" : [
-            {"prompt" : "", "name" : "legalName", "value" : "", "required":True},
-            {"prompt" : "", "name" : "genre", "value" : "", "required":False},
-            {"prompt" : "", "name" : "foundingLocation", "value" : "", "required":False},
-            {"prompt" : "", "name" : "language", "value" : "", "required":False},
-            {"prompt" : "", "name" : "foundingDate", "value" : "", "required":False},
-
-            ]
-        }
+        envelope['template'] = ARTIST_TEMPLATE
 
         #Fill the rest of properties
         envelope['legalName'] = artist_db['legalName']
@@ -221,45 +672,37 @@ class Artist(Resource):
         envelope['foundingDate'] = artist_db['foundingDate']
 
         #RENDER
-        return Response (json.dumps(envelope), 200, mimetype=HAL+";"+ ARTIST_PROFILE)
+        return Response(serialization.dumps(envelope), 200, mimetype=HAL+";"+ ARTIST_PROFILE)
 
 class Songs(Resource):
 
+    @conditional('songs')
     def get(self, artist):
-        songs_db = g.db.get_songs(artist)
+        streaming = is_streaming_requested()
+        try:
+            if streaming:
+                limit, after, before = get_page_parameters(None)
+                if before is not None:
+                    raise ValueError("before is not supported when streaming")
+                songs_db = g.db.iter_songs(artist, limit, after)
+            else:
+                limit, after, before = get_page_parameters()
+                songs_db = g.db.get_songs(artist, limit, after, before)
+        except ValueError as error:
+            return create_page_error_response(error, "Songs")
 
         envelope = {}
         collection = {}
         envelope["collection"] = collection
         collection['version'] = "1.0"
-        collection['href'] = api.url_for(Songs, artist=artist)
-        collection['template'] = {
-        "data" : [
-            {"prompt" : "", "name" : "name", "value" : "", "required":True},
-            {"prompt" : "", "name" : "byArtist", "value" : "", "required":True},
-            {"prompt" : "", "name" : "duration", "value" : "", "required":False},
-            {"prompt" : "", "name" : "datePublished", "value" : "", "required":False},
-
-            ]
-        }
+        collection['href'] = url_for(Songs, artist=artist)
+        if not streaming:
+            collection['links'] = create_page_links(songs_db, collection['href'])
+        collection['template'] = SONGS_TEMPLATE
+        if streaming:
+            return stream_collection(envelope, songs_db, create_song_item)
         #Create the items
-        items = []
-        for a in songs_db:
-            _title = a['name']
-            _length = a['duration']
-            _year = a['datePublished']
-            _url = api.url_for(Song, artist=artist, title=_title)
-            song = {}
-            song['href'] = _url
-            song['data'] = []
-            ss = [('name',_title), ('byArtist', artist), ('duration',_length), ('datePublished',_year)]
-            for s in ss:
-                value = {'name': s[0], 'value': s[1]}
-                song['data'].append(value)
-
-            song['links'] = []
-            items.append(song)
-        collection['items'] = items
+        collection['items'] = [create_song_item(a) for a in songs_db]
         return envelope
 
     def post(self, artist):
@@ -268,6 +711,8 @@ class Songs(Resource):
             return create_error_response(415, "Unsupported Media Type",
                                          "Use a JSON compatible format",
                                          "Songs")
+        if is_batch_request(input):
+            return self.post_batch(artist, input)
 
         #It throws a BadRequest exception, and hence a 400 code if the JSON is
         #not wellformed
@@ -299,16 +744,46 @@ class Songs(Resource):
         if not aid:
             abort(500)
 
-        url = api.url_for(Song, artist=artist, title=title)
+        url = url_for(Song, artist=artist, title=dictionary.get('name'))
 
         #RENDER
         #Return the response
         return Response(status=201, headers={'Location':url})
 
-        return
+    def post_batch(self, artist, input):
+        '''
+        Create every song of a batch request in a single transaction. The
+        response (207) has the status of every item, in order, and the URL
+        of the songs created.
+        '''
+        try:
+            items = get_batch_items(input)
+        except ValueError as error:
+            return create_error_response(400, "Wrong request format", str(error),
+                                         "Songs")
+        if not g.db.get_artist(artist):
+            return create_error_response(404, "Unknown artist",
+                                         "There is no artist named %s" % artist,
+                                         "Songs")
+
+        results = [{'status': 400, 'message': "Be sure you include song's title"}
+                   if not item.get('name') else None for item in items]
+        songs = [(item['name'], item.get('datePublished', None), item.get('duration', None))
+                 for item in items if item.get('name')]
+        created = iter(g.db.create_songs(artist, songs))
+        song_href = get_href_builder(Song, 'artist', 'title')
+        for i, item in enumerate(items):
+            if results[i] is None:
+                sid, error = next(created)
+                if error is None:
+                    results[i] = {'status': 201, 'href': song_href(artist, item['name'])}
+                else:
+                    results[i] = {'status': 400, 'message': error}
+        return {'results': results}, 207
 
 class Song(Resource):
 
+    @conditional('songs')
     def get(self, artist, title):
         song_db = g.db.get_song(artist, title)
         if not song_db:
@@ -323,45 +798,30 @@ class Song(Resource):
         envelope["_links"] = links
 
         #Fill the links
-        _curies = [
-            {
-            "name": "song",
-            "href": SONG_PROFILE,
-            },
-            {
-            "name": "atom-thread",
-            "href": ATOM_THREAD_PROFILE
-            }
-        ]
-        links['curies'] = _curies
-        links['self'] = {'href':api.url_for(Song, title=title, artist=artist),
+        links['curies'] = SONG_CURIES
+        links['self'] = {'href':url_for(Song, title=title, artist=artist),
                          'profile': SONG_PROFILE}
-        links['collection'] = [{'href':api.url_for(Songs, artist=artist),
+        links['collection'] = [{'href':url_for(Songs, artist=artist),
                                 'profile': SONG_PROFILE,
                                 'type':COLLECTIONJSON,
                                 'rel': "songs-all"},
-                               {'href':api.url_for(Artists),
+                               {'href':url_for(Artists),
                                 'profile': ARTIST_PROFILE,
                                 'type':COLLECTIONJSON,
                                 'rel': "artists-all"}
                                ]
-        links['artist'] = {'href':api.url_for(Artist, artist=artist),
+        links['artist'] = {'href':url_for(Artist, artist=artist),
 							   'profile': ARTIST_PROFILE,
 							   'type': "" ,
                                'rel': "artist"}
+        links['related'] = {'href':url_for(Song_related, artist=artist, title=title),
+                            'profile': SONG_PROFILE,
+                            'type': COLLECTIONJSON,
+                            'rel': "related"}
 
 
         #Fill the template
-        envelope['template'] = {
-        "data" : [
-            {"prompt" : "", "name" : "name", "value" : "", "required":True},
-            {"prompt" : "", "name" : "byArtist", "value" : "", "required":False},
-            {"prompt" : "", "name" : "datePublished", "value" : "", "required":False},
-            {"prompt" : "", "name" : "duration", "value" : "", "required":False},
-            {"prompt" : "", "name" : "sid", "value" : "", "required":False},
-
-            ]
-        }
+        envelope['template'] = SONG_TEMPLATE
 
         #Fill the rest of properties
         envelope['name'] = song_db['name']
@@ -372,7 +832,7 @@ class Song(Resource):
 
 
         #RENDER
-        return Response (json.dumps(envelope), 200, mimetype=HAL+";"+ SONG_PROFILE)
+        return Response(serialization.dumps(envelope), 200, mimetype=HAL+";"+ SONG_PROFILE)
 
     def delete(self, artist, title):
 
@@ -384,9 +844,65 @@ class Song(Resource):
                                          "There is no songs with title %s" % title,
                                          "Song")
 
+class Song_related(Resource):
+
+    #The index is rebuilt outside the API (python -m cooccurrence), so the
+    #responses are not validated with the change counters of the tables.
+    def get(self, artist, title):
+        song_db = g.db.get_song(artist, title)
+        if not song_db:
+            return create_error_response(404, "Unknown song",
+                                         "There is no song named %s of the artist %s" % (title,artist),
+                                         "Song_related")
+        #numpy and scipy take longer to import than the rest of the server:
+        #only the first request of this resource pays for them.
+        import cooccurrence
+        index = cooccurrence.get_index(current_app.config["COOCCURRENCE_PATH"] or cooccurrence.DEFAULT_PATH)
+        if index is None:
+            return create_error_response(503, "Service unavailable",
+                                         "The co-occurrence index has not been built",
+                                         "Song_related")
+        try:
+            limit = int(request.args.get('limit', DEFAULT_RELATED_LIMIT))
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= index.top_k:
+            return create_error_response(400, "Wrong request format",
+                                         "The limit must be between 1 and %d" % index.top_k,
+                                         "Song_related")
+        related = index.related(song_db['sid'], limit)
+        songs = g.db.get_songs_by_id(sid for sid, count in related)
+
+        envelope = {}
+        collection = {}
+        envelope["collection"] = collection
+        collection['version'] = "1.0"
+        collection['href'] = url_for(Song_related, artist=artist, title=title)
+        collection['links'] = [{'href': url_for(Song, artist=artist, title=title),
+                                'rel': 'song', 'prompt': 'Song of the related songs'}]
+        collection['queries'] = [
+            {'href': collection['href'],
+             'rel':'search',
+             'prompt':"Limit the related songs",
+             'data': RELATED_QUERY_DATA}
+        ]
+        #Create the items. Songs deleted since the index was built are
+        #left out.
+        items = []
+        for sid, count in related:
+            if sid not in songs:
+                continue
+            item = create_song_item(songs[sid])
+            item['data'].append({'name': 'sid', 'value': sid})
+            item['data'].append({'name': 'count', 'value': count})
+            items.append(item)
+        collection['items'] = items
+        return envelope
 
 class Playlist(Resource):
 
+    @conditional('playlists',
+                 last_modified=get_playlist_last_modified)
     def get(self, nickname, title):
         pl_db = g.db.get_playlist(title, nickname)
         if not pl_db:
@@ -401,31 +917,15 @@ class Playlist(Resource):
         envelope["_links"] = links
 
         #Fill the links
-        _curies = [
-            {
-            "name": "playlist",
-            "href": PLAYLIST_PROFILE,
-            },
-            {
-            "name": "atom-thread",
-            "href": ATOM_THREAD_PROFILE
-            }
-        ]
-        links['curies'] = _curies
-        links['self'] = {'href':api.url_for(Playlist, nickname=nickname, title=title),
+        links['curies'] = PLAYLIST_CURIES
+        links['self'] = {'href':url_for(Playlist, nickname=nickname, title=title),
                          'profile': PLAYLIST_PROFILE}
-        links['collection'] = {'href':api.url_for(User_playlists, nickname=nickname),
+        links['collection'] = {'href':url_for(User_playlists, nickname=nickname),
                                'profile': PLAYLIST_PROFILE,
                                'type':COLLECTIONJSON}
 
         #Fill the template
-        envelope['template'] = {
-        "data" : [
-            {"prompt" : "", "name" : "name", "value" : "", "required":True},
-            {"prompt" : "", "name" : "author", "value" : "", "required":True},
-            {"prompt" : "", "name" : "created_on", "value" : "", "required":False}
-        ]
-        }
+        envelope['template'] = PLAYLIST_TEMPLATE
 
         #Fill the rest of properties
         envelope['name'] = pl_db['name']
@@ -433,7 +933,7 @@ class Playlist(Resource):
         envelope['created_on'] = pl_db['created_on']
 
         #RENDER
-        return Response (json.dumps(envelope), 200, mimetype=HAL+";"+ PLAYLIST_PROFILE)
+        return Response(serialization.dumps(envelope), 200, mimetype=HAL+";"+ PLAYLIST_PROFILE)
 
     def post(self, nickname, title):
         input = request.get_json(force=True)
@@ -442,6 +942,9 @@ class Playlist(Resource):
                                         "Use a JSON compatible format",
                                         "Playlist")
 
+        if is_batch_request(input):
+            return self.post_batch(nickname, title, input)
+
         #It throws a BadRequest exception, and hence a 400 code if the JSON is
         #not wellformed
         try:
@@ -465,22 +968,50 @@ class Playlist(Resource):
             return create_error_response(400, "Wrong request format",
                                         "Be sure you include song's title and artist",
                                         "Playlist")
-        song = g.db.get_song(dictionary.get("byArtist"),dictionary.get("name"))
-        if not song:
-            abort(500)
-
-        sid = song['sid']
-        print(sid)  # Indent this line correctly
-
-        aid = g.db.append_song_to_playlist(sid, title, nickname)
-        if not aid:
-            abort(500)
-
-        url = api.url_for(Playlist, nickname=nickname, title=title)
+        #The song is looked up and appended in the same transaction
+        [(sid, error)] = g.db.append_songs_to_playlist(title, nickname,
+                                                       [(dictionary.get("byArtist"), dictionary.get("name"))])
+        if error is not None:
+            return create_error_response(404 if sid is None else 409,
+                                         "Song not appended", error, "Playlist")
 
         #RENDER
         #Return the response
-        return jsonify({'message': 'Playlist created successfully'}), 201
+        return {'message': 'Playlist created successfully'}, 201
+
+    def post_batch(self, nickname, title, input):
+        '''
+        Append the songs of a batch request, given by byArtist and name, to
+        the playlist in a single transaction. The response (207) has the
+        status of every item, in order.
+        '''
+        try:
+            items = get_batch_items(input)
+        except ValueError as error:
+            return create_error_response(400, "Wrong request format", str(error),
+                                         "Playlist")
+        if not g.db.contains_playlist(nickname, title):
+            return create_error_response(404, "Unknown playlist",
+                                         "There is no playlist called %s" % title,
+                                         "Playlist")
+
+        results = [{'status': 400, 'message': "Be sure you include song's title and artist"}
+                   if not item.get('byArtist') or not item.get('name') else None
+                   for item in items]
+        songs = [(item['byArtist'], item['name']) for i, item in enumerate(items)
+                 if results[i] is None]
+        appended = iter(g.db.append_songs_to_playlist(title, nickname, songs))
+        song_href = get_href_builder(Song, 'artist', 'title')
+        for i, item in enumerate(items):
+            if results[i] is None:
+                sid, error = next(appended)
+                if error is None:
+                    results[i] = {'status': 201,
+                                  'href': song_href(item['byArtist'], item['name'])}
+                else:
+                    results[i] = {'status': 404 if sid is None else 409,
+                                  'message': error}
+        return {'results': results}, 207
 
 
 
@@ -533,50 +1064,36 @@ class Playlist(Resource):
 
 class Playlist_songs(Resource):
 
+    @conditional('song_in_playlist', 'songs',
+                 last_modified=get_playlist_last_modified)
     def get(self, title, nickname):
 
-        songs = g.db.get_songs_in_playlist(title, nickname)
+        try:
+            limit, after, before = get_page_parameters()
+            songs = g.db.get_songs_in_playlist(title, nickname, limit, after, before)
+        except ValueError as error:
+            return create_page_error_response(error, "Playlist_songs")
 
         envelope = {}
         collection = {}
         envelope["collection"] = collection
         collection['version'] = "1.0"
-        collection['href'] = api.url_for(Playlist_songs, nickname=nickname, title=title)
-        collection['template'] = {
-        "data" : [
-            {"prompt" : "", "name" : "name", "value" : "", "required":True},
-            {"prompt" : "", "name" : "byArtist", "value" : "", "required":True},
-            {"prompt" : "", "name" : "duration", "value" : "", "required":False},
-            {"prompt" : "", "name" : "datePublished", "value" : "", "required":False},
-
-            ]
-        }
+        collection['href'] = url_for(Playlist_songs, nickname=nickname, title=title)
+        collection['links'] = create_page_links(songs, collection['href'])
+        collection['template'] = SONGS_TEMPLATE
         #Create the items
-        items = []
-        for a in songs:
-            _artist = a['byArtist']
-            _title = a['name']
-            _length = a['duration']
-            _year = a['datePublished']
-            _url = api.url_for(Song, artist=a['byArtist'], title=_title)
-            song = {}
-            song['href'] = _url
-            song['data'] = []
-
-            ss = [('name',_title), ('byArtist', _artist), ('duration',_length), ('datePublished',_year)]
-            for s in ss:
-                value = {'name': s[0], 'value': s[1]}
-                song['data'].append(value)
-
-            song['links'] = []
-            items.append(song)
-        collection['items'] = items
+        collection['items'] = [create_song_item(a) for a in songs]
 
         return envelope
 
 class Users(Resource):
+    @conditional('users')
     def get(self):
-        users_db = g.db.get_users()
+        try:
+            limit, after, before = get_page_parameters()
+            users_db = g.db.get_users(limit, after, before)
+        except ValueError as error:
+            return create_page_error_response(error, "Users")
 
         # FILTER AND GENERATE THE RESPONSE
         # Create the envelope
@@ -584,54 +1101,15 @@ class Users(Resource):
         collection = {}
         envelope["collection"] = collection
         collection['version'] = "1.0"
-        collection['href'] = api.url_for(Users)
+        collection['href'] = url_for(Users)
         collection['links'] = [{'prompt':'List of all artists in the Finder',
                                 'rel':'artists-all',
-                                'href': api.url_for(Artists)}
+                                'href': url_for(Artists)}
                                ]
-        collection['template'] = {
-        "data" : [
-            {"prompt" : "Insert nickname", "name" : "nickname",
-             "value" : "", "required":True},
-            {"prompt" : "Insert password", "name" : "password",
-             "object" : {}, "required":False},
-            {"prompt" : "Insert user gender", "name" : "gender",
-             "value" : "", "required":False},
-            {"prompt" : "Insert user country", "name" : "nationality",
-             "value" : "", "required":False},
-            {"prompt" : "Insert user age", "name" : "age",
-             "value" : "", "required":False}
-
-        ]
-        }
+        collection['links'].extend(create_page_links(users_db, url_for(Users)))
+        collection['template'] = USERS_TEMPLATE
         # Create the items
-        items = []
-        for user in users_db:
-            _nickname = user['nickname']
-            _gender = user['gender']
-            _country = user['nationality']
-            _age = user['age']
-
-            _url = api.url_for(User, nickname=_nickname)
-            _playlist_url = api.url_for(User_playlists, nickname=_nickname)
-            user = {}
-            user['href'] = _url
-            user['read-only'] = True
-            user['data'] = []
-
-            ss = [('nickname',_nickname), ('gender', _gender), ('nationality',_country), ('age',_age)]
-            for s in ss:
-                value = {'name': s, 'value': s}
-                user['data'].append(value)
-
-            user['links'] = [{
-                             'href':_playlist_url,
-                             'rel':"playlists",
-                             'name':"playlists",
-                             'prompt':"Playlists of user"
-                             }]
-            items.append(user)
-        collection['items'] = items
+        collection['items'] = [create_user_item(user) for user in users_db]
         # RENDER
         return envelope
 
@@ -666,7 +1144,7 @@ class Users(Resource):
         if not aid:
             abort(500)
 
-        url = api.url_for(User, nickname=dictionary.get("nickname"))
+        url = url_for(User, nickname=dictionary.get("nickname"))
 
 
         #RENDER
@@ -676,6 +1154,7 @@ class Users(Resource):
 
 class User(Resource):
 
+    @conditional('users')
     def get(self, nickname):
         user_db = g.db.get_user(nickname, request.args.get('password'))
         if not user_db:
@@ -690,38 +1169,25 @@ class User(Resource):
         envelope["_links"] = links
 
         #Fill the links
-        _curies = [
-            {
-            "name": "user",
-            "href": USER_PROFILE,
-            },
-            {
-            "name": "atom-thread",
-            "href": ATOM_THREAD_PROFILE
-            }
-        ]
-        links['curies'] = _curies
-        links['self'] = {'href':api.url_for(User, nickname=nickname),
+        links['curies'] = USER_CURIES
+        links['self'] = {'href':url_for(User, nickname=nickname),
                          'profile': USER_PROFILE}
-        links['collection'] = [{'href':api.url_for(Users),
+        links['collection'] = [{'href':url_for(Users),
                                'profile': USER_PROFILE,
                                'type':COLLECTIONJSON,
                                'rel': "users-all"},
-                               {'href':api.url_for(User_playlists, nickname=nickname),
+                               {'href':url_for(User_playlists, nickname=nickname),
                                'profile': PLAYLIST_PROFILE,
                                'type':COLLECTIONJSON,
-                               'rel': "playlists-all"}
+                               'rel': "playlists-all"},
+                               {'href':url_for(User_recommendations, nickname=nickname),
+                               'profile': SONG_PROFILE,
+                               'type':COLLECTIONJSON,
+                               'rel': "recommendations"}
                                ]
 
         #Fill the template
-        envelope['template'] = {
-        "data" : [
-            {"prompt" : "", "name" : "nickname", "value" : "", "required":True},
-            {"prompt" : "", "name" : "gender", "value" : "", "required":False},
-            {"prompt" : "", "name" : "nationality", "value" : "", "required":False},
-            {"prompt" : "", "name" : "age", "value" : "", "required":False}
-        ]
-        }
+        envelope['template'] = USER_TEMPLATE
 
         #Fill the rest of properties
         envelope['nickname'] = user_db['nickname']
@@ -730,7 +1196,7 @@ class User(Resource):
         envelope['age'] = user_db['age']
 
         #RENDER
-        return Response (json.dumps(envelope), 200, mimetype=HAL+";"+ USER_PROFILE)
+        return Response(serialization.dumps(envelope), 200, mimetype=HAL+";"+ USER_PROFILE)
 
     def delete(self, nickname):
         if g.db.delete_user(nickname):
@@ -770,41 +1236,23 @@ class User(Resource):
 
 class User_playlists(Resource):
 
+    @conditional('playlists')
     def get(self, nickname):
-        pl_db = g.db.get_playlists(nickname)
+        try:
+            limit, after, before = get_page_parameters()
+            pl_db = g.db.get_playlists(nickname, limit, after, before)
+        except ValueError as error:
+            return create_page_error_response(error, "User_playlists")
 
         envelope = {}
         collection = {}
         envelope["collection"] = collection
         collection['version'] = "1.0"
-        collection['href'] = api.url_for(User_playlists, nickname=nickname)
-        collection['template'] = {
-        "data" : [
-            {"prompt" : "", "name" : "name", "value" : "", "required":True},
-            {"prompt" : "", "name" : "author", "value" : "", "required":True},
-            {"prompt" : "", "name" : "created_on", "value" : "", "required":False}
-        ]
-        }
+        collection['href'] = url_for(User_playlists, nickname=nickname)
+        collection['links'] = create_page_links(pl_db, collection['href'])
+        collection['template'] = PLAYLIST_TEMPLATE
         #Create the items
-        items = []
-        for a in pl_db:
-            _title = a['name']
-            _user = a['author']
-            _created_on = a['created_on']
-            _url = api.url_for(Playlist, nickname=_user, title=_title)
-            pl = {}
-            pl['href'] = _url
-            pl['data'] = []
-
-            ss = [('name',_title), ('author', _user), ('created_on',_created_on)]
-            for s in ss:
-                value = {'name': s[0], 'value': s[1]}
-                pl['data'].append(value)
-
-            pl['links'] = []
-            items.append(pl)
-
-        collection['items'] = items
+        collection['items'] = [create_playlist_item(a) for a in pl_db]
         return envelope
 
     def post(self, nickname):
@@ -841,28 +1289,307 @@ class User_playlists(Resource):
         if not plid:
             abort(500)
 
-        url = api.url_for(Playlist, nickname=nickname, title=name)
+        url = url_for(Playlist, nickname=nickname, title=name)
 
         #RENDER
         #Return the response
         return Response(status=201, headers={'Location':url})
 
 
+class User_recommendations(Resource):
+
+    #The recommendations are derived from the artists, the songs, the
+    #playlist entries and the similarity index, so they only change when one
+    #of them does.
+    @conditional('artists', 'songs', 'song_in_playlist', 'artist_similarity')
+    def get(self, nickname):
+        try:
+            limit = int(request.args.get('limit', database.DEFAULT_RECOMMENDATIONS_LIMIT))
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= MAX_RECOMMENDATIONS_LIMIT:
+            return create_error_response(400, "Wrong request format",
+                                         "The limit must be between 1 and %d" % MAX_RECOMMENDATIONS_LIMIT,
+                                         "User_recommendations")
+        if not g.db.get_user(nickname):
+            return create_error_response(404, "Unknown user",
+                                         "There is no user named %s" % nickname,
+                                         "User_recommendations")
+        songs = g.db.get_recommendations(nickname, limit)
+
+        envelope = {}
+        collection = {}
+        envelope["collection"] = collection
+        collection['version'] = "1.0"
+        collection['href'] = url_for(User_recommendations, nickname=nickname)
+        collection['links'] = [{'href': url_for(User, nickname=nickname),
+                                'rel': 'user', 'prompt': 'Owner of the recommendations'}]
+        collection['queries'] = [
+            {'href': collection['href'],
+             'rel':'search',
+             'prompt':"Limit the recommendations",
+             'data': RECOMMENDATIONS_QUERY_DATA}
+        ]
+        #Create the items
+        items = []
+        for s in songs:
+            item = create_song_item(s)
+            item['data'].append({'name': 'score', 'value': s.score})
+            item['links'] = [{'href': SONG_PROFILE, 'rel': 'profile'}]
+            items.append(item)
+        collection['items'] = items
+        return envelope
+
+
+def get_limit_parameter(default, maximum):
+    '''
+    Return the limit parameter of the request (default if there is none),
+    or None if it is not an integer between 1 and maximum.
+    '''
+    try:
+        limit = int(request.args.get('limit', default))
+    except ValueError:
+        return None
+    return limit if 0 < limit <= maximum else None
+
+def parse_day(text):
+    '''
+    Return the time (seconds since the epoch) of the start of the UTC day
+    text (YYYY-MM-DD). Raise ValueError if text is not a date.
+    '''
+    return calendar.timegm(time.strptime(text, '%Y-%m-%d'))
+
+#The statistics resources read the summaries that the database keeps up to
+#date from the playlist entries (see MusicDatabase.get_top_songs).
+class Top_songs(Resource):
+
+    @conditional('song_in_playlist', 'songs')
+    def get(self):
+        limit = get_limit_parameter(database.DEFAULT_STATISTICS_LIMIT, MAX_STATISTICS_LIMIT)
+        if limit is None:
+            return create_error_response(400, "Wrong request format",
+                                         "The limit must be between 1 and %d" % MAX_STATISTICS_LIMIT,
+                                         "Top_songs")
+        envelope = {}
+        collection = {}
+        envelope["collection"] = collection
+        collection['version'] = "1.0"
+        collection['href'] = url_for(Top_songs)
+        collection['queries'] = [
+            {'href': collection['href'],
+             'rel':'search',
+             'prompt':"Limit the songs",
+             'data': STATISTICS_QUERY_DATA}
+        ]
+        #Create the items
+        items = []
+        for s in g.db.get_top_songs(limit):
+            item = create_song_item(s)
+            item['data'].append({'name': 'plays', 'value': s.plays})
+            item['links'] = [{'href': SONG_PROFILE, 'rel': 'profile'}]
+            items.append(item)
+        collection['items'] = items
+        return envelope
+
+class Top_artists(Resource):
+
+    @conditional('song_in_playlist', 'songs', 'artists')
+    def get(self):
+        limit = get_limit_parameter(database.DEFAULT_STATISTICS_LIMIT, MAX_STATISTICS_LIMIT)
+        if limit is None:
+            return create_error_response(400, "Wrong request format",
+                                         "The limit must be between 1 and %d" % MAX_STATISTICS_LIMIT,
+                                         "Top_artists")
+        envelope = {}
+        collection = {}
+        envelope["collection"] = collection
+        collection['version'] = "1.0"
+        collection['href'] = url_for(Top_artists)
+        collection['queries'] = [
+            {'href': collection['href'],
+             'rel':'search',
+             'prompt':"Limit the artists",
+             'data': STATISTICS_QUERY_DATA}
+        ]
+        #Create the items
+        items = []
+        for a in g.db.get_top_artists(limit):
+            item = create_artist_item(a)
+            item['data'].append({'name': 'plays', 'value': a.plays})
+            item['links'] = [{'href': ARTIST_PROFILE, 'rel': 'profile'}]
+            items.append(item)
+        collection['items'] = items
+        return envelope
+
+class Genre_popularity(Resource):
+
+    @conditional('song_in_playlist', 'songs', 'artists', 'users')
+    def get(self):
+        dimension = request.args.get('by', '')
+        value = request.args.get('value', None)
+        limit = None
+        if 'limit' in request.args:
+            limit = get_limit_parameter(None, MAX_STATISTICS_LIMIT)
+            if limit is None:
+                return create_error_response(400, "Wrong request format",
+                                             "The limit must be between 1 and %d" % MAX_STATISTICS_LIMIT,
+                                             "Genre_popularity")
+        if dimension not in database.STATISTICS_DIMENSIONS:
+            return create_error_response(400, "Wrong request format",
+                                         "The by parameter must be one of %s"
+                                         % ', '.join(database.STATISTICS_DIMENSIONS),
+                                         "Genre_popularity")
+        envelope = {}
+        collection = {}
+        envelope["collection"] = collection
+        collection['version'] = "1.0"
+        collection['href'] = url_for(Genre_popularity)
+        collection['queries'] = [
+            {'href': collection['href'],
+             'rel':'search',
+             'prompt':"Group the genres",
+             'data': GENRES_QUERY_DATA}
+        ]
+        #Every item links to the artists of its genre.
+        artists_href = url_for(Artists)
+        items = []
+        for _value, genre, plays in g.db.get_genre_popularity(dimension, value, limit):
+            items.append({'href': artists_href + '?' + urlencode({'genre': genre}),
+                          'data': [{'name': dimension, 'value': _value},
+                                   {'name': 'genre', 'value': genre},
+                                   {'name': 'plays', 'value': plays}],
+                          'links': []})
+        collection['items'] = items
+        return envelope
+
+class Playlist_additions(Resource):
 
+    @conditional('song_in_playlist')
+    def get(self):
+        try:
+            since = request.args.get('since', None)
+            until = request.args.get('until', None)
+            since = None if since is None else parse_day(since)
+            until = None if until is None else parse_day(until)
+        except ValueError:
+            return create_error_response(400, "Wrong request format",
+                                         "since and until must be dates (YYYY-MM-DD)",
+                                         "Playlist_additions")
+        envelope = {}
+        collection = {}
+        envelope["collection"] = collection
+        collection['version'] = "1.0"
+        collection['href'] = url_for(Playlist_additions)
+        collection['queries'] = [
+            {'href': collection['href'],
+             'rel':'search',
+             'prompt':"Choose the days",
+             'data': ADDITIONS_QUERY_DATA}
+        ]
+        #Every item links to the collection restricted to its day.
+        items = []
+        for day, additions in g.db.get_daily_additions(since, until):
+            items.append({'href': collection['href'] + '?' + urlencode({'since': day, 'until': day}),
+                          'data': [{'name': 'day', 'value': day},
+                                   {'name': 'additions', 'value': additions}],
+                          'links': []})
+        collection['items'] = items
+        return envelope
 
 
-# Add the resources to the API
-api.add_resource(Artists, "/musicfinder/api/artists/")
-api.add_resource(Artist, "/musicfinder/api/artists/<artist>/")
-api.add_resource(Songs, "/musicfinder/api/artists/<artist>/songs/")
-api.add_resource(Song, "/musicfinder/api/artists/<artist>/songs/<title>")
-api.add_resource(Playlist, "/musicfinder/api/users/<nickname>/playlists/<title>/")
-api.add_resource(Playlist_songs, "/musicfinder/api/users/<nickname>/playlists/<title>/")
-api.add_resource(User, "/musicfinder/api/users/<nickname>/")
-api.add_resource(Users, "/musicfinder/api/users/")
-api.add_resource(User_playlists, "/musicfinder/api/users/<nickname>/playlists/")
+#Time the resources and the JSON encoding when the instrumentation is
+#enabled, and the requests (see instrumentation).
+for _resource in (Artists, Search, Artist, Songs, Song, Song_related, Playlist,
+                  Playlist_songs, User, Users, User_playlists, User_recommendations,
+                  Top_songs, Top_artists, Genre_popularity, Playlist_additions):
+    instrumentation.register(_resource, 'resource',
+                             [m for m in ('get', 'post', 'put', 'delete') if m in vars(_resource)])
+instrumentation.register(serialization, 'serialize', ('dumps',))
+
+def metrics():
+    '''
+    Prometheus metrics of this process: the histograms of the
+    instrumentation and the statistics of the connection pool and caches.
+    '''
+    db = get_database()
+    return Response(instrumentation.render_metrics(db.get_pool_stats(), db.get_cache_stats()),
+                    200, mimetype='text/plain; version=0.0.4')
+
+def create_app(config=None):
+    '''
+    Create the Flask application of the API, with the settings of config
+    (a dict) over the defaults. Nothing is opened here: the database is
+    opened by the first request (see get_database). The Api of the
+    application is in app.extensions['api']. The debug mode is off unless
+    config sets DEBUG.
+    '''
+    app = Flask(__name__)
+    #Path and MusicDatabase keyword arguments of the database, opened on
+    #first use; set DATABASE to use a database opened already.
+    app.config["DATABASE_PATH"] = DEFAULT_DB_PATH
+    app.config["DATABASE_OPTIONS"] = {}
+    app.config["DATABASE"] = None
+    #Folder of the song co-occurrence index served by Song_related (see
+    #cooccurrence); None for cooccurrence.DEFAULT_PATH.
+    app.config["COOCCURRENCE_PATH"] = None
+    #Let clients profile a request with the X-Profile header (see
+    #instrumentation). Never enable it on a public server.
+    app.config["PROFILE_REQUESTS"] = os.environ.get('MUSICFINDER_PROFILE_REQUESTS', '') not in ('', '0')
+    app.config.update(config or {})
+
+    app.register_error_handler(404, resource_not_found)
+    app.register_error_handler(500, unknown_error)
+    app.before_request(set_database)
+
+    # Define the API
+    api = Api(app)
+    app.extensions['api'] = api
+    #Serialize the Collection+JSON, HAL and plain JSON responses with the fastest
+    #available encoder (see serialization)
+    for mediatype in ('application/json', COLLECTIONJSON, HAL):
+        api.representation(mediatype)(serialization.output)
+
+    #Compress the responses (see content_encoding). Added before the
+    #instrumentation, so the profile reports that replace a body are
+    #compressed too.
+    content_encoding.init_app(app)
+    instrumentation.init_app(app)
+    app.add_url_rule('/metrics', 'metrics', metrics)
+
+    # Add the resources to the API
+    api.add_resource(Artists, "/musicfinder/api/artists/")
+    api.add_resource(Search, "/musicfinder/api/search/")
+    api.add_resource(Artist, "/musicfinder/api/artists/<artist>/")
+    api.add_resource(Songs, "/musicfinder/api/artists/<artist>/songs/")
+    api.add_resource(Song, "/musicfinder/api/artists/<artist>/songs/<title>")
+    api.add_resource(Song_related, "/musicfinder/api/artists/<artist>/songs/<title>/related/")
+    api.add_resource(Playlist, "/musicfinder/api/users/<nickname>/playlists/<title>/")
+    api.add_resource(Playlist_songs, "/musicfinder/api/users/<nickname>/playlists/<title>/songs/")
+    api.add_resource(User, "/musicfinder/api/users/<nickname>/")
+    api.add_resource(Users, "/musicfinder/api/users/")
+    api.add_resource(User_playlists, "/musicfinder/api/users/<nickname>/playlists/")
+    api.add_resource(User_recommendations, "/musicfinder/api/users/<nickname>/recommendations/")
+    api.add_resource(Top_songs, "/musicfinder/api/statistics/songs/")
+    api.add_resource(Top_artists, "/musicfinder/api/statistics/artists/")
+    api.add_resource(Genre_popularity, "/musicfinder/api/statistics/genres/")
+    api.add_resource(Playlist_additions, "/musicfinder/api/statistics/additions/")
+    return app
+
+def __getattr__(name):
+    '''
+    The default application (app) and its Api (api), created by the first
+    use of either: importing this module creates nothing.
+    '''
+    if name not in ('app', 'api'):
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    with _lock:
+        if 'app' not in globals():
+            app = create_app()
+            globals()['api'] = app.extensions['api']
+            globals()['app'] = app
+    return globals()[name]
 
 if __name__ == "__main__":
+    app = create_app({"DEBUG": True})
+    get_database(app).apply_migrations()
     app.run(debug=True)
-				 
-
@@ -0,0 +1,67 @@
+'''
+JSON serialization of the API responses.
+
+Two backends are available: "orjson", used when the orjson package is
+installed, and "json", the standard library. Both return compact UTF-8
+encoded bytes. The backend in use can be changed with set_backend, e.g. to
+compare them or to rule out the encoder when looking for a bug.
+'''
+import json
+
+from flask import make_response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _dumps_json(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def _dumps_orjson(obj):
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+#Backend name -> function that takes an object and returns its JSON bytes.
+BACKENDS = {'json': _dumps_json}
+if orjson is not None:
+    BACKENDS['orjson'] = _dumps_orjson
+
+DEFAULT_BACKEND = 'orjson' if orjson is not None else 'json'
+
+_dumps = BACKENDS[DEFAULT_BACKEND]
+_backend = DEFAULT_BACKEND
+
+def set_backend(name=None):
+    '''
+    Select the backend used by dumps. None selects DEFAULT_BACKEND. Raise
+    ValueError if the backend is not available.
+    '''
+    global _dumps, _backend
+    if name is None:
+        name = DEFAULT_BACKEND
+    try:
+        _dumps = BACKENDS[name]
+    except KeyError:
+        raise ValueError("Unknown or not installed JSON backend %s" % name)
+    _backend = name
+
+def get_backend():
+    '''
+    Return the name of the backend used by dumps.
+    '''
+    return _backend
+
+def dumps(obj):
+    '''
+    Return the JSON representation of obj as UTF-8 encoded bytes.
+    '''
+    return _dumps(obj)
+
+def output(data, code, headers=None):
+    '''
+    Flask-RESTful representation: a response with data serialized by dumps.
+    The Api sets the Content-Type to the negotiated media type.
+    '''
+    response = make_response(dumps(data), code)
+    response.headers.extend(headers or {})
+    return response
@@ -0,0 +1,67 @@
+'''
+Refresh of the artist similarity index used by the recommendations.
+
+The triggers on the artists and on the songs of the playlists queue the
+artists whose neighbours change (similarity_queue and similarity_playlists);
+the recommendations only read the index. Recompute the queued artists from
+the main folder with:
+
+    python -m similarity [--full] [--db PATH] [--batch N] [--interval SECONDS]
+
+The queue is emptied in transactions of N artists, so the write lock is
+never held for long. With --interval the refresh runs again every SECONDS
+seconds until it is stopped, e.g. next to the production server; otherwise
+it runs once, e.g. from cron. --full first recomputes every artist, in a
+single transaction (see MusicDatabase.rebuild_similarity_index).
+'''
+import argparse, os, time
+
+import database
+
+def refresh(db, batch=database.SIMILARITY_REFRESH_BATCH):
+    '''
+    Recompute every queued artist of db, batch artists per transaction.
+    Return the number of artists recomputed.
+    '''
+    total = 0
+    while True:
+        count = db.refresh_similarity_index(batch)
+        total += count
+        if count < batch:
+            return total
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Refresh the artist similarity index of the recommendations.')
+    parser.add_argument('--full', action='store_true',
+                        help='recompute every artist instead of the queued ones')
+    parser.add_argument('--db', default=database.DEFAULT_DB_PATH,
+                        help='database file (default: %(default)s)')
+    parser.add_argument('--batch', type=int, default=database.SIMILARITY_REFRESH_BATCH,
+                        help='artists recomputed per transaction (default: %(default)s)')
+    parser.add_argument('--interval', type=float,
+                        help='refresh again every INTERVAL seconds instead of once')
+    args = parser.parse_args(argv)
+    if args.batch < 1:
+        parser.error('the batch must be a positive integer')
+    if not os.path.exists(args.db):
+        parser.error('the database %s does not exist' % args.db)
+
+    db = database.MusicDatabase(args.db)
+    db.apply_migrations()
+    try:
+        full = args.full
+        while True:
+            start = time.time()
+            count = db.rebuild_similarity_index() if full else refresh(db, args.batch)
+            full = False
+            print('%d artists recomputed in %.1f s' % (count, time.time() - start))
+            if args.interval is None:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db.close()
+
+if __name__ == '__main__':
+    main()
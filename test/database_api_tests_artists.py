@@ -1,5 +1,6 @@
 import sqlite3
 import unittest
+import database
 from .database_api_tests_common import BaseTestCase, db, db_path
 
 class ArtistsDbAPITestCase(BaseTestCase):
@@ -120,6 +121,66 @@ class ArtistsDbAPITestCase(BaseTestCase):
             self.assertIn(artist['legalName'], ('Editors', 'Foals', 'Empire of the sun'))
             self.assertNotIn(artist['legalName'], ('Clap Clap'))
 
+    def test_get_artists_pages(self):
+        '''
+        Walk the artists forwards and backwards with keyset pagination
+        '''
+        print(f"({self.test_get_artists_pages.__name__})",
+              self.test_get_artists_pages.__doc__)
+        everyone = [a['legalName'] for a in db.get_artists()]
+        self.assertEqual(everyone, sorted(everyone))
+        pages = []
+        page = db.get_artists(limit=6)
+        self.assertIsNone(page.prev_cursor)
+        while True:
+            pages.append(page)
+            if page.next_cursor is None:
+                break
+            page = db.get_artists(limit=6, after=page.next_cursor)
+        self.assertEqual([len(p) for p in pages], [6, 6, 6, 2])
+        self.assertEqual([a['legalName'] for p in pages for a in p], everyone)
+        #Going back from the last page gives the previous one
+        previous = db.get_artists(limit=6, before=pages[-1].prev_cursor)
+        self.assertEqual(previous, pages[-2])
+        self.assertEqual(previous.next_cursor, pages[-2].next_cursor)
+        first = db.get_artists(limit=6, before=pages[1].prev_cursor)
+        self.assertEqual(first, pages[0])
+        self.assertIsNone(first.prev_cursor)
+        #Filters and pagination combine
+        page = db.get_artists(genre='Rock', limit=2)
+        self.assertEqual(len(page), 2)
+        self.assertIsNotNone(page.next_cursor)
+        with self.assertRaises(ValueError):
+            db.get_artists(limit=2, after='not-a-cursor')
+
+    def test_iter_artists(self):
+        '''
+        Check that iter_artists yields the same artists as get_artists and
+        holds no connection between its batches
+        '''
+        print(f"({self.test_iter_artists.__name__})",
+              self.test_iter_artists.__doc__)
+        artists = db.iter_artists(batch_size=3)
+        self.assertEqual(list(artists), db.get_artists())
+        artists = db.iter_artists(genre='Rock', limit=4, batch_size=3)
+        self.assertEqual(list(artists), db.get_artists(genre='Rock')[:4])
+        artists = db.iter_artists(batch_size=3)
+        next(artists)
+        self.assertEqual(db.get_pool_stats()['in_use'], 0)
+        self.assertEqual(len(list(artists)), len(db.get_artists()) - 1)
+        #A pool of one connection serves other reads while a generator is
+        #half read.
+        small = database.MusicDatabase(db.db_path, pool_size=1, checkout_timeout=0.5)
+        try:
+            artists = small.iter_artists(batch_size=3)
+            first = next(artists)
+            self.assertEqual(small.get_artist(first['legalName']), first)
+            self.assertEqual([first] + list(artists), small.get_artists())
+        finally:
+            small.close()
+        with self.assertRaises(ValueError):
+            db.iter_artists(after='not-a-cursor')
+
     def test_create_artist(self):
         '''
         Test that a new artist can be created
@@ -0,0 +1,127 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import database
+from benchmarks import compare, datagen, db_benchmark, results
+from .database_api_tests_common import BaseTestCase, db, db_path
+
+SONGS = 500
+
+class BenchmarksTestCase(BaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print(f"Testing {cls.__name__}")
+
+    def setUp(self):
+        super(BenchmarksTestCase, self).setUp()
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        super(BenchmarksTestCase, self).tearDown()
+
+    def _count(self, table):
+        with db._pool.connection() as con:
+            return con.execute('SELECT COUNT(*) FROM %s' % table).fetchone()[0]
+
+    def test_generate(self):
+        '''
+        Check that the generator adds the rows of get_sizes and returns keys
+        of rows that exist
+        '''
+        print(f"({self.test_generate.__name__})", self.test_generate.__doc__)
+        before = dict((table, self._count(table)) for table in
+                      ('artists', 'songs', 'users', 'playlists', 'song_in_playlist'))
+        generated = datagen.generate(db, SONGS)
+        sizes = datagen.get_sizes(SONGS)
+        self.assertEqual(generated['sizes'], sizes)
+        for table, count in sizes.items():
+            self.assertEqual(self._count(table), before[table] + count)
+        self.assertEqual(generated['last_sid'] - generated['first_sid'] + 1, SONGS)
+        self.assertIsNotNone(db.get_artist(generated['artists'][0]))
+        self.assertIsNotNone(db.get_user(generated['users'][0]))
+        self.assertIsNotNone(db.get_playlist(*generated['playlists'][0]))
+        self.assertEqual(len(db.get_songs_by_id(generated['songs'])), len(set(generated['songs'])))
+
+    def test_generate_is_deterministic(self):
+        '''
+        Check that the same seed generates the same catalogue and that the
+        keys are saved with the database
+        '''
+        print(f"({self.test_generate_is_deterministic.__name__})",
+              self.test_generate_is_deterministic.__doc__)
+        catalogues = []
+        for name in ('first.db', 'second.db'):
+            path = os.path.join(self.folder, name)
+            other, generated = datagen.create_database(path, SONGS, seed=7, similarity=False)
+            with other._pool.connection() as con:
+                catalogues.append(con.execute('SELECT * FROM songs ORDER BY sid').fetchall())
+            other.close()
+            self.assertEqual(datagen.load_keys(path), generated)
+        self.assertEqual([tuple(row) for row in catalogues[0]],
+                         [tuple(row) for row in catalogues[1]])
+
+    def test_db_benchmark(self):
+        '''
+        Check that the database benchmarks run and leave the catalogue as
+        they found it
+        '''
+        print(f"({self.test_db_benchmark.__name__})", self.test_db_benchmark.__doc__)
+        keys = datagen.generate(db, SONGS, similarity=False)
+        tables = ('artists', 'songs', 'users', 'playlists', 'song_in_playlist')
+        counts = [self._count(table) for table in tables]
+        uncached = database.MusicDatabase(db_path, cache_size=0)
+        try:
+            measured = db_benchmark.run(db, uncached, keys, rounds=3)
+        finally:
+            uncached.close()
+        self.assertIn('get_artist[uncached]', measured)
+        self.assertIn('create_song+delete_song', measured)
+        self.assertEqual(measured['get_song[cached]']['rounds'], 3)
+        self.assertEqual([self._count(table) for table in tables], counts)
+
+    def test_summarize(self):
+        '''
+        Check the statistics of a list of timings
+        '''
+        print(f"({self.test_summarize.__name__})", self.test_summarize.__doc__)
+        stats = results.summarize([0.004, 0.001, 0.003, 0.002])
+        self.assertEqual(stats['rounds'], 4)
+        self.assertEqual((stats['min'], stats['max'], stats['median']), (0.001, 0.004, 0.002))
+        self.assertEqual(stats['p99'], 0.004)
+        self.assertAlmostEqual(stats['mean'], 0.0025)
+        self.assertAlmostEqual(stats['ops'], 400)
+        #Concurrent operations: the throughput comes from the wall time.
+        self.assertAlmostEqual(results.summarize([0.004, 0.004], 2, 0.004)['ops'], 500)
+        with self.assertRaises(ValueError):
+            results.summarize([])
+
+    def test_compare(self):
+        '''
+        Check that saved results are compared and regressions reported
+        '''
+        print(f"({self.test_compare.__name__})", self.test_compare.__doc__)
+        stats = lambda median: results.summarize([median])
+        old = results.create_document('db', {'fast': stats(0.001), 'slow': stats(0.001),
+                                             'same': stats(0.001), 'gone': stats(0.001)}, {})
+        new = results.create_document('db', {'fast': stats(0.0005), 'slow': stats(0.002),
+                                             'same': stats(0.00105), 'added': stats(0.001)}, {})
+        old_path = results.save(old, os.path.join(self.folder, 'old.json'))
+        new_path = results.save(new, os.path.join(self.folder, 'new.json'))
+        self.assertEqual(results.load(old_path), old)
+        rows = dict((row[0], row[1:]) for row in compare.compare(old, new))
+        self.assertEqual(rows['fast'][3], 'improvement')
+        self.assertEqual(rows['slow'][3], 'regression')
+        self.assertEqual(rows['same'][3], '')
+        self.assertEqual(rows['gone'], (0.001, None, None, None))
+        self.assertEqual(rows['added'], (None, 0.001, None, None))
+        self.assertEqual(compare.main([old_path, new_path], io.StringIO()), 1)
+        self.assertEqual(compare.main([old_path, new_path, '--threshold', '2'], io.StringIO()), 0)
+
+if __name__ == '__main__':
+    print('Start running tests')
+    unittest.main()
@@ -0,0 +1,159 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import bulk_import
+from .database_api_tests_common import BaseTestCase, db
+
+class BulkImportDbAPITestCase(BaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print(f"Testing {cls.__name__}")
+
+    def setUp(self):
+        super(BulkImportDbAPITestCase, self).setUp()
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        super(BulkImportDbAPITestCase, self).tearDown()
+
+    def _write(self, filename, content):
+        path = os.path.join(self.folder, filename)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def _schema_objects(self):
+        with db._pool.connection() as con:
+            rows = con.execute("SELECT type, name FROM sqlite_master\
+                                WHERE type IN ('index', 'trigger') ORDER BY name").fetchall()
+            return [(row['type'], row['name']) for row in rows]
+
+    def test_read_records(self):
+        '''
+        Check that CSV and JSONL files are read as dictionaries
+        '''
+        print(f"({self.test_read_records.__name__})",
+              self.test_read_records.__doc__)
+        csv_path = self._write('artists.csv', 'legalName,genre\nBjörk,Pop\n')
+        jsonl_path = self._write('artists.jsonl', '{"legalName": "Björk", "genre": "Pop"}\n\n')
+        expected = [{'legalName': 'Björk', 'genre': 'Pop'}]
+        self.assertEqual(list(bulk_import.read_records(csv_path)), expected)
+        self.assertEqual(list(bulk_import.read_records(jsonl_path)), expected)
+        with self.assertRaises(ValueError):
+            list(bulk_import.read_records(csv_path, 'xml'))
+
+    def test_import_artists_and_songs(self):
+        '''
+        Check that records are imported in batches, with duplicates skipped
+        and invalid records rejected
+        '''
+        print(f"({self.test_import_artists_and_songs.__name__})",
+              self.test_import_artists_and_songs.__doc__)
+        artists = self._write('artists.csv',
+                              'legalName,genre,foundingLocation,language,foundingDate\n'
+                              'Sigur Ros,Post-Rock,Iceland,Icelandic,1994\n'
+                              'Placebo,Rock,,,\n'
+                              ',Missing name,,,\n'
+                              'Mogwai,Post-Rock,Scotland,English,not a year\n'
+                              'Mogwai,Post-Rock,Scotland,English,1995\n')
+        songs = [{'name': 'Song %d' % i, 'byArtist': 'Sigur Ros',
+                  'datePublished': 2000 + i, 'duration': '4:%02d' % i} for i in range(25)]
+        songs.append({'name': 'Orphan', 'byArtist': 'Nobody', 'duration': '1:00'})
+        songs.append({'name': 'No duration', 'byArtist': 'Mogwai'})
+        songs = self._write('songs.jsonl', '\n'.join(json.dumps(s) for s in songs))
+        objects = self._schema_objects()
+        before = db.get_table_versions(('artists', 'songs'))
+        reports = []
+        importer = bulk_import.BulkImporter(db, batch_size=10,
+                                            progress=lambda kind, c: reports.append((kind, dict(c))))
+        counters = importer.import_file('artists', artists)
+        self.assertEqual((counters['read'], counters['imported'], counters['skipped'],
+                          counters['rejected']), (5, 2, 1, 2))
+        counters = importer.import_file('songs', songs)
+        self.assertEqual((counters['read'], counters['imported'], counters['skipped'],
+                          counters['rejected']), (27, 25, 0, 2))
+        self.assertEqual([c['read'] for kind, c in reports if kind == 'songs'], [10, 20, 27])
+        self.assertEqual(len(db.get_songs('Sigur Ros')), 25)
+        self.assertEqual(db.get_artist('Mogwai')['foundingDate'], 1995)
+        #The existing artist is not changed
+        self.assertEqual(db.get_artist('Placebo')['genre'], 'Alternative Rock')
+        #Indexes and triggers are back, and the search index is rebuilt
+        self.assertEqual(self._schema_objects(), objects)
+        self.assertEqual(db.search_songs('song 24')[0]['byArtist'], 'Sigur Ros')
+        self.assertEqual(db.search_artists('mogwai')[0]['legalName'], 'Mogwai')
+        after = db.get_table_versions(('artists', 'songs'))
+        self.assertGreater(after['artists'][0], before['artists'][0])
+        self.assertGreater(after['songs'][0], before['songs'][0])
+
+    def test_import_playlists(self):
+        '''
+        Check that playlists and their songs are resolved by author and by
+        artist and title
+        '''
+        print(f"({self.test_import_playlists.__name__})",
+              self.test_import_playlists.__doc__)
+        playlists = self._write('playlists.csv', 'name,author,created_on\n'
+                                                 'Imported,Robi,1500000000\n'
+                                                 'Nobody list,Nobody,1500000000\n')
+        entries = self._write('entries.csv', 'playlist,user,artist,title,added_on\n'
+                                             'Imported,Robi,Muse,Starlight,1500000001\n'
+                                             'Imported,Robi,Muse,Blackout,1500000002\n'
+                                             'Imported,Robi,Muse,No such song,1500000003\n')
+        importer = bulk_import.BulkImporter(db)
+        counters = importer.import_file('playlists', playlists)
+        self.assertEqual((counters['imported'], counters['rejected']), (1, 1))
+        counters = importer.import_file('playlist_songs', entries)
+        self.assertEqual((counters['imported'], counters['rejected']), (2, 1))
+        songs = db.get_songs_in_playlist('Imported', 'Robi')
+        self.assertEqual(set(s['name'] for s in songs), set(['Starlight', 'Blackout']))
+        self.assertEqual(db.get_playlist_last_modified('Imported', 'Robi'), 1500000002)
+
+    def test_entries_of_unknown_playlists_rejected(self):
+        '''
+        Check that the songs of a playlist that does not exist are rejected
+        and do not count in the statistics
+        '''
+        print(f"({self.test_entries_of_unknown_playlists_rejected.__name__})",
+              self.test_entries_of_unknown_playlists_rejected.__doc__)
+        entries = self._write('entries.csv', 'playlist,user,artist,title,added_on\n'
+                                             'NoSuchList,NoSuchUser,Muse,Starlight,1500000001\n'
+                                             'NoSuchList,Robi,Muse,Starlight,1500000002\n')
+        top_songs = db.get_top_songs()
+        top_artists = db.get_top_artists()
+        additions = db.get_daily_additions()
+        counters = bulk_import.BulkImporter(db).import_file('playlist_songs', entries)
+        self.assertEqual((counters['read'], counters['imported'], counters['rejected']), (2, 0, 2))
+        self.assertEqual(db.get_top_songs(), top_songs)
+        self.assertEqual(db.get_top_artists(), top_artists)
+        self.assertEqual(db.get_daily_additions(), additions)
+
+    def test_failed_import_restores_indexes(self):
+        '''
+        Check that an error during the load leaves the indexes and triggers
+        in place and keeps the batches committed before it
+        '''
+        print(f"({self.test_failed_import_restores_indexes.__name__})",
+              self.test_failed_import_restores_indexes.__doc__)
+        objects = self._schema_objects()
+
+        def records():
+            for i in range(5):
+                yield {'legalName': 'Generated %d' % i, 'genre': 'Pop'}
+            raise IOError('truncated file')
+
+        importer = bulk_import.BulkImporter(db, batch_size=2)
+        with self.assertRaises(IOError):
+            importer.import_records('artists', records())
+        self.assertEqual(self._schema_objects(), objects)
+        self.assertEqual(len(db.get_artists(name='Generated')), 4)
+        with self.assertRaises(ValueError):
+            importer.import_records('labels', [])
+
+if __name__ == '__main__':
+    print('Start running tests')
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+
+import cache
+from .database_api_tests_common import BaseTestCase, db
+
+class LRUCacheTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print(f"Testing {cls.__name__}")
+
+    def setUp(self):
+        self.now = 0.0
+        self.cache = cache.LRUCache(max_size=2, ttl=10, clock=lambda: self.now)
+
+    def test_least_recently_used_evicted(self):
+        '''
+        Check that the least recently used entry is evicted first
+        '''
+        print(f"({self.test_least_recently_used_evicted.__name__})",
+              self.test_least_recently_used_evicted.__doc__)
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.cache.set('c', 3)
+        self.assertIs(self.cache.get('b'), cache.MISSING)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.get('c'), 3)
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (3, 1, 1))
+
+    def test_entries_expire(self):
+        '''
+        Check that entries expire after ttl seconds
+        '''
+        print(f"({self.test_entries_expire.__name__})",
+              self.test_entries_expire.__doc__)
+        self.cache.set('a', 1)
+        self.now = 9.9
+        self.assertEqual(self.cache.get('a'), 1)
+        self.now = 10.0
+        self.assertIs(self.cache.get('a'), cache.MISSING)
+        self.assertEqual(self.cache.stats()['expirations'], 1)
+
+    def test_stale_read_not_stored(self):
+        '''
+        Check that a value read before an invalidation is not cached
+        '''
+        print(f"({self.test_stale_read_not_stored.__name__})",
+              self.test_stale_read_not_stored.__doc__)
+        generation = self.cache.generation
+        self.cache.invalidate('a')
+        self.cache.set('a', 'stale', generation)
+        self.assertIs(self.cache.get('a'), cache.MISSING)
+
+class CacheDbAPITestCase(BaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print(f"Testing {cls.__name__}")
+
+    def test_hot_entities_served_from_cache(self):
+        '''
+        Check that repeated lookups do not touch the database
+        '''
+        print(f"({self.test_hot_entities_served_from_cache.__name__})",
+              self.test_hot_entities_served_from_cache.__doc__)
+        db.get_artist('Placebo')
+        db.get_song('Placebo', 'I know')
+        checkouts = db.get_pool_stats()['checkouts']
+        before = db.get_cache_stats()
+        for _ in range(10):
+            self.assertEqual(db.get_artist('Placebo')['genre'], 'Alternative Rock')
+            self.assertEqual(db.get_song('Placebo', 'I know')['sid'], 1)
+        self.assertEqual(db.get_pool_stats()['checkouts'], checkouts)
+        stats = db.get_cache_stats()
+        self.assertEqual(stats['artist']['hits'] - before['artist']['hits'], 10)
+        self.assertEqual(stats['song']['hits'] - before['song']['hits'], 10)
+
+    def test_cached_objects_are_copies(self):
+        '''
+        Check that modifying a returned object does not modify the cache
+        '''
+        print(f"({self.test_cached_objects_are_copies.__name__})",
+              self.test_cached_objects_are_copies.__doc__)
+        db.get_artist('Placebo')['genre'] = 'Changed'
+        self.assertEqual(db.get_artist('Placebo')['genre'], 'Alternative Rock')
+
+    def test_writes_invalidate(self):
+        '''
+        Check that modify_* and delete_* invalidate the cached entities
+        '''
+        print(f"({self.test_writes_invalidate.__name__})",
+              self.test_writes_invalidate.__doc__)
+        self.assertEqual(db.get_user('Robi')['age'], 18)
+        db.modify_user('Robi', 40, 'Italy', 'Male')
+        self.assertEqual(db.get_user('Robi')['age'], 40)
+        self.assertIsNotNone(db.get_song('Cranberries', 'Zombie'))
+        db.delete_song('Cranberries', 'Zombie')
+        self.assertIsNone(db.get_song('Cranberries', 'Zombie'))
+        self.assertIsNone(db.get_playlist('New', 'Robi'))
+        db.create_playlist('New', 'Robi')
+        self.assertIsNotNone(db.get_playlist('New', 'Robi'))
+        db.delete_playlist('Robi', 'New')
+        self.assertIsNone(db.get_playlist('New', 'Robi'))
+
+    def test_get_user_password(self):
+        '''
+        Check that a cached user is only returned with the right password
+        '''
+        print(f"({self.test_get_user_password.__name__})",
+              self.test_get_user_password.__doc__)
+        self.assertIsNotNone(db.get_user('Robi', 'pass'))
+        self.assertIsNone(db.get_user('Robi', 'wrong'))
+        self.assertIsNone(db.get_user('Robi', "' OR '1'='1"))
+
+if __name__ == '__main__':
+    print('Start running tests')
+    unittest.main()
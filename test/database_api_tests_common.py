@@ -1,11 +1,34 @@
-import unittest, os
+import unittest, os, atexit, shutil, tempfile
 
 import database
 
+#Every test process has its own folder for its databases, so several
+#processes can run the tests at once (see test.parallel).
+db_folder = tempfile.mkdtemp(prefix='musicfinder-tests-')
+atexit.register(shutil.rmtree, db_folder, True)
+
 #Path to the database file, different from the deployment db
-db_path = 'db/db_test.db'
+db_path = os.path.join(db_folder, 'db_test.db')
 db = database.MusicDatabase(db_path)
 
+#Database with the initial values, populated by the first test of the
+#process and copied by every test (see reset_database).
+template_path = os.path.join(db_folder, 'db_template.db')
+
+def reset_database():
+    '''
+    Give the test database the initial values: the schema, the data dump and
+    the migrations (see MusicDatabase.load_init_values). They are loaded once
+    into the template database, which is then copied.
+    '''
+    if not os.path.exists(template_path):
+        template = database.MusicDatabase(template_path)
+        try:
+            template.load_init_values()
+        finally:
+            template.close()
+    db.restore(template_path)
+
 class BaseTestCase(unittest.TestCase):
     '''
     Base class for all test classes. It implements the setUp and the tearDown
@@ -13,10 +36,7 @@ class BaseTestCase(unittest.TestCase):
     '''
    
     def setUp(self):
-        if os.path.exists(db_path):
-            os.remove(db_path)
-
-        db.load_init_values()
+        reset_database()
 
     def tearDown(self):
         db.clean()
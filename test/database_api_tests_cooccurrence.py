@@ -0,0 +1,187 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import cooccurrence
+from .database_api_tests_common import BaseTestCase, db
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+@unittest.skipIf(cooccurrence.numpy is None, 'numpy and scipy are not installed')
+class CooccurrenceDbAPITestCase(BaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print(f"Testing {cls.__name__}")
+
+    def setUp(self):
+        super(CooccurrenceDbAPITestCase, self).setUp()
+        self.folder = tempfile.mkdtemp()
+        db.create_playlist('Mix', 'Robi')
+        db.append_songs_to_playlist('Mix', 'Robi', [('Muse', 'Starlight'),
+                                                    ('Cranberries', 'Zombie'),
+                                                    ('Muse', 'Blackout')])
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        super(CooccurrenceDbAPITestCase, self).tearDown()
+
+    def _generations(self):
+        return set(name.rsplit('-', 1)[1].split('.')[0] for name in os.listdir(self.folder)
+                   if name != cooccurrence.META_FILE)
+
+    def test_build(self):
+        '''
+        Check that a full build keeps the most co-occurring songs of every
+        song
+        '''
+        print(f"({self.test_build.__name__})", self.test_build.__doc__)
+        self.assertIsNone(cooccurrence.get_index(self.folder))
+        counters = cooccurrence.build(db, self.folder, top_k=5)
+        self.assertEqual((counters['entries'], counters['songs']), (5, 5))
+        index = cooccurrence.get_index(self.folder)
+        self.assertEqual(index.top_k, 5)
+        self.assertEqual(index.related(23), [(6, 1), (20, 1)])
+        self.assertEqual(index.related(23, 1), [(6, 1)])
+        self.assertEqual(index.related(2), [])
+        self.assertEqual(index.related(100000), [])
+        #Every build replaces the files of the previous one, which are
+        #removed by the build after it
+        cooccurrence.build(db, self.folder)
+        self.assertEqual(cooccurrence.get_index(self.folder).top_k, cooccurrence.DEFAULT_TOP_K)
+        self.assertEqual(self._generations(), set(['1', '2']))
+        cooccurrence.build(db, self.folder)
+        self.assertEqual(self._generations(), set(['2', '3']))
+
+    def test_files_in_use_are_kept(self):
+        '''
+        Check that a file of an old generation that cannot be removed (still
+        mapped on Windows) does not fail the build and is removed later
+        '''
+        print(f"({self.test_files_in_use_are_kept.__name__})", self.test_files_in_use_are_kept.__doc__)
+        remove = os.remove
+
+        def remove_unless_mapped(filename):
+            if os.path.basename(filename) == 'related-1.npy':
+                raise PermissionError(13, 'The file is in use', filename)
+            remove(filename)
+
+        for i in range(2):
+            cooccurrence.build(db, self.folder)
+        with mock.patch.object(cooccurrence.os, 'remove', remove_unless_mapped):
+            cooccurrence.build(db, self.folder)
+        self.assertEqual(cooccurrence.get_index(self.folder).meta['generation'], 3)
+        self.assertIn('related-1.npy', os.listdir(self.folder))
+        self.assertEqual(self._generations(), set(['1', '2', '3']))
+        cooccurrence.build(db, self.folder)
+        self.assertEqual(self._generations(), set(['3', '4']))
+
+    def test_update(self):
+        '''
+        Check that an update adds the new playlist entries and matches a full
+        build
+        '''
+        print(f"({self.test_update.__name__})", self.test_update.__doc__)
+        cooccurrence.build(db, self.folder)
+        #Entries already in the index are not counted twice
+        self.assertEqual(cooccurrence.update(db, self.folder)['entries'], 0)
+        db.create_playlist('Mix 2', 'Robi')
+        db.append_songs_to_playlist('Mix 2', 'Robi', [('Muse', 'Starlight'),
+                                                      ('Cranberries', 'Zombie')])
+        counters = cooccurrence.update(db, self.folder)
+        self.assertEqual((counters['entries'], counters['songs']), (2, 2))
+        updated = cooccurrence.get_index(self.folder)
+        self.assertEqual(updated.related(23), [(6, 2), (20, 1)])
+        full_folder = os.path.join(self.folder, 'full')
+        cooccurrence.build(db, full_folder)
+        full = cooccurrence.get_index(full_folder)
+        for sid in (1, 2, 6, 20, 23):
+            self.assertEqual(updated.related(sid), full.related(sid))
+
+    def test_update_writes_changed_rows(self):
+        '''
+        Check that the index only stores the songs in playlists and that an
+        update writes a layer with the songs whose co-occurrences changed
+        '''
+        print(f"({self.test_update_writes_changed_rows.__name__})",
+              self.test_update_writes_changed_rows.__doc__)
+        cooccurrence.build(db, self.folder)
+        rows = numpy.load(os.path.join(self.folder, 'rows-1.npy'))
+        self.assertEqual(rows.tolist(), [1, 2, 6, 20, 23])
+        db.create_playlist('Mix 2', 'Robi')
+        db.append_songs_to_playlist('Mix 2', 'Robi', [('Muse', 'Starlight'),
+                                                      ('Cranberries', 'Zombie')])
+        cooccurrence.update(db, self.folder)
+        index = cooccurrence.get_index(self.folder)
+        self.assertEqual(index.meta['layers'], [1, 2])
+        rows = numpy.load(os.path.join(self.folder, 'rows-2.npy'))
+        self.assertEqual(rows.tolist(), [6, 23])
+        self.assertEqual(index.related(23), [(6, 2), (20, 1)])
+        self.assertEqual(index.related(20), [(6, 1), (23, 1)])
+
+    def test_layers_are_merged(self):
+        '''
+        Check that the layers of the updates are merged into one past
+        MAX_LAYERS and that the merged index matches a full build
+        '''
+        print(f"({self.test_layers_are_merged.__name__})", self.test_layers_are_merged.__doc__)
+        cooccurrence.build(db, self.folder)
+        songs = [('Muse', 'Starlight'), ('Cranberries', 'Zombie'), ('Muse', 'Blackout')]
+        with mock.patch.object(cooccurrence, 'MAX_LAYERS', 3):
+            for i in range(3):
+                db.create_playlist('Mix %d' % i, 'Robi')
+                db.append_songs_to_playlist('Mix %d' % i, 'Robi', songs[i:i + 2])
+                cooccurrence.update(db, self.folder)
+        index = cooccurrence.get_index(self.folder)
+        self.assertEqual(index.meta['layers'], [4])
+        self.assertEqual(self._generations(), set(['1', '2', '3', '4']))
+        full_folder = os.path.join(self.folder, 'full')
+        cooccurrence.build(db, full_folder)
+        full = cooccurrence.get_index(full_folder)
+        for sid in (1, 2, 6, 20, 23):
+            self.assertEqual(index.related(sid), full.related(sid))
+
+    def test_update_follows_the_change_log(self):
+        '''
+        Check that an update takes the removed entries and the entries
+        without added_on into account, and that a bulk load asks for a full
+        build
+        '''
+        print(f"({self.test_update_follows_the_change_log.__name__})",
+              self.test_update_follows_the_change_log.__doc__)
+        cooccurrence.build(db, self.folder)
+        self.assertEqual(db.get_playlist_changes(), [])
+        with db._pool.connection() as con:
+            con.execute("DELETE FROM song_in_playlist WHERE song = 20 AND pl_name = 'Mix'")
+            con.execute("INSERT INTO song_in_playlist (song, pl_name, pl_user, added_on)\
+                         VALUES (2, 'Mix', 'Robi', NULL)")
+            con.commit()
+        counters = cooccurrence.update(db, self.folder)
+        self.assertEqual(counters['entries'], 2)
+        self.assertEqual(db.get_playlist_changes(), [])
+        updated = cooccurrence.get_index(self.folder)
+        self.assertEqual(updated.related(20), [])
+        self.assertEqual(updated.related(23), [(2, 1), (6, 1)])
+        full_folder = os.path.join(self.folder, 'full')
+        cooccurrence.build(db, full_folder)
+        full = cooccurrence.get_index(full_folder)
+        for sid in (1, 2, 6, 20, 23):
+            self.assertEqual(updated.related(sid), full.related(sid))
+        #Entries loaded without triggers
+        with db.bulk_load('song_in_playlist') as con:
+            con.execute("INSERT INTO song_in_playlist (song, pl_name, pl_user, added_on)\
+                         VALUES (20, 'Mix', 'Robi', 1)")
+            con.commit()
+        cooccurrence.update(db, self.folder)
+        self.assertEqual(cooccurrence.get_index(self.folder).meta['layers'],
+                         [cooccurrence.get_index(self.folder).meta['generation']])
+        self.assertEqual(cooccurrence.get_index(self.folder).related(20), [(2, 1), (6, 1), (23, 1)])
+
+if __name__ == '__main__':
+    print('Start running tests')
+    unittest.main()
@@ -0,0 +1,157 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from .database_api_tests_common import BaseTestCase, db, db_path, template_path
+
+class MigrationsDbAPITestCase(BaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print(f"Testing {cls.__name__}")
+
+    def _query_plan(self, query, pvalue):
+        '''
+        Return the EXPLAIN QUERY PLAN details of query as a single string.
+        '''
+        con = sqlite3.connect(db_path)
+        with con:
+            cur = con.cursor()
+            cur.execute('EXPLAIN QUERY PLAN ' + query, pvalue)
+            plan = ' | '.join(row[3] for row in cur.fetchall())
+        con.close()
+        return plan
+
+    def test_migrations_applied(self):
+        '''
+        Check that load_init_values leaves the database at the last version
+        '''
+        print(f"({self.test_migrations_applied.__name__})",
+              self.test_migrations_applied.__doc__)
+        last_version = db.get_migrations()[-1][0]
+        self.assertEqual(db.get_schema_version(), last_version)
+        #Nothing left to apply
+        self.assertEqual(db.apply_migrations(), [])
+
+    def test_failed_migration_is_rolled_back(self):
+        '''
+        Check that a failing migration does not change the schema version
+        '''
+        print(f"({self.test_failed_migration_is_rolled_back.__name__})",
+              self.test_failed_migration_is_rolled_back.__doc__)
+        version = db.get_schema_version()
+        folder = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(folder, '%04d_broken.sql' % (version + 1)), 'w') as f:
+                f.write('CREATE INDEX broken_index ON songs (name);\n'
+                        'CREATE INDEX broken_index ON songs (name);\n')
+            with self.assertRaises(sqlite3.OperationalError):
+                db.apply_migrations(folder)
+        finally:
+            shutil.rmtree(folder)
+        self.assertEqual(db.get_schema_version(), version)
+        plan = self._query_plan('SELECT * FROM songs WHERE name = ?', ('Pure Morning',))
+        self.assertNotIn('broken_index', plan)
+
+    def test_restore(self):
+        '''
+        Check that restore brings back the whole content of the copied
+        database, schema version included, and drops the cached entities
+        '''
+        print(f"({self.test_restore.__name__})", self.test_restore.__doc__)
+        version = db.get_schema_version()
+        song = db.get_song('Muse', 'Starlight')
+        self.assertIsNotNone(song)
+        db.delete_song('Muse', 'Starlight')
+        db.create_artist('Sigur Ros', 'Post-rock', 'Iceland', 'Icelandic', 1994)
+        #Cached while it exists.
+        self.assertIsNotNone(db.get_artist('Sigur Ros'))
+        db.restore(template_path)
+        self.assertEqual(db.get_song('Muse', 'Starlight'), song)
+        self.assertIsNone(db.get_artist('Sigur Ros'))
+        self.assertEqual(db.get_schema_version(), version)
+        plan = self._query_plan('SELECT * FROM songs WHERE byArtist = ? ORDER BY name ASC, sid ASC',
+                                ('Placebo',))
+        self.assertIn('songs_by_artist_name', plan)
+
+    def test_table_versions_follow_writes(self):
+        '''
+        Check that every write bumps the change counter of its table only
+        '''
+        print(f"({self.test_table_versions_follow_writes.__name__})",
+              self.test_table_versions_follow_writes.__doc__)
+        tables = ('artists', 'songs', 'playlists')
+        before = db.get_table_versions(tables)
+        self.assertEqual(set(before), set(tables))
+        db.create_playlist('Versioned', 'Robi')
+        db.delete_playlist('Robi', 'Versioned')
+        after = db.get_table_versions(tables)
+        self.assertEqual(after['playlists'][0], before['playlists'][0] + 2)
+        self.assertGreaterEqual(after['playlists'][1], before['playlists'][1])
+        self.assertEqual(after['artists'], before['artists'])
+        self.assertEqual(after['songs'], before['songs'])
+        self.assertEqual(db.get_table_versions(('nosuchtable',)), {})
+
+    def test_get_songs_uses_index(self):
+        '''
+        Check that get_song and get_songs(artist) search the songs index
+        '''
+        print(f"({self.test_get_songs_uses_index.__name__})",
+              self.test_get_songs_uses_index.__doc__)
+        plan = self._query_plan('SELECT * FROM songs WHERE byArtist = ? ORDER BY name ASC, sid ASC',
+                                ('Placebo',))
+        self.assertIn('USING INDEX songs_by_artist_name (byArtist=?)', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        plan = self._query_plan('SELECT * FROM songs WHERE byArtist = ? and name = ?',
+                                ('Placebo', 'Pure Morning'))
+        self.assertIn('USING INDEX songs_by_artist_name (byArtist=? AND name=?)', plan)
+
+    def test_get_playlists_uses_index(self):
+        '''
+        Check that get_playlists(user) searches the playlists index
+        '''
+        print(f"({self.test_get_playlists_uses_index.__name__})",
+              self.test_get_playlists_uses_index.__doc__)
+        plan = self._query_plan('SELECT name, author, created_on FROM playlists WHERE author = ? ORDER BY name ASC',
+                                ('Robi',))
+        self.assertIn('USING INDEX playlists_by_author_name (author=?)', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_get_songs_in_playlist_uses_index(self):
+        '''
+        Check that the join of get_songs_in_playlist does not scan any table
+        '''
+        print(f"({self.test_get_songs_in_playlist_uses_index.__name__})",
+              self.test_get_songs_in_playlist_uses_index.__doc__)
+        plan = self._query_plan('SELECT song, sid, name, datePublished, duration, byArtist FROM song_in_playlist, songs WHERE pl_name = ? AND pl_user = ? AND song = sid ORDER BY song ASC',
+                                ('Prima', 'robi'))
+        self.assertIn('USING COVERING INDEX song_in_playlist_by_playlist_song (pl_user=? AND pl_name=?)', plan)
+        self.assertIn('USING INTEGER PRIMARY KEY (rowid=?)', plan)
+        self.assertNotIn('SCAN', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_deep_pages_use_index(self):
+        '''
+        Check that pages after a cursor seek the index instead of skipping
+        rows
+        '''
+        print(f"({self.test_deep_pages_use_index.__name__})",
+              self.test_deep_pages_use_index.__doc__)
+        plan = self._query_plan('SELECT * FROM artists WHERE (legalName) > (?) ORDER BY legalName ASC LIMIT ?',
+                                ('M', 11))
+        self.assertIn('(legalName>?)', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        plan = self._query_plan('SELECT * FROM users WHERE (nickname) < (?) ORDER BY nickname DESC LIMIT ?',
+                                ('M', 11))
+        self.assertIn('(nickname<?)', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        plan = self._query_plan('SELECT * FROM songs WHERE byArtist = ? AND (name, sid) > (?, ?) ORDER BY name ASC, sid ASC LIMIT ?',
+                                ('Placebo', 'I know', 1, 11))
+        self.assertIn('USING INDEX songs_by_artist_name (byArtist=? AND name>?)', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+if __name__ == '__main__':
+    print('Start running tests')
+    unittest.main()
@@ -0,0 +1,232 @@
+import threading
+import unittest
+
+import database
+from .database_api_tests_common import BaseTestCase, db, db_path
+
+class PoolDbAPITestCase(BaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print(f"Testing {cls.__name__}")
+
+    def test_connections_are_reused(self):
+        '''
+        Check that consecutive calls reuse the same pooled connection
+        '''
+        print(f"({self.test_connections_are_reused.__name__})",
+              self.test_connections_are_reused.__doc__)
+        db.get_artist('Placebo')
+        stats = db.get_pool_stats()
+        created, checkouts = stats['created'], stats['checkouts']
+        for _ in range(10):
+            #The artist would come from the entity cache otherwise.
+            db.clear_caches()
+            db.get_artist('Placebo')
+            db.get_songs('Placebo')
+        stats = db.get_pool_stats()
+        self.assertEqual(stats['created'], created)
+        self.assertEqual(stats['in_use'], 0)
+        self.assertGreaterEqual(stats['checkouts'] - checkouts, 20)
+
+    def test_pooled_connection_configuration(self):
+        '''
+        Check that pooled connections have foreign keys and busy_timeout set
+        '''
+        print(f"({self.test_pooled_connection_configuration.__name__})",
+              self.test_pooled_connection_configuration.__doc__)
+        pool = database.ConnectionPool(db_path, size=1, busy_timeout=2500)
+        try:
+            with pool.connection() as con:
+                self.assertEqual(con.execute('PRAGMA foreign_keys').fetchone()[0], 1)
+                self.assertEqual(con.execute('PRAGMA busy_timeout').fetchone()[0], 2500)
+                row = con.execute('SELECT * FROM artists').fetchone()
+                self.assertEqual(row['legalName'], 'Placebo')
+        finally:
+            pool.close()
+
+    def test_checkout_timeout(self):
+        '''
+        Check that PoolTimeout is raised when every connection is checked out
+        '''
+        print(f"({self.test_checkout_timeout.__name__})",
+              self.test_checkout_timeout.__doc__)
+        pool = database.ConnectionPool(db_path, size=1, timeout=0.05)
+        con = pool.acquire()
+        try:
+            with self.assertRaises(database.PoolTimeout):
+                pool.acquire()
+            self.assertEqual(pool.stats()['timeouts'], 1)
+        finally:
+            pool.release(con)
+            pool.close()
+        self.assertEqual(pool.stats()['open'], 0)
+
+    def test_pool_size_is_bounded(self):
+        '''
+        Check that concurrent threads never open more than pool_size
+        connections
+        '''
+        print(f"({self.test_pool_size_is_bounded.__name__})",
+              self.test_pool_size_is_bounded.__doc__)
+        bounded = database.MusicDatabase(db_path, pool_size=2)
+        errors = []
+
+        def worker():
+            try:
+                for _ in range(20):
+                    bounded.get_artists()
+            except Exception as excp:
+                errors.append(excp)
+
+        threads = [threading.Thread(target=worker) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        bounded.close()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(bounded.get_pool_stats()['created'], 2)
+
+    def test_query_modes(self):
+        '''
+        Check every mode of the query layer and that writes are committed
+        '''
+        print(f"({self.test_query_modes.__name__})", self.test_query_modes.__doc__)
+        query = 'SELECT * FROM artists WHERE legalName = ?'
+        artist = db._execute(query, ('Placebo',), 'one', db._create_artist_object)
+        self.assertEqual(artist['genre'], 'Alternative Rock')
+        self.assertIsNone(db._execute(query, ('Nobody',), 'one', db._create_artist_object))
+        names = db._execute('SELECT legalName FROM artists ORDER BY legalName', create=tuple)
+        self.assertEqual(list(db._execute('SELECT legalName FROM artists ORDER BY legalName',
+                                          mode='iter', create=tuple, batch_size=2)), names)
+        cur = db._execute('UPDATE artists SET genre = ? WHERE legalName = ?',
+                          ('Rock', 'Placebo'), 'execute')
+        self.assertEqual(cur.rowcount, 1)
+        changed = db._execute('UPDATE artists SET language = ? WHERE legalName = ?',
+                              [('French', 'Placebo'), ('French', 'Muse')], 'many')
+        self.assertEqual(changed, 2)
+        self.assertEqual(db._execute(query, ('Placebo',), 'one')['language'], 'French')
+        with self.assertRaises(ValueError):
+            db._execute(query, ('Placebo',), 'scalar')
+
+    def test_statement_cache(self):
+        '''
+        Check the statement cache size of the pooled connections and that
+        lists bound in IN clauses only use a few statements
+        '''
+        print(f"({self.test_statement_cache.__name__})", self.test_statement_cache.__doc__)
+        pool = database.ConnectionPool(db_path, size=1, cached_statements=7)
+        try:
+            with pool.connection() as con:
+                self.assertEqual(con.execute('SELECT 1').fetchone()[0], 1)
+            self.assertEqual(pool.cached_statements, 7)
+        finally:
+            pool.close()
+        placeholders, pvalue = database.bind_list([1, 2, 3])
+        self.assertEqual(placeholders, '?, ?, ?, ?')
+        self.assertEqual(pvalue, [1, 2, 3, None])
+        self.assertEqual(database.bind_list([]), ('?', [None]))
+        statements = set(database.bind_list(range(n))[0] for n in range(1, 513))
+        self.assertEqual(len(statements), 10)
+        songs = db.get_songs_by_id([1, 2, 1000])
+        self.assertEqual(sorted(songs), [1, 2])
+
+class PragmaProfileDbAPITestCase(BaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print(f"Testing {cls.__name__}")
+
+    def test_wal_profile_applied(self):
+        '''
+        Check that the default profile puts the database in WAL mode
+        '''
+        print(f"({self.test_wal_profile_applied.__name__})",
+              self.test_wal_profile_applied.__doc__)
+        with db._pool.connection() as con:
+            self.assertEqual(con.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            self.assertEqual(con.execute('PRAGMA synchronous').fetchone()[0], 1)
+            self.assertEqual(con.execute('PRAGMA temp_store').fetchone()[0], 2)
+
+    def test_custom_profile(self):
+        '''
+        Check that a custom profile and an explicit busy_timeout are applied
+        '''
+        print(f"({self.test_custom_profile.__name__})",
+              self.test_custom_profile.__doc__)
+        pool = database.ConnectionPool(db_path, pragmas={'cache_size': -2000,
+                                                         'busy_timeout': 100},
+                                       busy_timeout=700)
+        try:
+            with pool.connection() as con:
+                self.assertEqual(con.execute('PRAGMA cache_size').fetchone()[0], -2000)
+                self.assertEqual(con.execute('PRAGMA busy_timeout').fetchone()[0], 700)
+        finally:
+            pool.close()
+        with self.assertRaises(ValueError):
+            database.resolve_pragmas('nosuchprofile')
+        with self.assertRaises(ValueError):
+            database.resolve_pragmas({'cache_size': '1; DROP TABLE users'})
+
+    def test_periodic_checkpoint(self):
+        '''
+        Check that a checkpoint runs every checkpoint_interval writes
+        '''
+        print(f"({self.test_periodic_checkpoint.__name__})",
+              self.test_periodic_checkpoint.__doc__)
+        writer = database.MusicDatabase(db_path, checkpoint_interval=3)
+        try:
+            for i in range(7):
+                writer.create_playlist('Checkpoint %d' % i, 'Robi')
+            writer.get_playlists('Robi')
+            stats = writer.get_pool_stats()
+            self.assertEqual(stats['writes'], 7)
+            self.assertEqual(stats['checkpoints'], 2)
+            busy, log, checkpointed = writer.checkpoint('TRUNCATE')
+            self.assertEqual(busy, 0)
+        finally:
+            writer.close()
+
+    def test_readers_alongside_writer(self):
+        '''
+        Check that reader threads and a playlist writer never fail with
+        "database is locked"
+        '''
+        print(f"({self.test_readers_alongside_writer.__name__})",
+              self.test_readers_alongside_writer.__doc__)
+        shared = database.MusicDatabase(db_path, pool_size=8)
+        errors = []
+        done = threading.Event()
+
+        def reader():
+            try:
+                while not done.is_set():
+                    shared.get_artists()
+                    shared.get_songs('Placebo')
+            except Exception as excp:
+                errors.append(excp)
+
+        def writer():
+            try:
+                for i in range(30):
+                    shared.create_playlist('Concurrent %d' % i, 'Robi')
+                    shared.append_song_to_playlist(1, 'Concurrent %d' % i, 'Robi')
+            except Exception as excp:
+                errors.append(excp)
+            finally:
+                done.set()
+
+        threads = [threading.Thread(target=reader) for _ in range(6)]
+        threads.append(threading.Thread(target=writer))
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        shared.close()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(db.get_playlists('Robi')), 30)
+
+if __name__ == '__main__':
+    print('Start running tests')
+    unittest.main()
@@ -0,0 +1,140 @@
+import unittest
+
+import similarity
+from .database_api_tests_common import BaseTestCase, db
+
+class RecommendationsDbAPITestCase(BaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print(f"Testing {cls.__name__}")
+
+    def _queue(self):
+        with db._pool.connection() as con:
+            return set(row[0] for row in con.execute('SELECT artist FROM similarity_queue'))
+
+    def test_rebuild_similarity_index(self):
+        '''
+        Check that the similarity index scores artists by genre, language and
+        country
+        '''
+        print(f"({self.test_rebuild_similarity_index.__name__})",
+              self.test_rebuild_similarity_index.__doc__)
+        self.assertEqual(db.rebuild_similarity_index(), 20)
+        self.assertEqual(self._queue(), set())
+        similar = db.get_similar_artists('Coldplay')
+        #Sting shares genre, language and country; OneRepublic only genre
+        #and language.
+        self.assertEqual([(a['legalName'], a['score']) for a in similar],
+                         [('Sting', 1.5), ('OneRepublic', 1.3), ('Sanni', 1.0)])
+        self.assertEqual(db.get_similar_artists('Coldplay', 1)[0]['genre'], 'Pop')
+        self.assertEqual(db.get_similar_artists('Eddie Vedder'), [])
+
+    def test_playlists_update_similarity(self):
+        '''
+        Check that playlist changes queue the artists involved and that the
+        co-occurrences are added to their scores
+        '''
+        print(f"({self.test_playlists_update_similarity.__name__})",
+              self.test_playlists_update_similarity.__doc__)
+        db.rebuild_similarity_index()
+        db.create_playlist('Mix', 'Robi')
+        db.append_songs_to_playlist('Mix', 'Robi', [('Muse', 'Starlight')])
+        self.assertEqual(self._queue(), set(['Muse']))
+        db.append_songs_to_playlist('Mix', 'Robi', [('Cranberries', 'Zombie')])
+        self.assertEqual(self._queue(), set(['Muse', 'Cranberries']))
+        self.assertEqual(db.refresh_similarity_index(1), 1)
+        self.assertEqual(db.refresh_similarity_index(), 1)
+        self.assertEqual(db.refresh_similarity_index(), 0)
+        scores = dict((a['legalName'], a['score']) for a in db.get_similar_artists('Muse'))
+        self.assertEqual(scores['Cranberries'], 3.0)
+        self.assertEqual(scores['Mana'], 1.0)
+        scores = dict((a['legalName'], a['score']) for a in db.get_similar_artists('Cranberries'))
+        self.assertEqual(scores['Muse'], 3.0)
+        #A new artist is queued with the artists of its genre and gets
+        #neighbours of its genre
+        db.create_artist('Kasabian', 'Rock', 'England', 'English', 1997)
+        self.assertEqual(self._queue(), set(['Kasabian', 'Muse', 'Cranberries', 'Mana']))
+        db.refresh_similarity_index()
+        self.assertEqual(db.get_similar_artists('Kasabian', 1)[0]['legalName'], 'Muse')
+
+    def test_playlist_entries_mark_the_playlist(self):
+        '''
+        Check that an entry queues only the artist of its song and marks its
+        playlist, whose other artists are queued by the refresh
+        '''
+        print(f"({self.test_playlist_entries_mark_the_playlist.__name__})",
+              self.test_playlist_entries_mark_the_playlist.__doc__)
+        db.rebuild_similarity_index()
+        db.create_playlist('Mix', 'Robi')
+        db.append_songs_to_playlist('Mix', 'Robi', [('Muse', 'Starlight')])
+        db.refresh_similarity_index()
+        db.append_songs_to_playlist('Mix', 'Robi', [('Cranberries', 'Zombie')])
+        self.assertEqual(self._queue(), set(['Cranberries']))
+        with db._pool.connection() as con:
+            self.assertEqual([tuple(row) for row in
+                              con.execute('SELECT pl_user, pl_name FROM similarity_playlists')],
+                             [('Robi', 'Mix')])
+        self.assertEqual(db.refresh_similarity_index(), 2)
+        self.assertEqual(self._queue(), set())
+        scores = dict((a['legalName'], a['score']) for a in db.get_similar_artists('Muse'))
+        self.assertEqual(scores['Cranberries'], 3.0)
+
+    def test_artist_changes_update_neighbours(self):
+        '''
+        Check that a change of genre queues the artists that had the artist
+        as a neighbour and the artists of its new genre
+        '''
+        print(f"({self.test_artist_changes_update_neighbours.__name__})",
+              self.test_artist_changes_update_neighbours.__doc__)
+        db.rebuild_similarity_index()
+        self.assertIn('Sting', [a['legalName'] for a in db.get_similar_artists('Coldplay')])
+        with db._pool.connection() as con:
+            con.execute("UPDATE artists SET genre = 'Rock' WHERE legalName = 'Sting'")
+            con.commit()
+        self.assertEqual(self._queue(), set(['Sting', 'Coldplay', 'OneRepublic', 'Sanni',
+                                             'Muse', 'Cranberries', 'Mana']))
+        db.refresh_similarity_index()
+        self.assertNotIn('Sting', [a['legalName'] for a in db.get_similar_artists('Coldplay')])
+        self.assertEqual(db.get_similar_artists('Muse', 1)[0]['legalName'], 'Sting')
+        #The artists that listed a deleted artist are queued
+        db.create_artist('Kasabian', 'Rock', 'England', 'English', 1997)
+        db.refresh_similarity_index()
+        with db._pool.connection() as con:
+            con.execute("DELETE FROM artists WHERE legalName = 'Kasabian'")
+            con.commit()
+        self.assertEqual(self._queue(), set(['Sting', 'Muse', 'Cranberries', 'Mana']))
+
+    def test_get_recommendations(self):
+        '''
+        Check that the recommendations are songs of similar artists that are
+        not in the playlists of the user
+        '''
+        print(f"({self.test_get_recommendations.__name__})",
+              self.test_get_recommendations.__doc__)
+        self.assertEqual(db.get_recommendations('Robi'), [])
+        db.create_playlist('Mix', 'Robi')
+        db.append_songs_to_playlist('Mix', 'Robi', [('Muse', 'Starlight'),
+                                                    ('Cranberries', 'Zombie')])
+        #The recommendations only read the index
+        queue = self._queue()
+        self.assertTrue(queue)
+        db.get_recommendations('Robi')
+        self.assertEqual(self._queue(), queue)
+        self.assertEqual(similarity.refresh(db, 1), len(queue))
+        self.assertEqual(self._queue(), set())
+        songs = db.get_recommendations('Robi')
+        self.assertTrue(songs)
+        names = [(s['byArtist'], s['name']) for s in songs]
+        self.assertNotIn(('Muse', 'Starlight'), names)
+        self.assertNotIn(('Cranberries', 'Zombie'), names)
+        self.assertIn(('Muse', 'Blackout'), names)
+        scores = [s['score'] for s in songs]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertEqual(len(db.get_recommendations('Robi', 1)), 1)
+        with self.assertRaises(ValueError):
+            db.get_recommendations('Robi', 0)
+
+if __name__ == '__main__':
+    print('Start running tests')
+    unittest.main()
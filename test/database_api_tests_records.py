@@ -0,0 +1,98 @@
+import pickle
+import sqlite3
+import unittest
+
+import records
+from .database_api_tests_common import BaseTestCase, db
+
+SONG = {'sid': 1, 'name': 'Song', 'byArtist': 'Artist', 'datePublished': 2000,
+        'duration': '3:00'}
+
+class RecordsTestCase(BaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print(f"Testing {cls.__name__}")
+
+    def test_mapping_interface(self):
+        '''
+        Check that a record reads, compares and updates like the dictionary
+        it replaces
+        '''
+        print(f"({self.test_mapping_interface.__name__})", self.test_mapping_interface.__doc__)
+        song = records.Song(1, 'Song', 'Artist', 2000, '3:00')
+        self.assertEqual(song, SONG)
+        self.assertEqual(dict(song), SONG)
+        self.assertEqual(list(song), list(SONG))
+        self.assertEqual((song['name'], song.name, len(song)), ('Song', 'Song', 5))
+        self.assertNotIn('score', song)
+        self.assertIsNone(song.get('score'))
+        song['score'] = 0.5
+        self.assertEqual((song.score, len(song)), (0.5, 6))
+        self.assertEqual(list(song)[-1], 'score')
+        del song['score']
+        self.assertEqual(song, SONG)
+        with self.assertRaises(KeyError):
+            song['unknown'] = 1
+        with self.assertRaises(KeyError):
+            song['score']
+        with self.assertRaises(KeyError):
+            del song['score']
+        with self.assertRaises(AttributeError):
+            song.unknown = 1
+
+    def test_copy(self):
+        '''
+        Check that a copy has the optional fields of the record and does not
+        share its changes
+        '''
+        print(f"({self.test_copy.__name__})", self.test_copy.__doc__)
+        song = records.Song(1, 'Song', 'Artist', 2000, '3:00')
+        song['rank'] = -1.5
+        copy = song.copy()
+        self.assertEqual(copy, song)
+        self.assertIsInstance(copy, records.Song)
+        copy['name'] = 'Other'
+        self.assertEqual(song['name'], 'Song')
+        self.assertEqual(pickle.loads(pickle.dumps(song)), song)
+
+    def test_row_factory(self):
+        '''
+        Check that the row factory builds records from the columns of any
+        order, with the optional fields that are columns
+        '''
+        print(f"({self.test_row_factory.__name__})", self.test_row_factory.__doc__)
+        con = sqlite3.connect(':memory:')
+        try:
+            cur = con.execute("SELECT 'Artist' AS byArtist, 2 AS score, 1 AS sid, '3:00' AS duration,\
+                               'Song' AS name, 2000 AS datePublished")
+            cur.row_factory = records.Song.row_factory(cur.description)
+            song = cur.fetchone()
+            self.assertIsInstance(song, records.Song)
+            self.assertEqual(dict(song), dict(SONG, score=2))
+            cur = con.execute("SELECT 'Artist' AS byArtist")
+            with self.assertRaises(ValueError):
+                records.Song.row_factory(cur.description)
+        finally:
+            con.close()
+
+    def test_database_returns_records(self):
+        '''
+        Check that the getters of the database return records
+        '''
+        print(f"({self.test_database_returns_records.__name__})",
+              self.test_database_returns_records.__doc__)
+        self.assertIsInstance(db.get_artist('Placebo'), records.Artist)
+        self.assertIsInstance(db.get_user('Robi'), records.User)
+        songs = db.get_songs(limit=2)
+        self.assertTrue(all(isinstance(song, records.Song) for song in songs))
+        self.assertTrue(all(isinstance(song, records.Song) for song in db.iter_songs()))
+        self.assertTrue(all(isinstance(pl, records.Playlist) for pl in db.get_playlists('robi')))
+        #The cached objects are copied: changing one does not change the cache.
+        artist = db.get_artist('Placebo')
+        artist['genre'] = 'Changed'
+        self.assertNotEqual(db.get_artist('Placebo')['genre'], 'Changed')
+
+if __name__ == '__main__':
+    print('Start running tests')
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+
+import database
+from .database_api_tests_common import BaseTestCase, db, db_path
+
+class ReplicaDbAPITestCase(BaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print(f"Testing {cls.__name__}")
+
+    def setUp(self):
+        super(ReplicaDbAPITestCase, self).setUp()
+        #A long interval: only the writes done through replica_db are
+        #noticed right away.
+        self.replica_db = database.MusicDatabase(db_path, replica=True,
+                                                 replica_check_interval=3600)
+
+    def tearDown(self):
+        self.replica_db.close()
+        super(ReplicaDbAPITestCase, self).tearDown()
+
+    def test_catalogue_reads_use_replica(self):
+        '''
+        Check that the artists and songs are read from the in-memory copy and
+        equal the ones of the database file
+        '''
+        print(f"({self.test_catalogue_reads_use_replica.__name__})",
+              self.test_catalogue_reads_use_replica.__doc__)
+        rdb = self.replica_db
+        self.assertEqual(rdb.get_artist('Muse'), db.get_artist('Muse'))
+        self.assertEqual(rdb.get_song('Cranberries', 'Zombie'), db.get_song('Cranberries', 'Zombie'))
+        self.assertEqual(rdb.get_artists(genre='Rock'), db.get_artists(genre='Rock'))
+        self.assertEqual(rdb.get_songs('Muse', limit=2), db.get_songs('Muse', limit=2))
+        self.assertEqual(list(rdb.iter_songs(batch_size=3)), db.get_songs())
+        self.assertEqual(rdb.get_songs_by_id([1, 2]), db.get_songs_by_id([1, 2]))
+        self.assertEqual(rdb.get_pool_stats()['checkouts'], 0)
+        stats = rdb.get_replica_stats()
+        self.assertEqual((stats['refreshes'], stats['generation']), (1, 1))
+        self.assertIsNone(db.get_replica_stats())
+        #The copy is read-only.
+        with self.assertRaises(database.sqlite3.OperationalError):
+            rdb._execute('DELETE FROM songs', (), 'execute', replica=True)
+
+    def test_own_writes_are_read_back(self):
+        '''
+        Check that a write to the catalogue makes a new copy before the next
+        read, and that other writes are only checked
+        '''
+        print(f"({self.test_own_writes_are_read_back.__name__})",
+              self.test_own_writes_are_read_back.__doc__)
+        rdb = self.replica_db
+        self.assertIsNone(rdb.get_song('Muse', 'Uprising'))
+        rdb.create_song('Uprising', 2009, '5:02', 'Muse')
+        self.assertEqual(rdb.get_song('Muse', 'Uprising')['datePublished'], 2009)
+        self.assertEqual(rdb.get_replica_stats()['refreshes'], 2)
+        rdb.create_playlist('Mix', 'Robi')
+        self.assertEqual(len(rdb.get_songs()), len(db.get_songs()))
+        stats = rdb.get_replica_stats()
+        self.assertEqual((stats['refreshes'], stats['checks']), (2, 2))
+        with rdb.bulk_load('artists') as con:
+            con.execute("INSERT INTO artists VALUES ('Sigur Ros', 'Post-rock', 'Iceland', 'Icelandic', 1994)")
+            con.commit()
+        self.assertIsNotNone(rdb.get_artist('Sigur Ros'))
+
+    def test_other_writes_are_checked(self):
+        '''
+        Check that the writes of other connections are seen once the check
+        interval has passed
+        '''
+        print(f"({self.test_other_writes_are_checked.__name__})",
+              self.test_other_writes_are_checked.__doc__)
+        eager = database.MusicDatabase(db_path, replica=True, replica_check_interval=0)
+        try:
+            self.assertIsNone(self.replica_db.get_artist('Sigur Ros'))
+            self.assertIsNone(eager.get_artist('Sigur Ros'))
+            db.create_artist('Sigur Ros', 'Post-rock', 'Iceland', 'Icelandic', 1994)
+            self.assertIsNone(self.replica_db.get_artist('Sigur Ros'))
+            self.assertIsNotNone(eager.get_artist('Sigur Ros'))
+            db.create_user('Jonsi', 'secret', 30, 'Iceland', 'Male')
+            eager.get_artists()
+            self.assertEqual(eager.get_replica_stats()['refreshes'], 2)
+        finally:
+            eager.close()
+
+    def test_refresh_between_batches(self):
+        '''
+        Check that a streamed read holds no copy between its batches: after
+        a refresh it goes on after its last row on the new copy
+        '''
+        print(f"({self.test_refresh_between_batches.__name__})",
+              self.test_refresh_between_batches.__doc__)
+        rdb = self.replica_db
+        songs = rdb.iter_songs('Muse', batch_size=1)
+        first = next(songs)
+        rdb.create_song('Uprising', 2009, '5:02', 'Muse')
+        self.assertIn('Uprising', [s['name'] for s in rdb.get_songs('Muse')])
+        self.assertEqual([first] + list(songs), rdb.get_songs('Muse'))
+        self.assertEqual(rdb.get_replica_stats()['generation'], 2)
+
+if __name__ == '__main__':
+    print('Start running tests')
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+import database
+from .database_api_tests_common import BaseTestCase, db
+
+class SearchDbAPITestCase(BaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print(f"Testing {cls.__name__}")
+
+    def test_search_expression(self):
+        '''
+        Check that free text becomes quoted prefix terms
+        '''
+        print(f"({self.test_search_expression.__name__})",
+              self.test_search_expression.__doc__)
+        self.assertEqual(database.build_search_expression('indie ro'), '"indie"* "ro"*')
+        self.assertEqual(database.build_search_expression('a" OR b*'), '"a"* "OR"* "b"*')
+        self.assertIsNone(database.build_search_expression(' -* '))
+
+    def test_search_artists_ranked(self):
+        '''
+        Check that every word must match and that the name weighs the most
+        '''
+        print(f"({self.test_search_artists_ranked.__name__})",
+              self.test_search_artists_ranked.__doc__)
+        artists = db.search_artists('indie rock')
+        self.assertEqual(set(a['legalName'] for a in artists),
+                         set(['Editors', 'Foals', 'Empire of the sun']))
+        artists = db.search_artists('kalk')
+        self.assertEqual(set(a['legalName'] for a in artists),
+                         set(['Fritz Kalkbrenner', 'Paul Kalkbrenner']))
+        #A prefix of the name ranks above the same prefix in the genre
+        artists = db.search_artists('r')
+        self.assertEqual(artists[0]['legalName'], 'Radiohead')
+
+    def test_search_limit(self):
+        '''
+        Check that no more than limit results are returned
+        '''
+        print(f"({self.test_search_limit.__name__})",
+              self.test_search_limit.__doc__)
+        self.assertEqual(len(db.search_artists('rock', limit=2)), 2)
+        self.assertEqual(db.search_artists('nosuchword'), [])
+
+    def test_search_index_follows_writes(self):
+        '''
+        Check that the triggers keep the indexes in sync with the tables
+        '''
+        print(f"({self.test_search_index_follows_writes.__name__})",
+              self.test_search_index_follows_writes.__doc__)
+        db.create_artist('Sigur Ros', 'Post-Rock', 'Iceland', 'Icelandic', 1994)
+        db.create_song('Hoppipolla', 2005, '4:28', 'Sigur Ros')
+        self.assertEqual(db.search_artists('icel')[0]['legalName'], 'Sigur Ros')
+        songs = db.search_songs('hoppi')
+        self.assertEqual(len(songs), 1)
+        self.assertEqual(songs[0]['byArtist'], 'Sigur Ros')
+        db.delete_song('Sigur Ros', 'Hoppipolla')
+        self.assertEqual(db.search_songs('hoppi'), [])
+        db.rebuild_search_index()
+        self.assertEqual(db.search_artists('sigur')[0]['legalName'], 'Sigur Ros')
+
+if __name__ == '__main__':
+    print('Start running tests')
+    unittest.main()
@@ -111,6 +111,25 @@ class SongsDbAPITestCase(BaseTestCase):
                 self.assertDictContainsSubset(song, self.song1)
 
 
+    def test_get_songs_pages(self):
+        '''
+        Walk the songs of an artist page by page
+        '''
+        print(f"({self.test_get_songs_pages.__name__})",
+              self.test_get_songs_pages.__doc__)
+        for i in range(5):
+            db.create_song('Same title', 2000 + i, '3:00', 'Placebo')
+        everything = db.get_songs('Placebo')
+        titles = []
+        page = db.get_songs('Placebo', limit=2)
+        while True:
+            titles.extend((s['name'], s['sid']) for s in page)
+            if page.next_cursor is None:
+                break
+            page = db.get_songs('Placebo', limit=2, after=page.next_cursor)
+        self.assertEqual(titles, [(s['name'], s['sid']) for s in everything])
+        self.assertEqual(len(titles), len(set(titles)))
+
     def test_create_song(self):
         '''
         Test that a new song can be created
@@ -129,6 +148,51 @@ class SongsDbAPITestCase(BaseTestCase):
         resp2 = db.get_song('Eddie Vedder', 'Society')
         self.assertDictContainsSubset(new_song, resp2)
 
+    def test_create_songs(self):
+        '''
+        Check that create_songs creates a batch in one transaction and
+        reports the songs that could not be created
+        '''
+        print(f"({self.test_create_songs.__name__})",
+              self.test_create_songs.__doc__)
+        writes = db.get_pool_stats()['writes']
+        results = db.create_songs('Muse', [('Uprising', 2009, '5:03'),
+                                           ('No length', 2009, None),
+                                           ('Madness', 2012, '4:41')])
+        self.assertEqual(db.get_pool_stats()['writes'], writes + 1)
+        self.assertIsNotNone(results[0][0])
+        self.assertIsNone(results[0][1])
+        self.assertEqual(results[1][0], None)
+        self.assertIn('NOT NULL', results[1][1])
+        self.assertEqual(db.get_song('Muse', 'Madness')['sid'], results[2][0])
+        self.assertIsNone(db.get_song('Muse', 'No length'))
+        #Unknown artist
+        results = db.create_songs('Nobody', [('Nothing', None, '1:00')])
+        self.assertIsNone(results[0][0])
+        self.assertIsNone(db.get_song('Nobody', 'Nothing'))
+
+    def test_append_songs_to_playlist(self):
+        '''
+        Check that append_songs_to_playlist resolves and appends a batch in
+        one transaction
+        '''
+        print(f"({self.test_append_songs_to_playlist.__name__})",
+              self.test_append_songs_to_playlist.__doc__)
+        writes = db.get_pool_stats()['writes']
+        results = db.append_songs_to_playlist('Posted', 'robi',
+                                              [('Muse', 'Starlight'), ('Muse', 'No such song'),
+                                               ('Placebo', 'Pierrot the clown'), ('Muse', 'Blackout')])
+        self.assertEqual(db.get_pool_stats()['writes'], writes + 1)
+        self.assertEqual(results[0], (23, None))
+        self.assertIsNone(results[1][0])
+        self.assertIn('No such song', results[1][1])
+        #Pierrot the clown was already in the playlist
+        self.assertEqual(results[2][0], 2)
+        self.assertIn('already', results[2][1])
+        self.assertEqual(results[3], (20, None))
+        sids = [s['sid'] for s in db.get_songs_in_playlist('Posted', 'robi')]
+        self.assertEqual(sids, [2, 20, 23])
+
 if __name__ == '__main__':
     print('Start running tests')
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,115 @@
+import unittest
+
+from .database_api_tests_common import BaseTestCase, db
+
+#Tuesday 2 June 2015, 12:00 UTC
+NOON = 1433246400
+
+class StatisticsDbAPITestCase(BaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print(f"Testing {cls.__name__}")
+
+    def _summaries(self):
+        '''
+        Return the rows of the summary tables with a count above zero.
+        '''
+        queries = ('SELECT * FROM song_stats WHERE plays > 0 ORDER BY song',
+                   'SELECT * FROM artist_stats WHERE plays > 0 ORDER BY artist',
+                   'SELECT * FROM genre_stats WHERE plays > 0 ORDER BY dimension, value, genre',
+                   'SELECT * FROM daily_stats WHERE additions > 0 ORDER BY day')
+        return [db._execute(query, (), 'all', tuple) for query in queries]
+
+    def _add_entries(self):
+        db.create_playlist('Mix', 'Robi')
+        db.create_playlist('Mix', 'Joshua')
+        db.append_songs_to_playlist('Mix', 'Robi', [('Muse', 'Starlight'), ('Muse', 'Blackout'),
+                                                    ('Cranberries', 'Zombie')])
+        db.append_songs_to_playlist('Mix', 'Joshua', [('Muse', 'Starlight')])
+        db._execute('UPDATE song_in_playlist SET added_on = ? WHERE pl_name = ?',
+                    (NOON, 'Mix'), 'execute')
+
+    def test_triggers_follow_writes(self):
+        '''
+        Check that the triggers keep the summaries equal to a rebuild through
+        inserts, deletes and changes of users, artists and songs
+        '''
+        print(f"({self.test_triggers_follow_writes.__name__})",
+              self.test_triggers_follow_writes.__doc__)
+        self._add_entries()
+        writes = [
+            lambda: db.modify_user('Robi', 42, 'Finland', 'Female'),
+            lambda: db._execute("UPDATE artists SET genre = 'Pop' WHERE legalName = 'Muse'",
+                                (), 'execute'),
+            lambda: db._execute("UPDATE songs SET byArtist = 'Placebo' WHERE sid = 6",
+                                (), 'execute'),
+            lambda: db._execute("DELETE FROM song_in_playlist WHERE song = 20", (), 'execute'),
+            #Deleting a playlist leaves its entries, still counted with the user.
+            lambda: db.delete_playlist('Joshua', 'Mix'),
+            lambda: db.delete_user('Joshua'),
+        ]
+        for write in writes:
+            write()
+            summaries = self._summaries()
+            db.rebuild_statistics()
+            self.assertEqual(self._summaries(), summaries)
+
+    def test_top_songs_and_artists(self):
+        '''
+        Check the songs in most playlists and the artists with most entries
+        '''
+        print(f"({self.test_top_songs_and_artists.__name__})",
+              self.test_top_songs_and_artists.__doc__)
+        self._add_entries()
+        songs = db.get_top_songs(2)
+        self.assertEqual([(s['name'], s['plays']) for s in songs], [('Starlight', 2), ('I know', 1)])
+        artists = db.get_top_artists()
+        self.assertEqual([(a['legalName'], a['plays']) for a in artists][:2], [('Muse', 3), ('Placebo', 2)])
+        with self.assertRaises(ValueError):
+            db.get_top_songs(0)
+
+    def test_genre_popularity(self):
+        '''
+        Check the genres grouped by nationality, gender and age
+        '''
+        print(f"({self.test_genre_popularity.__name__})", self.test_genre_popularity.__doc__)
+        self._add_entries()
+        self.assertEqual(db.get_genre_popularity('nationality'),
+                         [('Austalia', 'Rock', 1), ('Italy', 'Rock', 3)])
+        self.assertEqual(db.get_genre_popularity('age', '10-19'), [('10-19', 'Rock', 3)])
+        self.assertEqual(db.get_genre_popularity('gender', limit=1), [('Male', 'Rock', 4)])
+        db._execute("UPDATE artists SET genre = 'Pop' WHERE legalName = 'Cranberries'", (), 'execute')
+        self.assertEqual(db.get_genre_popularity('gender'), [('Male', 'Rock', 3), ('Male', 'Pop', 1)])
+        self.assertEqual(db.get_genre_popularity('gender', limit=1), [('Male', 'Rock', 3)])
+        with self.assertRaises(ValueError):
+            db.get_genre_popularity('password')
+
+    def test_daily_additions(self):
+        '''
+        Check the songs added to playlists per day
+        '''
+        print(f"({self.test_daily_additions.__name__})", self.test_daily_additions.__doc__)
+        self._add_entries()
+        self.assertEqual(db.get_daily_additions(since=NOON), [('2015-06-02', 4)])
+        self.assertEqual(db.get_daily_additions(until=NOON - 86400),
+                         [('2015-03-17', 1), ('2015-04-27', 1)])
+        db.delete_playlist('Joshua', 'Mix')
+        db._execute('DELETE FROM song_in_playlist WHERE pl_user = ?', ('Joshua',), 'execute')
+        self.assertEqual(db.get_daily_additions(NOON, NOON), [('2015-06-02', 3)])
+
+    def test_bulk_load_rebuilds_statistics(self):
+        '''
+        Check that the summaries are computed again after a bulk load
+        '''
+        print(f"({self.test_bulk_load_rebuilds_statistics.__name__})",
+              self.test_bulk_load_rebuilds_statistics.__doc__)
+        with db.bulk_load('song_in_playlist') as con:
+            con.execute("INSERT INTO song_in_playlist VALUES (1, 'Posted', 'robi', ?)", (NOON,))
+            con.commit()
+        self.assertEqual([(s['sid'], s['plays']) for s in db.get_top_songs(1)], [(1, 2)])
+        self.assertIn(('2015-06-02', 1), db.get_daily_additions())
+
+if __name__ == '__main__':
+    print('Start running tests')
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+import gzip, json, os, shutil, tempfile
+
+import flask
+from werkzeug.test import Client
+
+from musicfinder_admin import assets
+
+class AssetsTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print(f"Testing AssetsTestCase")
+
+    def setUp(self):
+        self.output = tempfile.mkdtemp()
+        self.manifest = assets.build(assets.DEFAULT_STATIC_FOLDER, self.output)
+        app = flask.Flask(__name__)
+        app.add_url_rule('/other', 'other', lambda: 'other')
+        self.client = Client(assets.StaticAssets(app.wsgi_app, self.output))
+
+    def tearDown(self):
+        shutil.rmtree(self.output)
+
+    def _read(self, path):
+        with open(os.path.join(self.output, *path.split('/')), 'rb') as f:
+            return f.read()
+
+    def test_build(self):
+        '''
+        Check that the assets are fingerprinted and compressed, and that the
+        pages and stylesheets point to the fingerprinted names
+        '''
+        print(f"({self.test_build.__name__})", self.test_build.__doc__)
+        with open(os.path.join(self.output, assets.MANIFEST)) as f:
+            self.assertEqual(json.load(f), self.manifest)
+        jquery = self.manifest['jquery.js']
+        self.assertEqual(jquery['file'], 'jquery.%s.js' % jquery['hash'])
+        self.assertEqual(gzip.decompress(self._read(jquery['file'] + '.gz')), self._read(jquery['file']))
+        with open(os.path.join(assets.DEFAULT_STATIC_FOLDER, 'jquery.js'), 'rb') as f:
+            self.assertEqual(self._read(jquery['file']), f.read())
+        #Fonts that are compressed already and tiny files keep no variant.
+        self.assertEqual(self.manifest['bootstrap/fonts/glyphicons-halflings-regular.woff']['encodings'], [])
+        self.assertEqual(self.manifest['musicfinder.css']['encodings'], [])
+        page = self.manifest['artists.html']
+        self.assertEqual(page['file'], 'artists.html')
+        html = self._read('artists.html').decode('utf-8')
+        self.assertIn('src="%s"' % jquery['file'], html)
+        self.assertIn('href="%s"' % self.manifest['bootstrap/css/bootstrap.min.css']['file'], html)
+        css = self._read(self.manifest['bootstrap/css/bootstrap.min.css']['file']).decode('utf-8')
+        eot = self.manifest['bootstrap/fonts/glyphicons-halflings-regular.eot']['file']
+        self.assertIn('url(../fonts/%s?#iefix)' % os.path.basename(eot), css)
+
+    def test_encoding_negotiation(self):
+        '''
+        Check that the smallest variant accepted by the client is sent
+        '''
+        print(f"({self.test_encoding_negotiation.__name__})", self.test_encoding_negotiation.__doc__)
+        jquery = self.manifest['jquery.js']
+        resp = self.client.get('/' + jquery['file'], headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(resp.headers['Vary'], 'Accept-Encoding')
+        self.assertIn('javascript', resp.headers['Content-Type'])
+        self.assertEqual(gzip.decompress(resp.data), self._read(jquery['file']))
+        self.assertEqual(int(resp.headers['Content-Length']), len(resp.data))
+        for accept in (None, 'identity', 'gzip;q=0'):
+            resp = self.client.get('/' + jquery['file'], headers={'Accept-Encoding': accept} if accept else {})
+            self.assertNotIn('Content-Encoding', resp.headers)
+            self.assertEqual(resp.data, self._read(jquery['file']))
+
+    def test_cache_headers(self):
+        '''
+        Check that the fingerprinted names are cached for good, the others
+        revalidated, and that a matching ETag gets a 304 without body
+        '''
+        print(f"({self.test_cache_headers.__name__})", self.test_cache_headers.__doc__)
+        jquery = self.manifest['jquery.js']
+        resp = self.client.get('/' + jquery['file'])
+        self.assertEqual(resp.headers['Cache-Control'], assets.CACHE_IMMUTABLE)
+        resp = self.client.get('/jquery.js', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.headers['Cache-Control'], assets.CACHE_REVALIDATE)
+        self.assertEqual(resp.headers['ETag'], '"%s-gzip"' % jquery['hash'])
+        resp = self.client.get('/jquery.js', headers={'Accept-Encoding': 'gzip',
+                                                      'If-None-Match': resp.headers['ETag']})
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.data, b'')
+        #The ETag of another encoding does not match.
+        resp = self.client.get('/jquery.js', headers={'If-None-Match': '"%s-gzip"' % jquery['hash']})
+        self.assertEqual(resp.status_code, 200)
+        resp = self.client.head('/' + jquery['file'])
+        self.assertEqual((resp.status_code, resp.data), (200, b''))
+
+    def test_other_requests(self):
+        '''
+        Check that the requests that are not for a built asset reach the
+        application, and that without a build every request does
+        '''
+        print(f"({self.test_other_requests.__name__})", self.test_other_requests.__doc__)
+        self.assertEqual(self.client.get('/other').data, b'other')
+        self.assertEqual(self.client.get('/missing.js').status_code, 404)
+        self.assertEqual(self.client.post('/jquery.js').status_code, 404)
+        app = flask.Flask(__name__)
+        client = Client(assets.StaticAssets(app.wsgi_app, os.path.join(self.output, 'missing')))
+        self.assertEqual(client.get('/jquery.js').status_code, 404)
+
+if __name__ == '__main__':
+    print('Start running tests')
+    unittest.main()
@@ -1,13 +1,18 @@
 import unittest, copy
-import json
+import shutil, tempfile
+import json, zlib
+import sqlite3
 
 import flask
 
 import resources as resources
+import content_encoding
+import cooccurrence
 import database
+import instrumentation
+import serialization
+from .database_api_tests_common import db, reset_database
 
-db_path ='db/db_test.db'
-db = database.MusicDatabase(db_path)
 initial_artists = 20
 initial_users = 3
 resources.app.config['TESTING'] = True
@@ -15,7 +20,7 @@ resources.app.config['DATABASE'] = db
 
 class ResourcesAPITestCase(unittest.TestCase):
     def setUp(self):
-        db.load_init_values()
+        reset_database()
         self.client = resources.app.test_client()
 
     def tearDown(self):
@@ -57,6 +62,62 @@ class ArtistsTestCase(ResourcesAPITestCase):
             artists = data['collection']['items']
             self.assertEqual(len(artists), initial_artists)
 
+    def test_get_artists_pages(self):
+        '''
+        Checks that the next and prev links walk the artists collection
+        '''
+        print(f"({self.test_get_artists_pages.__name__})", self.test_get_artists_pages.__doc__)
+        resp = self.client.get(self.url + '?limit=8&genre=o')
+        self.assertEqual(resp.status_code, 200)
+        collection = json.loads(resp.data)['collection']
+        names = [item['data'][0]['value'] for item in collection['items']]
+        links = dict((link['rel'], link['href']) for link in collection['links'])
+        self.assertNotIn('prev', links)
+        while 'next' in links:
+            self.assertIn('genre=o', links['next'])
+            self.assertIn('limit=8', links['next'])
+            resp = self.client.get(links['next'])
+            collection = json.loads(resp.data)['collection']
+            names.extend(item['data'][0]['value'] for item in collection['items'])
+            links = dict((link['rel'], link['href']) for link in collection['links'])
+        self.assertIn('prev', links)
+        expected = [a['legalName'] for a in db.get_artists(genre='o')]
+        self.assertEqual(names, expected)
+
+    def test_get_artists_streamed(self):
+        '''
+        Checks that the streamed collection has the same content as the
+        rendered one
+        '''
+        print(f"({self.test_get_artists_streamed.__name__})", self.test_get_artists_streamed.__doc__)
+        resources.STREAM_CHUNK_ITEMS, chunk_items = 3, resources.STREAM_CHUNK_ITEMS
+        try:
+            resp = self.client.get(self.url + '?stream=true&genre=o')
+        finally:
+            resources.STREAM_CHUNK_ITEMS = chunk_items
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.is_streamed)
+        self.assertEqual(resp.mimetype, resources.COLLECTIONJSON)
+        streamed = json.loads(resp.data)['collection']
+        rendered = json.loads(self.client.get(self.url + '?genre=o').data)['collection']
+        self.assertEqual(streamed['items'], rendered['items'])
+        self.assertEqual(streamed['template'], rendered['template'])
+        self.assertEqual(len(streamed['items']), len(db.get_artists(genre='o')))
+        #An empty collection is still a valid document
+        resp = self.client.get(self.url + '?stream=true&name=NoSuchArtist')
+        self.assertEqual(json.loads(resp.data)['collection']['items'], [])
+        resp = self.client.get(self.url + '?stream=true&before=WyJhIl0')
+        self.assertEqual(resp.status_code, 400)
+
+    def test_get_artists_wrong_page(self):
+        '''
+        Checks that wrong pagination parameters return 400
+        '''
+        print(f"({self.test_get_artists_wrong_page.__name__})", self.test_get_artists_wrong_page.__doc__)
+        self.assertEqual(self.client.get(self.url + '?limit=0').status_code, 400)
+        self.assertEqual(self.client.get(self.url + '?after=%%%').status_code, 400)
+        self.assertEqual(self.client.get(self.url + '?after=WyJhIl0&before=WyJhIl0').status_code, 400)
+
 class UsersTestCase(ResourcesAPITestCase):
     url = '/musicfinder/api/users/'
     
@@ -265,6 +326,642 @@ class PlaylistTestCase(ResourcesAPITestCase):
             self.assertEqual(len(template_data), self.template_data_number)
 
 
+class SearchTestCase(ResourcesAPITestCase):
+    url = '/musicfinder/api/search/'
+
+    @classmethod
+    def setUpClass(cls):
+        print(f"Testing SearchTestCase")
+
+    def test_url(self):
+        '''
+        Checks that the URL points to the right resource
+        '''
+        print(f"({self.test_url.__name__})", self.test_url.__doc__)
+        with resources.app.test_request_context(self.url):
+            rule = flask.request.url_rule
+            view_point = resources.app.view_functions[rule.endpoint].view_class
+            self.assertEqual(view_point, resources.Search)
+
+    def test_search(self):
+        '''
+        Checks that the search returns ranked artists and songs
+        '''
+        print(f"({self.test_search.__name__})", self.test_search.__doc__)
+        resp = self.client.get(self.url + '?q=placebo')
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        items = data['collection']['items']
+        hrefs = [item['href'] for item in items]
+        self.assertIn('/musicfinder/api/artists/Placebo/', hrefs)
+        self.assertIn('/musicfinder/api/artists/Placebo/songs/I%20know', hrefs)
+        #Artists first, then songs, each ranked
+        artists = [item for item in items if '/songs/' not in item['href']]
+        self.assertEqual(items[:len(artists)], artists)
+        for group in (artists, items[len(artists):]):
+            ranks = [item['data'][-1]['value'] for item in group]
+            self.assertEqual(ranks, sorted(ranks))
+
+    def test_search_types_ranked_apart(self):
+        '''
+        Checks that weak song matches do not push a strong artist match out
+        of the results: each type has its own ranking and limit
+        '''
+        print(f"({self.test_search_types_ranked_apart.__name__})", self.test_search_types_ranked_apart.__doc__)
+        #Tribute bands lower the weight of the word in the artists index, so
+        #the bm25 of the exact artist is worse than the one of a weak song match.
+        db.create_artist('Nightwish', 'Symphonic metal', 'Kitee', 'English', 1996)
+        for name in ('Wishmasters', 'Dark Chest', 'Elvenpath'):
+            db.create_artist(name, 'Nightwish tribute', 'Tampere', 'English', 2005)
+        db.create_song('Nightwish live remix', 2005, 200, 'Muse')
+        resp = self.client.get(self.url + '?q=nightwish&limit=1')
+        self.assertEqual(resp.status_code, 200)
+        items = json.loads(resp.data)['collection']['items']
+        self.assertEqual([item['href'] for item in items],
+                         ['/musicfinder/api/artists/Nightwish/',
+                          '/musicfinder/api/artists/Muse/songs/Nightwish%20live%20remix'])
+        resp = self.client.get(self.url + '?q=nightwish&limit=3')
+        items = json.loads(resp.data)['collection']['items']
+        self.assertEqual(len(items), 4)
+        self.assertEqual(items[0]['href'], '/musicfinder/api/artists/Nightwish/')
+        self.assertNotIn('/songs/', items[2]['href'])
+
+    def test_search_type_and_limit(self):
+        '''
+        Checks the type and limit parameters of the search
+        '''
+        print(f"({self.test_search_type_and_limit.__name__})", self.test_search_type_and_limit.__doc__)
+        resp = self.client.get(self.url + '?q=rock&type=artists&limit=3')
+        self.assertEqual(resp.status_code, 200)
+        items = json.loads(resp.data)['collection']['items']
+        self.assertEqual(len(items), 3)
+        for item in items:
+            self.assertTrue(item['href'].startswith('/musicfinder/api/artists/'))
+            self.assertNotIn('/songs/', item['href'])
+
+    def test_search_wrong_parameters(self):
+        '''
+        Checks that a missing query or a wrong limit return 400
+        '''
+        print(f"({self.test_search_wrong_parameters.__name__})", self.test_search_wrong_parameters.__doc__)
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(self.client.get(self.url + '?q=rock&limit=0').status_code, 400)
+        self.assertEqual(self.client.get(self.url + '?q=rock&limit=abc').status_code, 400)
+
+
+class ConditionalRequestsTestCase(ResourcesAPITestCase):
+    artists_url = '/musicfinder/api/artists/'
+    playlist_url = '/musicfinder/api/users/robi/playlists/Posted/'
+
+    @classmethod
+    def setUpClass(cls):
+        print(f"Testing ConditionalRequestsTestCase")
+
+    def test_if_none_match(self):
+        '''
+        Checks that a matching If-None-Match returns 304 until the table changes
+        '''
+        print(f"({self.test_if_none_match.__name__})", self.test_if_none_match.__doc__)
+        resp = self.client.get(self.artists_url)
+        self.assertEqual(resp.status_code, 200)
+        etag = resp.headers['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+        resp = self.client.get(self.artists_url, headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.data, b'')
+        self.assertEqual(resp.headers['ETag'], etag)
+        #Other query parameters are other representations
+        resp = self.client.get(self.artists_url + '?genre=pop', headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 200)
+        db.create_artist('Sigur Ros', 'Post-Rock', 'Iceland', 'Icelandic', 1994)
+        resp = self.client.get(self.artists_url, headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp.headers['ETag'], etag)
+
+    def test_not_modified_skips_rendering(self):
+        '''
+        Checks that a 304 does not read the resource from the database
+        '''
+        print(f"({self.test_not_modified_skips_rendering.__name__})", self.test_not_modified_skips_rendering.__doc__)
+        url = '/musicfinder/api/artists/Placebo/'
+        etag = self.client.get(url).headers['ETag']
+        db.clear_caches()
+        misses = db.get_cache_stats()['artist']['misses']
+        resp = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(db.get_cache_stats()['artist']['misses'], misses)
+
+    def test_playlist_last_modified(self):
+        '''
+        Checks that playlists use created_on and added_on as Last-Modified
+        '''
+        print(f"({self.test_playlist_last_modified.__name__})", self.test_playlist_last_modified.__doc__)
+        self._set_modified_on('song_in_playlist', 1400000000)
+        resp = self.client.get(self.playlist_url)
+        self.assertEqual(resp.status_code, 200)
+        last_modified = resp.headers['Last-Modified']
+        #Added_on of its last song, which is later than its created_on
+        self.assertEqual(resp.last_modified.timestamp(), 1430155183)
+        resp = self.client.get(self.playlist_url, headers={'If-Modified-Since': last_modified})
+        self.assertEqual(resp.status_code, 304)
+        resp = self.client.get(self.playlist_url,
+                               headers={'If-Modified-Since': 'Mon, 16 Mar 2015 00:00:00 GMT'})
+        self.assertEqual(resp.status_code, 200)
+        #A 404 has no validators
+        resp = self.client.get('/musicfinder/api/users/robi/playlists/Nothing/')
+        self.assertEqual(resp.status_code, 404)
+        self.assertNotIn('ETag', resp.headers)
+
+    def test_playlist_song_removed(self):
+        '''
+        Checks that removing a song from a playlist moves its Last-Modified
+        forward, so If-Modified-Since alone does not get a 304
+        '''
+        print(f"({self.test_playlist_song_removed.__name__})", self.test_playlist_song_removed.__doc__)
+        self._set_modified_on('song_in_playlist', 1400000000)
+        for url in (self.playlist_url, self.playlist_url + 'songs/'):
+            resp = self.client.get(url)
+            self.assertEqual(resp.last_modified.timestamp(), 1430155183)
+        last_modified = resp.headers['Last-Modified']
+        con = sqlite3.connect(db.db_path)
+        try:
+            with con:
+                con.execute("DELETE FROM song_in_playlist WHERE pl_user = 'robi' AND pl_name = 'Posted'")
+        finally:
+            con.close()
+        db.clear_caches()
+        for url in (self.playlist_url, self.playlist_url + 'songs/'):
+            resp = self.client.get(url, headers={'If-Modified-Since': last_modified})
+            self.assertEqual(resp.status_code, 200)
+            self.assertGreater(resp.last_modified.timestamp(), 1430155183)
+        self.assertEqual(json.loads(resp.data)['collection']['items'], [])
+
+    def _set_modified_on(self, table, modified_on):
+        #The counters are created with the time of the migration: older
+        #ones let the tests tell the times of the rows from them.
+        con = sqlite3.connect(db.db_path)
+        try:
+            with con:
+                con.execute('UPDATE table_versions SET modified_on = ? WHERE name = ?',
+                            (modified_on, table))
+        finally:
+            con.close()
+
+
+class BatchWritesTestCase(ResourcesAPITestCase):
+    songs_url = '/musicfinder/api/artists/Muse/songs/'
+    playlist_url = '/musicfinder/api/users/robi/playlists/Posted/'
+
+    @classmethod
+    def setUpClass(cls):
+        print(f"Testing BatchWritesTestCase")
+
+    def _items(self, *items):
+        return json.dumps({'items': [{'data': [{'name': name, 'value': value}
+                                               for name, value in item.items()]}
+                                     for item in items]})
+
+    def test_post_songs_batch(self):
+        '''
+        Checks that a batch of songs is created with a status per item
+        '''
+        print(f"({self.test_post_songs_batch.__name__})", self.test_post_songs_batch.__doc__)
+        body = self._items({'name': 'Uprising', 'duration': '5:03', 'datePublished': 2009},
+                           {'duration': '1:00'},
+                           {'name': 'Madness', 'duration': '4:41'},
+                           {'name': 'No length'})
+        resp = self.client.post(self.songs_url, data=body)
+        self.assertEqual(resp.status_code, 207)
+        results = json.loads(resp.data)['results']
+        self.assertEqual([r['status'] for r in results], [201, 400, 201, 400])
+        self.assertEqual(results[0]['href'], '/musicfinder/api/artists/Muse/songs/Uprising')
+        self.assertEqual(self.client.get(results[2]['href']).status_code, 200)
+        resp = self.client.post('/musicfinder/api/artists/Nobody/songs/', data=body)
+        self.assertEqual(resp.status_code, 404)
+        resp = self.client.post(self.songs_url, data=json.dumps({'items': []}))
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.post(self.songs_url, data=json.dumps({'items': [{'value': 1}]}))
+        self.assertEqual(resp.status_code, 400)
+
+    def test_post_playlist_batch(self):
+        '''
+        Checks that a batch of songs is appended to a playlist with a status
+        per item
+        '''
+        print(f"({self.test_post_playlist_batch.__name__})", self.test_post_playlist_batch.__doc__)
+        body = self._items({'byArtist': 'Muse', 'name': 'Starlight'},
+                           {'byArtist': 'Muse', 'name': 'No such song'},
+                           {'byArtist': 'Placebo', 'name': 'Pierrot the clown'},
+                           {'name': 'Blackout'})
+        resp = self.client.post(self.playlist_url, data=body)
+        self.assertEqual(resp.status_code, 207)
+        results = json.loads(resp.data)['results']
+        self.assertEqual([r['status'] for r in results], [201, 404, 409, 400])
+        songs = json.loads(self.client.get(self.playlist_url + 'songs/').data)['collection']['items']
+        self.assertEqual(len(songs), 2)
+        resp = self.client.post('/musicfinder/api/users/robi/playlists/Nothing/', data=body)
+        self.assertEqual(resp.status_code, 404)
+
+    def test_post_playlist_single(self):
+        '''
+        Checks that appending one unknown or repeated song is an error
+        '''
+        print(f"({self.test_post_playlist_single.__name__})", self.test_post_playlist_single.__doc__)
+        def song(artist, title):
+            return json.dumps({'template': {'data': [{'name': 'byArtist', 'value': artist},
+                                                     {'name': 'name', 'value': title}]}})
+        self.assertEqual(self.client.post(self.playlist_url, data=song('Muse', 'Starlight')).status_code, 201)
+        self.assertEqual(self.client.post(self.playlist_url, data=song('Muse', 'Starlight')).status_code, 409)
+        self.assertEqual(self.client.post(self.playlist_url, data=song('Muse', 'Nothing')).status_code, 404)
+
+
+class RecommendationsTestCase(ResourcesAPITestCase):
+    url = '/musicfinder/api/users/Robi/recommendations/'
+
+    @classmethod
+    def setUpClass(cls):
+        print(f"Testing RecommendationsTestCase")
+
+    def test_url(self):
+        '''
+        Checks that the URL points to the right resource
+        '''
+        print(f"({self.test_url.__name__})", self.test_url.__doc__)
+        with resources.app.test_request_context(self.url):
+            rule = flask.request.url_rule
+            view_point = resources.app.view_functions[rule.endpoint].view_class
+            self.assertEqual(view_point, resources.User_recommendations)
+
+    def test_get_recommendations(self):
+        '''
+        Checks that the recommended songs follow the playlists of the user
+        '''
+        print(f"({self.test_get_recommendations.__name__})", self.test_get_recommendations.__doc__)
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.data)['collection']['items'], [])
+        db.create_playlist('Mix', 'Robi')
+        db.append_songs_to_playlist('Mix', 'Robi', [('Muse', 'Starlight'),
+                                                    ('Cranberries', 'Zombie')])
+        etag = self.client.get(self.url + '?limit=2').headers['ETag']
+        db.refresh_similarity_index()
+        resp = self.client.get(self.url + '?limit=2', headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 200)
+        items = json.loads(resp.data)['collection']['items']
+        self.assertEqual(items[0]['href'], '/musicfinder/api/artists/Muse/songs/Blackout')
+        self.assertEqual([d['name'] for d in items[0]['data']],
+                         ['name', 'byArtist', 'duration', 'datePublished', 'score'])
+        self.assertEqual(self.client.get(self.url + '?limit=0').status_code, 400)
+        self.assertEqual(self.client.get(self.url + '?limit=x').status_code, 400)
+        resp = self.client.get('/musicfinder/api/users/Nobody/recommendations/')
+        self.assertEqual(resp.status_code, 404)
+
+
+class StatisticsTestCase(ResourcesAPITestCase):
+    url = '/musicfinder/api/statistics/'
+
+    @classmethod
+    def setUpClass(cls):
+        print(f"Testing StatisticsTestCase")
+
+    def setUp(self):
+        super(StatisticsTestCase, self).setUp()
+        db.create_playlist('Mix', 'Robi')
+        db.append_songs_to_playlist('Mix', 'Robi', [('Muse', 'Starlight'),
+                                                    ('Cranberries', 'Zombie')])
+
+    def test_url(self):
+        '''
+        Checks that the URLs point to the right resources
+        '''
+        print(f"({self.test_url.__name__})", self.test_url.__doc__)
+        for path, resource in (('songs/', resources.Top_songs), ('artists/', resources.Top_artists),
+                               ('genres/', resources.Genre_popularity),
+                               ('additions/', resources.Playlist_additions)):
+            with resources.app.test_request_context(self.url + path):
+                rule = flask.request.url_rule
+                view_point = resources.app.view_functions[rule.endpoint].view_class
+                self.assertEqual(view_point, resource)
+
+    def test_get_top_songs_and_artists(self):
+        '''
+        Checks that the top songs and artists have their playlist counts
+        '''
+        print(f"({self.test_get_top_songs_and_artists.__name__})",
+              self.test_get_top_songs_and_artists.__doc__)
+        resp = self.client.get(self.url + 'songs/?limit=1')
+        self.assertEqual(resp.status_code, 200)
+        items = json.loads(resp.data)['collection']['items']
+        self.assertEqual(len(items), 1)
+        self.assertEqual([d['name'] for d in items[0]['data']],
+                         ['name', 'byArtist', 'duration', 'datePublished', 'plays'])
+        resp = self.client.get(self.url + 'artists/')
+        self.assertEqual(resp.status_code, 200)
+        items = json.loads(resp.data)['collection']['items']
+        self.assertEqual(items[0]['href'], '/musicfinder/api/artists/Placebo/')
+        self.assertEqual(items[0]['data'][-1], {'name': 'plays', 'value': 2})
+        self.assertEqual(self.client.get(self.url + 'songs/?limit=0').status_code, 400)
+        self.assertEqual(self.client.get(self.url + 'artists/?limit=x').status_code, 400)
+
+    def test_get_genres(self):
+        '''
+        Checks the genres grouped by an attribute of the users
+        '''
+        print(f"({self.test_get_genres.__name__})", self.test_get_genres.__doc__)
+        resp = self.client.get(self.url + 'genres/?by=nationality')
+        self.assertEqual(resp.status_code, 200)
+        items = json.loads(resp.data)['collection']['items']
+        self.assertEqual(items, [{'href': '/musicfinder/api/artists/?genre=Rock',
+                                  'data': [{'name': 'nationality', 'value': 'Italy'},
+                                           {'name': 'genre', 'value': 'Rock'},
+                                           {'name': 'plays', 'value': 2}],
+                                  'links': []}])
+        resp = self.client.get(self.url + 'genres/?by=age&value=30-39')
+        self.assertEqual(json.loads(resp.data)['collection']['items'], [])
+        self.assertEqual(self.client.get(self.url + 'genres/').status_code, 400)
+        self.assertEqual(self.client.get(self.url + 'genres/?by=age&limit=0').status_code, 400)
+
+    def test_get_additions(self):
+        '''
+        Checks the songs added to playlists per day
+        '''
+        print(f"({self.test_get_additions.__name__})", self.test_get_additions.__doc__)
+        resp = self.client.get(self.url + 'additions/?until=2015-04-27')
+        self.assertEqual(resp.status_code, 200)
+        items = json.loads(resp.data)['collection']['items']
+        self.assertEqual([[d['value'] for d in item['data']] for item in items],
+                         [['2015-03-17', 1], ['2015-04-27', 1]])
+        self.assertEqual(items[0]['href'],
+                         '/musicfinder/api/statistics/additions/?since=2015-03-17&until=2015-03-17')
+        self.assertEqual(self.client.get(self.url + 'additions/?since=yesterday').status_code, 400)
+
+    def test_not_modified(self):
+        '''
+        Checks that the statistics change their ETag when a song is added to a playlist
+        '''
+        print(f"({self.test_not_modified.__name__})", self.test_not_modified.__doc__)
+        etag = self.client.get(self.url + 'songs/').headers['ETag']
+        resp = self.client.get(self.url + 'songs/', headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 304)
+        db.append_song_to_playlist(1, 'Mix', 'Robi')
+        resp = self.client.get(self.url + 'songs/', headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 200)
+
+
+class SongRelatedTestCase(ResourcesAPITestCase):
+    url = '/musicfinder/api/artists/Muse/songs/Starlight/related/'
+
+    @classmethod
+    def setUpClass(cls):
+        print(f"Testing SongRelatedTestCase")
+
+    def setUp(self):
+        super(SongRelatedTestCase, self).setUp()
+        self.folder = tempfile.mkdtemp()
+        resources.app.config['COOCCURRENCE_PATH'] = self.folder
+
+    def tearDown(self):
+        resources.app.config['COOCCURRENCE_PATH'] = cooccurrence.DEFAULT_PATH
+        shutil.rmtree(self.folder)
+        super(SongRelatedTestCase, self).tearDown()
+
+    def test_url(self):
+        '''
+        Checks that the URL points to the right resource
+        '''
+        print(f"({self.test_url.__name__})", self.test_url.__doc__)
+        with resources.app.test_request_context(self.url):
+            rule = flask.request.url_rule
+            view_point = resources.app.view_functions[rule.endpoint].view_class
+            self.assertEqual(view_point, resources.Song_related)
+
+    def test_get_related_without_index(self):
+        '''
+        Checks that related songs are unavailable until the index is built
+        '''
+        print(f"({self.test_get_related_without_index.__name__})", self.test_get_related_without_index.__doc__)
+        self.assertEqual(self.client.get(self.url).status_code, 503)
+        resp = self.client.get('/musicfinder/api/artists/Muse/songs/Nothing/related/')
+        self.assertEqual(resp.status_code, 404)
+
+    @unittest.skipIf(cooccurrence.numpy is None, 'numpy and scipy are not installed')
+    def test_get_related(self):
+        '''
+        Checks that the related songs are the songs added to the same
+        playlists
+        '''
+        print(f"({self.test_get_related.__name__})", self.test_get_related.__doc__)
+        db.create_playlist('Mix', 'Robi')
+        db.append_songs_to_playlist('Mix', 'Robi', [('Muse', 'Starlight'),
+                                                    ('Cranberries', 'Zombie')])
+        cooccurrence.build(db, self.folder)
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, 200)
+        items = json.loads(resp.data)['collection']['items']
+        self.assertEqual([item['href'] for item in items],
+                         ['/musicfinder/api/artists/Cranberries/songs/Zombie'])
+        self.assertEqual(items[0]['data'][-2:], [{'name': 'sid', 'value': 6},
+                                                 {'name': 'count', 'value': 1}])
+        self.assertEqual(self.client.get(self.url + '?limit=0').status_code, 400)
+
+
+class InstrumentationTestCase(ResourcesAPITestCase):
+    url = '/musicfinder/api/artists/Muse/'
+
+    @classmethod
+    def setUpClass(cls):
+        print(f"Testing InstrumentationTestCase")
+
+    def setUp(self):
+        super(InstrumentationTestCase, self).setUp()
+        instrumentation.reset()
+        instrumentation.enable()
+
+    def tearDown(self):
+        instrumentation.disable()
+        instrumentation.reset()
+        resources.app.config['PROFILE_REQUESTS'] = False
+        super(InstrumentationTestCase, self).tearDown()
+
+    def test_server_timing(self):
+        '''
+        Checks that the phases of a request are reported in Server-Timing
+        '''
+        print(f"({self.test_server_timing.__name__})", self.test_server_timing.__doc__)
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, 200)
+        phases = [entry.split(';')[0] for entry in resp.headers['Server-Timing'].split(', ')]
+        for phase in ('checkout', 'query', 'rows', 'resource', 'serialize', 'total'):
+            self.assertIn(phase, phases)
+        instrumentation.disable()
+        self.assertNotIn('Server-Timing', self.client.get(self.url).headers)
+
+    def test_metrics(self):
+        '''
+        Checks that /metrics exposes the latency histograms and the
+        connection counts
+        '''
+        print(f"({self.test_metrics.__name__})", self.test_metrics.__doc__)
+        self.client.get(self.url)
+        resp = self.client.get('/metrics')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.mimetype, 'text/plain')
+        text = resp.data.decode('utf-8')
+        self.assertIn('# TYPE musicfinder_request_seconds histogram', text)
+        self.assertIn('musicfinder_request_seconds_count{endpoint="artist",method="GET",status="200"} 1', text)
+        self.assertIn('musicfinder_phase_seconds_count{phase="query",name="MusicDatabase.get_artist"} 1', text)
+        self.assertIn('musicfinder_phase_seconds_count{phase="rows",name="MusicDatabase._fetch_rows"}', text)
+        self.assertIn('musicfinder_phase_seconds_bucket{phase="resource",name="Artist.get",le="+Inf"} 1', text)
+        self.assertIn('musicfinder_db_connections{state="open"}', text)
+
+    def test_profile_header(self):
+        '''
+        Checks that a request is profiled with X-Profile only when profiling
+        is allowed
+        '''
+        print(f"({self.test_profile_header.__name__})", self.test_profile_header.__doc__)
+        resp = self.client.get(self.url, headers={'X-Profile': 'cprofile'})
+        self.assertEqual(json.loads(resp.data)['legalName'], 'Muse')
+        resources.app.config['PROFILE_REQUESTS'] = True
+        resp = self.client.get(self.url, headers={'X-Profile': 'cprofile'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.mimetype, 'text/plain')
+        self.assertEqual(resp.headers['X-Profile'], 'cprofile')
+        self.assertIn('function calls', resp.data.decode('utf-8'))
+
+
+class SerializationTestCase(ResourcesAPITestCase):
+    url = '/musicfinder/api/artists/'
+
+    @classmethod
+    def setUpClass(cls):
+        print(f"Testing SerializationTestCase")
+
+    def tearDown(self):
+        serialization.set_backend()
+        super(SerializationTestCase, self).tearDown()
+
+    def test_backends_agree(self):
+        '''
+        Checks that every JSON backend renders the same documents
+        '''
+        print(f"({self.test_backends_agree.__name__})", self.test_backends_agree.__doc__)
+        documents = {}
+        for name in serialization.BACKENDS:
+            serialization.set_backend(name)
+            collection = self.client.get(self.url)
+            artist = self.client.get(self.url + 'Placebo/')
+            streamed = self.client.get(self.url + '?stream=true')
+            documents[name] = (json.loads(collection.data), json.loads(artist.data),
+                               json.loads(streamed.data))
+        for document in documents.values():
+            self.assertEqual(document, documents['json'])
+        with self.assertRaises(ValueError):
+            serialization.set_backend('nosuchbackend')
+
+    def test_collection_media_types(self):
+        '''
+        Checks that collections can be requested as Collection+JSON
+        '''
+        print(f"({self.test_collection_media_types.__name__})", self.test_collection_media_types.__doc__)
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.mimetype, 'application/json')
+        resp = self.client.get(self.url, headers={'Accept': resources.COLLECTIONJSON})
+        self.assertEqual(resp.mimetype, resources.COLLECTIONJSON)
+        self.assertEqual(len(json.loads(resp.data)['collection']['items']), initial_artists)
+
+
+class CompressionTestCase(ResourcesAPITestCase):
+    url = '/musicfinder/api/artists/'
+
+    @classmethod
+    def setUpClass(cls):
+        print(f"Testing CompressionTestCase")
+
+    def tearDown(self):
+        resources.app.config.pop('COMPRESS_MIN_SIZE', None)
+        super(CompressionTestCase, self).tearDown()
+
+    def test_compressed_collection(self):
+        '''
+        Checks that a large body is compressed with an encoding accepted by
+        the client and decompresses to the uncompressed body
+        '''
+        print(f"({self.test_compressed_collection.__name__})", self.test_compressed_collection.__doc__)
+        plain = self.client.get(self.url)
+        self.assertNotIn('Content-Encoding', plain.headers)
+        resp = self.client.get(self.url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', resp.headers['Vary'])
+        self.assertEqual(int(resp.headers['Content-Length']), len(resp.data))
+        self.assertLess(len(resp.data), len(plain.data) / 3)
+        self.assertEqual(zlib.decompress(resp.data, 31), plain.data)
+        #The ETag is weak, so it validates both encodings.
+        resp = self.client.get(self.url, headers={'Accept-Encoding': 'gzip',
+                                                  'If-None-Match': plain.headers['ETag']})
+        self.assertEqual(resp.status_code, 304)
+        self.assertNotIn('Content-Encoding', resp.headers)
+        resp = self.client.get(self.url, headers={'Accept-Encoding': 'gzip;q=0, identity'})
+        self.assertNotIn('Content-Encoding', resp.headers)
+
+    def test_min_size(self):
+        '''
+        Checks that the bodies below the minimum size are not compressed
+        '''
+        print(f"({self.test_min_size.__name__})", self.test_min_size.__doc__)
+        #A small body that gzip can still make smaller.
+        url = self.url + 'NoSuchArtist' * 10 + '/'
+        resp = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertLess(len(resp.data), content_encoding.DEFAULT_MIN_SIZE)
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertNotIn('Vary', resp.headers)
+        resources.app.config['COMPRESS_MIN_SIZE'] = 10
+        resp = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        resources.app.config['COMPRESS_MIN_SIZE'] = 10 ** 6
+        resp = self.client.get(self.url, headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', resp.headers)
+
+    def test_streamed_collection(self):
+        '''
+        Checks that a streamed collection is compressed chunk by chunk and
+        that every chunk can be decompressed as it arrives
+        '''
+        print(f"({self.test_streamed_collection.__name__})", self.test_streamed_collection.__doc__)
+        plain = self.client.get(self.url + '?stream=true')
+        resp = self.client.get(self.url + '?stream=true', headers={'Accept-Encoding': 'gzip'},
+                               buffered=False)
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', resp.headers)
+        decompressor = zlib.decompressobj(31)
+        chunks = [decompressor.decompress(chunk) for chunk in resp.response]
+        resp.close()
+        #The first chunk holds the envelope, before the items are read.
+        self.assertTrue(plain.data.startswith(chunks[0]))
+        self.assertTrue(chunks[0])
+        self.assertEqual(b''.join(chunks), plain.data)
+        self.assertTrue(decompressor.eof)
+
+    def test_stream_compressor(self):
+        '''
+        Checks that every installed encoding compresses in one piece and as a
+        stream
+        '''
+        print(f"({self.test_stream_compressor.__name__})", self.test_stream_compressor.__doc__)
+        data = json.dumps([{'name': 'Song %d' % i, 'value': i} for i in range(1000)]).encode('utf-8')
+        for encoding in content_encoding.ENCODINGS:
+            level = content_encoding.DEFAULT_LEVELS[encoding]
+            whole = content_encoding.compress(data, encoding, level)
+            streamed = b''.join(content_encoding.compress_stream([data[:500], data[500:]], encoding, level))
+            self.assertLess(len(whole), len(data) / 4)
+            if encoding == 'gzip':
+                self.assertEqual(zlib.decompress(whole, 31), data)
+                self.assertEqual(zlib.decompress(streamed, 31), data)
+        with self.assertRaises(ValueError):
+            content_encoding.StreamCompressor('compress', 1)
+
+
 if __name__ == '__main__':
     print('Start running tests')
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,103 @@
+import unittest
+import os, shutil, tempfile, types
+from unittest import mock
+
+try:
+    import gunicorn
+except ImportError:
+    gunicorn = None
+
+import database
+import musicfinder
+import resources
+
+ENVIRONMENT = {'MUSICFINDER_BIND': '127.0.0.1:8123', 'MUSICFINDER_WORKERS': '3',
+               'MUSICFINDER_THREADS': '5', 'MUSICFINDER_BACKLOG': '64',
+               'MUSICFINDER_GRACEFUL_TIMEOUT': '7'}
+
+@unittest.skipIf(gunicorn is None, 'gunicorn is not installed')
+class ProductionTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print(f"Testing ProductionTestCase")
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.folder, 'production.db')
+        self.environment = dict(ENVIRONMENT, MUSICFINDER_DATABASE=self.db_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _create_server(self, **settings):
+        with mock.patch.dict(os.environ, self.environment):
+            return musicfinder.create_production_server(settings)
+
+    def test_settings(self):
+        '''
+        Check that the environment variables set the gunicorn settings, and
+        that the options of the command line take precedence
+        '''
+        print(f"({self.test_settings.__name__})", self.test_settings.__doc__)
+        cfg = self._create_server().cfg
+        self.assertEqual(cfg.bind, ['127.0.0.1:8123'])
+        self.assertEqual((cfg.workers, cfg.threads, cfg.backlog, cfg.graceful_timeout),
+                         (3, 5, 64, 7))
+        self.assertEqual(cfg.worker_class_str, 'gthread')
+        self.assertFalse(cfg.preload_app)
+        cfg = self._create_server(workers=2, bind='localhost:9000', graceful_timeout=None).cfg
+        self.assertEqual((cfg.workers, cfg.bind, cfg.graceful_timeout), (2, ['localhost:9000'], 7))
+
+    def test_on_starting_applies_migrations(self):
+        '''
+        Check that the master process brings the schema of the database up
+        to date before starting the workers
+        '''
+        print(f"({self.test_on_starting_applies_migrations.__name__})",
+              self.test_on_starting_applies_migrations.__doc__)
+        db = database.MusicDatabase(self.db_path)
+        try:
+            db.create_tables_from_schema()
+            db.load_table_values_from_dump()
+            self.assertEqual(db.get_schema_version(), 0)
+            server = self._create_server()
+            with mock.patch.dict(os.environ, self.environment):
+                server.cfg.on_starting(server)
+            self.assertEqual(db.get_schema_version(), db.get_migrations()[-1][0])
+        finally:
+            db.close()
+
+    def test_worker_database(self):
+        '''
+        Check that a worker opens the database with a connection per thread
+        and that worker_exit closes it
+        '''
+        print(f"({self.test_worker_database.__name__})", self.test_worker_database.__doc__)
+        db = database.MusicDatabase(self.db_path)
+        db.load_init_values()
+        db.close()
+        server = self._create_server()
+        worker = types.SimpleNamespace(cfg=server.cfg)
+        config = resources.app.config
+        saved = dict((key, config[key]) for key in ('DATABASE', 'DATABASE_PATH', 'DATABASE_OPTIONS'))
+        config['DATABASE'] = None
+        try:
+            with mock.patch.dict(os.environ, self.environment):
+                server.cfg.post_worker_init(worker)
+            resp = resources.app.test_client().get('/musicfinder/api/artists/')
+            self.assertEqual(resp.status_code, 200)
+            worker_db = config['DATABASE']
+            stats = worker_db.get_pool_stats()
+            self.assertEqual((worker_db.db_path, stats['size']), (self.db_path, 5))
+            self.assertGreater(stats['open'], 0)
+            server.cfg.worker_exit(server, worker)
+            self.assertEqual(worker_db.get_pool_stats()['open'], 0)
+        finally:
+            if config['DATABASE'] is not None:
+                config['DATABASE'].close()
+            config.update(saved)
+
+if __name__ == '__main__':
+    print('Start running tests')
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+import os, shutil, tempfile
+
+import database
+import resources
+from benchmarks import startup_benchmark
+
+#Run in a new process, from another folder than the main one.
+SIDE_EFFECTS_SCRIPT = '''
+import sys
+import musicfinder, resources, database
+print('app' in vars(resources), 'application' in vars(musicfinder),
+      'numpy' in sys.modules, 'cooccurrence' in sys.modules)
+print(database.DEFAULT_DB_PATH)
+'''
+
+class StartupTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print(f"Testing StartupTestCase")
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_import_has_no_side_effects(self):
+        '''
+        Check that importing the server prints nothing, creates no
+        application, loads no NumPy and finds the database wherever it is
+        started from
+        '''
+        print(f"({self.test_import_has_no_side_effects.__name__})",
+              self.test_import_has_no_side_effects.__doc__)
+        _seconds, output, _errors = startup_benchmark.run_python(['-c', SIDE_EFFECTS_SCRIPT], self.folder)
+        self.assertEqual(output.splitlines(), ['False False False False',
+                                               os.path.join(database.BASE_DIR, 'db', 'musicdb.db')])
+
+    def test_lazy_database(self):
+        '''
+        Check that an application opens its database on its first request,
+        with the options of its configuration
+        '''
+        print(f"({self.test_lazy_database.__name__})", self.test_lazy_database.__doc__)
+        db_path = startup_benchmark.create_database(self.folder)
+        app = resources.create_app({'DATABASE_PATH': db_path, 'DATABASE_OPTIONS': {'pool_size': 2}})
+        self.assertIsNone(app.config['DATABASE'])
+        self.assertFalse(app.debug)
+        self.assertTrue(resources.create_app({'DEBUG': True}).debug)
+        try:
+            resp = app.test_client().get('/musicfinder/api/artists/')
+            self.assertEqual(resp.status_code, 200)
+            db = app.config['DATABASE']
+            self.assertEqual((db.db_path, db.get_pool_stats()['size']), (db_path, 2))
+            self.assertIs(resources.get_database(app), db)
+            #The links are built for the application of the request.
+            with app.test_request_context('/'):
+                self.assertEqual(resources.url_for(resources.Artist, artist='Muse'),
+                                 '/musicfinder/api/artists/Muse/')
+        finally:
+            if app.config['DATABASE'] is not None:
+                app.config['DATABASE'].close()
+
+    def test_startup_budget(self):
+        '''
+        Check that the import of the server and its first response stay
+        within their budgets
+        '''
+        print(f"({self.test_startup_budget.__name__})", self.test_startup_budget.__doc__)
+        db_path = startup_benchmark.create_database(self.folder)
+        #The best of a few runs: a busy machine only makes a run slower.
+        imports = min(startup_benchmark.measure_import(self.folder) for i in range(3))
+        self.assertLess(imports, startup_benchmark.IMPORT_BUDGET)
+        first_response = min(startup_benchmark.measure_first_response(self.folder, db_path)[0]
+                             for i in range(3))
+        self.assertLess(first_response, startup_benchmark.FIRST_RESPONSE_BUDGET)
+
+if __name__ == '__main__':
+    print('Start running tests')
+    unittest.main()
@@ -0,0 +1,60 @@
+'''
+Run the test modules in several processes at once. Run it from the main
+folder with:
+
+    python -m test.parallel [--workers N] [module ...]
+
+The modules (by default every test module of this folder) are run by N
+worker processes (by default one per CPU), each module with python -m
+unittest in a new process. Every process keeps its databases in its own
+temporary folder (see database_api_tests_common), so the workers never
+share a database file. The output of a module is printed when it ends. The
+exit status is 1 if a module failed.
+'''
+import argparse, os, subprocess, sys, time
+from concurrent.futures import ThreadPoolExecutor
+
+TEST_FOLDER = os.path.dirname(os.path.abspath(__file__))
+MAIN_FOLDER = os.path.dirname(TEST_FOLDER)
+
+def get_modules():
+    '''
+    Return the sorted names of the test modules of TEST_FOLDER.
+    '''
+    names = [filename[:-3] for filename in os.listdir(TEST_FOLDER)
+             if filename.endswith('.py') and '_tests' in filename]
+    return sorted('test.' + name for name in names if name != 'database_api_tests_common')
+
+def run_module(module):
+    '''
+    Run the tests of module in a new process. Return (module, exit status,
+    output, seconds).
+    '''
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, '-m', 'unittest', module], cwd=MAIN_FOLDER,
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                             universal_newlines=True)
+    return module, process.returncode, process.stdout, time.perf_counter() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the test modules in parallel processes.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='modules run at once (default: %(default)s)')
+    parser.add_argument('modules', nargs='*',
+                        help='modules to run, e.g. test.database_api_tests_songs (default: all)')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    failed = []
+    with ThreadPoolExecutor(max(args.workers, 1)) as executor:
+        for module, status, output, seconds in executor.map(run_module, args.modules or get_modules()):
+            print('==== %s (%.1f s)' % (module, seconds))
+            print(output)
+            if status != 0:
+                failed.append(module)
+    print('%s in %.1f s' % ('FAILED: ' + ', '.join(failed) if failed else 'OK',
+                            time.perf_counter() - start))
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())